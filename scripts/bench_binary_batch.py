@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+Benchmark of encoding batches of snapshot events as NDJSON and as binary batches.
+
+Snapshots are captured by the SnapshotCollector from a request handler holding a few
+objects, dicts and lists, as a tracepoint would capture them. For each encoding it
+reports the CPU time spent per event and the bytes per event on the wire, as sent and
+gzip compressed as the EventBatcher compresses large batches.
+
+Run with: python scripts/bench_binary_batch.py [--events N] [--batch-size N]
+"""
+
+import argparse
+import gzip
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tracepointdebug.broker.binary_batch import BinaryBatchEncoder
+from tracepointdebug.broker.event_batcher import encode_batch, NDJSON
+from tracepointdebug.broker.event_process_pool import COMPRESS_LEVEL
+from tracepointdebug.probe.encoder import to_json
+from tracepointdebug.probe.event.tracepoint.trace_point_snapshot_event import TracePointSnapshotEvent
+from tracepointdebug.probe.snapshot import SnapshotCollector
+
+
+class Customer(object):
+    def __init__(self, i):
+        self.id = i
+        self.email = "customer%d@example.com" % i
+        self.tier = ("free", "pro", "enterprise")[i % 3]
+
+
+class Order(object):
+    def __init__(self, i):
+        self.id = 10000 + i
+        self.customer = Customer(i % 97)
+        self.lines = [{"sku": "sku-%d" % (i * 7 + j), "qty": j + 1, "price": 9.99 * (j + 1)} for j in range(5)]
+        self.status = "pending"
+        self.tags = ["web", "eu-west", "retry"]
+
+
+def _checkout(order, attempt, headers):
+    total = sum(line["qty"] * line["price"] for line in order.lines)
+    discount = 0.1 if order.customer.tier == "pro" else 0.0
+    return SnapshotCollector().collect(sys._getframe())
+
+
+def _snapshot_event(i):
+    snapshot = _checkout(Order(i), i % 3, {"user-agent": "bench/1.0", "x-request-id": "req-%d" % i})
+    event = TracePointSnapshotEvent("tp-%d" % (i % 4), "app/orders.py", 42, "_checkout", snapshot.frames)
+    event.id = "e-%d" % i
+    event.time = 1760000000000 + i
+    event.hostname = "host-1"
+    event.application_instance_id = "instance-1"
+    event.application_name = "orders"
+    return event
+
+
+def _ndjson(batch):
+    return encode_batch([to_json(event.to_json(), separators=(",", ":")).encode("utf-8") for event in batch], NDJSON)
+
+
+def _binary(batch):
+    encoder = BinaryBatchEncoder()
+    for event in batch:
+        encoder.add(event)
+    return encoder.getvalue()
+
+
+def _measure(encode, batches, compress):
+    size = 0
+    cpu = time.process_time()
+    for batch in batches:
+        body = encode(batch)
+        if compress:
+            body = gzip.compress(body, COMPRESS_LEVEL)
+        size += len(body)
+    return time.process_time() - cpu, size
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--events", type=int, default=2000)
+    parser.add_argument("--batch-size", type=int, default=100)
+    args = parser.parse_args()
+
+    events = [_snapshot_event(i) for i in range(args.events)]
+    batches = [events[i:i + args.batch_size] for i in range(0, len(events), args.batch_size)]
+    print("%d snapshot events in batches of %d" % (args.events, args.batch_size))
+    for name, encode in (("NDJSON", _ndjson), ("binary", _binary)):
+        for compress in (False, True):
+            cpu, size = _measure(encode, batches, compress)
+            print("%-6s %-5s %6.1f us CPU/event, %6.0f bytes/event" % (
+                name, "gzip" if compress else "", cpu / args.events * 1e6, size / args.events))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+Benchmark of the latency a tracepoint hit adds to the application thread,
+with synchronous and with deferred snapshot capture.
+
+Run with: python scripts/bench_deferred_capture.py [--hits N]
+"""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tracepointdebug.probe.breakpoints.tracepoint.trace_point import TracePoint
+from tracepointdebug.probe.breakpoints.tracepoint.trace_point_config import TracePointConfig
+from tracepointdebug.probe.snapshot import snapshot_collector_config_manager as config_manager
+
+
+class Order(object):
+    def __init__(self, order_id):
+        self.id = order_id
+        self.customer = {"name": "Ada", "email": "ada@example.com", "tags": ["vip", "beta"]}
+        self.lines = [{"sku": "sku-%d" % i, "qty": i, "price": i * 1.5} for i in range(20)]
+
+
+def handle_request(order, hit):
+    headers = {"accept": "application/json", "x-request-id": "abc-123", "user-agent": "bench"}
+    totals = [line["qty"] * line["price"] for line in order.lines]
+    hit(sys._getframe())  # TRACEPOINT_LINE
+    return sum(totals), headers
+
+
+class _Engine(object):
+    def set_logpoint(self, probe_id, file, line, callback):
+        return probe_id
+
+    def remove_logpoint(self, probe_id):
+        pass
+
+
+class _TracePointManager(object):
+    _data_redaction_callback = None
+
+    def __init__(self):
+        self.published = 0
+
+    def publish_event(self, event, callback=None):
+        self.published += 1
+        if callback:
+            callback()
+
+    def expire_trace_point(self, trace_point):
+        pass
+
+
+def _tracepoint_line():
+    with open(__file__) as f:
+        for line_no, line in enumerate(f, 1):
+            if line.rstrip().endswith("# TRACEPOINT_LINE") and "hit(" in line:
+                return line_no
+    raise RuntimeError("tracepoint line not found")
+
+
+def _run(deferred, hits):
+    config = TracePointConfig("bench", file="scripts/bench_deferred_capture.py", line=_tracepoint_line(), client="bench",
+                              expire_duration=-1, expire_hit_count=-1, deferred_capture=deferred)
+    manager = _TracePointManager()
+    trace_point = TracePoint(manager, config, _Engine())
+    trace_point.rate_limiter.check_rate_limit = lambda now: None
+
+    order = Order(1)
+    latencies = []
+
+    def hit(frame):
+        start = time.perf_counter()
+        trace_point.breakpoint_callback("line", frame)
+        latencies.append(time.perf_counter() - start)
+
+    for _ in range(hits):
+        handle_request(order, hit)
+    while manager.published < hits:
+        time.sleep(0.01)
+    latencies.sort()
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--hits", type=int, default=2000)
+    args = parser.parse_args()
+
+    config_manager.snapshot_configs.update({"maxParseDepth": 4, "maxExpandFrames": 2, "memoryBudget": 0})
+    print("%-12s %10s %10s %10s" % ("mode", "p50 (us)", "p99 (us)", "mean (us)"))
+    for deferred in (False, True):
+        latencies = _run(deferred, args.hits)
+        print("%-12s %10.1f %10.1f %10.1f" % (
+            "deferred" if deferred else "synchronous",
+            latencies[len(latencies) // 2] * 1e6,
+            latencies[int(len(latencies) * 0.99)] * 1e6,
+            sum(latencies) / len(latencies) * 1e6))
+
+
+if __name__ == "__main__":
+    main()
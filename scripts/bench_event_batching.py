@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Benchmark of sending logpoint events to a local event sink one POST per event and in
+batches.
+
+For each mode it reports how fast events are sent and how much CPU time the
+application process spends per event, encoding, compressing and posting included.
+
+Run with: python scripts/bench_event_batching.py [--events N] [--threads N] [--batch-size N]
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import threading
+import time
+from concurrent.futures.thread import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tracepointdebug.broker.event_batcher import EventBatcher, NDJSON, JSON_ARRAY
+from tracepointdebug.probe.event.logpoint.log_point_event import LogPointEvent
+
+
+class _SinkHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        self.rfile.read(int(self.headers["Content-Length"]))
+        self.send_response(200)
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+def _run_sink(port):
+    ThreadingHTTPServer(("127.0.0.1", port), _SinkHandler).serve_forever()
+
+
+def _event(i):
+    return LogPointEvent("lp-%d" % (i % 8), "app/orders.py", 42, "checkout",
+                         "retrying order %d for user %d, attempt %d" % (i, i % 97, i % 5),
+                         "2026-10-18 12:00:00.%03d" % (i % 1000))
+
+
+def _encode(event):
+    return json.dumps(event.to_json(), separators=(",", ":")).encode("utf-8")
+
+
+def _measure(send_all, events):
+    cpu = time.process_time()
+    start = time.perf_counter()
+    send_all()
+    elapsed = time.perf_counter() - start
+    cpu = time.process_time() - cpu
+    return events / elapsed, cpu / events * 1000
+
+
+def _single_mode(url, events, threads):
+    import requests
+    local = threading.local()
+
+    def send(event):
+        if not hasattr(local, "session"):
+            local.session = requests.Session()
+        local.session.post(url + "/api/events", data=_encode(event), headers={"content-type": "application/json"},
+                           timeout=10).raise_for_status()
+
+    def send_all():
+        with ThreadPoolExecutor(threads) as executor:
+            list(executor.map(send, (_event(i) for i in range(events))))
+    return send_all
+
+
+def _batch_mode(url, events, batch_size, batch_format):
+    def send_all():
+        batcher = EventBatcher(url, _encode, max_events=batch_size, batch_format=batch_format, timeout=10)
+        batcher.start()
+        for i in range(events):
+            batcher.submit(_event(i))
+        batcher.flush()
+        batcher.stop()
+    return send_all
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--events", type=int, default=5000)
+    parser.add_argument("--threads", type=int, default=4)
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--port", type=int, default=4398)
+    args = parser.parse_args()
+
+    sink = multiprocessing.get_context("spawn").Process(target=_run_sink, args=(args.port,), daemon=True)
+    sink.start()
+    time.sleep(1)
+    url = "http://127.0.0.1:%d" % args.port
+    try:
+        rate, cpu = _measure(_single_mode(url, args.events, args.threads), args.events)
+        print("one POST per event (%d threads): %8.0f events/s, %.3f CPU ms/event" % (args.threads, rate, cpu))
+        for batch_format in (NDJSON, JSON_ARRAY):
+            rate, cpu = _measure(_batch_mode(url, args.events, args.batch_size, batch_format), args.events)
+            print("batches of %d (%s):%s %8.0f events/s, %.3f CPU ms/event" % (
+                args.batch_size, batch_format, " " * (12 - len(batch_format)), rate, cpu))
+    finally:
+        sink.terminate()
+
+
+if __name__ == "__main__":
+    main()
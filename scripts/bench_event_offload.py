@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+"""
+Benchmark of sending large snapshot events from agent threads and from the event
+process pool, while an application thread keeps the interpreter busy.
+
+For each mode it reports how fast events are sent and how much work the application
+thread got done meanwhile, compared to running alone.
+
+Run with: python scripts/bench_event_offload.py [--events N] [--workers N] [--threads N]
+"""
+
+import argparse
+import multiprocessing
+import os
+import pickle
+import sys
+import threading
+import time
+from concurrent.futures.thread import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tracepointdebug.broker.event_process_pool import EventProcessPool, encode_body
+from tracepointdebug.probe.frame import Frame
+from tracepointdebug.probe.snapshot.value import Value
+from tracepointdebug.probe.snapshot.variable import Variable
+from tracepointdebug.probe.snapshot.variables import Variables
+
+
+class _SinkHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        self.rfile.read(int(self.headers["Content-Length"]))
+        self.send_response(200)
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+def _run_sink(port):
+    ThreadingHTTPServer(("127.0.0.1", port), _SinkHandler).serve_forever()
+
+
+def _payload(i):
+    lines = Value("list", [Value("dict", {"sku": Value("str", "sku-%d" % j), "qty": Value("int", j),
+                                          "price": Value("float", j * 1.5)}) for j in range(400)])
+    variables = Variables([Variable("lines", "list", lines),
+                           Variable("body", "str", Value("str", "payload-%d " % i * 2000))])
+    return {"name": "TracePointSnapshotEvent", "id": str(i),
+            "frames": [Frame(10, variables, "app/orders.py", "checkout")]}
+
+
+def _cost_ms(fn, runs=20):
+    start = time.perf_counter()
+    for _ in range(runs):
+        fn()
+    return (time.perf_counter() - start) / runs * 1000
+
+
+def _app_work(stop, counter):
+    while not stop.is_set():
+        sum(i * i for i in range(200))
+        counter[0] += 1
+
+
+def _measure(send_all, seconds=None):
+    stop = threading.Event()
+    counter = [0]
+    app = threading.Thread(target=_app_work, args=(stop, counter))
+    start = time.perf_counter()
+    app.start()
+    if send_all is None:
+        time.sleep(seconds)
+    else:
+        send_all()
+    elapsed = time.perf_counter() - start
+    stop.set()
+    app.join()
+    return elapsed, counter[0] / elapsed
+
+
+def _thread_mode(url, events, threads):
+    import requests
+    session = requests.Session()
+
+    def send(payload):
+        body, headers = encode_body(payload)
+        session.post(url + "/api/events", data=body, headers=headers, timeout=10).raise_for_status()
+
+    def send_all():
+        with ThreadPoolExecutor(threads) as executor:
+            list(executor.map(send, (_payload(i) for i in range(events))))
+    return send_all
+
+
+def _process_mode(url, events, workers):
+    pool = EventProcessPool(workers, url, timeout=10)
+    pool.start()
+
+    def send_all():
+        done = threading.Semaphore(0)
+        for i in range(events):
+            pool.submit(_payload(i), "/api/events", callback=done.release)
+        for _ in range(events):
+            done.acquire()
+    return pool, send_all
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--events", type=int, default=200)
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--threads", type=int, default=4)
+    parser.add_argument("--port", type=int, default=4399)
+    args = parser.parse_args()
+
+    sink = multiprocessing.get_context("spawn").Process(target=_run_sink, args=(args.port,), daemon=True)
+    sink.start()
+    time.sleep(1)
+    url = "http://127.0.0.1:%d" % args.port
+
+    payload = _payload(0)
+    print("cost per event in the application process: threads %.1f ms (encode and gzip), "
+          "processes %.1f ms (pickle), %d CPUs" % (_cost_ms(lambda: encode_body(payload)),
+                                                   _cost_ms(lambda: pickle.dumps(payload, pickle.HIGHEST_PROTOCOL)),
+                                                   os.cpu_count()))
+    try:
+        _, baseline = _measure(None, seconds=2)
+        print("application thread alone: %.0f iterations/s" % baseline)
+
+        elapsed, app_rate = _measure(_thread_mode(url, args.events, args.threads))
+        print("threads (%d):   %6.1f events/s, application thread at %3.0f%%" % (
+            args.threads, args.events / elapsed, 100 * app_rate / baseline))
+
+        pool, send_all = _process_mode(url, args.events, args.workers)
+        try:
+            elapsed, app_rate = _measure(send_all)
+        finally:
+            pool.stop()
+        print("processes (%d): %6.1f events/s, application thread at %3.0f%%" % (
+            args.workers, args.events / elapsed, 100 * app_rate / baseline))
+    finally:
+        sink.terminate()
+
+
+if __name__ == "__main__":
+    main()
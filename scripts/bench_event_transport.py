@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""
+Benchmark of sending logpoint events to a local collector over HTTP on TCP loopback,
+over a Unix domain socket and through a shared memory ring.
+
+All transports go through the EventBatcher, with the same batch sizes. For each it
+reports how fast events are sent and how much CPU time the application process spends
+per event, encoding and framing included. Events written into the ring count as sent,
+the agent doesn't wait for the collector to read them.
+
+Run with: python scripts/bench_event_transport.py [--events N] [--batch-sizes 1,50,500]
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import socketserver
+import struct
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from scripts.event_sink import EventRingReader
+from tracepointdebug.broker.event_batcher import EventBatcher
+from tracepointdebug.broker.event_ring import EventRingTransport
+from tracepointdebug.broker.unix_socket_transport import UnixSocketTransport
+from tracepointdebug.probe.event.logpoint.log_point_event import LogPointEvent
+
+_ANSWER = json.dumps({"status": "accepted", "rejected": []}).encode("utf-8")
+
+
+class _HTTPHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Headers and body are written separately, Nagle would hold the body back for a delayed ACK
+    disable_nagle_algorithm = True
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers["Content-Length"]))
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(_ANSWER)))
+        self.end_headers()
+        self.wfile.write(_ANSWER)
+
+    def log_message(self, *args):
+        pass
+
+
+class _FrameHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        while True:
+            header = self.rfile.read(4)
+            if len(header) < 4:
+                return
+            self.rfile.read(struct.unpack(">I", header)[0])
+            self.wfile.write(struct.pack(">I", len(_ANSWER)) + _ANSWER)
+
+
+def _read_ring(reader):
+    while True:
+        reader.heartbeat()
+        if not reader.read(lambda views: None):
+            reader.wait(0.05)
+
+
+def _run_collector(port, path, ring):
+    server = socketserver.ThreadingUnixStreamServer(path, _FrameHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    threading.Thread(target=_read_ring, args=(EventRingReader(ring),), daemon=True).start()
+    ThreadingHTTPServer(("127.0.0.1", port), _HTTPHandler).serve_forever()
+
+
+def _event(i):
+    return LogPointEvent("lp-%d" % (i % 8), "app/orders.py", 42, "checkout",
+                         "retrying order %d for user %d, attempt %d" % (i, i % 97, i % 5),
+                         "2026-10-18 12:00:00.%03d" % (i % 1000))
+
+
+def _encode(event):
+    return json.dumps(event.to_json(), separators=(",", ":")).encode("utf-8")
+
+
+def _measure(events, batch_size, url, transport=None):
+    # No delay and no compression, so both transports send the same batches
+    batcher = EventBatcher(url, _encode, max_events=batch_size, max_delay_ms=0, timeout=10,
+                           compress_min_bytes=None, transport=transport)
+    batcher.start()
+    cpu = time.process_time()
+    start = time.perf_counter()
+    for i in range(events):
+        batcher.submit(_event(i))
+    batcher.flush()
+    elapsed = time.perf_counter() - start
+    cpu = time.process_time() - cpu
+    batcher.stop()
+    return events / elapsed, cpu / events * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--events", type=int, default=5000)
+    parser.add_argument("--batch-sizes", default="1,50,500")
+    parser.add_argument("--port", type=int, default=4399)
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp(prefix="debugin-bench-")
+    path = os.path.join(directory, "events.sock")
+    ring = os.path.join("/dev/shm" if os.path.isdir("/dev/shm") else directory, "debugin-bench-%d" % os.getpid())
+    collector = multiprocessing.get_context("spawn").Process(target=_run_collector, args=(args.port, path, ring),
+                                                             daemon=True)
+    collector.start()
+    time.sleep(1)
+    url = "http://127.0.0.1:%d" % args.port
+    try:
+        for batch_size in [int(size) for size in args.batch_sizes.split(",")]:
+            rate, cpu = _measure(args.events, batch_size, url)
+            print("HTTP,        batches of %4d: %8.0f events/s, %.3f CPU ms/event" % (batch_size, rate, cpu))
+            rate, cpu = _measure(args.events, batch_size, "unix://" + path, UnixSocketTransport(path, timeout=10))
+            print("Unix socket, batches of %4d: %8.0f events/s, %.3f CPU ms/event" % (batch_size, rate, cpu))
+            rate, cpu = _measure(args.events, batch_size, "ring://" + ring, EventRingTransport(ring))
+            print("Ring,        batches of %4d: %8.0f events/s, %.3f CPU ms/event" % (batch_size, rate, cpu))
+    finally:
+        collector.terminate()
+        for leftover in (path, ring, ring + ".wakeup"):
+            if os.path.exists(leftover):
+                os.unlink(leftover)
+
+
+if __name__ == "__main__":
+    main()
@@ -9,22 +9,45 @@ Implements the canonical Event Schema specified in docs/event-schema.md.
 
 HTTP Endpoints:
   - POST /api/events     - Accept an event
+  - POST /api/events/batch - Accept a batch of events (NDJSON or JSON array)
   - GET /health          - Health check
 
+Unix socket listener (--unix-socket PATH), for agents with EVENT_SINK_URL=unix://PATH:
+  - Each frame is a 4 byte big-endian length followed by a batch of events as NDJSON,
+    answered with a frame holding what POST /api/events/batch returns
+  - An empty frame is answered with what GET /health returns
+
+Shared memory event ring (--ring PATH), for agents with EVENT_SINK_URL=ring://PATH:
+  - The sink creates the ring, agents write events into it and never wait for the sink
+  - Events that don't fit are dropped by the agent and counted in the ring
+
 Usage:
-  python scripts/event_sink.py [--host 127.0.0.1] [--port 4317]
+  python scripts/event_sink.py [--host 127.0.0.1] [--port 4317] [--unix-socket /run/debugin/events.sock]
+                               [--ring /dev/shm/debugin-events] [--ring-bytes 67108864]
 
 Environment Variables:
   - EVENT_SINK_HOST      - Server host (default: 127.0.0.1)
   - EVENT_SINK_PORT      - Server port (default: 4317)
   - EVENT_SINK_DEBUG     - Enable debug logging (default: false)
+  - EVENT_SINK_UNIX_SOCKET - Unix socket to listen on as well (default: none)
+  - EVENT_SINK_RING      - Shared memory event ring to read as well (default: none)
 """
 
+import copy
+import gzip
 import json
+import mmap
+import os
+import select
+import socketserver
+import struct
 import sys
+import time
 import uuid
 import logging
 import argparse
+import threading
+from collections import OrderedDict
 from datetime import datetime, timezone
 from typing import Any, Dict, Tuple, Optional
 from pathlib import Path
@@ -48,6 +71,20 @@ app = Flask(__name__)
 # In-memory event storage (for testing/debugging)
 _events_received = []
 
+# Reconstructed snapshot frames by event id, used as bases for delta encoded snapshots
+_MAX_SNAPSHOT_BASES = 1000
+_snapshot_bases = OrderedDict()
+_snapshot_bases_lock = threading.Lock()
+
+# Most events accepted in one POST /api/events/batch
+MAX_BATCH_EVENTS = 10000
+
+# Largest frame accepted on the Unix socket
+MAX_FRAME_BYTES = 64 * 1024 * 1024
+
+# Binary event batches, see docs/event-schema.md
+BINARY_CONTENT_TYPE = 'application/x-debugin-batch'
+
 
 class EventValidator:
     """Validates events against the DebugIn Event Schema."""
@@ -170,15 +207,107 @@ class EventValidator:
         return True, None
 
 
+def _collect_reference_targets(node, targets):
+    """Index every value carrying an ``@id`` so ``@ref`` markers can point back to it."""
+    if isinstance(node, dict):
+        ref_id = node.get('@id')
+        if ref_id is not None:
+            targets.setdefault(ref_id, node)
+        for value in node.values():
+            _collect_reference_targets(value, targets)
+    elif isinstance(node, list):
+        for item in node:
+            _collect_reference_targets(item, targets)
+
+
+def _expand_references(node, targets, active):
+    if isinstance(node, dict):
+        if len(node) == 1 and '@ref' in node:
+            ref_id = node['@ref']
+            target = targets.get(ref_id)
+            # Unknown targets and true cycles back to an enclosing value stay as markers
+            if target is None or ref_id in active:
+                return node
+            node = target
+        ref_id = node.get('@id')
+        if ref_id is not None:
+            active = active | {ref_id}
+        return {key: _expand_references(value, targets, active) for key, value in node.items()}
+    if isinstance(node, list):
+        return [_expand_references(item, targets, active) for item in node]
+    return node
+
+
+def resolve_snapshot_references(event: Any) -> Any:
+    """
+    Expand ``{"@ref": n}`` markers produced by agents running with ``dedupReferences``.
+
+    Reference ids are scoped to a single event, so each event is resolved on its own.
+    """
+    targets: Dict[Any, Any] = {}
+    _collect_reference_targets(event, targets)
+    if not targets:
+        return event
+    return _expand_references(event, targets, frozenset())
+
+
+def _apply_snapshot_delta(delta, base):
+    if isinstance(delta, dict):
+        if delta.get('@unchanged') is True and len(delta) == 1:
+            return copy.deepcopy(base)
+        base = base if isinstance(base, dict) else {}
+        return {key: _apply_snapshot_delta(value, base.get(key)) for key, value in delta.items()}
+    if isinstance(delta, list):
+        base = base if isinstance(base, list) else []
+        return [_apply_snapshot_delta(item, base[idx] if idx < len(base) else None)
+                for idx, item in enumerate(delta)]
+    return delta
+
+
+def reconstruct_delta_snapshot(event: Any) -> Any:
+    """
+    Rebuild the full frames of a delta encoded snapshot (``baseSnapshotId`` set).
+
+    ``{"@unchanged": true}`` markers are replaced by the subtree at the same position in the
+    base snapshot. Every snapshot is kept as a base for the next one; when the base is
+    unknown the event is stored as received and flagged with ``deltaUnresolved``.
+    """
+    if not isinstance(event, dict) or not isinstance(event.get('frames'), list):
+        return event
+    base_snapshot_id = event.get('baseSnapshotId')
+    with _snapshot_bases_lock:
+        if base_snapshot_id:
+            base_frames = _snapshot_bases.get(base_snapshot_id)
+            if base_frames is None:
+                return dict(event, deltaUnresolved=True)
+            event = dict(event, frames=_apply_snapshot_delta(event['frames'], base_frames))
+        event_id = event.get('id')
+        if event_id:
+            _snapshot_bases[event_id] = event['frames']
+            if len(_snapshot_bases) > _MAX_SNAPSHOT_BASES:
+                _snapshot_bases.popitem(last=False)
+    return event
+
+
 @app.route('/health', methods=['GET'])
 def health_check():
     """Health check endpoint."""
-    return jsonify({
+    return jsonify(_health()), 200
+
+
+def _health() -> Dict[str, Any]:
+    return {
         'status': 'healthy',
         'service': 'debugin-event-sink',
         'events_received': len(_events_received),
+        'batch': {
+            'supported': True,
+            'path': '/api/events/batch',
+            'formats': ['ndjson', 'json', 'binary'],
+            'maxEvents': MAX_BATCH_EVENTS
+        },
         'timestamp': datetime.now(timezone.utc).isoformat().replace('+00:00', 'Z')
-    }), 200
+    }
 
 
 @app.route('/api/events', methods=['POST'])
@@ -188,6 +317,7 @@ def receive_event():
 
     POST /api/events
     Content-Type: application/json
+    Content-Encoding: gzip (optional)
 
     Body: { event object conforming to schema }
 
@@ -196,9 +326,9 @@ def receive_event():
         400: Invalid event format
         500: Server error
     """
-    # Parse JSON
+    # Parse JSON, gzip compressed bodies are sent by the agent's event process workers
     try:
-        event = request.get_json(force=True)
+        event = json.loads(_request_body())
     except Exception as e:
         logger.warning(f"Failed to parse JSON: {e}")
         return jsonify({
@@ -217,24 +347,338 @@ def receive_event():
             'error': error_msg
         }), 400
 
-    # Store event (for testing/debugging)
-    event_id = event.get('id')
-    event_name = event.get('name')
-    _events_received.append(event)
-
-    # Log event
-    runtime = event.get('client', {}).get('runtime', 'unknown')
-    app_name = event.get('client', {}).get('applicationName', 'unknown')
-    logger.info(f"✓ Event accepted: {event_name} (id={event_id}, runtime={runtime}, app={app_name})")
+    _store_event(event)
 
     # Return success response
     return jsonify({
         'status': 'accepted',
-        'id': event_id,
+        'id': event.get('id'),
         'timestamp': datetime.now(timezone.utc).isoformat().replace('+00:00', 'Z')
     }), 200
 
 
+@app.route('/api/events/batch', methods=['POST'])
+def receive_event_batch():
+    """
+    Receive a batch of events, validating each on its own.
+
+    POST /api/events/batch
+    Content-Type: application/x-ndjson (one event per line), application/json (array of events)
+                  or application/x-debugin-batch (binary, see docs/event-schema.md)
+    Content-Encoding: gzip (optional)
+
+    Returns:
+        200: Valid events accepted, invalid ones listed under 'rejected' by index
+        400: Body is not NDJSON, a JSON array or a binary batch, or holds too many events
+    """
+    try:
+        body = _request_body()
+        if BINARY_CONTENT_TYPE in request.headers.get('Content-Type', '').lower():
+            events = decode_binary_batch(body)
+        elif 'ndjson' in request.headers.get('Content-Type', '').lower():
+            events = [json.loads(line) for line in body.splitlines() if line.strip()]
+        else:
+            events = json.loads(body)
+            if not isinstance(events, list):
+                raise ValueError("Batch must be a JSON array of events")
+    except Exception as e:
+        logger.warning(f"Failed to parse event batch: {e}")
+        return jsonify({
+            'status': 'error',
+            'message': 'Invalid batch format',
+            'error': str(e)
+        }), 400
+    result = _accept_batch(events)
+    return jsonify(result), 400 if result['status'] == 'error' else 200
+
+
+def decode_binary_batch(data: bytes) -> list:
+    """Decodes the events of a binary batch, see docs/event-schema.md. Raises ValueError when it is garbled."""
+    if data[:5] != b'DBGB\x01':
+        raise ValueError("Not a version 1 binary batch")
+    keys = []
+    names = []
+    position = 5
+
+    def varint():
+        nonlocal position
+        result = shift = 0
+        while True:
+            byte = data[position]
+            position += 1
+            result |= (byte & 0x7F) << shift
+            if byte < 0x80:
+                return result
+            shift += 7
+
+    def text():
+        nonlocal position
+        length = varint()
+        if position + length > len(data):
+            raise ValueError("String past the end of the batch")
+        position += length
+        return data[position - length:position].decode('utf-8', 'surrogatepass')
+
+    def entry(table):
+        index = varint()
+        if index == len(table):
+            table.append(text())
+        elif index > len(table):
+            raise ValueError(f"Table index {index} is not defined yet")
+        return table[index]
+
+    def value():
+        nonlocal position
+        tag = data[position]
+        position += 1
+        if tag == 0:
+            return None
+        if tag in (1, 2):
+            return tag == 2
+        if tag == 3:
+            n = varint()
+            return n >> 1 if not n & 1 else -((n + 1) >> 1)
+        if tag == 4:
+            position += 8
+            return struct.unpack_from('<d', data, position - 8)[0]
+        if tag == 5:
+            return text()
+        if tag == 6:
+            return entry(names)
+        if tag == 7:
+            return [value() for _ in range(varint())]
+        if tag == 8:
+            result = {}
+            for _ in range(varint()):
+                key = entry(keys)
+                result[key] = value()
+            return result
+        if tag == 9:
+            name = entry(names)
+            return {'@type': name, '@value': value()}
+        raise ValueError(f"Unknown tag {tag} at byte {position - 1}")
+
+    events = []
+    try:
+        while position < len(data):
+            events.append(value())
+    except (IndexError, struct.error):
+        raise ValueError("Binary batch ends in the middle of an event")
+    return events
+
+
+def _accept_batch(events) -> Dict[str, Any]:
+    """Validates and stores each event of a batch, returns the response body."""
+    if len(events) > MAX_BATCH_EVENTS:
+        return {
+            'status': 'error',
+            'message': 'Batch too large',
+            'error': f"{len(events)} events, at most {MAX_BATCH_EVENTS} are accepted"
+        }
+
+    accepted = 0
+    rejected = []
+    for index, event in enumerate(events):
+        is_valid, error_msg = EventValidator.validate(event)
+        if not is_valid:
+            rejected.append({'index': index, 'error': error_msg})
+            continue
+        _store_event(event)
+        accepted += 1
+    if rejected:
+        logger.warning(f"Rejected {len(rejected)} of {len(events)} events in batch")
+
+    return {
+        'status': 'accepted',
+        'accepted': accepted,
+        'rejected': rejected,
+        'timestamp': datetime.now(timezone.utc).isoformat().replace('+00:00', 'Z')
+    }
+
+
+class UnixSocketHandler(socketserver.StreamRequestHandler):
+    """Answers the frames of one agent connection until the agent closes it."""
+
+    def handle(self):
+        while True:
+            header = self.rfile.read(4)
+            if len(header) < 4:
+                return
+            length = struct.unpack('>I', header)[0]
+            if length > MAX_FRAME_BYTES:
+                logger.warning(f"Closing connection sending a frame of {length} bytes")
+                return
+            body = self.rfile.read(length)
+            if len(body) < length:
+                return
+            if not body:
+                answer = _health()
+            else:
+                try:
+                    answer = _accept_batch([json.loads(line) for line in body.splitlines() if line.strip()])
+                except Exception as e:
+                    logger.warning(f"Failed to parse event frame: {e}")
+                    answer = {'status': 'error', 'message': 'Invalid batch format', 'error': str(e)}
+            data = json.dumps(answer).encode('utf-8')
+            self.wfile.write(struct.pack('>I', len(data)) + data)
+
+
+def serve_unix_socket(path: str) -> socketserver.ThreadingUnixStreamServer:
+    """Listens for agents on the Unix socket at path, on a thread of its own, and returns the server."""
+    if os.path.exists(path):
+        # Left by an earlier run
+        os.unlink(path)
+    server = socketserver.ThreadingUnixStreamServer(path, UnixSocketHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='unix-socket-listener', daemon=True).start()
+    return server
+
+
+class EventRingReader:
+    """
+    Collector side of the shared memory event ring, see docs/event-schema.md. Creates the
+    ring and reads the records the agent writes into it.
+    """
+
+    HEADER_BYTES = 256
+    WRAP = 0xFFFFFFFF
+
+    def __init__(self, path: str, capacity: int = 64 * 1024 * 1024):
+        self.path = path
+        self.capacity = max(64, capacity) & ~7
+        temporary = f"{path}.{os.getpid()}.tmp"
+        with open(temporary, 'wb') as f:
+            f.truncate(self.HEADER_BYTES + self.capacity)
+            f.write(b'DBGRING1' + struct.pack('<Q', self.capacity))
+        # A new file, an agent still mapping a ring left by an earlier run notices and maps this one
+        os.replace(temporary, path)
+        try:
+            os.mkfifo(path + '.wakeup')
+        except FileExistsError:
+            pass
+        self._file = open(path, 'r+b')
+        self._map = mmap.mmap(self._file.fileno(), 0)
+        self._data = memoryview(self._map)[self.HEADER_BYTES:]
+        # Read and write, so opening doesn't wait for the agent and select never sees EOF
+        self._wakeup_fd = os.open(path + '.wakeup', os.O_RDWR | os.O_NONBLOCK)
+        self._stopped = threading.Event()
+        self._thread = None
+        self.heartbeat()
+
+    def start(self, poll_interval: float = 0.05) -> None:
+        """Reads the ring on a thread of its own, waking up at least every poll_interval seconds."""
+        def read_forever():
+            while not self._stopped.is_set():
+                self.heartbeat()
+                if not self.read(_accept_ring_records):
+                    self.wait(poll_interval)
+
+        self._thread = threading.Thread(target=read_forever, name='event-ring-reader', daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stops reading and unmaps the ring, an agent notices from the heartbeat."""
+        self._stopped.set()
+        if self._thread is not None:
+            os.write(self._wakeup_fd, b'\0')
+            self._thread.join()
+        self.close()
+
+    def read(self, handle, max_records: int = MAX_BATCH_EVENTS) -> int:
+        """
+        Calls handle(views) with memoryviews of the records written since the last read, without
+        copying them out of the ring, and frees their room once handle returns.
+        """
+        read_pos = struct.unpack_from('<Q', self._map, 128)[0]
+        write_pos = struct.unpack_from('<Q', self._map, 64)[0]
+        views = []
+        while read_pos < write_pos and len(views) < max_records:
+            offset = read_pos % self.capacity
+            length = struct.unpack_from('<I', self._data, offset)[0]
+            if length == self.WRAP:
+                read_pos += self.capacity - offset
+                continue
+            views.append(self._data[offset + 4:offset + 4 + length])
+            read_pos += (4 + length + 7) & ~7
+        try:
+            if views:
+                handle(views)
+        finally:
+            for view in views:
+                view.release()
+            struct.pack_into('<Q', self._map, 128, read_pos)
+        return len(views)
+
+    def wait(self, timeout: float) -> None:
+        """Sleeps until the agent writes or timeout seconds have passed."""
+        struct.pack_into('<I', self._map, 136, 1)
+        try:
+            if struct.unpack_from('<Q', self._map, 128) == struct.unpack_from('<Q', self._map, 64):
+                if select.select([self._wakeup_fd], [], [], timeout)[0]:
+                    try:
+                        os.read(self._wakeup_fd, 4096)
+                    except BlockingIOError:
+                        pass
+        finally:
+            struct.pack_into('<I', self._map, 136, 0)
+
+    def heartbeat(self) -> None:
+        struct.pack_into('<Q', self._map, 144, time.time_ns())
+
+    def get_stats(self) -> Dict[str, Any]:
+        write_pos, dropped_events, dropped_bytes = struct.unpack_from('<QQQ', self._map, 64)
+        return {
+            'path': self.path,
+            'capacity': self.capacity,
+            'used': write_pos - struct.unpack_from('<Q', self._map, 128)[0],
+            'droppedEvents': dropped_events,
+            'droppedBytes': dropped_bytes
+        }
+
+    def close(self) -> None:
+        os.close(self._wakeup_fd)
+        self._data.release()
+        self._map.close()
+        self._file.close()
+
+
+def _accept_ring_records(views) -> None:
+    events = []
+    for view in views:
+        try:
+            # The only copy of the event, as json parses bytes
+            events.append(json.loads(bytes(view)))
+        except ValueError as e:
+            logger.warning(f"Failed to parse event from ring: {e}")
+    result = _accept_batch(events)
+    if result['status'] == 'error':
+        logger.warning(f"Rejected {len(events)} events from ring: {result['error']}")
+
+
+def serve_event_ring(path: str, capacity: int = 64 * 1024 * 1024) -> EventRingReader:
+    """Creates the event ring at path, reads it on a thread of its own and returns the reader."""
+    reader = EventRingReader(path, capacity)
+    reader.start()
+    return reader
+
+
+def _request_body() -> bytes:
+    if request.headers.get('Content-Encoding', '').lower() == 'gzip':
+        return gzip.decompress(request.get_data())
+    return request.get_data()
+
+
+def _store_event(event: Dict[str, Any]) -> None:
+    """Stores a valid event (for testing/debugging) and logs it."""
+    event_id = event.get('id')
+    event_name = event.get('name')
+    _events_received.append(resolve_snapshot_references(reconstruct_delta_snapshot(event)))
+
+    runtime = event.get('client', {}).get('runtime', 'unknown')
+    app_name = event.get('client', {}).get('applicationName', 'unknown')
+    logger.info(f"✓ Event accepted: {event_name} (id={event_id}, runtime={runtime}, app={app_name})")
+
+
 @app.route('/api/events', methods=['GET'])
 def list_events():
     """
@@ -287,6 +731,8 @@ def clear_events():
     global _events_received
     count = len(_events_received)
     _events_received = []
+    with _snapshot_bases_lock:
+        _snapshot_bases.clear()
     logger.info(f"Cleared {count} stored events")
     return jsonify({
         'status': 'cleared',
@@ -346,6 +792,22 @@ def main():
         action='store_true',
         help='Enable debug logging'
     )
+    parser.add_argument(
+        '--unix-socket',
+        default=os.getenv('EVENT_SINK_UNIX_SOCKET'),
+        help='Also accept event frames on this Unix socket (default: none)'
+    )
+    parser.add_argument(
+        '--ring',
+        default=os.getenv('EVENT_SINK_RING'),
+        help='Also read events from a shared memory ring created at this path, e.g. /dev/shm/debugin-events'
+    )
+    parser.add_argument(
+        '--ring-bytes',
+        type=int,
+        default=64 * 1024 * 1024,
+        help='Size of the event ring (default: 64 MiB)'
+    )
     parser.add_argument(
         '--workers',
         type=int,
@@ -363,6 +825,12 @@ def main():
     logger.info(f"Event schema: docs/event-schema.md")
     logger.info(f"Health check: GET http://{args.host}:{args.port}/health")
     logger.info(f"POST events: POST http://{args.host}:{args.port}/api/events")
+    if args.unix_socket:
+        serve_unix_socket(args.unix_socket)
+        logger.info(f"Event frames: unix://{args.unix_socket}")
+    if args.ring:
+        serve_event_ring(args.ring, args.ring_bytes)
+        logger.info(f"Event ring: ring://{args.ring}")
 
     try:
         app.run(
@@ -0,0 +1,169 @@
+"""
+Tests for the compact binary batch encoding and its negotiation with the event sink.
+"""
+
+import gzip
+import json
+import os
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from scripts import event_sink
+from scripts.event_sink import decode_binary_batch
+from test_support.event_capture import construct_event
+from tracepointdebug.broker import broker_manager
+from tracepointdebug.broker.binary_batch import BINARY, CONTENT_TYPE, BinaryBatchEncoder, supports_binary_batches
+from tracepointdebug.broker.broker_manager import BrokerManager
+from tracepointdebug.broker.event_batcher import EventBatcher, NDJSON
+from tracepointdebug.probe.encoder import to_json
+from tracepointdebug.probe.frame import Frame
+from tracepointdebug.probe.snapshot.value import Value
+from tracepointdebug.probe.snapshot.variable import Variable
+from tracepointdebug.probe.snapshot.variables import Variables
+
+
+def _snapshot_event(i):
+    order = Value("dict", {"id": Value("int", i), "total": Value("float", -12.5 * i),
+                           "note": Value("str", "café \U0001F600 %d" % i), "paid": Value("bool", i % 2 == 0)})
+    variables = Variables([Variable("order", "dict", order), Variable("retries", "int", Value("int", -(2 ** 40)))])
+    return {"name": "TracePointSnapshotEvent", "id": "e-%d" % i, "lineNo": 10, "traceId": None,
+            "frames": [Frame(10, variables, "app/orders.py", "checkout")], "tags": ("a", "b"), 7: "int key"}
+
+
+def _encode(events):
+    encoder = BinaryBatchEncoder()
+    for event in events:
+        encoder.add(event)
+    return encoder.getvalue()
+
+
+class TestBinaryBatchEncoder:
+    """Test encoding against the reference sink's decoder."""
+
+    def test_round_trip_matches_json(self):
+        events = [_snapshot_event(i) for i in range(3)]
+
+        assert decode_binary_batch(_encode(events)) == [json.loads(to_json(event)) for event in events]
+
+    def test_keys_and_names_are_written_once_per_batch(self):
+        encoder = BinaryBatchEncoder()
+        first = encoder.add(_snapshot_event(1))
+        second = encoder.add(_snapshot_event(1))
+
+        assert second < first / 2
+        assert len(_encode([_snapshot_event(1)])) == len(BinaryBatchEncoder()) + first
+        assert len(encoder.getvalue()) * 2 < len(b"\n".join(to_json(_snapshot_event(1)).encode() for _ in range(2)))
+
+    def test_failed_event_leaves_the_batch_as_it_was(self):
+        encoder = BinaryBatchEncoder()
+        encoder.add({"kept": 1})
+        with pytest.raises(TypeError):
+            encoder.add({"newKey": "x", "type": "newName", "broken": object()})
+        encoder.add({"newKey": "y", "type": "otherName"})
+
+        assert decode_binary_batch(encoder.getvalue()) == [{"kept": 1}, {"newKey": "y", "type": "otherName"}]
+        assert encoder.events == 2
+
+    def test_garbled_batches_are_refused(self):
+        body = _encode([_snapshot_event(1)])
+
+        for garbled in (b'{"id": 1}', body[:-3], body[:5] + b'\x7f'):
+            with pytest.raises(ValueError):
+                decode_binary_batch(garbled)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    received = []
+    refuse_binary = False
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        if self.headers.get("Content-Encoding") == "gzip":
+            body = gzip.decompress(body)
+        binary = self.headers["Content-Type"] == CONTENT_TYPE
+        if binary and _Handler.refuse_binary:
+            self.send_response(415)
+        else:
+            _Handler.received.append((self.headers["Content-Type"],
+                                      decode_binary_batch(body) if binary else
+                                      [json.loads(line) for line in body.splitlines()]))
+            self.send_response(200)
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def sink():
+    _Handler.received = []
+    _Handler.refuse_binary = False
+    server = HTTPServer(("127.0.0.1", 0), _Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield "http://127.0.0.1:%d" % server.server_address[1]
+    server.shutdown()
+    server.server_close()
+
+
+class TestBinaryBatches:
+    """Test the batcher and the reference sink with binary batches."""
+
+    def _batcher(self, sink):
+        batcher = EventBatcher(sink, lambda event: to_json(event).encode("utf-8"), max_events=2, max_delay_ms=60000,
+                               retries=1, batch_format=BINARY)
+        batcher.start()
+        return batcher
+
+    def test_batches_are_posted_binary(self, sink):
+        batcher = self._batcher(sink)
+        for i in range(3):
+            batcher.submit(_snapshot_event(i))
+
+        assert batcher.flush(5)
+        batcher.stop()
+        assert [content_type for content_type, _ in _Handler.received] == [CONTENT_TYPE, CONTENT_TYPE]
+        assert [event["id"] for _, events in _Handler.received for event in events] == ["e-0", "e-1", "e-2"]
+        assert batcher.get_stats()["format"] == BINARY
+
+    def test_falls_back_to_ndjson_when_the_sink_refuses_binary(self, sink):
+        _Handler.refuse_binary = True
+        batcher = self._batcher(sink)
+        for i in range(3):
+            batcher.submit(_snapshot_event(i))
+
+        assert batcher.flush(5)
+        batcher.stop()
+        assert [content_type for content_type, _ in _Handler.received] == ["application/x-ndjson"] * 2
+        assert [event["id"] for _, events in _Handler.received for event in events] == ["e-0", "e-1", "e-2"]
+        assert batcher.get_stats()["format"] == NDJSON
+
+    def test_reference_sink_advertises_and_accepts_binary_batches(self):
+        client = event_sink.app.test_client()
+        client.post('/api/events/clear')
+        events = [construct_event(name='probe.hit.logpoint', payload={
+            'probeId': 'lp-1', 'probeType': 'logpoint', 'file': 'app.py', 'line': line, 'message': 'hi'})
+            for line in (1, 2)]
+
+        assert supports_binary_batches(client.get('/health').get_json())
+        response = client.post('/api/events/batch', data=_encode(events + [{'name': 'probe.hit.logpoint'}]),
+                               headers={'Content-Type': CONTENT_TYPE})
+        assert response.status_code == 200
+        assert (response.get_json()['accepted'], [item['index'] for item in response.get_json()['rejected']]) == \
+               (2, [2])
+        assert client.post('/api/events/batch', data=b'DBGB\x01\x05\x10',
+                           headers={'Content-Type': CONTENT_TYPE}).status_code == 400
+
+    def test_broker_manager_only_sends_binary_to_sinks_that_list_it(self, monkeypatch, tmp_path):
+        monkeypatch.setattr(broker_manager, "EVENT_BATCH_FORMAT", "binary")
+        monkeypatch.setattr(broker_manager, "EVENT_SPOOL_DIR", str(tmp_path))
+        manager = BrokerManager()
+
+        manager._on_sink_healthy({"batch": {"supported": True, "formats": ["ndjson", "json"]}})
+        assert manager._batch_format() == NDJSON
+        manager._on_sink_healthy({"batch": {"supported": True, "formats": ["ndjson", "json", "binary"]}})
+        assert manager._batch_format() == BINARY
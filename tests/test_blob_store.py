@@ -0,0 +1,132 @@
+"""
+Tests for offloading large snapshots to the memory-mapped blob store.
+"""
+
+import json
+import os
+import sys
+import zlib
+from unittest.mock import patch
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tracepointdebug.control_api import ControlAPI
+from tracepointdebug.probe.frame import Frame
+from tracepointdebug.probe.snapshot.blob_store import SnapshotBlobStore, offload_frames
+from tracepointdebug.probe.snapshot.value import Value
+from tracepointdebug.probe.snapshot.variable import Variable
+from tracepointdebug.probe.snapshot.variables import Variables
+
+
+@pytest.fixture
+def store(tmp_path):
+    blob_store = SnapshotBlobStore(path=str(tmp_path / "snapshots.blobs"), capacity=100)
+    yield blob_store
+    blob_store.close()
+
+
+def _frames(body):
+    variables = Variables([Variable("body", "str", Value("str", body))])
+    return [Frame(12, variables, "app/handlers.py", "upload")]
+
+
+class TestSnapshotBlobStore:
+    """Test the ring file and its oldest first eviction."""
+
+    def test_put_and_get(self, store):
+        ref = store.put(b"x" * 40)
+
+        assert (ref.offset, ref.length) == (0, 40)
+        assert ref.to_json()["checksum"] == "crc32:%08x" % zlib.crc32(b"x" * 40)
+        assert store.get(ref.blob_id) == b"x" * 40
+
+    def test_wrapping_evicts_oldest_first(self, store):
+        first, second, third = store.put(b"a" * 40), store.put(b"b" * 40), store.put(b"c" * 30)
+
+        assert (third.offset, store.get(first.blob_id)) == (0, None)
+        assert store.get(second.blob_id) == b"b" * 40
+
+        fourth = store.put(b"d" * 40)
+
+        assert fourth.offset == 30 and store.get(second.blob_id) is None
+        assert store.evicted == 2
+
+    def test_blob_larger_than_ring_is_rejected(self, store):
+        assert store.put(b"x" * 101) is None
+        assert store.get_stats()["blobs"] == 0
+
+
+class TestRingFile:
+    """Test that the ring file is private to the agent and removed with the store."""
+
+    def test_default_file_is_private_and_removed_on_close(self):
+        store = SnapshotBlobStore(path=None, capacity=100)
+        store.put(b"x" * 40)
+        path, directory = store._file_path, store._directory
+
+        assert os.stat(path).st_mode & 0o777 == 0o600
+        assert os.stat(directory).st_mode & 0o777 == 0o700
+
+        store.close()
+
+        assert not os.path.exists(path) and not os.path.exists(directory)
+
+    def test_symlink_is_not_followed(self, tmp_path):
+        target = tmp_path / "target"
+        target.write_bytes(b"keep")
+        os.symlink(str(target), str(tmp_path / "snapshots.blobs"))
+        store = SnapshotBlobStore(path=str(tmp_path / "snapshots.blobs"), capacity=100)
+
+        assert store.put(b"x" * 40) is None
+        assert target.read_bytes() == b"keep"
+
+    def test_file_left_by_a_crashed_process_is_replaced(self, tmp_path):
+        path = tmp_path / "snapshots.blobs"
+        path.write_bytes(b"old")
+        os.chmod(str(path), 0o644)
+        store = SnapshotBlobStore(path=str(path), capacity=100)
+        try:
+            ref = store.put(b"x" * 40)
+
+            assert store.get(ref.blob_id) == b"x" * 40
+            assert os.stat(str(path)).st_mode & 0o777 == 0o600
+        finally:
+            store.close()
+
+
+class TestOffloadFrames:
+    """Test the event side of an offloaded snapshot."""
+
+    def test_event_keeps_frames_without_variables(self, tmp_path):
+        store = SnapshotBlobStore(path=str(tmp_path / "snapshots.blobs"), capacity=4096)
+        try:
+            summary, ref = offload_frames(_frames("y" * 1000), store)
+
+            full = json.loads(store.get(ref.blob_id))
+        finally:
+            store.close()
+
+        assert summary == [{"lineNo": 12, "variables": {}, "fileName": "app/handlers.py", "methodName": "upload"}]
+        assert full[0]["variables"]["body"]["@value"] == "y" * 1000
+
+    def test_frames_stay_inline_when_the_ring_is_too_small(self, store):
+        frames = _frames("y" * 1000)
+
+        assert offload_frames(frames, store) == (frames, None)
+
+
+class TestBlobEndpoint:
+    """Test streaming blobs through GET /blobs/<id>."""
+
+    def test_stream_and_evicted_blob(self, store):
+        ref = store.put(b'[{"lineNo": 1}]')
+        client = ControlAPI(port=5001, host='127.0.0.1').app.test_client()
+
+        with patch.object(SnapshotBlobStore, 'instance', return_value=store):
+            found = client.get('/blobs/%d' % ref.blob_id)
+            missing = client.get('/blobs/%d' % (ref.blob_id + 1))
+
+        assert found.status_code == 200 and found.data == b'[{"lineNo": 1}]'
+        assert missing.status_code == 404 and missing.get_json()["code"] == "BLOB_NOT_FOUND"
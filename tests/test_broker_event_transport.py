@@ -0,0 +1,307 @@
+"""
+Tests for sending events over the broker websocket and for permessage-deflate in the
+asyncio websocket client.
+"""
+
+import asyncio
+import json
+import os
+import sys
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tracepointdebug.broker import broker_client, broker_manager
+from tracepointdebug.broker.async_ws import AsyncWebSocket, PerMessageDeflate, WebSocketClosed, accept_key
+from tracepointdebug.broker.broker_client import AsyncBrokerConnection, BrokerConnection
+from tracepointdebug.broker.broker_credentials import BrokerCredentials
+from tracepointdebug.broker.broker_event_transport import BrokerEventTransport
+from tracepointdebug.broker.broker_manager import BrokerManager
+from tracepointdebug.broker.event_batcher import EventBatcher, PartialSendError
+from tracepointdebug.broker.io_loop import IOLoop
+
+
+def _wait_for(predicate, timeout=5):
+    deadline = time.time() + timeout
+    while not predicate() and time.time() < deadline:
+        time.sleep(0.01)
+    return predicate()
+
+
+class _Broker(object):
+    """A websocket server recording the messages it gets, accepting permessage-deflate when offered."""
+
+    def __init__(self, deflate=True):
+        self.deflate = deflate
+        self.offered = None
+        self.messages = []
+        self.compressed_frames = 0
+
+    async def _serve(self, reader, writer):
+        key = None
+        while True:
+            line = (await reader.readline()).decode("latin-1").strip()
+            if not line:
+                break
+            name, _, value = line.partition(":")
+            if name.lower() == "sec-websocket-key":
+                key = value.strip()
+            elif name.lower() == "sec-websocket-extensions":
+                self.offered = value.strip()
+        extension = self.deflate and self.offered is not None
+        writer.write(("HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n"
+                      "Sec-WebSocket-Accept: %s\r\n%s\r\n" % (
+                          accept_key(key), "Sec-WebSocket-Extensions: permessage-deflate\r\n" if extension else ""))
+                     .encode("latin-1"))
+        server_side = AsyncWebSocket(reader, writer, PerMessageDeflate({}) if extension else None)
+        read_frame = server_side._read_frame
+
+        async def counting_read_frame():
+            frame = await read_frame()
+            self.compressed_frames += frame[1]
+            return frame
+
+        server_side._read_frame = counting_read_frame
+        try:
+            while True:
+                message = await server_side.recv()
+                self.messages.append(message)
+                if message == "ping me":
+                    await server_side.send("pong " * 50)
+        except WebSocketClosed:
+            pass
+
+    def start(self):
+        async def start():
+            return await asyncio.start_server(self._serve, "127.0.0.1", 0)
+
+        self.server = IOLoop.instance().submit(start()).result(5)
+        return self.server.sockets[0].getsockname()[1]
+
+    def stop(self):
+        IOLoop.instance().call_soon(self.server.close)
+
+    def events(self):
+        return [json.loads(line) for message in self.messages if isinstance(message, bytes)
+                for line in message.splitlines()]
+
+
+def _credentials():
+    return BrokerCredentials(api_key="key", app_instance_id="instance", app_name="app", app_stage="test",
+                             app_version="1", runtime="python", hostname="host")
+
+
+class _FlakyConnection(object):
+    """A connected broker connection taking one event per frame, whose second frame times out once."""
+
+    event_frame_backoffs = 0
+
+    def __init__(self):
+        self.frames = []
+        self.calls = 0
+
+    def is_connected(self):
+        return True
+
+    def event_frame_bytes(self):
+        return 1
+
+    def send_event_frame(self, frame, timeout):
+        self.calls += 1
+        if self.calls == 2:
+            raise TimeoutError("no room in the send buffer")
+        self.frames.append(frame)
+
+
+def _lines(count, size=100):
+    return [json.dumps({"id": "e-%d" % i, "message": "x" * size}).encode("utf-8") for i in range(count)]
+
+
+class TestPerMessageDeflate:
+    """Test permessage-deflate against a local server that accepts it."""
+
+    def test_messages_are_compressed_both_ways(self):
+        broker = _Broker()
+        port = broker.start()
+
+        async def talk():
+            ws = await AsyncWebSocket.connect("ws://127.0.0.1:%d/app" % port, deflate=True)
+            for _ in range(3):
+                await ws.send(b"event " * 100)
+            await ws.send("ping me")
+            reply = await ws.recv()
+            await ws.close()
+            return ws.deflate, reply
+
+        try:
+            negotiated, reply = IOLoop.instance().submit(talk()).result(5)
+        finally:
+            broker.stop()
+        assert broker.offered.startswith("permessage-deflate")
+        assert negotiated is not None and reply == "pong " * 50
+        assert _wait_for(lambda: len(broker.messages) == 4)
+        assert broker.messages[:3] == [b"event " * 100] * 3 and broker.compressed_frames == 3
+
+    def test_declined_extension_sends_plain_frames(self):
+        broker = _Broker(deflate=False)
+        port = broker.start()
+
+        async def talk():
+            ws = await AsyncWebSocket.connect("ws://127.0.0.1:%d/app" % port, deflate=True)
+            await ws.send(b"event " * 100)
+            await ws.close()
+            return ws.deflate
+
+        try:
+            assert IOLoop.instance().submit(talk()).result(5) is None
+        finally:
+            broker.stop()
+        assert _wait_for(lambda: broker.messages == [b"event " * 100]) and broker.compressed_frames == 0
+
+
+class TestBrokerEventTransport:
+    """Test batches of events sent as binary messages over the broker connection."""
+
+    def test_batches_are_split_into_binary_frames(self):
+        broker = _Broker()
+        port = broker.start()
+        connection = AsyncBrokerConnection("ws://127.0.0.1", port, _credentials(), lambda conn, msg: None,
+                                           lambda: connection.send("hello"), IOLoop.instance(), deflate=True)
+        transport = BrokerEventTransport(lambda: connection, frame_bytes=1000)
+        try:
+            assert transport.check_health() is None
+            with pytest.raises(ConnectionError):
+                transport.send_batch(_lines(1))
+            connection.connect()
+            assert _wait_for(lambda: transport.check_health() is not None)
+            answer = transport.send_batch(_lines(25))
+            assert _wait_for(lambda: len(broker.events()) == 25)
+        finally:
+            connection.close()
+            broker.stop()
+        assert answer == {"status": "accepted", "accepted": 25, "rejected": []}
+        assert broker.messages[0] == "hello" and [event["id"] for event in broker.events()] == \
+               ["e-%d" % i for i in range(25)]
+        # 7 events of about 130 bytes fit in a frame, "hello" is too short to compress
+        assert transport.get_stats()["frames"] == 4 and broker.compressed_frames == 4
+
+    def test_control_messages_are_not_held_behind_event_frames(self, monkeypatch):
+        broker = _Broker()
+        port = broker.start()
+        connection = AsyncBrokerConnection("ws://127.0.0.1", port, _credentials(), lambda conn, msg: None,
+                                           lambda: None, IOLoop.instance())
+        transport = BrokerEventTransport(lambda: connection, timeout=0.3)
+        try:
+            connection.connect()
+            assert _wait_for(lambda: transport.check_health() is not None)
+            # The write buffer never has room for event frames
+            monkeypatch.setattr(broker_client, "EVENT_FRAME_WRITE_BUFFER", 0)
+            with pytest.raises(TimeoutError):
+                transport.send_batch(_lines(1))
+            connection.send("status")
+            assert _wait_for(lambda: broker.messages == ["status"])
+            assert connection.event_frame_backoffs > 0
+            monkeypatch.setattr(broker_client, "EVENT_FRAME_WRITE_BUFFER", 256 * 1024)
+            transport.send_batch(_lines(2))
+            assert _wait_for(lambda: len(broker.events()) == 2)
+        finally:
+            connection.close()
+            broker.stop()
+        # The timed out frame was dropped from the queue, not sent late
+        assert [event["id"] for event in broker.events()] == ["e-0", "e-1"]
+
+    def test_thread_mode_connection_sends_binary_frames(self):
+        broker = _Broker()
+        port = broker.start()
+        connection = BrokerConnection("ws://127.0.0.1", port, _credentials(), lambda conn, msg: None, lambda: None)
+        transport = BrokerEventTransport(lambda: connection)
+        try:
+            connection.connect()
+            assert _wait_for(lambda: transport.check_health() is not None)
+            transport.send_batch(_lines(3))
+            assert _wait_for(lambda: len(broker.events()) == 3)
+        finally:
+            connection.close()
+            broker.stop()
+        assert all(isinstance(message, bytes) for message in broker.messages)
+
+    def test_thread_mode_frames_fit_the_send_buffer(self, monkeypatch):
+        broker = _Broker()
+        port = broker.start()
+        connection = BrokerConnection("ws://127.0.0.1", port, _credentials(), lambda conn, msg: None, lambda: None)
+        transport = BrokerEventTransport(lambda: connection)
+        # An empty buffer that takes frames of 400 bytes
+        capacity = 400 + broker_client.EVENT_FRAME_OVERHEAD
+        monkeypatch.setattr(broker_client, "_send_buffer_room", lambda sock: (capacity, capacity))
+        try:
+            connection.connect()
+            assert _wait_for(lambda: transport.check_health() is not None)
+            transport.send_batch(_lines(9))
+            assert _wait_for(lambda: len(broker.events()) == 9)
+        finally:
+            connection.close()
+            broker.stop()
+        assert transport.get_stats()["frames"] == 3
+        assert all(len(message) <= 400 for message in broker.messages)
+
+    def test_failure_after_the_first_frames_reports_what_was_sent(self):
+        connection = _FlakyConnection()
+        transport = BrokerEventTransport(lambda: connection)
+
+        with pytest.raises(PartialSendError) as raised:
+            transport.send_batch(_lines(4))
+
+        assert raised.value.sent == 1
+        assert transport.get_stats()["frames"] == 1
+
+    def test_batcher_only_sends_the_unsent_events_again(self):
+        connection = _FlakyConnection()
+        batcher = EventBatcher("http://unused", lambda event: json.dumps(event).encode("utf-8"), max_events=4,
+                               max_delay_ms=60000, retries=3, backoff=0.01,
+                               transport=BrokerEventTransport(lambda: connection))
+        batcher.start()
+        for i in range(4):
+            batcher.submit({"id": i})
+        assert batcher.flush(10)
+        batcher.stop()
+
+        # Retried events join a later batch in no set order, but each one goes out once
+        assert sorted(json.loads(frame)["id"] for frame in connection.frames) == [0, 1, 2, 3]
+        assert (batcher.get_stats()["sentEvents"], batcher.get_stats()["failedEvents"]) == (4, 0)
+
+    def test_thread_mode_frames_wait_for_room_before_writing(self, monkeypatch):
+        broker = _Broker()
+        port = broker.start()
+        connection = BrokerConnection("ws://127.0.0.1", port, _credentials(), lambda conn, msg: None, lambda: None)
+        transport = BrokerEventTransport(lambda: connection, timeout=0.3)
+        send_buffer_room = broker_client._send_buffer_room
+        try:
+            connection.connect()
+            assert _wait_for(lambda: transport.check_health() is not None)
+            # The send buffer is full, frames are not written and control messages still are
+            monkeypatch.setattr(broker_client, "_send_buffer_room", lambda sock: (0, 64 * 1024))
+            with pytest.raises(TimeoutError):
+                transport.send_batch(_lines(1))
+            connection.send("status")
+            assert _wait_for(lambda: broker.messages == ["status"])
+            assert connection.event_frame_backoffs > 0
+            monkeypatch.setattr(broker_client, "_send_buffer_room", send_buffer_room)
+            transport.send_batch(_lines(2))
+            assert _wait_for(lambda: len(broker.events()) == 2)
+        finally:
+            connection.close()
+            broker.stop()
+        # The timed out frame was never written
+        assert [event["id"] for event in broker.events()] == ["e-0", "e-1"]
+
+    def test_broker_manager_spools_until_the_broker_connects(self, monkeypatch, tmp_path):
+        monkeypatch.setattr(broker_manager, "EVENT_SINK_URL", "broker://")
+        monkeypatch.setattr(broker_manager, "EVENT_SPOOL_DIR", str(tmp_path))
+        manager = BrokerManager()
+
+        assert isinstance(manager._transport, BrokerEventTransport)
+        assert manager._circuit_breaker.is_open
+        assert manager.get_process_pool() is None
+        assert manager.get_stats()["transport"]["connected"] is False
@@ -0,0 +1,159 @@
+"""
+Tests for per probe capture profiles.
+"""
+
+import json
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tracepointdebug.probe.breakpoints.tracepoint.trace_point import TracePoint
+from tracepointdebug.probe.breakpoints.tracepoint.trace_point_config import TracePointConfig
+from tracepointdebug.probe.coded_exception import CodedException
+from tracepointdebug.probe.encoder import to_json
+from tracepointdebug.probe.errors import INVALID_CAPTURE_PROFILE
+from tracepointdebug.probe.snapshot import SnapshotCollector, deferred_capture
+from tracepointdebug.probe.snapshot import snapshot_collector_config_manager as config_manager
+from tracepointdebug.probe.snapshot.capture_profile import CaptureProfile, WatchExpression
+from tracepointdebug.probe.snapshot.snapshot_memory_budget import SnapshotMemoryBudget, FRAME_SIZE_ESTIMATE
+
+
+@pytest.fixture
+def snapshot_config():
+    """Snapshot config overrides, restored after the test."""
+    saved = dict(config_manager.snapshot_configs)
+    yield config_manager.snapshot_configs
+    config_manager.snapshot_configs.clear()
+    config_manager.snapshot_configs.update(saved)
+
+
+class Order(object):
+    def __init__(self):
+        self.id = 7
+        self.customer = {"name": "Ada", "tier": "gold"}
+        self._secret = "s3cret"
+
+
+def _encode_frames(snapshot):
+    return json.loads(to_json(snapshot.frames))
+
+
+class TestCaptureProfile:
+    """Test parsing and validation of capture profiles."""
+
+    def test_from_json_clamps_limits(self):
+        profile = CaptureProfile.from_json({"maxFrames": 100, "maxParseDepth": 2, "maxSize": 500})
+
+        assert profile.get_max_frames() == config_manager.MAX_SNAPSHOT_CONFIGS.MAX_FRAMES
+        assert profile.get_parse_depth() == 2
+        assert profile.get_max_size() == 500
+        assert profile.to_json() == {"maxFrames": config_manager.MAX_SNAPSHOT_CONFIGS.MAX_FRAMES,
+                                     "maxParseDepth": 2, "maxSize": 500}
+
+    def test_missing_limits_fall_back_to_global_config(self, snapshot_config):
+        profile = CaptureProfile.from_json({"variables": ["order"]})
+        snapshot_config["maxFrames"] = 3
+
+        assert profile.get_max_frames() == 3
+        assert profile.get_max_properties() == snapshot_config["maxProperties"]
+
+    @pytest.mark.parametrize("profile", [
+        {"maxFrames": -1},
+        {"maxSize": "big"},
+        {"variables": "order"},
+        {"watchExpressions": [1]},
+        [],
+    ])
+    def test_invalid_profiles_are_rejected(self, profile):
+        with pytest.raises(ValueError):
+            CaptureProfile.from_json(profile)
+
+    @pytest.mark.parametrize("expression", [
+        "order.save()",
+        "order.__class__",
+        "order._secret",
+        "[x for x in order]",
+        "lambda: 1",
+        "order.id +",
+    ])
+    def test_unsafe_watch_expressions_are_rejected(self, expression):
+        with pytest.raises(ValueError):
+            WatchExpression(expression)
+
+    def test_watch_expression_names(self):
+        watch = WatchExpression("order.customer['tier'] == tier and not closed")
+
+        assert sorted(watch.names) == ["closed", "order", "tier"]
+
+    def test_invalid_profile_fails_tracepoint(self):
+        config = TracePointConfig("tp", file="app.py", line=1, client="test",
+                                  capture_profile={"watchExpressions": ["order.delete()"]})
+
+        with pytest.raises(CodedException) as exc_info:
+            TracePoint(None, config, None)
+
+        assert exc_info.value.code == INVALID_CAPTURE_PROFILE.code
+
+
+class TestProfileCapture:
+    """Test snapshots taken with a capture profile."""
+
+    def test_allowlist_limits_captured_variables(self, snapshot_config):
+        order = Order()
+        total = 42
+        ignored = "not captured"
+        profile = CaptureProfile.from_json({"variables": ["order", "total", "missing"], "maxFrames": 1})
+
+        frames = _encode_frames(SnapshotCollector(profile=profile).collect(sys._getframe()))
+
+        assert len(frames) == 1
+        assert sorted(frames[0]["variables"]) == ["order", "total"]
+
+    def test_watches_are_captured_on_top_frame(self, snapshot_config):
+        order = Order()
+        profile = CaptureProfile.from_json({"variables": [], "maxFrames": 2,
+                                            "watchExpressions": ["order.customer['tier']", "order.id > 5",
+                                                                 "order.missing"]})
+
+        frames = _encode_frames(SnapshotCollector(profile=profile).collect(sys._getframe()))
+
+        watches = frames[0]["watches"]
+        assert watches["order.customer['tier']"]["@value"] == "gold"
+        assert watches["order.id > 5"]["@value"] is True
+        assert watches["order.missing"]["@type"] == "EvaluationError"
+        assert frames[0]["variables"] == {}
+        assert "watches" not in frames[1]
+
+    def test_profile_depth_applies(self, snapshot_config):
+        order = Order()
+        profile = CaptureProfile.from_json({"variables": ["order"], "maxParseDepth": 1})
+
+        frames = _encode_frames(SnapshotCollector(profile=profile).collect(sys._getframe()))
+
+        assert frames[0]["variables"]["order"]["@value"] == {}
+
+    def test_deferred_copy_keeps_allowlisted_and_watched_locals(self, snapshot_config):
+        order = Order()
+        total = 42
+        ignored = "not copied"
+        profile = CaptureProfile.from_json({"variables": ["total"], "maxFrames": 1,
+                                            "watchExpressions": ["order.id"]})
+        collector = SnapshotCollector(profile=profile)
+
+        captured = deferred_capture.copy_frames(collector, sys._getframe())
+        frames = _encode_frames(collector.collect(captured))
+
+        assert sorted(captured.f_locals) == ["order", "total"]
+        assert list(frames[0]["variables"]) == ["total"]
+        assert frames[0]["watches"]["order.id"]["@value"] == 7
+
+    def test_budget_reserves_profile_size(self, snapshot_config):
+        profile = CaptureProfile.from_json({"maxSize": 100, "maxFrames": 1})
+
+        reservation = SnapshotMemoryBudget().reserve(profile)
+
+        assert reservation.size == 100 + FRAME_SIZE_ESTIMATE
+        assert reservation.max_size == 100
@@ -13,6 +13,8 @@ from unittest.mock import Mock, patch, MagicMock
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from tracepointdebug.control_api import ControlAPI
+from tracepointdebug.probe.coded_exception import CodedException
+from tracepointdebug.probe.errors import SNAPSHOT_OBJECT_COLLECTED
 from test_support.event_capture import EventSinkServer, construct_event, post_event_directly
 
 
@@ -394,5 +396,66 @@ class TestMetadata:
         assert api.point_ids[point_id]['hit_count'] == 5
 
 
+class TestStatsEndpoint:
+    """Test the GET /stats endpoint."""
+
+    @pytest.fixture
+    def api(self):
+        return ControlAPI(port=5001, host='127.0.0.1')
+
+    def test_stats_reports_snapshot_memory(self, api):
+        """Snapshot memory budget usage is reported"""
+        response = api.app.test_client().get('/stats')
+
+        assert response.status_code == 200
+        body = response.get_json()
+        assert body["ok"] is True
+        assert set(body["snapshotMemory"]) >= {"budgetBytes", "inFlightBytes", "inFlightSnapshots", "captures"}
+
+    def test_stats_reports_trace_points(self, api):
+        """Per tracepoint counters come from the tracepoint manager"""
+        api.tracepoint_manager = Mock()
+        api.tracepoint_manager.get_stats.return_value = {"tp-1": {"snapshots": 3, "timeTruncated": 1}}
+
+        body = api.app.test_client().get('/stats').get_json()
+
+        assert body["tracePoints"] == {"tp-1": {"snapshots": 3, "timeTruncated": 1}}
+
+
+class TestExpandSnapshotEndpoint:
+    """Test the POST /snapshots/<id>/expand endpoint."""
+
+    @pytest.fixture
+    def api(self):
+        return ControlAPI(port=5001, host='127.0.0.1')
+
+    def test_expand_returns_value(self, api):
+        """A registered handle is serialized on demand"""
+        with patch('tracepointdebug.control_api.expand_snapshot_value',
+                   return_value={"@type": "dict", "@value": {}}) as expand:
+            response = api.app.test_client().post('/snapshots/snap-1/expand',
+                                                  json={"handle": 3, "path": ["a"], "depth": 2})
+
+        assert response.status_code == 200
+        assert response.get_json()["value"] == {"@type": "dict", "@value": {}}
+        expand.assert_called_once_with("snap-1", 3, ["a"], 2)
+
+    def test_collected_and_unknown_handles(self, api):
+        """A collected object is reported apart from a handle that is unknown or expired"""
+        client = api.app.test_client()
+        with patch('tracepointdebug.control_api.expand_snapshot_value',
+                   side_effect=CodedException(SNAPSHOT_OBJECT_COLLECTED, (3, "snap-1"))):
+            collected = client.post('/snapshots/snap-1/expand', json={"handle": 3})
+        unknown = client.post('/snapshots/no-such-snapshot/expand', json={"handle": 3})
+
+        assert collected.status_code == 410 and collected.get_json()["code"] == "OBJECT_COLLECTED"
+        assert unknown.status_code == 404 and unknown.get_json()["code"] == "HANDLE_NOT_FOUND"
+
+    def test_handle_is_required(self, api):
+        response = api.app.test_client().post('/snapshots/snap-1/expand', json={"path": []})
+
+        assert response.status_code == 400
+
+
 if __name__ == '__main__':
     pytest.main([__file__, '-v'])
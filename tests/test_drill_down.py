@@ -0,0 +1,180 @@
+"""
+Tests for drill-down snapshots: shallow capture with handles and on-demand expansion.
+"""
+
+import gc
+import json
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tracepointdebug.probe.coded_exception import CodedException
+from tracepointdebug.probe.encoder import to_json
+from tracepointdebug.probe.errors import SNAPSHOT_HANDLE_NOT_FOUND, SNAPSHOT_OBJECT_COLLECTED, SNAPSHOT_PATH_NOT_FOUND
+from tracepointdebug.probe.snapshot import SnapshotCollector
+from tracepointdebug.probe.snapshot import snapshot_collector_config_manager as config_manager
+from tracepointdebug.probe.snapshot.drill_down import DrillDownCache, expand_snapshot_value
+from tracepointdebug.probe.snapshot.redaction import DEFAULT_MASK, set_redaction_rules
+from tracepointdebug.probe.snapshot.type_serializers import register_serializer, unregister_serializer
+
+
+@pytest.fixture
+def drill_down():
+    """Turns drill-down on at one level and restores the snapshot config afterwards."""
+    saved_configs = dict(config_manager.snapshot_configs)
+    config_manager.snapshot_configs.update({"maxFrames": 1, "drillDownDepth": 1})
+    yield config_manager.snapshot_configs
+    config_manager.snapshot_configs.clear()
+    config_manager.snapshot_configs.update(saved_configs)
+
+
+class Order(object):
+    def __init__(self, customer=None):
+        self.customer = customer
+        self.lines = [{"sku": "A-1", "qty": 2}]
+
+
+class Customer(object):
+    def __init__(self):
+        self.name = "Ada"
+
+
+def _capture(snapshot_id):
+    """Captures the caller's frame and registers its handles under snapshot_id, as a tracepoint does."""
+    collector = SnapshotCollector()
+    frames = json.loads(to_json(collector.collect(sys._getframe(1)).frames))
+    DrillDownCache.instance().store(snapshot_id, collector.drill_down_refs)
+    return frames[0]["variables"]
+
+
+def _expand(snapshot_id, handle, path=(), depth=None):
+    return json.loads(to_json(expand_snapshot_value(snapshot_id, handle, path, depth)))
+
+
+class TestDrillDownCapture:
+    """Test that hits capture only the first levels and hand out handles below them."""
+
+    def test_nested_objects_get_handles(self, drill_down):
+        order = Order(Customer())
+
+        variables = _capture("capture-1")
+
+        customer = variables["order"]["@value"]["customer"]
+        assert customer["@type"] == "Customer" and "@value" not in customer
+        assert isinstance(customer["@handle"], int)
+        assert variables["order"]["@value"]["lines"]["@handle"] != customer["@handle"]
+
+    def test_leaves_at_the_cutoff_are_kept(self, drill_down):
+        order = Order(customer="Ada")
+
+        variables = _capture("capture-2")
+
+        assert variables["order"]["@value"]["customer"] == {"@type": "str", "@value": "Ada"}
+
+    def test_disabled_by_default(self):
+        order = Order(Customer())
+
+        collector = SnapshotCollector(parse_depth=1)
+        variables = json.loads(to_json(collector.collect(sys._getframe()).frames))[0]["variables"]
+
+        assert "customer" not in variables["order"]["@value"]
+        assert collector.drill_down_refs is None
+
+    def test_redacted_names_at_the_cutoff_are_masked(self, drill_down):
+        set_redaction_rules({"names": ["secrets"]})
+        try:
+            config = {"secrets": {"key": "k3y"}}
+
+            variables = _capture("capture-3")
+        finally:
+            set_redaction_rules(None)
+
+        assert variables["config"]["@value"]["secrets"] == {"@type": "dict", "@value": DEFAULT_MASK}
+
+
+class TestDrillDownExpansion:
+    """Test serializing unexpanded values on demand."""
+
+    def test_expand_handle_and_sub_path(self, drill_down):
+        order = Order(Customer())
+        lines = _capture("expand-1")["order"]["@value"]["lines"]
+
+        expanded = _expand("expand-1", lines["@handle"], depth=2)
+        sku = _expand("expand-1", lines["@handle"], path=["0", "sku"])
+
+        assert expanded["@value"][0]["@value"]["qty"] == {"@type": "int", "@value": 2}
+        assert sku == {"@type": "str", "@value": "A-1"}
+
+    def test_expansion_hands_out_handles_of_the_same_snapshot(self, drill_down):
+        order = Order(Customer())
+        lines = _capture("expand-2")["order"]["@value"]["lines"]
+
+        item = _expand("expand-2", lines["@handle"], depth=1)["@value"][0]
+
+        assert _expand("expand-2", item["@handle"])["@value"]["sku"]["@value"] == "A-1"
+
+    def test_values_are_read_from_the_live_object(self, drill_down):
+        order = Order(Customer())
+        customer = _capture("expand-3")["order"]["@value"]["customer"]
+
+        order.customer.name = "Grace"
+
+        assert _expand("expand-3", customer["@handle"])["@value"]["name"]["@value"] == "Grace"
+
+    def test_converted_values_resolve_through_the_serializer(self, drill_down):
+        register_serializer(Customer, lambda value: {"profile": {"name": value.name}})
+        try:
+            order = Order(Customer())
+            profile = _capture("expand-4")["order"]["@value"]["customer"]
+            customer = _expand("expand-4", profile["@handle"])["@value"]["profile"]
+
+            expanded = _expand("expand-4", customer["@handle"])
+        finally:
+            unregister_serializer(Customer)
+
+        assert expanded["@value"]["name"]["@value"] == "Ada"
+
+    def test_collected_object_is_reported(self, drill_down):
+        def hit():
+            order = Order(Customer())
+            return _capture("expand-5")["order"]["@value"]["customer"]
+
+        customer = hit()
+        gc.collect()
+
+        with pytest.raises(CodedException) as e:
+            expand_snapshot_value("expand-5", customer["@handle"])
+        assert e.value.code == SNAPSHOT_OBJECT_COLLECTED.code
+
+    def test_replaced_value_is_reported_as_collected(self, drill_down):
+        order = Order(Customer())
+        lines = _capture("expand-7")["order"]["@value"]["lines"]
+
+        order.lines = [{"sku": "B-2", "qty": 1}]
+
+        with pytest.raises(CodedException) as e:
+            expand_snapshot_value("expand-7", lines["@handle"])
+        assert e.value.code == SNAPSHOT_OBJECT_COLLECTED.code
+
+    def test_unknown_handle_and_path(self, drill_down):
+        order = Order(Customer())
+        customer = _capture("expand-6")["order"]["@value"]["customer"]
+
+        with pytest.raises(CodedException) as unknown:
+            expand_snapshot_value("other-snapshot", customer["@handle"])
+        with pytest.raises(CodedException) as missing:
+            expand_snapshot_value("expand-6", customer["@handle"], ["missing"])
+
+        assert unknown.value.code == SNAPSHOT_HANDLE_NOT_FOUND.code
+        assert missing.value.code == SNAPSHOT_PATH_NOT_FOUND.code
+
+    def test_expired_handles_are_gone(self):
+        cache = DrillDownCache(ttl=0)
+        collector = SnapshotCollector(parse_depth=1, drill_down_depth=1)
+        collector.collect_value({"inner": {"a": 1}})
+        cache.store("expired", collector.drill_down_refs)
+
+        assert len(cache) == 0
@@ -0,0 +1,261 @@
+"""
+Tests for batched event shipping to the event sink.
+"""
+
+import gzip
+import json
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from scripts import event_sink
+from test_support.event_capture import construct_event
+from tracepointdebug.broker.circuit_breaker import CircuitBreaker
+from tracepointdebug.broker.event_batcher import EventBatcher, encode_batch, sink_supports_batches, NDJSON, \
+    JSON_ARRAY
+
+
+class _Handler(BaseHTTPRequestHandler):
+    received = []
+    batch_status = 200
+    # Batch posts answered 503 before batch_status is used
+    batch_failures = 0
+    # n -> answer to the n-th event posted to /api/events (counted from 1), 200 for the others
+    event_statuses = {}
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        if self.headers.get("Content-Encoding") == "gzip":
+            body = gzip.decompress(body)
+        _Handler.received.append((self.path, self.headers, body))
+        if self.path == "/api/events/batch":
+            status = _Handler.batch_status
+        else:
+            status = _Handler.event_statuses.get(sum(1 for path, _, _ in _Handler.received if path == self.path), 200)
+        if self.path == "/api/events/batch" and _Handler.batch_failures:
+            _Handler.batch_failures -= 1
+            status = 503
+        self.send_response(status)
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def sink():
+    _Handler.received = []
+    _Handler.batch_status = 200
+    _Handler.batch_failures = 0
+    _Handler.event_statuses = {}
+    server = HTTPServer(("127.0.0.1", 0), _Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield "http://127.0.0.1:%d" % server.server_address[1]
+    server.shutdown()
+    server.server_close()
+
+
+def _encode(event):
+    return json.dumps(event, separators=(",", ":")).encode("utf-8")
+
+
+def _batcher(sink, **kwargs):
+    kwargs.setdefault("max_delay_ms", 60000)
+    batcher = EventBatcher(sink, _encode, retries=1, **kwargs)
+    batcher.start()
+    return batcher
+
+
+def _events(body):
+    return [json.loads(line) for line in body.splitlines()]
+
+
+class TestBatchEncoding:
+    """Test negotiation and batch bodies."""
+
+    def test_sink_support_is_read_from_health(self):
+        assert sink_supports_batches({"status": "healthy", "batch": {"supported": True}})
+        assert sink_supports_batches({"batch": True})
+        assert not sink_supports_batches({"status": "healthy"})
+        assert not sink_supports_batches({"batch": {"supported": False}})
+        assert not sink_supports_batches(None)
+
+    def test_ndjson_and_json_array_bodies(self):
+        lines = [b'{"id":1}', b'{"id":2}']
+
+        assert encode_batch(lines, NDJSON) == b'{"id":1}\n{"id":2}\n'
+        assert json.loads(encode_batch(lines, JSON_ARRAY)) == [{"id": 1}, {"id": 2}]
+
+
+class TestEventBatcher:
+    """Test the batcher against a local sink."""
+
+    def test_sends_a_batch_once_max_events_are_queued_and_on_flush(self, sink):
+        batcher = _batcher(sink, max_events=3)
+        done = []
+        for i in range(7):
+            batcher.submit({"id": i}, callback=lambda i=i: done.append(i))
+        assert batcher.flush(10)
+        batches = [(path, _events(body)) for path, _, body in _Handler.received]
+        batcher.stop()
+
+        assert batches == [("/api/events/batch", [{"id": 0}, {"id": 1}, {"id": 2}]),
+                           ("/api/events/batch", [{"id": 3}, {"id": 4}, {"id": 5}]),
+                           ("/api/events/batch", [{"id": 6}])]
+        assert sorted(done) == list(range(7))
+        assert batcher.get_stats()["sentEvents"] == 7
+
+    def test_sends_a_batch_before_it_grows_past_max_bytes(self, sink):
+        batcher = _batcher(sink, max_bytes=60, max_events=100)
+        for i in range(4):
+            batcher.submit({"id": i, "pad": "x" * 8})
+        batcher.stop()
+
+        assert [len(_events(body)) for _, _, body in _Handler.received] == [2, 2]
+
+    def test_sends_a_partial_batch_after_max_delay(self, sink):
+        batcher = _batcher(sink, max_delay_ms=50)
+        batcher.submit({"id": 1})
+        deadline = time.time() + 5
+        while not _Handler.received and time.time() < deadline:
+            time.sleep(0.01)
+        batcher.stop()
+
+        assert [_events(body) for _, _, body in _Handler.received] == [[{"id": 1}]]
+
+    def test_large_batches_are_gzipped_json_arrays(self, sink):
+        batcher = _batcher(sink, batch_format=JSON_ARRAY, headers={"X-Runtime": "python"})
+        for i in range(50):
+            batcher.submit({"id": i, "message": "retrying order %d" % i})
+        batcher.stop()
+
+        path, headers, body = _Handler.received[0]
+        assert headers["Content-Encoding"] == "gzip" and headers["X-Runtime"] == "python"
+        assert headers["Content-Type"] == "application/json"
+        assert [event["id"] for event in json.loads(body)] == list(range(50))
+
+    def test_falls_back_to_single_events_without_batch_endpoint(self, sink):
+        _Handler.batch_status = 404
+        batcher = _batcher(sink, max_events=2)
+        for i in range(4):
+            batcher.submit({"id": i})
+        batcher.stop()
+
+        paths = [path for path, _, _ in _Handler.received]
+        assert paths == ["/api/events/batch"] + ["/api/events"] * 4
+        assert not batcher.batching
+        assert batcher.get_stats()["sentEvents"] == 4
+
+    def test_failed_batches_are_retried_through_the_queue(self, sink):
+        _Handler.batch_failures = 1
+        batcher = EventBatcher(sink, _encode, max_events=1, max_delay_ms=0, retries=3, backoff=1.0)
+        batcher.start()
+        batcher.submit({"id": 1})
+        deadline = time.time() + 5
+        while not _Handler.received and time.time() < deadline:
+            time.sleep(0.01)
+        failed_at = time.time()
+        # The batcher is not asleep in a backoff, a priority event goes out right away
+        batcher.submit({"id": "status"}, priority=True)
+        while len(_Handler.received) < 2 and time.time() < deadline:
+            time.sleep(0.01)
+        status_after = time.time() - failed_at
+        assert batcher.flush(10)
+        batcher.stop()
+
+        assert [_events(body) for _, _, body in _Handler.received] == [[{"id": 1}], [{"id": "status"}], [{"id": 1}]]
+        assert status_after < 0.5
+        assert batcher._queue.get_stats()["retried"] == 1
+        assert batcher.get_stats()["sentEvents"] == 2
+
+    def test_rejected_batches_are_not_retried(self, sink):
+        _Handler.batch_status = 400
+        breaker = CircuitBreaker(sink + "/health", failure_threshold=2)
+        batcher = EventBatcher(sink, _encode, max_events=1, max_delay_ms=0, retries=3, backoff=0.01,
+                               circuit_breaker=breaker)
+        batcher.start()
+        for i in range(6):
+            batcher.submit({"id": i})
+        assert batcher.flush(10)
+        batcher.stop()
+
+        assert len(_Handler.received) == 6
+        assert not breaker.is_open
+        assert batcher._queue.get_stats()["retried"] == 0
+        assert (batcher.get_stats()["sentEvents"], batcher.get_stats()["failedEvents"]) == (0, 6)
+
+    def test_rejected_event_posted_alone_does_not_hold_back_the_next(self, sink):
+        _Handler.batch_status = 404
+        _Handler.event_statuses = {2: 422}
+        batcher = _batcher(sink, max_events=3)
+        for i in range(3):
+            batcher.submit({"id": i})
+        assert batcher.flush(10)
+        batcher.stop()
+
+        assert [json.loads(body) for path, _, body in _Handler.received if path == "/api/events"] == \
+            [{"id": 0}, {"id": 1}, {"id": 2}]
+        assert (batcher.get_stats()["sentEvents"], batcher.get_stats()["failedEvents"]) == (2, 1)
+
+    def test_unencodable_events_are_dropped_with_their_callback(self, sink):
+        batcher = _batcher(sink)
+        called = threading.Event()
+        batcher.submit({"id": object()}, callback=called.set)
+        batcher.submit({"id": 2})
+        batcher.stop()
+
+        assert called.is_set()
+        assert [_events(body) for _, _, body in _Handler.received] == [[{"id": 2}]]
+        assert batcher.get_stats()["failedEvents"] == 1
+
+
+class TestSinkBatchEndpoint:
+    """Test the reference sink's batch endpoint."""
+
+    def _event(self, line):
+        return construct_event(name='probe.hit.logpoint', payload={'probeId': 'lp-1', 'probeType': 'logpoint',
+                                                                    'file': 'app.py', 'line': line, 'message': 'hi'})
+
+    def test_health_advertises_batches(self):
+        health = event_sink.app.test_client().get('/health').get_json()
+
+        assert sink_supports_batches(health)
+        assert health['batch']['path'] == '/api/events/batch'
+
+    def test_accepts_gzipped_ndjson(self):
+        client = event_sink.app.test_client()
+        client.post('/api/events/clear')
+        body = encode_batch([json.dumps(self._event(line)).encode('utf-8') for line in (1, 2, 3)])
+
+        response = client.post('/api/events/batch', data=gzip.compress(body),
+                               headers={'Content-Type': 'application/x-ndjson', 'Content-Encoding': 'gzip'})
+
+        assert response.status_code == 200
+        assert (response.get_json()['accepted'], response.get_json()['rejected']) == (3, [])
+        assert client.get('/api/events').get_json()['total'] == 3
+
+    def test_rejects_invalid_events_by_index(self):
+        client = event_sink.app.test_client()
+        events = [self._event(1), {'name': 'probe.hit.logpoint'}, self._event(3)]
+
+        response = client.post('/api/events/batch', data=json.dumps(events),
+                               headers={'Content-Type': 'application/json'})
+
+        assert response.status_code == 200
+        assert response.get_json()['accepted'] == 2
+        assert [item['index'] for item in response.get_json()['rejected']] == [1]
+
+    def test_rejects_bodies_that_are_not_batches(self):
+        client = event_sink.app.test_client()
+
+        assert client.post('/api/events/batch', data=json.dumps(self._event(1)),
+                           headers={'Content-Type': 'application/json'}).status_code == 400
+        assert client.post('/api/events/batch', data=b'{"id": 1}\nnot json\n',
+                           headers={'Content-Type': 'application/x-ndjson'}).status_code == 400
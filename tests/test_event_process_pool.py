@@ -0,0 +1,153 @@
+"""
+Tests for sending events from worker processes.
+"""
+
+import gzip
+import json
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from scripts import event_sink
+from test_support.event_capture import construct_event
+from tracepointdebug.broker.event_process_pool import EventProcessPool, encode_body
+from tracepointdebug.probe.frame import Frame
+from tracepointdebug.probe.snapshot.value import Value
+from tracepointdebug.probe.snapshot.variable import Variable
+from tracepointdebug.probe.snapshot.variables import Variables
+
+
+class _Handler(BaseHTTPRequestHandler):
+    received = []
+    # Set to an Event to hold requests until it is set
+    hold = None
+    arrived = threading.Event()
+    status = 200
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        _Handler.arrived.set()
+        if _Handler.hold is not None:
+            _Handler.hold.wait(10)
+        _Handler.received.append((self.path, dict(self.headers), body))
+        self.send_response(_Handler.status)
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def sink():
+    _Handler.received = []
+    _Handler.hold = None
+    _Handler.arrived.clear()
+    _Handler.status = 200
+    server = HTTPServer(("127.0.0.1", 0), _Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield "http://127.0.0.1:%d" % server.server_address[1]
+    server.shutdown()
+    server.server_close()
+
+
+def _wait_for(predicate, timeout=30):
+    deadline = time.time() + timeout
+    while not predicate() and time.time() < deadline:
+        time.sleep(0.05)
+    return predicate()
+
+
+def _payload(body):
+    variables = Variables([Variable("body", "str", Value("str", body))])
+    return {"name": "TracePointSnapshotEvent", "frames": [Frame(7, variables, "app/upload.py", "receive")]}
+
+
+class TestEncodeBody:
+    """Test encoding done by the workers."""
+
+    def test_large_bodies_are_compressed(self):
+        body, headers = encode_body(_payload("x" * 5000))
+
+        assert headers["content-encoding"] == "gzip"
+        assert json.loads(gzip.decompress(body))["frames"][0]["variables"]["body"]["@value"] == "x" * 5000
+
+    def test_small_bodies_are_sent_plain(self):
+        body, headers = encode_body({"name": "ApplicationStatusEvent"})
+
+        assert "content-encoding" not in headers
+        assert json.loads(body) == {"name": "ApplicationStatusEvent"}
+
+
+class TestEventProcessPool:
+    """Test the pool end to end against a local sink."""
+
+    def test_events_are_sent_by_workers(self, sink):
+        pool = EventProcessPool(1, sink)
+        done = threading.Event()
+        pool.start()
+        try:
+            pool.submit(_payload("y" * 4000), "/api/events", headers={"X-Runtime": "python"}, callback=done.set)
+
+            assert done.wait(30)
+        finally:
+            pool.stop()
+
+        path, headers, body = _Handler.received[0]
+        assert path == "/api/events" and headers["X-Runtime"] == "python"
+        assert json.loads(gzip.decompress(body))["frames"][0]["methodName"] == "receive"
+        assert (pool.sent, pool.failed, pool.pending()) == (1, 0, 0)
+
+    def test_events_of_a_dead_worker_fail_and_it_is_replaced(self, sink):
+        pool = EventProcessPool(1, sink, retries=1)
+        failed, done = threading.Event(), threading.Event()
+        _Handler.hold = threading.Event()
+        pool.start()
+        try:
+            pool.submit(_payload("lost"), "/api/events", callback=failed.set)
+            assert _Handler.arrived.wait(30)
+            dead = pool._workers[0].process
+            dead.kill()
+
+            assert failed.wait(10)
+            assert pool.failed == 1 and pool.pending() == 0
+            _Handler.hold.set()
+            assert _wait_for(lambda: pool.alive() == 1 and pool._workers[0].process is not dead)
+            pool.submit(_payload("sent"), "/api/events", callback=done.set)
+            assert done.wait(30)
+        finally:
+            _Handler.hold.set()
+            pool.stop()
+
+        assert (pool.sent, pool.failed, pool.respawned) == (1, 1, 1)
+
+    def test_rejected_events_are_not_retried(self, sink):
+        pool = EventProcessPool(1, sink, retries=3, backoff=0.01)
+        done = threading.Event()
+        _Handler.status = 400
+        pool.start()
+        try:
+            pool.submit(_payload("invalid"), "/api/events", callback=done.set)
+
+            assert done.wait(30)
+        finally:
+            pool.stop()
+
+        assert len(_Handler.received) == 1
+        assert (pool.sent, pool.failed) == (0, 1)
+
+    def test_sink_accepts_gzip_bodies(self):
+        event = construct_event(name='probe.hit.snapshot', payload={'probeId': 'p-1', 'probeType': 'tracepoint',
+                                                                      'file': 'app.py', 'line': 3})
+        client = event_sink.app.test_client()
+
+        response = client.post('/api/events', data=gzip.compress(json.dumps(event).encode('utf-8')),
+                               headers={'Content-Type': 'application/json', 'Content-Encoding': 'gzip'})
+
+        assert response.status_code == 200
@@ -0,0 +1,181 @@
+"""
+Tests for the bounded event queue in front of the event sink.
+"""
+
+import json
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tracepointdebug.broker import broker_manager
+from tracepointdebug.broker.broker_manager import BrokerManager
+from tracepointdebug.broker.event_queue import EventQueue, DROP_NEWEST, DROP_OLDEST, SAMPLE
+from tracepointdebug.probe.event.logpoint.log_point_event import LogPointEvent
+from tracepointdebug.probe.event.logpoint.log_point_rate_limit_event import LogPointRateLimitEvent
+
+
+def _events(taken):
+    return [queued.event for queued in taken]
+
+
+class TestEventQueue:
+    """Test lanes, bounds and overflow policies."""
+
+    def test_priority_events_are_taken_first(self):
+        queue = EventQueue()
+        queue.put("snapshot-1", size=100)
+        queue.put("snapshot-2", size=100)
+        queue.put("rate-limit", priority=True)
+
+        assert _events(queue.take(10)) == ["rate-limit", "snapshot-1", "snapshot-2"]
+
+    def test_drop_newest_keeps_the_queued_events(self):
+        dropped = []
+        queue = EventQueue(max_events=2, overflow=DROP_NEWEST)
+        for i in range(4):
+            queue.put(i, callback=lambda i=i: dropped.append(i))
+
+        assert _events(queue.take(10)) == [0, 1]
+        assert dropped == [2, 3]
+        assert queue.get_stats()["droppedNewest"] == 2
+
+    def test_drop_oldest_makes_room_by_bytes(self):
+        dropped = []
+        queue = EventQueue(max_bytes=250, overflow=DROP_OLDEST)
+        for i in range(3):
+            queue.put(i, callback=lambda i=i: dropped.append(i), size=100)
+
+        assert dropped == [0]
+        assert queue.get_stats()["bytes"] == 200
+        assert _events(queue.take(10)) == [1, 2]
+
+    def test_sample_admits_one_in_n_overflowing_events(self):
+        queue = EventQueue(max_events=2, overflow=SAMPLE, sample_every=3)
+        for i in range(8):
+            queue.put(i)
+
+        assert _events(queue.take(10)) == [4, 7]
+        stats = queue.get_stats()
+        assert (stats["droppedSampled"], stats["droppedOldest"]) == (4, 2)
+
+    def test_bulk_events_never_push_out_priority_events(self):
+        queue = EventQueue(max_events=1, overflow=DROP_OLDEST)
+        queue.put("status", priority=True)
+        for i in range(5):
+            queue.put(i, size=10)
+
+        assert _events(queue.take(10)) == ["status", 4]
+
+    def test_event_larger_than_the_bound_gets_in_alone(self):
+        queue = EventQueue(max_bytes=100)
+
+        assert queue.put("large", size=1000)
+        assert not queue.put("small", size=10)
+        assert _events(queue.take(10)) == ["large"]
+
+    def test_retried_events_wait_and_count_against_the_bound(self):
+        queue = EventQueue(max_events=1)
+        queue.put("snapshot")
+        queued = queue.take()[0]
+        queue.retry(queued, 0.05)
+
+        assert not queue.put("other")
+        assert queue.take(timeout=0) == []
+        assert queue.take(timeout=5)[0] is queued
+        assert queued.attempts == 1
+
+    def test_join_waits_for_taken_events_to_finish(self):
+        queue = EventQueue()
+        queue.put("snapshot")
+        queue.put("dropped-later", priority=True)
+
+        assert not queue.join(0)
+        queue.take(10)
+        queue.task_done(2)
+        assert queue.join(0)
+
+    def test_close_lets_takers_drain_and_stop(self):
+        queue = EventQueue()
+        queue.put("snapshot")
+        queue.close()
+
+        assert not queue.put("late")
+        assert _events(queue.take()) == ["snapshot"]
+        assert queue.take() == []
+
+    def test_unknown_overflow_policy_is_rejected(self):
+        with pytest.raises(ValueError):
+            EventQueue(overflow="drop_everything")
+
+
+class _Handler(BaseHTTPRequestHandler):
+    received = []
+    failures = 0
+
+    def do_GET(self):
+        self.send_response(200)
+        self.end_headers()
+        self.wfile.write(b'{"status": "healthy"}')
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        if _Handler.failures:
+            _Handler.failures -= 1
+            self.send_response(500)
+        else:
+            _Handler.received.append(body)
+            self.send_response(200)
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def manager(monkeypatch, tmp_path):
+    _Handler.received = []
+    _Handler.failures = 0
+    server = HTTPServer(("127.0.0.1", 0), _Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    monkeypatch.setattr(broker_manager, "EVENT_SINK_URL", "http://127.0.0.1:%d" % server.server_address[1])
+    monkeypatch.setattr(broker_manager, "EVENT_SENDER_THREADS", 1)
+    monkeypatch.setattr(broker_manager, "EVENT_PROCESS_WORKERS", 0)
+    monkeypatch.setattr(broker_manager, "EVENT_SPOOL_DIR", str(tmp_path))
+    yield BrokerManager()
+    server.shutdown()
+    server.server_close()
+
+
+class TestBrokerManagerEventQueue:
+    """Test sending queued events from BrokerManager."""
+
+    def test_failed_sends_retry_without_blocking_the_sender(self, manager):
+        _Handler.failures = 1
+        done = threading.Event()
+        manager.publish_event(LogPointEvent("lp-1", "app.py", 3, "run", "first", "now"))
+        manager.publish_event(LogPointEvent("lp-1", "app.py", 3, "run", "second", "now"), callback=done.set)
+
+        assert done.wait(5)
+        assert manager._event_queue.join(5)
+        assert [event["logMessage"] for event in _Handler.received] == ["second", "first"]
+        assert manager.get_stats()["queue"]["retried"] == 1
+
+    def test_control_events_skip_queued_snapshots(self, manager):
+        # Holds the senders back until both events are queued
+        manager._event_senders = []
+        manager.publish_event(LogPointEvent("lp-1", "app.py", 3, "run", "message", "now"))
+        manager.publish_event(LogPointRateLimitEvent("app.py", 3))
+        manager._event_senders = None
+
+        manager.start_event_senders()
+        deadline = time.time() + 5
+        while len(_Handler.received) < 2 and time.time() < deadline:
+            time.sleep(0.01)
+        assert [event["name"] for event in _Handler.received] == ["LogPointRateLimitEvent", "LogPointEvent"]
@@ -0,0 +1,188 @@
+"""
+Tests for sending events to a local collector through a shared memory ring buffer.
+"""
+
+import json
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from scripts import event_sink
+from scripts.event_sink import EventRingReader
+from test_support.event_capture import construct_event
+from tracepointdebug.broker import broker_manager, event_ring
+from tracepointdebug.broker.broker_manager import BrokerManager
+from tracepointdebug.broker.event_batcher import sink_supports_batches
+from tracepointdebug.broker.event_ring import EventRing, EventRingTransport, is_ring_url, ring_path
+from tracepointdebug.probe.event.logpoint.log_point_event import LogPointEvent
+
+
+def _read_all(reader):
+    records = []
+    reader.read(lambda views: records.extend(bytes(view) for view in views))
+    return records
+
+
+@pytest.fixture
+def ring_file(tmp_path):
+    return str(tmp_path / 'events.ring')
+
+
+class TestEventRing:
+    """Test the ring layout shared by the agent and the collector."""
+
+    def test_ring_urls_are_recognized(self):
+        assert is_ring_url('ring:///dev/shm/debugin-events')
+        assert ring_path('ring:///dev/shm/debugin-events') == '/dev/shm/debugin-events'
+        assert not is_ring_url('unix:///run/debugin/events.sock')
+
+    def test_records_are_read_in_order_across_the_end_of_the_ring(self, ring_file):
+        reader = EventRingReader(ring_file, capacity=256)
+        ring = EventRing.attach(ring_file)
+        try:
+            received = []
+            for i in range(20):
+                # 48 bytes a record, so records wrap around the 256 bytes every few rounds
+                records = [b'{"id": "%02d", "pad": "%s"}' % (i * 2 + j, b'x' * 14) for j in range(2)]
+                assert ring.write(records) == 2
+                received += _read_all(reader)
+            assert [int(json.loads(record)['id']) for record in received] == list(range(40))
+        finally:
+            ring.close()
+            reader.close()
+
+    def test_full_ring_drops_and_counts_instead_of_waiting(self, ring_file):
+        reader = EventRingReader(ring_file, capacity=256)
+        ring = EventRing.attach(ring_file)
+        try:
+            assert ring.write([b'x' * 60] * 10) == 4
+            assert ring.write([b'x' * 300]) == 0
+            stats = reader.get_stats()
+            assert (stats['used'], stats['droppedEvents'], stats['droppedBytes']) == (256, 7, 6 * 60 + 300)
+
+            assert len(_read_all(reader)) == 4
+            assert ring.write([b'y' * 60]) == 1
+            assert _read_all(reader) == [b'y' * 60]
+        finally:
+            ring.close()
+            reader.close()
+
+    def test_writing_wakes_a_waiting_collector(self, ring_file):
+        reader = EventRingReader(ring_file, capacity=4096)
+        ring = EventRing.attach(ring_file)
+        try:
+            threading.Timer(0.1, ring.write, args=([b'{}'],)).start()
+            start = time.time()
+            reader.wait(5)
+            assert time.time() - start < 2
+            assert _read_all(reader) == [b'{}']
+        finally:
+            ring.close()
+            reader.close()
+
+
+class TestEventRingTransport:
+    """Test the agent's side: health, reattaching and the reference collector."""
+
+    def test_health_follows_the_collector(self, ring_file, monkeypatch):
+        transport = EventRingTransport(ring_file)
+        assert transport.check_health() is None
+        with pytest.raises(OSError):
+            transport.send_batch([b'{}'])
+
+        first = EventRingReader(ring_file, capacity=4096)
+        assert sink_supports_batches(transport.check_health())
+        monkeypatch.setattr(event_ring, 'STALE_HEARTBEAT_SECS', -1)
+        assert transport.check_health() is None
+        monkeypatch.undo()
+
+        # A restarted collector creates a new ring, the agent maps it on the next health check
+        second = EventRingReader(ring_file, capacity=4096)
+        try:
+            assert transport.check_health() is not None
+            assert transport.send_batch([b'{"id": 1}'])['accepted'] == 1
+            assert _read_all(second) == [b'{"id": 1}'] and _read_all(first) == []
+            assert transport.get_stats()['attaches'] == 2
+        finally:
+            transport.close()
+            first.close()
+            second.close()
+
+    def test_orphaned_ring_is_not_written(self, ring_file, monkeypatch):
+        reader = EventRingReader(ring_file, capacity=4096)
+        transport = EventRingTransport(ring_file)
+        try:
+            assert transport.send_batch([b'{"id": 1}'])['accepted'] == 1
+            # The collector stopped beating and left its ring behind
+            monkeypatch.setattr(event_ring, 'STALE_HEARTBEAT_SECS', -1)
+            with pytest.raises(OSError):
+                transport.send_batch([b'{"id": 2}'])
+
+            assert _read_all(reader) == [b'{"id": 1}']
+            assert transport.get_stats()['written'] == 1 and transport.get_stats()['attaches'] == 1
+        finally:
+            transport.close()
+            reader.close()
+
+    def test_reference_collector_stores_valid_events(self, ring_file):
+        event_sink.app.test_client().post('/api/events/clear')
+        reader = event_sink.serve_event_ring(ring_file, capacity=1 << 16)
+        transport = EventRingTransport(ring_file)
+        try:
+            event = construct_event(name='probe.hit.logpoint', payload={
+                'probeId': 'lp-1', 'probeType': 'logpoint', 'file': 'app.py', 'line': 7, 'message': 'hi'})
+            transport.send_batch([json.dumps(event).encode('utf-8'), b'{"name": "probe.hit.logpoint"}'])
+
+            deadline = time.time() + 5
+            while reader.get_stats()['used'] and time.time() < deadline:
+                time.sleep(0.01)
+            events = event_sink.app.test_client().get('/api/events').get_json()['events']
+            assert [e['payload']['line'] for e in events] == [7]
+        finally:
+            transport.close()
+            reader.stop()
+
+
+class TestBrokerManagerEventRing:
+    """Test BrokerManager with a ring:// event sink URL."""
+
+    def test_events_are_written_into_the_ring(self, ring_file, tmp_path, monkeypatch):
+        reader = EventRingReader(ring_file, capacity=1 << 16)
+        monkeypatch.setattr(broker_manager, "EVENT_SINK_URL", "ring://" + ring_file)
+        monkeypatch.setattr(broker_manager, "EVENT_PROCESS_WORKERS", 2)
+        monkeypatch.setattr(broker_manager, "EVENT_BATCH_MAX_DELAY_MS", 10)
+        monkeypatch.setattr(broker_manager, "EVENT_SPOOL_DIR", str(tmp_path / 'spool'))
+        try:
+            manager = BrokerManager()
+            for i in range(3):
+                manager.publish_event(LogPointEvent("lp-1", "app.py", 3, "run", "message %d" % i, "now"))
+
+            assert manager._event_queue.join(5)
+            assert [json.loads(record)["logMessage"] for record in _read_all(reader)] == ["message 0", "message 1",
+                                                                                         "message 2"]
+            assert manager.get_process_pool() is None
+            assert manager.get_stats()["transport"]["written"] == 3
+        finally:
+            reader.close()
+
+    def test_events_are_spooled_once_the_collector_is_gone(self, ring_file, tmp_path, monkeypatch):
+        reader = EventRingReader(ring_file, capacity=1 << 16)
+        monkeypatch.setattr(broker_manager, "EVENT_SINK_URL", "ring://" + ring_file)
+        monkeypatch.setattr(broker_manager, "EVENT_SINK_FAILURE_THRESHOLD", 1)
+        monkeypatch.setattr(broker_manager, "EVENT_BATCH_MAX_DELAY_MS", 10)
+        monkeypatch.setattr(broker_manager, "EVENT_SPOOL_DIR", str(tmp_path / 'spool'))
+        try:
+            manager = BrokerManager()
+            monkeypatch.setattr(event_ring, 'STALE_HEARTBEAT_SECS', -1)
+            manager.publish_event(LogPointEvent("lp-1", "app.py", 3, "run", "message", "now"))
+
+            assert manager._event_queue.join(5)
+            assert manager._circuit_breaker.is_open
+            assert manager._event_spool.get_stats()["spooled"] == 1 and _read_all(reader) == []
+        finally:
+            reader.close()
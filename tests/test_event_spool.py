@@ -0,0 +1,258 @@
+"""
+Tests for spooling events to disk while the event sink is down.
+"""
+
+import json
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tracepointdebug.broker import broker_manager
+from tracepointdebug.broker.broker_manager import BrokerManager
+from tracepointdebug.broker.circuit_breaker import CircuitBreaker, CLOSED, OPEN
+from tracepointdebug.broker.event_spool import EventSpool
+from tracepointdebug.probe.event.logpoint.log_point_event import LogPointEvent
+
+
+def _line(i):
+    return json.dumps({"id": i, "message": "x" * 20}).encode("utf-8")
+
+
+def _wait_for(predicate, timeout=5):
+    deadline = time.time() + timeout
+    while not predicate() and time.time() < deadline:
+        time.sleep(0.01)
+    return predicate()
+
+
+class TestEventSpool:
+    """Test segments, the size cap and replay."""
+
+    def test_directory_is_created_on_first_event(self, tmp_path):
+        directory = str(tmp_path / "spool")
+        spool = EventSpool(directory)
+
+        assert not os.path.exists(directory)
+        spool.append(_line(0))
+        assert os.listdir(directory) == ["000000000000.ndjson"]
+
+    def test_events_are_replayed_oldest_first_across_segments(self, tmp_path):
+        spool = EventSpool(str(tmp_path), segment_bytes=80)
+        for i in range(6):
+            spool.append(_line(i))
+        sent = []
+
+        assert spool.get_stats()["segments"] == 3
+        assert spool.replay(lambda line: sent.append(json.loads(line)["id"]) is None)
+        assert sent == list(range(6))
+        assert os.listdir(str(tmp_path)) == [] and len(spool) == 0
+
+    def test_oldest_segments_are_dropped_past_max_bytes(self, tmp_path):
+        spool = EventSpool(str(tmp_path), max_bytes=200, segment_bytes=80)
+        for i in range(8):
+            spool.append(_line(i))
+        sent = []
+        spool.replay(lambda line: sent.append(json.loads(line)["id"]) is None)
+
+        assert sent == [4, 5, 6, 7]
+        assert spool.get_stats()["droppedSegments"] == 2
+
+    def test_failed_replay_resumes_after_the_last_sent_event(self, tmp_path):
+        spool = EventSpool(str(tmp_path))
+        for i in range(4):
+            spool.append(_line(i))
+        sent = []
+
+        def send(line):
+            if len(sent) == 2:
+                return False
+            sent.append(json.loads(line)["id"])
+            return True
+
+        assert not spool.replay(send)
+        spool.append(_line(4))
+        sent.append("down")
+        assert spool.replay(lambda line: sent.append(json.loads(line)["id"]) is None)
+        assert sent == [0, 1, "down", 2, 3, 4]
+
+    def test_replay_is_rate_limited(self, tmp_path):
+        spool = EventSpool(str(tmp_path))
+        for i in range(5):
+            spool.append(_line(i))
+
+        started = time.monotonic()
+        spool.replay(lambda line: True, rate=50)
+        assert time.monotonic() - started >= 0.07
+
+    def test_segments_of_an_earlier_process_are_picked_up(self, tmp_path):
+        spool = EventSpool(str(tmp_path), segment_bytes=80)
+        for i in range(3):
+            spool.append(_line(i))
+        spool.close()
+        sent = []
+
+        assert EventSpool(str(tmp_path)).replay(lambda line: sent.append(json.loads(line)["id"]) is None)
+        assert sent == [0, 1, 2]
+
+    def test_directory_and_segments_are_private(self, tmp_path):
+        directory = str(tmp_path / "spool")
+        spool = EventSpool(directory)
+        spool.append(_line(0))
+        spool.close()
+
+        assert os.stat(directory).st_mode & 0o777 == 0o700
+        assert os.stat(os.path.join(directory, "000000000000.ndjson")).st_mode & 0o777 == 0o600
+
+    def test_directory_others_can_access_is_refused(self, tmp_path):
+        directory = tmp_path / "spool"
+        directory.mkdir()
+        os.chmod(str(directory), 0o777)
+
+        with pytest.raises(OSError):
+            EventSpool(str(directory))
+
+    def test_segments_of_a_spool_left_behind_are_adopted(self, tmp_path):
+        left = EventSpool(str(tmp_path / "4242"), segment_bytes=80)
+        for i in range(3):
+            left.append(_line(i))
+        left.close()
+        spool = EventSpool(str(tmp_path / "4343"))
+        spool.append(_line(3))
+        sent = []
+
+        spool.adopt(str(tmp_path / "4242"))
+        spool.append(_line(4))
+
+        assert spool.replay(lambda line: sent.append(json.loads(line)["id"]) is None)
+        assert sorted(sent) == [0, 1, 2, 3, 4] and sent[-1] == 4
+        assert not os.path.exists(str(tmp_path / "4242"))
+
+
+class _Handler(BaseHTTPRequestHandler):
+    healthy = True
+    received = []
+
+    def do_GET(self):
+        self.send_response(200 if _Handler.healthy else 503)
+        self.end_headers()
+        self.wfile.write(b'{"status": "healthy"}')
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        if _Handler.healthy:
+            _Handler.received.append(json.loads(body))
+        self.send_response(200 if _Handler.healthy else 503)
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def sink():
+    _Handler.healthy = True
+    _Handler.received = []
+    server = HTTPServer(("127.0.0.1", 0), _Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield "http://127.0.0.1:%d" % server.server_address[1]
+    server.shutdown()
+    server.server_close()
+
+
+class TestCircuitBreaker:
+    """Test opening on failures and closing on a healthy probe."""
+
+    def test_opens_after_threshold_and_closes_when_healthy(self, sink):
+        _Handler.healthy = False
+        closed = []
+        breaker = CircuitBreaker(sink + "/health", failure_threshold=2, probe_interval=0.02, on_close=closed.append)
+        try:
+            breaker.record_failure()
+            assert breaker.state == CLOSED
+            breaker.record_failure()
+            assert breaker.state == OPEN
+
+            time.sleep(0.1)
+            assert breaker.is_open
+            _Handler.healthy = True
+            assert _wait_for(lambda: closed)
+            assert breaker.state == CLOSED and closed == [{"status": "healthy"}]
+            assert breaker.get_stats()["opened"] == 1
+        finally:
+            breaker.stop()
+
+    def test_success_resets_the_failure_count(self, sink):
+        breaker = CircuitBreaker(sink + "/health", failure_threshold=2)
+        breaker.record_failure()
+        breaker.record_success()
+        breaker.record_failure()
+
+        assert breaker.state == CLOSED
+
+
+class TestBrokerManagerSpool:
+    """Test spooling and replaying events through BrokerManager."""
+
+    def test_instance_is_created_once(self, sink, tmp_path, monkeypatch):
+        monkeypatch.setattr(broker_manager, "EVENT_SINK_URL", sink)
+        monkeypatch.setattr(broker_manager, "EVENT_SPOOL_DIR", str(tmp_path))
+        monkeypatch.setattr(BrokerManager, "_BrokerManager__instance", None)
+        managers = []
+        threads = [threading.Thread(target=lambda: managers.append(BrokerManager.instance())) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        try:
+            assert len(managers) == 4 and all(manager is managers[0] for manager in managers)
+        finally:
+            managers[0]._circuit_breaker.stop()
+
+    def test_spools_of_processes_that_are_gone_are_adopted(self, tmp_path, monkeypatch):
+        monkeypatch.setattr(broker_manager, "EVENT_SPOOL_DIR", "")
+        monkeypatch.setattr(broker_manager.tempfile, "gettempdir", lambda: str(tmp_path))
+        base = tmp_path / ("tracepointdebug-spool-%d" % os.geteuid())
+        base.mkdir(mode=0o700)
+        # Above the largest pid, so never a running process
+        gone = EventSpool(str(base / "999999999"))
+        gone.append(_line(0))
+        gone.close()
+        running = EventSpool(str(base / "1"))
+        running.append(_line(1))
+        running.close()
+
+        spool = BrokerManager._create_event_spool()
+
+        assert spool.directory == str(base / str(os.getpid()))
+        assert spool.get_stats()["segments"] == 1
+        assert sorted(os.listdir(str(base))) == sorted(["1", str(os.getpid())])
+
+    def test_events_are_spooled_while_sink_is_down_and_replayed(self, sink, tmp_path, monkeypatch):
+        monkeypatch.setattr(broker_manager, "EVENT_SINK_URL", sink)
+        monkeypatch.setattr(broker_manager, "EVENT_SENDER_THREADS", 1)
+        monkeypatch.setattr(broker_manager, "EVENT_PROCESS_WORKERS", 0)
+        monkeypatch.setattr(broker_manager, "EVENT_SINK_PROBE_INTERVAL_MS", 20)
+        monkeypatch.setattr(broker_manager, "EVENT_SPOOL_DIR", str(tmp_path))
+        _Handler.healthy = False
+        manager = BrokerManager()
+        try:
+            assert manager._circuit_breaker.is_open
+            for i in range(3):
+                manager.publish_event(LogPointEvent("lp-1", "app.py", 3, "run", "message %d" % i, "now"))
+            assert manager._event_queue.join(5)
+            assert manager.get_stats()["spool"]["spooled"] == 3
+            assert _Handler.received == []
+
+            _Handler.healthy = True
+            assert _wait_for(lambda: len(_Handler.received) == 3)
+            assert [event["logMessage"] for event in _Handler.received] == ["message 0", "message 1", "message 2"]
+            assert _wait_for(lambda: manager.get_stats()["spool"]["segments"] == 0)
+        finally:
+            manager._circuit_breaker.stop()
@@ -0,0 +1,234 @@
+"""
+Tests for the asyncio I/O mode: the loop's timers, the keep-alive HTTP pool, the
+websocket client and sending events from the loop.
+"""
+
+import asyncio
+import json
+import os
+import struct
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tracepointdebug.broker import broker_manager, io_loop
+from tracepointdebug.broker.async_http import AsyncHTTPPool
+from tracepointdebug.broker.async_ws import AsyncWebSocket, WebSocketClosed, accept_key, encode_frame, OPCODE_PING
+from tracepointdebug.broker.broker_client import AsyncBrokerConnection
+from tracepointdebug.broker.broker_credentials import BrokerCredentials
+from tracepointdebug.broker.broker_manager import BrokerManager
+from tracepointdebug.broker.io_loop import IOLoop, schedule_timer
+from tracepointdebug.probe.event.logpoint.log_point_event import LogPointEvent
+
+
+def _wait_for(predicate, timeout=5):
+    deadline = time.time() + timeout
+    while not predicate() and time.time() < deadline:
+        time.sleep(0.01)
+    return predicate()
+
+
+class TestIOLoop:
+    """Test timers on the loop."""
+
+    def test_timer_runs_on_the_loop_and_can_be_cancelled(self, monkeypatch):
+        monkeypatch.setattr(io_loop, "IO_MODE", "asyncio")
+        fired = []
+        schedule_timer(0.01, lambda name: fired.append((name, IOLoop.instance().in_loop())), "expired")
+        cancelled = schedule_timer(0.05, fired.append, "cancelled")
+        cancelled.cancel()
+
+        assert _wait_for(lambda: fired)
+        time.sleep(0.1)
+        assert fired == [("expired", True)]
+
+    def test_timer_is_a_daemon_thread_in_thread_mode(self):
+        timer = schedule_timer(60, lambda: None)
+        try:
+            assert isinstance(timer, threading.Timer) and timer.daemon
+        finally:
+            timer.cancel()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    received = []
+    failures = 0
+
+    def do_GET(self):
+        # Chunked, to read it the way the pool reads any sink response
+        self.send_response(200)
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        for chunk in (b'{"status": ', b'"healthy"}'):
+            self.wfile.write(b"%x\r\n%s\r\n" % (len(chunk), chunk))
+        self.wfile.write(b"0\r\n\r\n")
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        if _Handler.failures:
+            _Handler.failures -= 1
+            self.send_response(500)
+        else:
+            _Handler.received.append((self.path, json.loads(body)))
+            self.send_response(200)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def sink():
+    _Handler.received = []
+    _Handler.failures = 0
+    # Threading, a kept alive connection would hold up a single threaded server
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield "http://127.0.0.1:%d" % server.server_address[1]
+    server.shutdown()
+    server.server_close()
+
+
+class TestAsyncHTTPPool:
+    """Test keep-alive requests to a local HTTP/1.1 server."""
+
+    def test_connection_is_kept_alive_between_requests(self, sink):
+        pool = AsyncHTTPPool(sink, max_connections=2)
+
+        async def requests():
+            health = await pool.request("GET", "/health")
+            posted = await pool.request("POST", "/api/events", b'{"id": 1}', {"content-type": "application/json"})
+            return health, posted
+
+        health, posted = IOLoop.instance().submit(requests()).result(5)
+        assert (health.status, json.loads(health.body)) == (200, {"status": "healthy"})
+        assert posted.status == 200 and _Handler.received == [("/api/events", {"id": 1})]
+        assert pool.get_stats()["openedConnections"] == 1
+
+
+class TestAsyncWebSocket:
+    """Test the websocket client against a minimal local server."""
+
+    @staticmethod
+    async def _accept(reader, writer):
+        key = None
+        while True:
+            line = (await reader.readline()).decode("latin-1").strip()
+            if not line:
+                break
+            if line.lower().startswith("sec-websocket-key:"):
+                key = line.split(":", 1)[1].strip()
+        writer.write(("HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n"
+                      "Sec-WebSocket-Accept: %s\r\n\r\n" % accept_key(key)).encode("latin-1"))
+
+    @staticmethod
+    async def _serve(reader, writer):
+        await TestAsyncWebSocket._accept(reader, writer)
+        writer.write(encode_frame(OPCODE_PING, b"hi", mask=False))
+        server_side = AsyncWebSocket(reader, writer)
+        try:
+            while True:
+                await server_side.send("echo: " + await server_side.recv())
+        except WebSocketClosed:
+            pass
+
+    def _start_server(self):
+        async def start():
+            return await asyncio.start_server(self._serve, "127.0.0.1", 0)
+
+        server = IOLoop.instance().submit(start()).result(5)
+        return server, server.sockets[0].getsockname()[1]
+
+    def test_messages_are_exchanged_and_pings_answered(self):
+        server, port = self._start_server()
+
+        async def talk():
+            ws = await AsyncWebSocket.connect("ws://127.0.0.1:%d/app" % port, ["x-test: 1"])
+            await ws.send("a" * 70000)
+            reply = await ws.recv()
+            await ws.close()
+            return reply
+
+        try:
+            assert IOLoop.instance().submit(talk()).result(5) == "echo: " + "a" * 70000
+        finally:
+            IOLoop.instance().call_soon(server.close)
+
+    def test_frame_over_max_message_bytes_closes_the_connection(self):
+        dropped = threading.Event()
+
+        async def serve(reader, writer):
+            await self._accept(reader, writer)
+            # A binary frame announcing 1 TB, of which nothing follows
+            writer.write(b"\x82\x7f" + struct.pack("!Q", 1 << 40))
+            if await reader.read() == b"":
+                dropped.set()
+            writer.close()
+
+        async def start():
+            return await asyncio.start_server(serve, "127.0.0.1", 0)
+
+        server = IOLoop.instance().submit(start()).result(5)
+
+        async def receive():
+            port = server.sockets[0].getsockname()[1]
+            ws = await AsyncWebSocket.connect("ws://127.0.0.1:%d/app" % port, [])
+            try:
+                await ws.recv()
+            except WebSocketClosed as e:
+                return ws.closed, str(e)
+
+        try:
+            assert IOLoop.instance().submit(receive()).result(5) == (True, "Frame over 67108864 bytes")
+            assert dropped.wait(5)
+        finally:
+            IOLoop.instance().call_soon(server.close)
+
+    def test_broker_connection_sends_initial_requests_on_open(self):
+        server, port = self._start_server()
+        messages = []
+        credentials = BrokerCredentials(api_key="key", app_instance_id="instance", app_name="app", app_stage="test",
+                                        app_version="1", runtime="python", hostname="host")
+        connection = AsyncBrokerConnection("ws://127.0.0.1", port, credentials,
+                                           message_callback=lambda conn, msg: messages.append(msg),
+                                           initial_request_to_broker=lambda: connection.send("hello"),
+                                           io_loop=IOLoop.instance())
+        try:
+            connection.connect()
+            assert connection.connected.wait(5)
+            assert _wait_for(lambda: messages == ["echo: hello"])
+        finally:
+            connection.close()
+            IOLoop.instance().call_soon(server.close)
+        assert not connection.is_running()
+
+
+class TestBrokerManagerAsyncio:
+    """Test sending events from the loop instead of sender threads."""
+
+    def test_events_are_sent_from_the_loop_over_one_connection(self, sink, monkeypatch, tmp_path):
+        monkeypatch.setattr(io_loop, "IO_MODE", "asyncio")
+        monkeypatch.setattr(broker_manager, "EVENT_SINK_URL", sink)
+        monkeypatch.setattr(broker_manager, "EVENT_SENDER_THREADS", 1)
+        monkeypatch.setattr(broker_manager, "EVENT_PROCESS_WORKERS", 0)
+        monkeypatch.setattr(broker_manager, "EVENT_SPOOL_DIR", str(tmp_path))
+        _Handler.failures = 1
+        manager = BrokerManager()
+        for i in range(3):
+            manager.publish_event(LogPointEvent("lp-1", "app.py", 3, "run", "message %d" % i, "now"))
+
+        assert manager._event_queue.join(5)
+        assert sorted(event["logMessage"] for _, event in _Handler.received) == ["message 0", "message 1",
+                                                                                "message 2"]
+        assert manager._event_senders == [] and manager._event_batcher is None
+        stats = manager.get_stats()
+        assert stats["sender"]["sentEvents"] == 3 and stats["queue"]["retried"] == 1
+        assert stats["sender"]["connections"]["openedConnections"] == 1
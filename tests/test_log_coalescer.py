@@ -0,0 +1,178 @@
+"""
+Tests for coalescing repeated logpoint messages.
+"""
+
+import os
+import sys
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tracepointdebug.engine import pytrace
+from tracepointdebug.probe.breakpoints.logpoint import log_coalescer
+from tracepointdebug.probe.breakpoints.logpoint.log_coalescer import CoalesceConfig, LogCoalescer
+from tracepointdebug.probe.breakpoints.logpoint.log_point import LogPoint
+from tracepointdebug.probe.breakpoints.logpoint.log_point_config import LogPointConfig
+from tracepointdebug.probe.coded_exception import CodedException
+from tracepointdebug.probe.errors import INVALID_LOGPOINT_COALESCE
+from tracepointdebug.probe.event.logpoint.log_point_event import LogPointEvent
+
+
+def _event(message, created_at="2026-10-18 12:00:00.000"):
+    return LogPointEvent("lp-1", "app/retry.py", 12, "retry", message, created_at)
+
+
+class RecordingManager(object):
+    """Stands in for LogPointManager, keeping the events logpoints publish."""
+    _data_redaction_callback = None
+
+    def __init__(self):
+        self.events = []
+
+    def publish_event(self, event):
+        self.events.append(event)
+
+    def expire_log_point(self, log_point):
+        pass
+
+
+def _hit_line():
+    return _hit_line.__code__.co_firstlineno + 1
+
+
+class TestCoalesceConfig:
+    """Test parsing the coalesce logpoint field."""
+
+    def test_parses_window_count_and_keys(self):
+        config = CoalesceConfig.from_json({"windowMs": 500, "maxCount": 10, "keys": ["user_id", "attempt"]})
+
+        assert (config.window_ms, config.max_count, config.keys) == (500, 10, ("user_id", "attempt"))
+        assert CoalesceConfig.from_json({"windowMs": 1}).max_count == log_coalescer.DEFAULT_COALESCE_MAX_COUNT
+        assert CoalesceConfig.from_json(None) is None
+
+    @pytest.mark.parametrize("config", [
+        {"maxCount": 5},
+        {"windowMs": 0},
+        {"windowMs": True},
+        {"windowMs": 100, "maxCount": 0},
+        {"windowMs": 100, "keys": []},
+        {"windowMs": 100, "keys": "user_id"},
+        {"windowMs": 100, "window": 5},
+        [100],
+    ])
+    def test_rejects_invalid_configs(self, config):
+        with pytest.raises(ValueError):
+            CoalesceConfig.from_json(config)
+
+
+class TestLogCoalescer:
+    """Test folding messages into windows."""
+
+    def test_folds_identical_messages_until_window_closes(self):
+        published = []
+        coalescer = LogCoalescer(CoalesceConfig(window_ms=100), published.append)
+        first = _event("retrying order 7")
+
+        assert coalescer.add("retrying order 7", first)
+        assert coalescer.add("retrying order 7", _event("retrying order 7"))
+        assert coalescer.add("retrying order 8", _event("retrying order 8"))
+        assert coalescer.fold("retrying order 7")
+        assert published == []
+
+        deadline = time.time() + 5
+        while len(published) < 2 and time.time() < deadline:
+            time.sleep(0.01)
+        assert sorted((event.log_message, event.count) for event in published) == \
+            [("retrying order 7", 3), ("retrying order 8", 1)]
+        assert published[0] is first or published[1] is first
+        assert first.first_seen == first.created_at
+        assert first.last_seen >= first.first_seen
+        assert not coalescer.fold("retrying order 7")
+
+    def test_publishes_when_count_reaches_cap(self):
+        published = []
+        coalescer = LogCoalescer(CoalesceConfig(window_ms=60000, max_count=3), published.append)
+        for _ in range(7):
+            coalescer.add("same", _event("same"))
+
+        assert [event.count for event in published] == [3, 3]
+        coalescer.flush()
+        assert [event.count for event in published] == [3, 3, 1]
+
+    def test_expired_window_is_published_on_next_message(self, monkeypatch):
+        now = [1000 * 1000000000]
+        monkeypatch.setattr(log_coalescer.time, "time_ns", lambda: now[0])
+        published = []
+        coalescer = LogCoalescer(CoalesceConfig(window_ms=10), published.append)
+        coalescer.add("same", _event("same"))
+        coalescer.add("same", _event("same"))
+        now[0] += 20 * 1000000
+
+        assert not coalescer.fold("same")
+        assert [event.count for event in published] == [2]
+        coalescer.flush()
+
+    def test_new_keys_beyond_the_table_are_not_coalesced(self, monkeypatch):
+        monkeypatch.setattr(log_coalescer, "MAX_COALESCE_ENTRIES", 2)
+        coalescer = LogCoalescer(CoalesceConfig(window_ms=60000), lambda event: None)
+
+        assert coalescer.add("a", _event("a"))
+        assert coalescer.add("b", _event("b"))
+        assert not coalescer.add("c", _event("c"))
+        assert coalescer.add("a", _event("a"))
+        coalescer.flush()
+
+    def test_values_key_handles_unhashable_values(self):
+        coalescer = LogCoalescer(CoalesceConfig(window_ms=100, keys=("user", "items")), lambda event: None)
+
+        assert coalescer.values_key({"user": "ada", "items": [1, 2]}) == \
+            coalescer.values_key({"user": "ada", "items": [1, 2], "other": 3})
+        assert coalescer.values_key({"user": "ada"}) == ("ada", None)
+
+    def test_event_json_carries_coalescing_fields(self):
+        event = _event("message")
+
+        assert (event.to_json()["count"], event.to_json()["firstSeen"], event.to_json()["lastSeen"]) == (1, None, None)
+
+
+class TestCoalescingLogPoint:
+    """Test logpoints with a coalesce config."""
+
+    def _log_point(self, manager, coalesce, expression="attempt for {{user}}"):
+        config = LogPointConfig("lp-coalesce", "tests/" + os.path.basename(__file__), "", _hit_line(), "test",
+                                expression, None, -1, -1, coalesce=coalesce)
+        return LogPoint(manager, config, pytrace)
+
+    def test_logpoint_publishes_one_event_per_window(self):
+        manager = RecordingManager()
+        log_point = self._log_point(manager, {"windowMs": 60000})
+        try:
+            for user in ["ada", "ada", "bob", "ada"]:
+                log_point.breakpoint_callback("line", sys._getframe())
+        finally:
+            log_point.remove_log_point()
+            pytrace.remove_logpoint(log_point.id)
+
+        assert sorted((event.log_message, event.count) for event in manager.events) == \
+            [("attempt for ada", 3), ("attempt for bob", 1)]
+
+    def test_keys_fold_hits_before_rendering(self):
+        manager = RecordingManager()
+        log_point = self._log_point(manager, {"windowMs": 60000, "keys": ["user"]}, "attempt {{attempt}} for {{user}}")
+        try:
+            user = "ada"
+            for attempt in range(3):
+                log_point.breakpoint_callback("line", sys._getframe())
+        finally:
+            log_point.remove_log_point()
+            pytrace.remove_logpoint(log_point.id)
+
+        assert [(event.log_message, event.count) for event in manager.events] == [("attempt 0 for ada", 3)]
+
+    def test_invalid_config_fails_the_put(self):
+        with pytest.raises(CodedException) as e:
+            self._log_point(RecordingManager(), {"windowMs": -1})
+
+        assert e.value.code == INVALID_LOGPOINT_COALESCE.code
@@ -0,0 +1,177 @@
+"""
+Tests for buffered logpoint output sinks.
+"""
+
+import io
+import json
+import logging
+import os
+import sys
+import threading
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tracepointdebug.probe.breakpoints.logpoint.log_output import LogOutputBuffer, LogSink, StdoutSink, \
+    NdjsonFileSink, LoggingSink, LogOutput, create_sinks, DROP_OLDEST, DROP_NEWEST
+from tracepointdebug.probe.event.logpoint.log_point_event import LogPointEvent
+
+
+def _event(i=0, message=None):
+    return LogPointEvent("lp-1", "app/orders.py", 42, "checkout", message or "message %d" % i,
+                         "2026-10-18 12:00:00.%03d" % i)
+
+
+class BlockingSink(LogSink):
+    """Sink whose writes wait until released, standing in for a slow pipe."""
+    name = "blocking"
+
+    def __init__(self, **kwargs):
+        super(BlockingSink, self).__init__(**kwargs)
+        self.release = threading.Event()
+        self.writing = threading.Event()
+        self.batches = []
+
+    def write(self, messages):
+        self.writing.set()
+        self.release.wait(5)
+        self.batches.append([event.log_message for event, _ in messages])
+
+
+class TestLogOutputBuffer:
+    """Test the bounded buffer and its overflow policies."""
+
+    def test_drop_oldest_keeps_newest_messages(self):
+        buffer = LogOutputBuffer(capacity=2, overflow=DROP_OLDEST)
+        for i in range(4):
+            assert buffer.put(i)
+
+        assert buffer.take_all() == [2, 3]
+        assert (buffer.dropped_oldest, buffer.dropped_newest) == (2, 0)
+
+    def test_drop_newest_keeps_oldest_messages(self):
+        buffer = LogOutputBuffer(capacity=2, overflow=DROP_NEWEST)
+        results = [buffer.put(i) for i in range(4)]
+
+        assert results == [True, True, False, False]
+        assert buffer.take_all() == [0, 1]
+        assert (buffer.dropped_oldest, buffer.dropped_newest) == (0, 2)
+
+    def test_unknown_overflow_policy_is_rejected(self):
+        with pytest.raises(ValueError):
+            LogOutputBuffer(overflow="block")
+
+    def test_closed_buffer_hands_out_the_rest_then_none(self):
+        buffer = LogOutputBuffer()
+        buffer.put(1)
+        buffer.close()
+
+        assert not buffer.put(2)
+        assert buffer.take_all() == [1]
+        assert buffer.take_all() is None
+
+
+class TestLogSinks:
+    """Test writer threads and the sinks."""
+
+    def test_emit_does_not_wait_for_a_slow_writer(self):
+        sink = BlockingSink(buffer_size=3, overflow=DROP_OLDEST)
+        sink.emit(_event(0), "INFO")
+        assert sink.writing.wait(5)
+        for i in range(1, 6):
+            sink.emit(_event(i), "INFO")
+        sink.release.set()
+
+        assert sink.flush(5)
+        assert sink.batches == [["message 0"], ["message 3", "message 4", "message 5"]]
+        stats = sink.get_stats()
+        assert (stats["written"], stats["droppedOldest"], stats["buffered"]) == (4, 2, 0)
+        sink.close()
+
+    def test_stdout_sink_writes_the_printed_lines(self, monkeypatch):
+        stream = io.StringIO()
+        monkeypatch.setattr(sys, "stdout", stream)
+        sink = StdoutSink()
+        sink.emit(_event(1), "INFO")
+        sink.emit(_event(2), "WARN")
+
+        assert sink.flush(5)
+        assert stream.getvalue() == "2026-10-18 12:00:00.001 [INFO] message 1\n" \
+                                    "2026-10-18 12:00:00.002 [WARN] message 2\n"
+        sink.close()
+
+    def test_file_sink_writes_ndjson_records(self, tmp_path):
+        path = str(tmp_path / "logpoints.ndjson")
+        sink = NdjsonFileSink(path=path)
+        sink.emit(_event(1, message="café \"quoted\""), "INFO")
+        sink.emit(_event(2), "ERROR")
+        assert sink.flush(5)
+        sink.close()
+
+        with open(path, encoding="utf-8") as f:
+            records = [json.loads(line) for line in f]
+        assert records == [
+            {"createdAt": "2026-10-18 12:00:00.001", "level": "INFO", "logPointId": "lp-1",
+             "fileName": "app/orders.py", "lineNo": 42, "methodName": "checkout", "logMessage": "café \"quoted\""},
+            {"createdAt": "2026-10-18 12:00:00.002", "level": "ERROR", "logPointId": "lp-1",
+             "fileName": "app/orders.py", "lineNo": 42, "methodName": "checkout", "logMessage": "message 2"},
+        ]
+
+    def test_file_sink_rotates_by_size(self, tmp_path):
+        path = str(tmp_path / "logpoints.ndjson")
+        line_size = len(NdjsonFileSink._encode(_event(0), "INFO"))
+        sink = NdjsonFileSink(path=path, max_bytes=line_size * 3, backups=2)
+        for i in range(10):
+            sink.emit(_event(i), "INFO")
+        assert sink.flush(5)
+        sink.close()
+
+        def messages(name):
+            with open(os.path.join(str(tmp_path), name), encoding="utf-8") as f:
+                return [json.loads(line)["logMessage"] for line in f]
+        assert messages("logpoints.ndjson") == ["message 9"]
+        assert messages("logpoints.ndjson.1") == ["message 6", "message 7", "message 8"]
+        assert messages("logpoints.ndjson.2") == ["message 3", "message 4", "message 5"]
+        assert not os.path.exists(path + ".3")
+
+    def test_logging_sink_hands_records_to_its_logger(self, caplog):
+        sink = LoggingSink(logger_name="tracepointdebug.logpoint.test")
+        with caplog.at_level(logging.DEBUG, logger="tracepointdebug.logpoint.test"):
+            sink.emit(_event(1), "WARN")
+            sink.emit(_event(2), "debug")
+            assert sink.flush(5)
+
+        records = [r for r in caplog.records if r.name == "tracepointdebug.logpoint.test"]
+        assert [(r.levelno, r.getMessage(), r.lineno, r.funcName, r.log_point_id) for r in records] == [
+            (logging.WARNING, "message 1", 42, "checkout", "lp-1"),
+            (logging.DEBUG, "message 2", 42, "checkout", "lp-1"),
+        ]
+        sink.close()
+
+
+class TestLogOutput:
+    """Test configuring the sinks of logpoint output."""
+
+    def test_creates_sinks_by_name(self):
+        sinks = create_sinks("stdout, logging,file")
+
+        assert [type(sink) for sink in sinks] == [StdoutSink, LoggingSink, NdjsonFileSink]
+        with pytest.raises(ValueError):
+            create_sinks("stdout,syslog")
+
+    def test_emits_to_every_sink_and_reports_stats(self):
+        first, second = BlockingSink(), BlockingSink(overflow=DROP_NEWEST)
+        first.release.set()
+        second.release.set()
+        output = LogOutput([first, second])
+        output.emit(_event(1), "INFO")
+
+        assert output.flush(5)
+        assert first.batches == second.batches == [["message 1"]]
+        assert output.get_stats()["blocking"]["overflow"] == DROP_NEWEST
+
+        replacement = BlockingSink()
+        output.set_sinks([replacement])
+        assert output.sinks == [replacement]
+        assert first.buffer.take_all() is None
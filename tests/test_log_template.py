@@ -0,0 +1,111 @@
+"""
+Tests for compiled logpoint templates and logpoint timestamps.
+"""
+
+import os
+import sys
+from datetime import datetime
+
+import pystache
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tracepointdebug.probe.breakpoints.logpoint import log_template
+from tracepointdebug.probe.breakpoints.logpoint.log_template import LogTemplate, format_timestamp
+from tracepointdebug.probe.capture_context import CaptureContext
+
+TEMPLATES = [
+    "plain text",
+    "x={{x}}, y={{y}}",
+    "html={{html}} raw={{{html}}} amp={{&html}}",
+    "order {{order.id}} of {{order.owner.name}}",
+    "{{#items}}{{name}}={{qty}};{{/items}}",
+    "{{^missing}}none{{/missing}}{{^items}}never{{/items}}",
+    "{{! a comment }}x={{x}}",
+    "{{=<% %>=}}x=<%x%> y=<%y%>",
+    "{{#items}}{{.}}{{/items}} {{unknown}}|",
+    "{{x}} {{x}} {{x.real}}",
+]
+
+
+class Owner(object):
+    def __init__(self):
+        self.name = "ada"
+
+
+def _frame():
+    x = 3
+    y = "<b>&\"'"
+    html = "<i>"
+    order = {"id": 7, "owner": Owner()}
+    items = [{"name": "a", "qty": 1}, {"name": "b", "qty": 2}]
+    return sys._getframe()
+
+
+def _all_variables(frame):
+    variables = dict(frame.f_locals)
+    variables.update(frame.f_globals)
+    return variables
+
+
+class TestLogTemplate:
+    """Test that compiled templates render what pystache.render does."""
+
+    @pytest.mark.parametrize("template", TEMPLATES)
+    def test_renders_like_pystache(self, template):
+        frame = _frame()
+        variables = _all_variables(frame)
+        compiled = LogTemplate(template)
+
+        assert compiled.render(variables) == pystache.render(template, variables)
+        assert compiled.render(CaptureContext(frame).lookup(compiled.names)) == pystache.render(template, variables)
+
+    def test_collects_root_names_only(self):
+        assert LogTemplate("plain").names == set()
+        assert LogTemplate("{{a.b}} {{#c}}{{d}}{{.}}{{/c}} {{^e}}{{f}}{{/e}} {{! g }}").names == {"a", "c", "d", "e", "f"}
+
+    def test_partials_need_all_variables(self):
+        assert LogTemplate("{{> other}} {{x}}").names is None
+        assert LogTemplate("{{#c}}{{> other}}{{/c}}").names is None
+
+    def test_lookup_prefers_globals_like_the_merged_variables(self):
+        __name__ = "shadowed"
+        context = CaptureContext(sys._getframe())
+
+        assert context.lookup(["__name__", "missing"]) == {"__name__": globals()["__name__"]}
+        assert context.lookup(["__name__"]) == {"__name__": context.variables["__name__"]}
+
+    def test_invalid_template_fails_on_render(self):
+        template = "{{/never_opened}}"
+        with pytest.raises(Exception) as expected:
+            pystache.render(template, {})
+        compiled = LogTemplate(template)
+
+        with pytest.raises(type(expected.value)):
+            compiled.render({})
+
+
+class TestFormatTimestamp:
+    """Test logpoint timestamps formatted from a cached per-second prefix."""
+
+    @pytest.mark.parametrize("now_ns", [0, 999999, 1700000000000000000, 1700000000999999999, 1700000001000500000])
+    def test_formats_like_datetime(self, now_ns):
+        expected = datetime.fromtimestamp(now_ns // 1000000000).replace(
+            microsecond=now_ns % 1000000000 // 1000).strftime("%Y-%m-%d %H:%M:%S.%f")[:-3]
+
+        assert format_timestamp(now_ns) == expected
+
+    def test_reuses_prefix_within_a_second(self):
+        format_timestamp(1700000000000000000)
+        second, prefix = log_template._timestamp_prefix
+
+        assert format_timestamp(1700000000456000000) == prefix + ".456"
+        assert log_template._timestamp_prefix[1] is prefix
+        assert format_timestamp(1700000001000000000) != prefix + ".000"
+
+    def test_defaults_to_now(self):
+        before = datetime.now().replace(microsecond=0)
+        formatted = datetime.strptime(format_timestamp(), "%Y-%m-%d %H:%M:%S.%f")
+
+        assert before <= formatted <= datetime.now()
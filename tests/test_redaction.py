@@ -0,0 +1,229 @@
+"""
+Tests for declarative redaction rules applied during snapshot capture.
+"""
+
+import json
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tracepointdebug.probe.breakpoints.logpoint.log_template import LogTemplate
+from tracepointdebug.probe.encoder import to_json
+from tracepointdebug.probe.snapshot import SnapshotCollector
+from tracepointdebug.probe.snapshot import snapshot_collector_config_manager as config_manager
+from tracepointdebug.probe.snapshot.capture_profile import CaptureProfile
+from tracepointdebug.probe.snapshot.serialization import CircularReferenceTracker, safe_serialize_object
+from tracepointdebug.probe.snapshot.redaction import RedactionRules, DEFAULT_MASK, set_redaction_rules, \
+    get_redaction_rules
+from tracepointdebug.probe.snapshot.type_serializers import register_serializer, unregister_serializer
+
+
+@pytest.fixture
+def redaction_rules():
+    """Installs redaction rules for a test and removes them afterwards."""
+    saved_configs = dict(config_manager.snapshot_configs)
+    config_manager.snapshot_configs.update({"maxFrames": 1})
+    yield set_redaction_rules
+    set_redaction_rules(None)
+    config_manager.snapshot_configs.clear()
+    config_manager.snapshot_configs.update(saved_configs)
+
+
+class Credentials(object):
+    serialized = 0
+
+    def __init__(self):
+        self.user = "ada"
+        self.key = "k3y"
+
+
+class Account(object):
+    def __init__(self):
+        self.owner = "Ada"
+        self.api_token = "t0ken"
+
+
+class SecretFile(object):
+    """File-like, so the collector serializes it as a non-serializable object."""
+
+    def __init__(self):
+        self.name = "vault.txt"
+        self.secret = "s3cret"
+        self.options = {"mode": "r", "password": "hunter2"}
+
+    def read(self):
+        return self.secret
+
+    def close(self):
+        pass
+
+    def __repr__(self):
+        return "<SecretFile Bearer abc.def>"
+
+
+def _capture_variables():
+    return json.loads(to_json(SnapshotCollector().collect(sys._getframe(1)).frames))[0]["variables"]
+
+
+class TestRedactionRules:
+    """Test compiling and matching redaction rules."""
+
+    def test_name_patterns_are_case_insensitive_globs(self):
+        rules = RedactionRules(names=["*password*", "authorization"])
+
+        assert rules.matches_name("db_PASSWORD")
+        assert rules.matches_name("Authorization")
+        assert not rules.matches_name("authorization_count")
+        assert not rules.matches_name("username")
+
+    def test_builtin_value_patterns(self):
+        rules = RedactionRules(values=["cardNumber", "bearerToken"])
+
+        assert rules.redact_text("card 4111 1111 1111 1111 ok") == "card %s ok" % DEFAULT_MASK
+        assert rules.redact_text("Authorization: Bearer abc.def-123") == "Authorization: %s" % DEFAULT_MASK
+        assert rules.redact_text("order 12345") == "order 12345"
+
+    def test_type_names_match_plain_and_qualified(self):
+        rules = RedactionRules(types=["Credentials", "%s.Account" % __name__])
+
+        assert rules.matches_type(Credentials())
+        assert rules.matches_type(Account())
+        assert not rules.matches_type({})
+
+    @pytest.mark.parametrize("rules", [
+        {"names": "password"},
+        {"values": ["("]},
+        {"mask": 1},
+        ["password"],
+    ])
+    def test_invalid_rules_are_rejected(self, rules):
+        with pytest.raises(ValueError):
+            RedactionRules.from_json(rules)
+
+    def test_invalid_rules_keep_current_ones(self, redaction_rules):
+        redaction_rules({"names": ["password"]})
+
+        with pytest.raises(ValueError):
+            set_redaction_rules({"values": ["("]})
+
+        assert get_redaction_rules().matches_name("password")
+
+
+class TestCollectorRedaction:
+    """Test that the collector masks values before walking them."""
+
+    def test_names_are_masked_at_every_level(self, redaction_rules):
+        redaction_rules({"names": ["*password*", "*token*"]})
+        password = "hunter2"
+        config = {"db": {"user": "app", "db_password": "hunter2"}}
+        account = Account()
+
+        variables = _capture_variables()
+
+        assert variables["password"] == {"@type": "str", "@value": DEFAULT_MASK}
+        assert variables["config"]["@value"]["db"]["@value"]["db_password"]["@value"] == DEFAULT_MASK
+        assert variables["config"]["@value"]["db"]["@value"]["user"]["@value"] == "app"
+        assert variables["account"]["@value"]["api_token"]["@value"] == DEFAULT_MASK
+        assert variables["account"]["@value"]["owner"]["@value"] == "Ada"
+
+    def test_redacted_types_are_never_serialized(self, redaction_rules):
+        def serialize(value):
+            Credentials.serialized += 1
+            return {"user": value.user}
+
+        register_serializer(Credentials, serialize)
+        try:
+            redaction_rules({"types": ["Credentials"]})
+            credentials = [Credentials()]
+
+            variables = _capture_variables()
+        finally:
+            unregister_serializer(Credentials)
+
+        assert variables["credentials"]["@value"] == [{"@type": "Credentials", "@value": DEFAULT_MASK}]
+        assert Credentials.serialized == 0
+
+    def test_value_patterns_mask_parts_of_strings(self, redaction_rules):
+        redaction_rules({"values": ["cardNumber"], "mask": "****"})
+        note = "paid with 4111-1111-1111-1111"
+
+        variables = _capture_variables()
+
+        assert variables["note"]["@value"] == "paid with ****"
+
+    def test_watches_reading_redacted_names_are_masked(self, redaction_rules):
+        redaction_rules({"names": ["*token*"]})
+        account = Account()
+        profile = CaptureProfile.from_json({"variables": [], "watchExpressions": ["account.api_token",
+                                                                                  "account.owner"]})
+
+        frames = json.loads(to_json(SnapshotCollector(profile=profile).collect(sys._getframe()).frames))
+
+        assert frames[0]["watches"]["account.api_token"]["@value"] == DEFAULT_MASK
+        assert frames[0]["watches"]["account.owner"]["@value"] == "Ada"
+
+    def test_non_serializable_values_apply_type_and_value_rules(self, redaction_rules):
+        redaction_rules({"types": ["Credentials"], "values": ["bearerToken"]})
+        credentials = Credentials()
+        vault = SecretFile()
+
+        variables = _capture_variables()
+
+        assert variables["credentials"]["@value"] == DEFAULT_MASK
+        assert variables["vault"]["@value"]["__repr__"] == "<SecretFile %s>" % DEFAULT_MASK
+
+    def test_nested_values_of_serialized_objects_are_masked(self, redaction_rules):
+        redaction_rules({"names": ["*password*", "secret"], "types": ["Credentials"]})
+        tracker = CircularReferenceTracker()
+        rules = get_redaction_rules()
+
+        serialized = safe_serialize_object({"vault": SecretFile().__dict__, "creds": Credentials()}, tracker,
+                                           redaction=rules)
+
+        assert serialized == {"vault": {"name": "vault.txt", "secret": DEFAULT_MASK,
+                                        "options": {"mode": "r", "password": DEFAULT_MASK}},
+                              "creds": DEFAULT_MASK}
+
+    def test_no_rules_capture_everything(self, redaction_rules):
+        password = "hunter2"
+
+        assert _capture_variables()["password"]["@value"] == "hunter2"
+
+
+class TestLogRedaction:
+    """Test redaction of logpoint template variables and messages."""
+
+    def test_redact_variables_masks_names_types_and_values(self):
+        rules = RedactionRules(names=["password"], types=["Credentials"], values=["bearerToken"])
+        variables = {"password": "hunter2", "creds": Credentials(), "header": "Bearer abc", "user": "ada"}
+
+        redacted = rules.redact_variables(variables)
+
+        assert redacted == {"password": DEFAULT_MASK, "creds": DEFAULT_MASK, "header": DEFAULT_MASK, "user": "ada"}
+        assert variables["password"] == "hunter2"
+
+    def test_dotted_template_paths_are_masked(self):
+        rules = RedactionRules(names=["*password*", "authorization"], values=["bearerToken"])
+        template = LogTemplate("{{user.name}} {{user.password}} {{headers.authorization}} {{headers.host}} "
+                               "{{account.owner}} {{#accounts}}{{api_password}}{{/accounts}}")
+        variables = {"user": {"name": "ada", "password": "hunter2"},
+                     "headers": {"authorization": "Basic YWRh", "host": "example.com"},
+                     "account": Account(), "accounts": [{"api_password": "p"}]}
+
+        rendered = template.render(rules.redact_variables(variables))
+
+        assert rendered == "ada {0} {0} example.com Ada {0}".format(DEFAULT_MASK)
+        assert variables["user"]["password"] == "hunter2"
+
+    def test_attributes_and_method_results_are_redacted(self):
+        rules = RedactionRules(names=["secret"], types=["Credentials"], values=["bearerToken"])
+        vault = SecretFile()
+        vault.credentials = Credentials()
+        template = LogTemplate("{{vault.name}} {{vault.secret}} {{vault.credentials}} {{vault.read}} {{{vault}}}")
+
+        rendered = template.render(rules.redact_variables({"vault": vault}))
+
+        assert rendered == "vault.txt {0} {0} s3cret <SecretFile {0}>".format(DEFAULT_MASK)
@@ -0,0 +1,670 @@
+"""
+Tests for the Python snapshot collector.
+
+Captures real frames with SnapshotCollector and checks the encoded snapshot tree.
+"""
+
+import dataclasses
+import enum
+import json
+import os
+import sys
+import time
+from collections import namedtuple
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tracepointdebug.engine import pytrace
+from tracepointdebug.probe.capture_context import CaptureContext, open_capture_context, close_capture_context, \
+    get_capture_context
+from tracepointdebug.probe.encoder import to_json
+from tracepointdebug.probe.snapshot import SnapshotCollector
+from tracepointdebug.probe.snapshot import snapshot_collector_config_manager as config_manager
+from tracepointdebug.probe.snapshot import deferred_capture, frame_metadata, snapshot_collector
+from tracepointdebug.probe.snapshot.capture_profile import CaptureProfile
+from tracepointdebug.probe.breakpoints.tracepoint.trace_point_stats import TracePointStats
+from tracepointdebug.probe.snapshot.snapshot_delta_encoder import SnapshotDeltaEncoder
+from tracepointdebug.probe.snapshot.type_serializers import register_serializer, unregister_serializer
+from scripts.event_sink import resolve_snapshot_references, reconstruct_delta_snapshot
+
+
+@pytest.fixture
+def snapshot_config():
+    """Snapshot config overrides, restored after the test."""
+    saved = dict(config_manager.snapshot_configs)
+    yield config_manager.snapshot_configs
+    config_manager.snapshot_configs.clear()
+    config_manager.snapshot_configs.update(saved)
+
+
+def _encode_frames(snapshot):
+    return json.loads(to_json(snapshot.frames))
+
+
+class Request(object):
+    def __init__(self, path):
+        self.path = path
+        self.headers = {"accept": "json"}
+
+
+class Handler(object):
+    def __init__(self, request):
+        self.request = request
+
+
+def _capture_shared_request():
+    request = Request("/orders")
+    handler = Handler(request)
+    return SnapshotCollector().collect(sys._getframe())
+
+
+class TestReferenceDeduplication:
+    """Test identity based sharing of repeated objects inside one snapshot."""
+
+    def test_repeated_objects_are_serialized_in_full_by_default(self, snapshot_config):
+        """Without dedupReferences every occurrence is serialized"""
+        variables = _encode_frames(_capture_shared_request())[0]["variables"]
+
+        assert "@id" not in variables["request"]
+        assert variables["handler"]["@value"]["request"]["@value"]["path"]["@value"] == "/orders"
+
+    def test_repeated_objects_become_references(self, snapshot_config):
+        """With dedupReferences later occurrences become @ref markers"""
+        snapshot_config["dedupReferences"] = True
+        variables = _encode_frames(_capture_shared_request())[0]["variables"]
+
+        request_id = variables["request"]["@id"]
+        assert variables["handler"]["@value"]["request"] == {"@ref": request_id}
+
+    def test_dedup_reduces_snapshot_size(self, snapshot_config):
+        """Shared subtrees are only paid for once"""
+        full = to_json(_capture_shared_request().frames)
+        snapshot_config["dedupReferences"] = True
+        deduplicated = to_json(_capture_shared_request().frames)
+
+        assert len(deduplicated) < len(full)
+
+    def test_self_cycle_becomes_reference(self, snapshot_config):
+        """A container that contains itself points back to its own id"""
+        snapshot_config["dedupReferences"] = True
+
+        def capture():
+            node = {"name": "root"}
+            node["self"] = node
+            return SnapshotCollector().collect(sys._getframe())
+
+        node = _encode_frames(capture())[0]["variables"]["node"]
+        assert node["@value"]["self"] == {"@ref": node["@id"]}
+
+    def test_sink_resolves_references(self, snapshot_config):
+        """The event sink expands @ref markers back to the shared value"""
+        snapshot_config["dedupReferences"] = True
+        variables = resolve_snapshot_references(_encode_frames(_capture_shared_request()))[0]["variables"]
+
+        shared = variables["handler"]["@value"]["request"]
+        assert shared["@value"]["path"]["@value"] == "/orders"
+        assert shared == variables["request"]
+
+    def test_sink_keeps_cyclic_references(self):
+        """Resolving never builds a cyclic structure"""
+        tree = {"@type": "dict", "@id": 1, "@value": {"self": {"@ref": 1}}}
+
+        assert resolve_snapshot_references(tree) == tree
+
+
+def _capture_order(order, config):
+    return SnapshotCollector().collect(sys._getframe())
+
+
+class TestSnapshotDeltaEncoding:
+    """Test delta encoding of repeated snapshots of the same tracepoint."""
+
+    def test_first_snapshot_is_keyframe(self, snapshot_config):
+        """The first snapshot is always sent in full"""
+        frames, base_snapshot_id = SnapshotDeltaEncoder().encode("s1", _capture_order({"id": 1}, {"retries": 3}).frames)
+
+        assert base_snapshot_id is None
+        assert frames[0]["variables"]["config"]["@value"]["retries"]["@value"] == 3
+
+    def test_unchanged_subtrees_are_replaced(self, snapshot_config):
+        """Only changed subtrees are sent after the keyframe"""
+        encoder = SnapshotDeltaEncoder()
+        config = {"retries": 3}
+        encoder.encode("s1", _capture_order({"id": 1, "total": 10}, config).frames, now=100)
+        frames, base_snapshot_id = encoder.encode("s2", _capture_order({"id": 1, "total": 20}, config).frames, now=101)
+
+        variables = frames[0]["variables"]
+        assert base_snapshot_id == "s1"
+        assert variables["config"] == {"@unchanged": True}
+        assert variables["order"]["@value"]["id"] == {"@unchanged": True}
+        assert variables["order"]["@value"]["total"]["@value"] == 20
+
+    def test_deltas_are_based_on_the_keyframe(self, snapshot_config):
+        """Every delta refers to the keyframe, so a dropped delta leaves later ones resolvable"""
+        encoder = SnapshotDeltaEncoder()
+        config = {"retries": 3}
+        keyframe, _ = encoder.encode("s1", _capture_order({"id": 1, "total": 10}, config).frames, now=100)
+        encoder.encode("s2", _capture_order({"id": 1, "total": 20}, config).frames, now=101)
+        full = json.loads(to_json(_capture_order({"id": 1, "total": 30}, config).frames))
+        delta, base_snapshot_id = encoder.encode("s3", _capture_order({"id": 1, "total": 30}, config).frames, now=102)
+
+        assert base_snapshot_id == "s1"
+        # s2 never reaches the sink
+        reconstruct_delta_snapshot({"id": "s1", "frames": keyframe, "baseSnapshotId": None})
+        event = reconstruct_delta_snapshot({"id": "s3", "frames": delta, "baseSnapshotId": base_snapshot_id})
+
+        assert "deltaUnresolved" not in event
+        assert event["frames"][0]["variables"] == full[0]["variables"]
+
+    def test_keyframe_every_n_snapshots(self, snapshot_config):
+        """A keyframe is forced after deltaKeyframeInterval snapshots"""
+        snapshot_config["deltaKeyframeInterval"] = 2
+        encoder = SnapshotDeltaEncoder()
+        bases = [encoder.encode("s%d" % i, _capture_order({"id": 1}, {}).frames, now=100)[1] for i in range(4)]
+
+        assert bases == [None, "s0", None, "s2"]
+
+    def test_keyframe_after_time_window(self, snapshot_config):
+        """A keyframe is forced once deltaKeyframeSecs have passed"""
+        snapshot_config["deltaKeyframeSecs"] = 5
+        encoder = SnapshotDeltaEncoder()
+        encoder.encode("s1", _capture_order({"id": 1}, {}).frames, now=100)
+
+        assert encoder.encode("s2", _capture_order({"id": 1}, {}).frames, now=102)[1] == "s1"
+        assert encoder.encode("s3", _capture_order({"id": 1}, {}).frames, now=106)[1] is None
+
+    def test_sink_reconstructs_full_snapshot(self, snapshot_config):
+        """The event sink rebuilds the full frames from the base snapshot"""
+        encoder = SnapshotDeltaEncoder()
+        config = {"retries": 3}
+        keyframe, _ = encoder.encode("s1", _capture_order({"id": 1, "total": 10}, config).frames, now=100)
+        full = json.loads(to_json(_capture_order({"id": 1, "total": 20}, config).frames))
+        delta, base_snapshot_id = encoder.encode("s2", _capture_order({"id": 1, "total": 20}, config).frames, now=101)
+
+        reconstruct_delta_snapshot({"id": "s1", "frames": keyframe, "baseSnapshotId": None})
+        event = reconstruct_delta_snapshot({"id": "s2", "frames": delta, "baseSnapshotId": base_snapshot_id})
+
+        assert event["frames"][0]["variables"] == full[0]["variables"]
+
+    def test_sink_flags_unknown_base(self):
+        """Deltas against an unknown base are kept and flagged"""
+        event = reconstruct_delta_snapshot({"id": "s9", "frames": [], "baseSnapshotId": "missing"})
+
+        assert event["deltaUnresolved"] is True
+
+
+def _capture_locals(**values):
+    frame_locals = values
+    return _encode_frames(SnapshotCollector().collect(sys._getframe()))[0]["variables"]["frame_locals"]["@value"]
+
+
+class TestValueSummarizers:
+    """Test summaries for binary buffers and array libraries."""
+
+    def test_bytes_get_bounded_hex_preview(self, snapshot_config):
+        """bytes locals are kept as a bounded hex preview"""
+        snapshot_config["maxVarLen"] = 8
+
+        def capture():
+            payload = b"\x00\x01abcdefgh"
+            return _encode_frames(SnapshotCollector().collect(sys._getframe()))[0]["variables"]
+
+        payload = capture()["payload"]
+        assert payload["@type"] == "bytes"
+        assert payload["@value"] == {"length": 10, "hex": "00016162", "truncated": True}
+
+    def test_array_and_memoryview_previews(self, snapshot_config):
+        """array.array and memoryview values report their size and a preview"""
+        import array
+
+        values = _capture_locals(numbers=array.array("H", [1, 2]), view=memoryview(b"xy"))
+
+        assert values["numbers"]["@value"]["nbytes"] == 4
+        assert values["numbers"]["@value"]["hex"] == "01000200"
+        assert values["view"]["@value"]["hex"] == "7879"
+
+    def test_ndarray_summary(self, snapshot_config):
+        """ndarrays report shape, dtype, samples and NaN aware stats"""
+        np = pytest.importorskip("numpy")
+
+        summary = _capture_locals(matrix=np.array([[1.0, np.nan, 3.0], [4.0, 5.0, 6.0]]))["matrix"]["@value"]
+
+        assert summary["shape"] == [2, 3]
+        assert summary["dtype"] == "float64"
+        assert summary["nbytes"] == 48
+        assert summary["head"][0] == 1.0
+        assert summary["tail"] == [6.0]
+        assert summary["nanCount"] == 1
+        assert summary["min"] == 1.0 and summary["max"] == 6.0
+
+    def test_dataframe_summary(self, snapshot_config):
+        """DataFrames are summarized instead of walking their block manager"""
+        pd = pytest.importorskip("pandas")
+
+        frame = pd.DataFrame({"qty": [1, 2, 3], "sku": ["a", "b", "c"]})
+        summary = _capture_locals(frame=frame)["frame"]["@value"]
+
+        assert summary["shape"] == [3, 2]
+        assert summary["columns"] == ["qty", "sku"]
+        assert summary["head"][0] == [1, "a"]
+        assert summary["stats"] == {"qty": {"min": 1, "max": 3, "mean": 2.0}}
+
+
+class Money(object):
+    def __init__(self, amount, currency):
+        self.amount = amount
+        self.currency = currency
+
+
+class PricedMoney(Money):
+    pass
+
+
+class Customer(object):
+    def __init__(self):
+        self.id = 7
+        self.name = "Ada"
+        self.session = {"token": "secret"}
+
+
+class SlottedPoint(object):
+    __slots__ = ("x", "y", "__hidden")
+
+    def __init__(self, x, y):
+        self.x = x
+        self.y = y
+        self.__hidden = 0
+
+
+class TaggedPoint(SlottedPoint):
+    def __init__(self, x, y):
+        super(TaggedPoint, self).__init__(x, y)
+        self.tag = "p"
+
+
+@dataclasses.dataclass
+class LineItem:
+    sku: str
+    qty: int
+
+
+class Color(enum.Enum):
+    RED = 1
+
+
+Pair = namedtuple("Pair", ["left", "right"])
+
+
+@pytest.fixture
+def serializers():
+    """Registers serializers for the test and removes them afterwards."""
+    registered = []
+
+    def register(cls, **kwargs):
+        register_serializer(cls, **kwargs)
+        registered.append(cls)
+
+    yield register
+    for cls in registered:
+        unregister_serializer(cls)
+
+
+class TestTypeSerializers:
+    """Test registered and built-in per type serializers."""
+
+    def test_registered_fn_applies_to_subclasses(self, snapshot_config, serializers):
+        """A fn serializer found through the MRO replaces the value, keeping its type name"""
+        serializers(Money, fn=lambda m: "%s %s" % (m.amount, m.currency))
+
+        values = _capture_locals(price=PricedMoney(5, "EUR"))
+
+        assert values["price"] == {"@type": "PricedMoney", "@value": "5 EUR"}
+
+    def test_registered_fields_limit_capture(self, snapshot_config, serializers):
+        """Only the declared fields are captured"""
+        serializers(Customer, fields=["id", "name"])
+
+        customer = _capture_locals(customer=Customer())["customer"]["@value"]
+
+        assert set(customer) == {"id", "name"}
+
+    def test_serializer_errors_capture_null(self, snapshot_config, serializers):
+        """A failing serializer does not break the snapshot"""
+        serializers(Money, fn=lambda m: 1 / 0)
+
+        assert _capture_locals(price=Money(1, "EUR"))["price"] == {"@type": "Money", "@value": None}
+
+    def test_register_requires_one_of_fn_or_fields(self):
+        with pytest.raises(ValueError):
+            register_serializer(Money)
+        with pytest.raises(ValueError):
+            register_serializer(Money, fn=str, fields=["amount"])
+
+    def test_builtin_handlers(self, snapshot_config):
+        """Slots, dataclasses, namedtuples and enums are captured from their declared fields"""
+        values = _capture_locals(point=TaggedPoint(1, 2), item=LineItem("a", 3), pair=Pair(1, 2), color=Color.RED)
+
+        point = values["point"]["@value"]
+        assert point["x"]["@value"] == 1 and point["_SlottedPoint__hidden"]["@value"] == 0
+        assert point["tag"]["@value"] == "p"
+        assert values["item"]["@value"]["qty"]["@value"] == 3
+        assert values["pair"]["@type"] == "Pair"
+        assert values["pair"]["@value"]["right"]["@value"] == 2
+        assert values["color"]["@value"] == {"name": {"@type": "str", "@value": "RED"},
+                                             "value": {"@type": "int", "@value": 1}}
+
+    def test_serialized_objects_are_deduplicated(self, snapshot_config):
+        """Field serialized objects take part in reference sharing"""
+        snapshot_config["dedupReferences"] = True
+
+        def capture():
+            first = SlottedPoint(1, 2)
+            second = first
+            return _encode_frames(SnapshotCollector().collect(sys._getframe()))[0]["variables"]
+
+        values = capture()
+        assert values["second"] == {"@ref": values["first"]["@id"]}
+
+
+class TestFrameMetadata:
+    """Test the per code object frame metadata cache and library frame handling."""
+
+    def test_metadata_is_cached_per_code_object(self):
+        code = sys._getframe().f_code
+
+        metadata = frame_metadata.get_frame_metadata(code)
+
+        assert frame_metadata.get_frame_metadata(code) is metadata
+        assert metadata.method_name == "test_metadata_is_cached_per_code_object"
+        assert metadata.qualified_name.endswith("TestFrameMetadata.test_metadata_is_cached_per_code_object")
+
+    def test_sys_path_change_invalidates_cache(self, monkeypatch):
+        code = sys._getframe().f_code
+        metadata = frame_metadata.get_frame_metadata(code)
+
+        monkeypatch.syspath_prepend(os.path.dirname(os.path.abspath(__file__)))
+        frame_metadata.check_sys_path()
+
+        assert frame_metadata.get_frame_metadata(code) is not metadata
+        assert frame_metadata.get_frame_metadata(code).path == "test_snapshot_collector.py"
+
+    def test_classification(self):
+        assert frame_metadata.classify_path(__file__) == frame_metadata.FRAME_CATEGORY_APP
+        assert frame_metadata.classify_path(json.__file__) == frame_metadata.FRAME_CATEGORY_STDLIB
+        assert frame_metadata.classify_path(frame_metadata.__file__) == frame_metadata.FRAME_CATEGORY_AGENT
+        assert frame_metadata.classify_path(pytest.__file__) == frame_metadata.FRAME_CATEGORY_LIBRARY
+
+    def test_library_frames_included_by_default(self, snapshot_config):
+        frames = _encode_frames(SnapshotCollector().collect(sys._getframe()))
+
+        assert not frames[1]["fileName"].startswith("tests")
+
+    def test_skip_library_frames(self, snapshot_config):
+        """Skipped library frames leave the frame budget to application code"""
+        snapshot_config["libraryFrames"] = "skip"
+
+        frames = _encode_frames(SnapshotCollector().collect(sys._getframe()))
+
+        assert frames[0]["methodName"] == "test_skip_library_frames"
+        assert all(frame["fileName"].startswith("tests") for frame in frames)
+
+    def test_collapse_library_frames(self, snapshot_config):
+        """Runs of library frames become a single frame with their count"""
+        snapshot_config["libraryFrames"] = "collapse"
+
+        frames = _encode_frames(SnapshotCollector().collect(sys._getframe()))
+
+        collapsed = [frame for frame in frames if "collapsedFrames" in frame]
+        assert collapsed and all(frame["collapsedFrames"] >= 1 for frame in collapsed)
+        assert frames[1].get("collapsedFrames", 0) > 1
+
+
+class TestDeferredCapture:
+    """Test the shallow frame copy used by deferred capture."""
+
+    def test_copy_serializes_like_the_live_frame(self, snapshot_config):
+        snapshot_config["maxExpandFrames"] = 2
+        order = {"id": 1, "lines": [{"sku": "a"}]}
+        customer = Customer()
+        frame = sys._getframe()
+
+        live = _encode_frames(SnapshotCollector().collect(frame))
+        collector = SnapshotCollector()
+        copied = _encode_frames(collector.collect(deferred_capture.copy_frames(collector, frame)))
+
+        assert copied[0]["variables"]["order"] == live[0]["variables"]["order"]
+        assert copied[0]["variables"]["customer"] == live[0]["variables"]["customer"]
+        assert [f["methodName"] for f in copied] == [f["methodName"] for f in live]
+
+    def test_first_container_level_is_copied(self, snapshot_config):
+        """Later changes to copied containers are not seen, nested values are shared"""
+        nested = {"status": "new"}
+        order = {"id": 1, "nested": nested}
+        collector = SnapshotCollector()
+        captured = deferred_capture.copy_frames(collector, sys._getframe())
+
+        order["id"] = 2
+        nested["status"] = "paid"
+
+        captured_order = captured.f_locals["order"]
+        assert captured_order["id"] == 1
+        assert captured_order["nested"] is nested
+
+    def test_large_containers_are_bounded(self):
+        copied = deferred_capture.shallow_copy(list(range(deferred_capture.MAX_COPIED_ITEMS * 2)))
+
+        assert len(copied) == deferred_capture.MAX_COPIED_ITEMS
+
+
+class _CountingCollector(SnapshotCollector):
+    def __init__(self, **kwargs):
+        super(_CountingCollector, self).__init__(**kwargs)
+        self.collections = 0
+
+    def collect(self, frame):
+        self.collections += 1
+        return super(_CountingCollector, self).collect(frame)
+
+
+class TestCaptureContext:
+    """Test the capture shared by the probes firing on the same line hit."""
+
+    def test_shared_context_collects_once(self, snapshot_config):
+        snapshot_config["maxFrames"] = 1
+        order = {"id": 1, "customer": {"name": "Ada"}}
+        context = CaptureContext(sys._getframe(), shared=True)
+        first, second = _CountingCollector(), _CountingCollector()
+
+        first_snapshot = context.collect(first)
+        second_snapshot = context.collect(second)
+
+        assert first.collections == 1 and second.collections == 0
+        assert second.cur_size == first.cur_size
+        assert _encode_frames(second_snapshot) == _encode_frames(first_snapshot)
+
+    def test_copies_are_independent(self, snapshot_config):
+        """A probe changing its snapshot, e.g. to redact it, does not change another probe's"""
+        snapshot_config["maxFrames"] = 1
+        secret = "s3cret"
+        context = CaptureContext(sys._getframe(), shared=True)
+        first = context.collect(SnapshotCollector())
+        second = context.collect(SnapshotCollector())
+
+        variable = next(v for v in first.frames[0].variables.variables if v.name == "secret")
+        variable.value.value = "****"
+
+        assert _encode_frames(second)[0]["variables"]["secret"]["@value"] == "s3cret"
+
+    def test_shallower_probe_gets_trimmed_copy(self, snapshot_config):
+        snapshot_config["maxFrames"] = 1
+        order = {"customer": {"address": {"city": "Paris"}}}
+        context = CaptureContext(sys._getframe(), shared=True)
+        deep = context.collect(SnapshotCollector(parse_depth=4))
+        shallow_collector = _CountingCollector(parse_depth=2)
+        shallow = context.collect(shallow_collector)
+
+        assert shallow_collector.collections == 0
+        expected = _encode_frames(SnapshotCollector(parse_depth=2).collect(sys._getframe()))
+        assert _encode_frames(shallow)[0]["variables"]["order"] == expected[0]["variables"]["order"]
+        assert _encode_frames(deep)[0]["variables"]["order"] != expected[0]["variables"]["order"]
+
+    def test_line_limits_collect_once_for_increasing_depths(self, snapshot_config):
+        """With the line's limits known up front, deeper probes after the first do not walk again"""
+        snapshot_config["maxFrames"] = 1
+        order = {"customer": {"address": {"city": {"name": "Paris"}}}}
+        context = CaptureContext(sys._getframe(), shared=True, limits=(4, SnapshotCollector().max_size))
+        collectors = [_CountingCollector(parse_depth=depth) for depth in (2, 3, 4)]
+
+        snapshots = [context.collect(collector) for collector in collectors]
+
+        assert sum(collector.collections for collector in collectors) == 1
+        for depth, snapshot in zip((2, 3, 4), snapshots):
+            expected = _encode_frames(SnapshotCollector(parse_depth=depth).collect(sys._getframe()))
+            assert _encode_frames(snapshot)[0]["variables"]["order"] == expected[0]["variables"]["order"]
+
+    def test_smaller_probe_gets_copy_trimmed_to_its_size(self, snapshot_config):
+        snapshot_config["maxFrames"] = 1
+        snapshot_config["maxProperties"] = 100
+
+        def capture(items):
+            context = CaptureContext(sys._getframe(), shared=True, limits=(3, 100000))
+            context.collect(SnapshotCollector())
+            small = _CountingCollector(max_size=100)
+            expected = SnapshotCollector(max_size=100)
+            return small, context.collect(small), expected, expected.collect(sys._getframe())
+
+        small, snapshot, expected, expected_snapshot = capture({"key%d" % i: "value%d" % i for i in range(50)})
+
+        assert small.collections == 0 and small.cur_size == expected.cur_size
+        captured = _encode_frames(snapshot)[0]["variables"]["items"]
+        assert captured == _encode_frames(expected_snapshot)[0]["variables"]["items"]
+        assert len(captured["@value"]) < 50
+
+    def test_unshared_context_collects_every_time(self, snapshot_config):
+        snapshot_config["maxFrames"] = 1
+        context = CaptureContext(sys._getframe())
+        collector = _CountingCollector()
+
+        context.collect(collector)
+        context.collect(collector)
+
+        assert collector.collections == 2
+
+    def test_current_context_is_per_frame(self):
+        frame = sys._getframe()
+        context = open_capture_context(frame)
+        try:
+            assert get_capture_context(frame) is context
+            assert get_capture_context(frame.f_back) is not context
+        finally:
+            close_capture_context()
+        assert get_capture_context(frame) is not context
+
+    def test_pytrace_fires_probes_of_a_line_together(self):
+        calls = []
+
+        def probe(name):
+            def callback(event, frame):
+                calls.append((name, event, get_capture_context(frame).shared, frame.f_locals.get("value")))
+            return callback
+
+        def target():
+            value = 1
+            return value  # PROBED_LINE
+
+        line = target.__code__.co_firstlineno + 2
+        pytrace.set_logpoint("first", __file__, line, probe("first"))
+        pytrace.set_logpoint("second", __file__, line, probe("second"))
+        pytrace.set_logpoint("other", __file__, line + 100, probe("other"))
+        pytrace.start()
+        try:
+            target()
+        finally:
+            pytrace.stop()
+            for probe_id in ("first", "second", "other"):
+                pytrace.remove_logpoint(probe_id)
+
+        assert calls == [("first", "line", True, 1), ("second", "line", True, 1)]
+        assert not pytrace._LINE_CALLBACKS
+
+    def test_pytrace_passes_the_line_limits(self):
+        limits = []
+
+        def target():
+            value = 1
+            return value  # PROBED_LINE
+
+        line = target.__code__.co_firstlineno + 2
+        callback = lambda event, frame: limits.append(get_capture_context(frame).limits)
+        pytrace.set_logpoint("shallow", __file__, line, callback, capture_limits=lambda: (2, 5000))
+        pytrace.set_logpoint("deep", __file__, line, callback, capture_limits=lambda: (5, 1000))
+        pytrace.start()
+        try:
+            target()
+        finally:
+            pytrace.stop()
+            for probe_id in ("shallow", "deep"):
+                pytrace.remove_logpoint(probe_id)
+
+        assert limits == [(5, 5000), (5, 5000)]
+        assert not pytrace._LINE_LIMITS
+
+
+class SlowValue(object):
+    """Value whose serializer takes a millisecond, like a proxy doing I/O on access."""
+
+    def __init__(self, index):
+        self.index = index
+
+
+@pytest.fixture
+def slow_values(monkeypatch):
+    def serialize(value):
+        time.sleep(0.001)
+        return value.index
+
+    monkeypatch.setattr(snapshot_collector, "DEADLINE_CHECK_INTERVAL", 4)
+    register_serializer(SlowValue, serialize)
+    yield [SlowValue(i) for i in range(200)]
+    unregister_serializer(SlowValue)
+
+
+class TestCaptureDeadline:
+    """Test the wall clock deadline of snapshot capture."""
+
+    def test_capture_stops_at_deadline(self, snapshot_config, slow_values):
+        snapshot_config.update({"captureDeadlineMs": 10, "maxFrames": 2, "maxExpandFrames": 2})
+
+        started = time.perf_counter()
+        snapshot = SnapshotCollector().collect(sys._getframe())
+        elapsed = time.perf_counter() - started
+
+        assert snapshot.truncated_by_time
+        assert elapsed < 0.1
+        assert len(_encode_frames(snapshot)[0]["variables"]["slow_values"]["@value"]) < len(slow_values)
+        assert len(snapshot.frames) == 2
+
+    def test_profile_deadline_overrides_global(self, snapshot_config, slow_values):
+        snapshot_config.update({"captureDeadlineMs": 0, "maxFrames": 1})
+        del slow_values[20:]
+        profile = CaptureProfile.from_json({"captureDeadlineMs": 2})
+
+        assert SnapshotCollector(profile=profile).collect(sys._getframe()).truncated_by_time
+        assert not SnapshotCollector().collect(sys._getframe()).truncated_by_time
+
+    def test_fast_capture_is_not_truncated(self, snapshot_config):
+        order = {"id": 1, "lines": list(range(10))}
+
+        assert not SnapshotCollector().collect(sys._getframe()).truncated_by_time
+
+    def test_stats_count_time_truncation(self):
+        stats = TracePointStats()
+
+        stats.record_snapshot(0.002)
+        stats.record_snapshot(0.030, truncated_by_time=True)
+        stats.record_dropped()
+
+        assert stats.to_json() == {"snapshots": 2, "failed": 0, "dropped": 1, "timeTruncated": 1,
+                                   "captureTimeMsTotal": 32.0, "captureTimeMsMax": 30.0}
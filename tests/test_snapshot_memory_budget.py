@@ -0,0 +1,88 @@
+"""
+Tests for the process wide in-flight snapshot memory budget.
+"""
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tracepointdebug.probe.snapshot import SnapshotCollector
+from tracepointdebug.probe.snapshot import snapshot_collector_config_manager as config_manager
+from tracepointdebug.probe.snapshot.snapshot_memory_budget import SnapshotMemoryBudget, FRAME_SIZE_ESTIMATE, \
+    CAPTURE_FULL, CAPTURE_SHALLOW, CAPTURE_FRAMES_ONLY, CAPTURE_DROPPED
+
+
+@pytest.fixture
+def snapshot_config():
+    """Snapshot config overrides, restored after the test."""
+    saved = dict(config_manager.snapshot_configs)
+    config_manager.snapshot_configs.update({"maxSize": 1000, "maxFrames": 2, "maxParseDepth": 4})
+    yield config_manager.snapshot_configs
+    config_manager.snapshot_configs.clear()
+    config_manager.snapshot_configs.update(saved)
+
+
+def _frames_size():
+    return FRAME_SIZE_ESTIMATE * 2
+
+
+class TestSnapshotMemoryBudget:
+    """Test reservation, degradation and release of snapshot memory."""
+
+    def test_captures_degrade_as_budget_fills(self, snapshot_config):
+        """Full, then shallow, then frames only, then dropped"""
+        snapshot_config["memoryBudget"] = 4 * (1000 + _frames_size())
+        budget = SnapshotMemoryBudget()
+
+        levels = [budget.reserve().level for _ in range(10)]
+
+        assert levels[:3] == [CAPTURE_FULL, CAPTURE_FULL, CAPTURE_SHALLOW]
+        assert CAPTURE_FRAMES_ONLY in levels
+        assert levels[-1] == CAPTURE_DROPPED
+        assert budget.in_flight_bytes <= snapshot_config["memoryBudget"]
+
+    def test_release_returns_bytes(self, snapshot_config):
+        budget = SnapshotMemoryBudget()
+        reservation = budget.reserve()
+
+        reservation.release()
+        reservation.release()
+
+        assert budget.in_flight_bytes == 0
+        assert budget.in_flight_snapshots == 0
+        assert budget.get_stats()["captures"][CAPTURE_FULL] == 1
+
+    def test_settle_keeps_captured_size(self, snapshot_config):
+        """Unused reserved bytes are returned once the snapshot is captured"""
+        budget = SnapshotMemoryBudget()
+        reservation = budget.reserve()
+        collector = SnapshotCollector(max_size=reservation.max_size)
+        snapshot = collector.collect(sys._getframe())
+
+        reservation.settle(collector, snapshot)
+
+        assert budget.in_flight_bytes == collector.cur_size + FRAME_SIZE_ESTIMATE * len(snapshot.frames)
+        assert budget.in_flight_bytes < 1000 + _frames_size()
+
+    def test_shallow_and_frames_only_captures(self, snapshot_config):
+        snapshot_config["memoryBudget"] = 3 * (1000 + _frames_size()) + 2 * _frames_size()
+        budget = SnapshotMemoryBudget()
+        budget.reserve()
+        budget.reserve()
+
+        shallow = budget.reserve()
+        frames_only = budget.reserve()
+
+        assert shallow.level == CAPTURE_SHALLOW and shallow.parse_depth == 2
+        assert frames_only.level == CAPTURE_FRAMES_ONLY and not frames_only.collect_variables
+        snapshot = SnapshotCollector(collect_variables=frames_only.collect_variables).collect(sys._getframe())
+        assert all(not frame.variables.variables for frame in snapshot.frames)
+
+    def test_zero_budget_disables_limit(self, snapshot_config):
+        snapshot_config["memoryBudget"] = 0
+        budget = SnapshotMemoryBudget()
+
+        assert all(budget.reserve().level == CAPTURE_FULL for _ in range(100))
@@ -0,0 +1,197 @@
+"""
+Tests for sending events to a local collector over a Unix domain socket.
+"""
+
+import json
+import os
+import shutil
+import socketserver
+import struct
+import sys
+import tempfile
+import threading
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from scripts import event_sink
+from test_support.event_capture import construct_event
+from tracepointdebug.broker import broker_manager
+from tracepointdebug.broker.broker_manager import BrokerManager
+from tracepointdebug.broker.event_batcher import EventBatcher, sink_supports_batches
+from tracepointdebug.broker.unix_socket_transport import UnixSocketTransport, is_unix_socket_url, socket_path
+from tracepointdebug.probe.event.logpoint.log_point_event import LogPointEvent
+
+
+def _event(line):
+    return construct_event(name='probe.hit.logpoint', payload={'probeId': 'lp-1', 'probeType': 'logpoint',
+                                                                'file': 'app.py', 'line': line, 'message': 'hi'})
+
+
+def _line(event):
+    return json.dumps(event).encode('utf-8')
+
+
+def _received():
+    return event_sink.app.test_client().get('/api/events').get_json()['events']
+
+
+@pytest.fixture
+def socket_dir():
+    # Short, socket paths are limited to about 100 bytes
+    directory = tempfile.mkdtemp(prefix='debugin-')
+    yield directory
+    shutil.rmtree(directory, ignore_errors=True)
+
+
+@pytest.fixture
+def collector(socket_dir):
+    event_sink.app.test_client().post('/api/events/clear')
+    path = os.path.join(socket_dir, 'events.sock')
+    server = event_sink.serve_unix_socket(path)
+    yield path
+    server.shutdown()
+    server.server_close()
+
+
+class _RecordingHandler(socketserver.StreamRequestHandler):
+    """Collector that accepts any event, as the agent's events aren't in the reference sink's schema."""
+    received = []
+    # Frames answered before the connection is closed, as a restarting collector would
+    frames_per_connection = None
+
+    def handle(self):
+        frames = 0
+        while frames != _RecordingHandler.frames_per_connection:
+            frames += 1
+            header = self.rfile.read(4)
+            if len(header) < 4:
+                return
+            body = self.rfile.read(struct.unpack('>I', header)[0])
+            if body:
+                _RecordingHandler.received.extend(json.loads(line) for line in body.splitlines())
+                answer = {'status': 'accepted', 'accepted': len(body.splitlines()), 'rejected': []}
+            else:
+                answer = {'status': 'healthy', 'batch': {'supported': True}}
+            data = json.dumps(answer).encode('utf-8')
+            self.wfile.write(struct.pack('>I', len(data)) + data)
+
+
+@pytest.fixture
+def recording_collector(socket_dir):
+    _RecordingHandler.received = []
+    _RecordingHandler.frames_per_connection = None
+    path = os.path.join(socket_dir, 'collector.sock')
+    server = socketserver.ThreadingUnixStreamServer(path, _RecordingHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield path
+    server.shutdown()
+    server.server_close()
+
+
+class TestUnixSocketTransport:
+    """Test framing, answers and reconnecting."""
+
+    def test_unix_urls_are_recognized(self):
+        assert is_unix_socket_url('unix:///run/debugin/events.sock')
+        assert socket_path('unix:///run/debugin/events.sock') == '/run/debugin/events.sock'
+        assert not is_unix_socket_url('http://127.0.0.1:4317')
+
+    def test_empty_frame_asks_for_health(self, collector):
+        transport = UnixSocketTransport(collector)
+
+        assert sink_supports_batches(transport.check_health())
+        assert UnixSocketTransport(collector + '.missing').check_health() is None
+
+    def test_batches_share_one_connection_and_invalid_events_are_rejected_by_index(self, collector):
+        transport = UnixSocketTransport(collector)
+
+        assert transport.send_batch([_line(_event(1)), _line(_event(2))])['accepted'] == 2
+        answer = transport.send_batch([_line(_event(3)), b'{"name": "probe.hit.logpoint"}'])
+        assert (answer['accepted'], [item['index'] for item in answer['rejected']]) == (1, [1])
+        assert [event['payload']['line'] for event in _received()] == [1, 2, 3]
+        assert transport.get_stats()['connects'] == 1
+
+    def test_reconnects_when_the_collector_closed_the_connection(self, recording_collector):
+        _RecordingHandler.frames_per_connection = 1
+        transport = UnixSocketTransport(recording_collector)
+
+        for i in range(3):
+            transport.send_batch([b'{"id": %d}' % i])
+        assert _RecordingHandler.received == [{'id': 0}, {'id': 1}, {'id': 2}]
+        assert transport.get_stats()['connects'] == 3
+        with pytest.raises(OSError):
+            UnixSocketTransport(recording_collector + '.missing').send_batch([b'{"id": 3}'])
+
+    def test_event_batcher_sends_frames_over_the_transport(self, collector):
+        batcher = EventBatcher('unix://' + collector, lambda event: _line(event), max_events=2,
+                               max_delay_ms=60000, retries=1, transport=UnixSocketTransport(collector))
+        batcher.start()
+        for line in range(5):
+            batcher.submit(_event(line))
+
+        assert batcher.flush(5)
+        batcher.stop()
+        assert sorted(event['payload']['line'] for event in _received()) == [0, 1, 2, 3, 4]
+        assert batcher.get_stats()['sentBatches'] == 3
+
+
+class TestBrokerManagerUnixSocket:
+    """Test BrokerManager with a unix:// event sink URL."""
+
+    def test_events_are_batched_to_the_collector(self, recording_collector, socket_dir, monkeypatch):
+        monkeypatch.setattr(broker_manager, "EVENT_SINK_URL", "unix://" + recording_collector)
+        monkeypatch.setattr(broker_manager, "EVENT_PROCESS_WORKERS", 2)
+        monkeypatch.setattr(broker_manager, "EVENT_BATCH_MAX_DELAY_MS", 10)
+        monkeypatch.setattr(broker_manager, "EVENT_SPOOL_DIR", os.path.join(socket_dir, 'spool'))
+        manager = BrokerManager()
+        for i in range(3):
+            manager.publish_event(LogPointEvent("lp-1", "app.py", 3, "run", "message %d" % i, "now"))
+
+        assert manager._event_queue.join(5)
+        assert [event["logMessage"] for event in _RecordingHandler.received] == ["message 0", "message 1",
+                                                                                 "message 2"]
+        assert manager.get_process_pool() is None
+        assert manager.get_stats()["transport"]["connects"] == 1
+
+    def test_collector_starting_late_gets_batches(self, socket_dir, monkeypatch):
+        path = os.path.join(socket_dir, 'late.sock')
+        monkeypatch.setattr(broker_manager, "EVENT_SINK_URL", "unix://" + path)
+        monkeypatch.setattr(broker_manager, "EVENT_SINK_PROBE_INTERVAL_MS", 50)
+        monkeypatch.setattr(broker_manager, "EVENT_BATCH_MAX_DELAY_MS", 10)
+        monkeypatch.setattr(broker_manager, "EVENT_SPOOL_DIR", os.path.join(socket_dir, 'spool'))
+        _RecordingHandler.received = []
+        _RecordingHandler.frames_per_connection = None
+        manager = BrokerManager()
+        assert manager._circuit_breaker.is_open
+        manager.publish_event(LogPointEvent("lp-1", "app.py", 3, "run", "spooled", "now"))
+        assert manager._event_queue.join(5)
+        # Nothing takes batches yet, so events are taken by sender threads
+        assert manager.get_event_batcher() is None and manager._event_senders
+
+        server = socketserver.ThreadingUnixStreamServer(path, _RecordingHandler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        try:
+            deadline = time.time() + 5
+            while manager._circuit_breaker.is_open and time.time() < deadline:
+                time.sleep(0.01)
+            while any(sender.is_alive() for sender in manager._event_senders) and time.time() < deadline:
+                time.sleep(0.01)
+            for i in range(3):
+                manager.publish_event(LogPointEvent("lp-1", "app.py", 3, "run", "message %d" % i, "now"))
+            assert manager._event_queue.join(5)
+            while len(_RecordingHandler.received) < 4 and time.time() < deadline:
+                time.sleep(0.01)
+        finally:
+            server.shutdown()
+            server.server_close()
+
+        assert manager.get_event_batcher() is not None
+        assert not any(sender.is_alive() for sender in manager._event_senders)
+        assert sorted(event["logMessage"] for event in _RecordingHandler.received) == \
+               ["message 0", "message 1", "message 2", "spooled"]
+        assert manager.get_event_batcher().get_stats()["sentEvents"] == 3
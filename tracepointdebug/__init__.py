@@ -19,6 +19,9 @@ from .broker.broker_manager import BrokerManager
 from .probe.breakpoints.tracepoint import TracePointManager
 from .probe.breakpoints.logpoint import LogPointManager
 from .probe.error_stack_manager import ErrorStackManager
+from .probe.snapshot.type_serializers import register_serializer, unregister_serializer
+from .probe.snapshot.redaction import set_redaction_rules
+from .probe.breakpoints.logpoint.log_output import set_log_output_sinks
 from .control_api import start_control_api
 
 '''
@@ -33,7 +36,13 @@ log_data_redaction_callback = None
 import logging
 logger = logging.getLogger(__name__)
 
-def start(tracepoint_data_redaction_callback=None, log_data_redaction_callback=None, enable_control_api=True, control_api_port=5001):
+def start(tracepoint_data_redaction_callback=None, log_data_redaction_callback=None, enable_control_api=True, control_api_port=5001,
+          redaction_rules=None, log_output_sinks=None):
+    if redaction_rules is not None:
+        set_redaction_rules(redaction_rules)
+    if log_output_sinks is not None:
+        set_log_output_sinks(log_output_sinks)
+
     engine = get_engine()
     engine.start()
     
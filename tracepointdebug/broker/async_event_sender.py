@@ -0,0 +1,199 @@
+"""
+Sending of queued events from the agent's IOLoop, in asyncio I/O mode.
+
+Application threads put events into BrokerManager's bounded EventQueue as in thread
+mode. Instead of sender threads blocking in take(), the queue's on_put hook wakes the
+loop, at most once per drain: a flag says a drain is already scheduled, so a burst of
+events costs one ``call_soon_threadsafe`` and no lock beyond the queue's own. The
+drain takes whatever is queued and sends it over an AsyncHTTPPool of keep-alive
+connections, at most ``max_in_flight`` requests at a time.
+
+When the sink supports batches, everything taken in one go, up to ``batch_max_events``
+and ``batch_max_bytes``, is sent as one batch; events queued while all requests are in
+flight make up the next one, so batches grow with the load without waiting for a
+delay. Failed sends are retried through the queue with the same backoff, and the
+circuit breaker and spool work as for the sender threads.
+"""
+
+import asyncio
+import gzip
+import logging
+
+from tracepointdebug.broker.event_batcher import BATCH_PATH, EVENT_PATH, NDJSON, encode_batch, CONTENT_TYPES
+from tracepointdebug.broker.event_process_pool import COMPRESS_LEVEL, COMPRESS_MIN_BYTES
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncEventSender(object):
+
+    def __init__(self, io_loop, queue, pool, encode, headers=None, retries=3, backoff=0.25, max_in_flight=4,
+                 batching=False, batch_max_events=500, batch_max_bytes=1024 * 1024, batch_format=NDJSON,
+                 compress_min_bytes=COMPRESS_MIN_BYTES, circuit_breaker=None, spool=None):
+        """
+        encode(event) returns the event as a JSON document in bytes, it is called on the loop.
+        Events are sent one by one until batching is set, when the sink supports batches.
+        """
+        self.io_loop = io_loop
+        self.queue = queue
+        self.pool = pool
+        self.encode = encode
+        self.headers = dict(headers or {})
+        self.retries = retries
+        self.backoff = backoff
+        self.max_in_flight = max(1, max_in_flight)
+        self.batching = batching
+        self.batch_max_events = max(1, batch_max_events)
+        self.batch_max_bytes = batch_max_bytes
+        self.batch_format = batch_format
+        self.compress_min_bytes = compress_min_bytes
+        self.circuit_breaker = circuit_breaker
+        self.spool = spool
+        self._drain_scheduled = False
+        # Only used on the loop
+        self._in_flight = 0
+        self.sent_requests = 0
+        self.sent_events = 0
+        self.failed_events = 0
+        self.spooled_events = 0
+
+    def start(self):
+        self.queue.on_put = self.wake
+        self.wake()
+
+    def wake(self):
+        """Schedules a drain of the queue on the loop, callable from any thread."""
+        if not self._drain_scheduled:
+            self._drain_scheduled = True
+            self.io_loop.call_soon(self._drain)
+
+    def get_stats(self):
+        return {
+            "inFlight": self._in_flight,
+            "batching": self.batching,
+            "sentRequests": self.sent_requests,
+            "sentEvents": self.sent_events,
+            "failedEvents": self.failed_events,
+            "spooledEvents": self.spooled_events,
+            "connections": self.pool.get_stats()
+        }
+
+    def _drain(self):
+        # Cleared before taking, so events put from now on schedule another drain
+        self._drain_scheduled = False
+        while self._in_flight < self.max_in_flight:
+            taken = self.queue.take(self.batch_max_events if self.batching else 1, timeout=0)
+            if not taken:
+                return
+            self._in_flight += 1
+            asyncio.ensure_future(self._send(taken), loop=self.io_loop.loop)
+
+    async def _send(self, taken):
+        try:
+            encoded = []
+            for queued in taken:
+                try:
+                    encoded.append((self.encode(queued.event), queued))
+                except Exception as e:
+                    logger.error("Error encoding event %s for the event sink: %s", type(queued.event).__name__, e)
+                    self.failed_events += 1
+                    self._finish([queued])
+            for chunk in self._chunks(encoded):
+                await self._send_chunk(chunk)
+        finally:
+            self._in_flight -= 1
+            self._drain()
+
+    def _chunks(self, encoded):
+        chunk, size = [], 0
+        for item in encoded:
+            if chunk and size + len(item[0]) > self.batch_max_bytes:
+                yield chunk
+                chunk, size = [], 0
+            chunk.append(item)
+            size += len(item[0])
+        if chunk:
+            yield chunk
+
+    async def _send_chunk(self, chunk):
+        if self.circuit_breaker is not None and self.circuit_breaker.is_open:
+            self._spool(chunk)
+            return
+        if self.batching:
+            status = await self._post_batch([line for line, _ in chunk])
+            if status not in (404, 405):
+                self._done(chunk, status)
+                return
+            logger.warning("Event sink does not accept batches any more, sending events one by one")
+            self.batching = False
+        for item in chunk:
+            self._done([item], await self._post(EVENT_PATH, item[0], {"content-type": "application/json"}))
+
+    async def _post_batch(self, lines):
+        body = encode_batch(lines, self.batch_format)
+        headers = {"content-type": CONTENT_TYPES[self.batch_format]}
+        if self.compress_min_bytes is not None and len(body) >= self.compress_min_bytes:
+            body = gzip.compress(body, COMPRESS_LEVEL)
+            headers["content-encoding"] = "gzip"
+        return await self._post(BATCH_PATH, body, headers)
+
+    async def _post(self, path, body, headers):
+        """Status of the sink's response, None when there was none."""
+        headers.update(self.headers)
+        self.sent_requests += 1
+        try:
+            response = await self.pool.request("POST", path, body, headers)
+        except Exception as e:
+            logger.debug("Sending events to %s failed: %r", path, e)
+            return None
+        return response.status
+
+    def _done(self, chunk, status):
+        if status is not None and status < 400:
+            if self.circuit_breaker is not None:
+                self.circuit_breaker.record_success()
+            self.sent_events += len(chunk)
+            self._finish([queued for _, queued in chunk])
+        elif status is not None and status < 500 and status not in (408, 429):
+            logger.error("Event sink rejected %d events with %d", len(chunk), status)
+            self.failed_events += len(chunk)
+            self._finish([queued for _, queued in chunk])
+        else:
+            if self.circuit_breaker is not None:
+                self.circuit_breaker.record_failure()
+                if self.circuit_breaker.is_open:
+                    self._spool(chunk)
+                    return
+            for _, queued in chunk:
+                if queued.attempts + 1 < self.retries:
+                    delay = self.backoff * (2 ** queued.attempts)
+                    # The event waits for its retry in the queue, the loop wakes up to take it again
+                    # once it is due, a little late rather than a little early
+                    self.queue.retry(queued, delay)
+                    self.io_loop.loop.call_later(delay + 0.001, self.wake)
+                else:
+                    logger.error("Sending %s failed after %d retries", type(queued.event).__name__, self.retries)
+                    self.failed_events += 1
+                    self._finish([queued])
+
+    def _spool(self, chunk):
+        if self.spool is None:
+            self.failed_events += len(chunk)
+        else:
+            try:
+                for line, _ in chunk:
+                    self.spool.append(line)
+                self.spooled_events += len(chunk)
+            except Exception as e:
+                logger.error("Error spooling events: %s", e)
+                self.failed_events += len(chunk)
+        self._finish([queued for _, queued in chunk])
+
+    def _finish(self, queued_events):
+        for queued in queued_events:
+            if queued.callback:
+                try:
+                    queued.callback()
+                except Exception as e:
+                    logger.error("Error in event callback: %s", e)
+        self.queue.task_done(len(queued_events))
@@ -0,0 +1,142 @@
+"""
+Pool of keep-alive HTTP/1.1 connections on asyncio streams, for sending events to the
+event sink in asyncio I/O mode.
+
+At most ``max_connections`` requests are in flight, each on a connection of its own;
+idle connections are kept open for the next request. A request that fails on a
+connection that had been idle is retried once on a new connection, as the sink may
+have closed it in the meantime.
+"""
+
+import asyncio
+import ssl
+from urllib.parse import urlsplit
+
+
+class HTTPResponse(object):
+    __slots__ = ('status', 'headers', 'body')
+
+    def __init__(self, status, headers, body):
+        self.status = status
+        self.headers = headers
+        self.body = body
+
+
+class _Connection(object):
+    __slots__ = ('reader', 'writer')
+
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+
+    def close(self):
+        self.writer.close()
+
+
+class AsyncHTTPPool(object):
+
+    def __init__(self, base_url, max_connections=4, timeout=2.0):
+        parts = urlsplit(base_url)
+        self.secure = parts.scheme == "https"
+        self.hostname = parts.hostname
+        self.port = parts.port or (443 if self.secure else 80)
+        self.host = parts.hostname if parts.port is None else "%s:%d" % (parts.hostname, parts.port)
+        self.base_path = parts.path.rstrip("/")
+        self.max_connections = max(1, max_connections)
+        self.timeout = timeout
+        self._idle = []
+        # Created on the loop, on first use
+        self._semaphore = None
+        self.opened = 0
+        self.requests = 0
+
+    async def request(self, method, path, body=b"", headers=None):
+        """Sends a request and returns its HTTPResponse, raises on connection errors and timeouts."""
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_connections)
+        async with self._semaphore:
+            self.requests += 1
+            while self._idle:
+                connection = self._idle.pop()
+                try:
+                    return await asyncio.wait_for(self._request(connection, method, path, body, headers),
+                                                  self.timeout)
+                except (ConnectionError, asyncio.IncompleteReadError):
+                    # Closed by the sink while it was idle
+                    connection.close()
+            connection = await asyncio.wait_for(self._open(), self.timeout)
+            return await asyncio.wait_for(self._request(connection, method, path, body, headers), self.timeout)
+
+    def close(self):
+        while self._idle:
+            self._idle.pop().close()
+
+    def get_stats(self):
+        return {
+            "maxConnections": self.max_connections,
+            "idleConnections": len(self._idle),
+            "openedConnections": self.opened,
+            "requests": self.requests
+        }
+
+    async def _open(self):
+        context = ssl.create_default_context() if self.secure else None
+        reader, writer = await asyncio.open_connection(self.hostname, self.port, ssl=context)
+        self.opened += 1
+        return _Connection(reader, writer)
+
+    async def _request(self, connection, method, path, body, headers):
+        try:
+            lines = ["%s %s%s HTTP/1.1" % (method, self.base_path, path),
+                     "Host: %s" % self.host,
+                     "Content-Length: %d" % len(body)]
+            for name, value in (headers or {}).items():
+                lines.append("%s: %s" % (name, value))
+            connection.writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1") + body)
+            await connection.writer.drain()
+            response, keep_alive = await self._read_response(connection.reader, method)
+        except BaseException:
+            connection.close()
+            raise
+        if keep_alive:
+            self._idle.append(connection)
+        else:
+            connection.close()
+        return response
+
+    @staticmethod
+    async def _read_response(reader, method):
+        status_line = (await reader.readline()).decode("latin-1")
+        if not status_line:
+            raise ConnectionResetError("Connection closed before the response")
+        version, status = status_line.split(" ", 2)[:2]
+        headers = {}
+        while True:
+            line = (await reader.readline()).decode("latin-1").strip()
+            if not line:
+                break
+            name, _, value = line.partition(":")
+            headers[name.strip().lower()] = value.strip()
+        status = int(status)
+        connection_header = headers.get("connection", "").lower()
+        keep_alive = connection_header != "close" if version == "HTTP/1.1" else connection_header == "keep-alive"
+        if method == "HEAD" or status in (204, 304) or 100 <= status < 200:
+            body = b""
+        elif headers.get("transfer-encoding", "").lower() == "chunked":
+            chunks = []
+            while True:
+                size = int((await reader.readline()).split(b";")[0], 16)
+                if size == 0:
+                    # Trailers, if any, up to the blank line
+                    while (await reader.readline()).strip():
+                        pass
+                    break
+                chunks.append(await reader.readexactly(size))
+                await reader.readexactly(2)
+            body = b"".join(chunks)
+        elif "content-length" in headers:
+            body = await reader.readexactly(int(headers["content-length"]))
+        else:
+            body = await reader.read()
+            keep_alive = False
+        return HTTPResponse(status, headers, body), keep_alive
@@ -0,0 +1,300 @@
+"""
+Minimal websocket client (RFC 6455) on asyncio streams, for the broker connection in
+asyncio I/O mode.
+
+It covers what the broker protocol needs: the opening handshake over ws:// or wss://,
+text and binary messages, fragmented messages, ping/pong and the closing handshake.
+permessage-deflate (RFC 7692) is offered when asked for; once the server accepts it,
+data messages are sent compressed and compressed messages from the server inflated.
+No other extension is negotiated.
+"""
+
+import asyncio
+import base64
+import hashlib
+import os
+import ssl
+import struct
+import zlib
+from urllib.parse import urlsplit
+
+_GUID = b"258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+
+OPCODE_CONTINUATION = 0x0
+OPCODE_TEXT = 0x1
+OPCODE_BINARY = 0x2
+OPCODE_CLOSE = 0x8
+OPCODE_PING = 0x9
+OPCODE_PONG = 0xA
+
+CLOSE_NORMAL = 1000
+
+MAX_MESSAGE_BYTES = 64 * 1024 * 1024
+
+PERMESSAGE_DEFLATE = "permessage-deflate"
+# Data messages shorter than this are sent uncompressed, deflate would only grow them
+DEFLATE_MIN_BYTES = 64
+_DEFLATE_TAIL = b"\x00\x00\xff\xff"
+
+
+class WebSocketHandshakeError(Exception):
+
+    def __init__(self, status_code, message):
+        super(WebSocketHandshakeError, self).__init__(message)
+        self.status_code = status_code
+
+
+class WebSocketClosed(Exception):
+    pass
+
+
+def accept_key(key):
+    return base64.b64encode(hashlib.sha1(key.encode("ascii") + _GUID).digest()).decode("ascii")
+
+
+def encode_frame(opcode, payload, fin=True, mask=True, rsv1=False):
+    header = bytearray([(0x80 if fin else 0) | (0x40 if rsv1 else 0) | opcode])
+    length = len(payload)
+    mask_bit = 0x80 if mask else 0
+    if length < 126:
+        header.append(mask_bit | length)
+    elif length < 1 << 16:
+        header.append(mask_bit | 126)
+        header += struct.pack("!H", length)
+    else:
+        header.append(mask_bit | 127)
+        header += struct.pack("!Q", length)
+    if not mask:
+        return bytes(header) + payload
+    masking_key = os.urandom(4)
+    return bytes(header) + masking_key + _apply_mask(payload, masking_key)
+
+
+def _apply_mask(payload, masking_key):
+    if not payload:
+        return b""
+    # XOR in one go as integers, much faster than byte by byte in Python
+    length = len(payload)
+    repeated = (masking_key * (length // 4 + 1))[:length]
+    return (int.from_bytes(payload, "big") ^ int.from_bytes(repeated, "big")).to_bytes(length, "big")
+
+
+class PerMessageDeflate(object):
+    """Compression state of a connection that negotiated permessage-deflate."""
+
+    def __init__(self, params):
+        """params are those of the server's Sec-WebSocket-Extensions answer, by lower case name."""
+        self.client_no_context_takeover = "client_no_context_takeover" in params
+        self.server_no_context_takeover = "server_no_context_takeover" in params
+        # zlib has no raw deflate with a 256 byte window
+        self.client_window_bits = max(9, min(15, int(params.get("client_max_window_bits") or 15)))
+        self._compressor = None
+        self._decompressor = None
+
+    @classmethod
+    def from_header(cls, value):
+        """State for the server's Sec-WebSocket-Extensions answer, None when it declined the extension."""
+        if not value:
+            return None
+        parts = [part.strip() for part in value.split(";")]
+        if parts[0].lower() != PERMESSAGE_DEFLATE or "," in value:
+            raise WebSocketHandshakeError(101, "Extension %s was not offered" % value)
+        params = {}
+        for part in parts[1:]:
+            name, _, param = part.partition("=")
+            params[name.strip().lower()] = param.strip().strip('"')
+        return cls(params)
+
+    def compress(self, payload):
+        if self._compressor is None or self.client_no_context_takeover:
+            self._compressor = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -self.client_window_bits)
+        data = self._compressor.compress(payload) + self._compressor.flush(zlib.Z_SYNC_FLUSH)
+        return data[:-4] if data.endswith(_DEFLATE_TAIL) else data
+
+    def decompress(self, payload):
+        if self._decompressor is None or self.server_no_context_takeover:
+            # A 32 KB window reads what the server wrote with any smaller one
+            self._decompressor = zlib.decompressobj(-15)
+        data = self._decompressor.decompress(payload + _DEFLATE_TAIL, MAX_MESSAGE_BYTES)
+        if self._decompressor.unconsumed_tail:
+            raise WebSocketClosed("Message inflates past %d bytes" % MAX_MESSAGE_BYTES)
+        return data
+
+
+class AsyncWebSocket(object):
+
+    def __init__(self, reader, writer, deflate=None):
+        self.reader = reader
+        self.writer = writer
+        self.closed = False
+        self.last_pong = None
+        # PerMessageDeflate, when the server accepted the extension
+        self.deflate = deflate
+
+    @classmethod
+    async def connect(cls, url, header=None, deflate=False):
+        """
+        Opens a websocket to url, header is a list of "name: value" strings sent with the
+        handshake. With deflate, permessage-deflate is offered. Raises WebSocketHandshakeError
+        when the server doesn't switch protocols.
+        """
+        parts = urlsplit(url)
+        secure = parts.scheme == "wss"
+        port = parts.port or (443 if secure else 80)
+        context = ssl.create_default_context() if secure else None
+        reader, writer = await asyncio.open_connection(parts.hostname, port, ssl=context)
+        key = base64.b64encode(os.urandom(16)).decode("ascii")
+        path = (parts.path or "/") + ("?" + parts.query if parts.query else "")
+        host = parts.hostname if parts.port is None else "%s:%d" % (parts.hostname, parts.port)
+        lines = ["GET %s HTTP/1.1" % path,
+                 "Host: %s" % host,
+                 "Upgrade: websocket",
+                 "Connection: Upgrade",
+                 "Sec-WebSocket-Key: %s" % key,
+                 "Sec-WebSocket-Version: 13"]
+        if deflate:
+            lines.append("Sec-WebSocket-Extensions: %s; client_max_window_bits" % PERMESSAGE_DEFLATE)
+        lines.extend(header or [])
+        writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("utf-8"))
+        await writer.drain()
+        try:
+            status_line = (await reader.readline()).decode("latin-1").strip()
+            headers = {}
+            while True:
+                line = (await reader.readline()).decode("latin-1").strip()
+                if not line:
+                    break
+                name, _, value = line.partition(":")
+                headers[name.strip().lower()] = value.strip()
+            status = status_line.split(" ", 2)
+            status_code = int(status[1]) if len(status) > 1 and status[1].isdigit() else 0
+            if status_code != 101:
+                raise WebSocketHandshakeError(status_code, "Handshake status %s" % status_line)
+            if headers.get("sec-websocket-accept") != accept_key(key):
+                raise WebSocketHandshakeError(status_code, "Invalid Sec-WebSocket-Accept header")
+            extension = headers.get("sec-websocket-extensions")
+            if extension and not deflate:
+                raise WebSocketHandshakeError(status_code, "Extension %s was not offered" % extension)
+            negotiated = PerMessageDeflate.from_header(extension)
+        except Exception:
+            writer.close()
+            raise
+        return cls(reader, writer, negotiated)
+
+    async def send(self, data):
+        """Sends data as a text message when it is a str, as a binary message when it is bytes."""
+        self.send_nowait(data)
+        await self.writer.drain()
+
+    def send_nowait(self, data):
+        """Writes the message to the transport's buffer without waiting for it to drain."""
+        if isinstance(data, str):
+            self._write_nowait(OPCODE_TEXT, data.encode("utf-8"), True)
+        else:
+            self._write_nowait(OPCODE_BINARY, bytes(data), True)
+
+    def write_buffer_size(self):
+        """Bytes written to the connection that the socket hasn't taken yet."""
+        return self.writer.transport.get_write_buffer_size()
+
+    async def ping(self, payload=b""):
+        await self._write(OPCODE_PING, payload)
+
+    async def recv(self):
+        """
+        Next message, a str for text messages and bytes for binary ones. Answers pings on the
+        way. Raises WebSocketClosed once the connection is closed.
+        """
+        fragments = []
+        message_opcode = None
+        compressed = False
+        size = 0
+        while True:
+            fin, rsv1, opcode, payload = await self._read_frame()
+            if opcode == OPCODE_PING:
+                await self._write(OPCODE_PONG, payload)
+            elif opcode == OPCODE_PONG:
+                self.last_pong = asyncio.get_event_loop().time()
+            elif opcode == OPCODE_CLOSE:
+                if not self.closed:
+                    self.closed = True
+                    try:
+                        self.writer.write(encode_frame(OPCODE_CLOSE, payload[:2]))
+                        await self.writer.drain()
+                    except (ConnectionError, OSError):
+                        pass
+                self.writer.close()
+                code = struct.unpack("!H", payload[:2])[0] if len(payload) >= 2 else None
+                raise WebSocketClosed("Closed by the server, code %s" % code)
+            else:
+                if opcode != OPCODE_CONTINUATION:
+                    message_opcode = opcode
+                    compressed = rsv1
+                    fragments = []
+                    size = 0
+                fragments.append(payload)
+                size += len(payload)
+                if size > MAX_MESSAGE_BYTES:
+                    self.abort()
+                    raise WebSocketClosed("Message over %d bytes" % MAX_MESSAGE_BYTES)
+                if fin:
+                    message = b"".join(fragments)
+                    if compressed:
+                        if self.deflate is None:
+                            self.abort()
+                            raise WebSocketClosed("Compressed message without permessage-deflate")
+                        message = self.deflate.decompress(message)
+                    return message.decode("utf-8") if message_opcode == OPCODE_TEXT else message
+
+    async def close(self, code=CLOSE_NORMAL):
+        """Starts the closing handshake, the server's close frame is not waited for."""
+        if self.closed:
+            return
+        self.closed = True
+        try:
+            self.writer.write(encode_frame(OPCODE_CLOSE, struct.pack("!H", code)))
+            await self.writer.drain()
+        except (ConnectionError, OSError):
+            pass
+        finally:
+            self.writer.close()
+
+    def abort(self):
+        self.closed = True
+        self.writer.close()
+
+    async def _write(self, opcode, payload):
+        self._write_nowait(opcode, payload, False)
+        await self.writer.drain()
+
+    def _write_nowait(self, opcode, payload, data):
+        if self.closed:
+            raise WebSocketClosed("Websocket is closed")
+        compress = data and self.deflate is not None and len(payload) >= DEFLATE_MIN_BYTES
+        if compress:
+            # Compressed and written in one go, the compression context follows the order on the wire
+            payload = self.deflate.compress(payload)
+        # One write per frame, so frames of concurrent senders never interleave
+        self.writer.write(encode_frame(opcode, payload, rsv1=compress))
+
+    async def _read_frame(self):
+        try:
+            head = await self.reader.readexactly(2)
+            length = head[1] & 0x7F
+            if length == 126:
+                length = struct.unpack("!H", await self.reader.readexactly(2))[0]
+            elif length == 127:
+                length = struct.unpack("!Q", await self.reader.readexactly(8))[0]
+            if length > MAX_MESSAGE_BYTES:
+                # Refused before reading it, a frame can announce up to 2**63 bytes
+                self.abort()
+                raise WebSocketClosed("Frame over %d bytes" % MAX_MESSAGE_BYTES)
+            masking_key = await self.reader.readexactly(4) if head[1] & 0x80 else None
+            payload = await self.reader.readexactly(length)
+        except (asyncio.IncompleteReadError, ConnectionError, OSError) as e:
+            self.closed = True
+            self.writer.close()
+            raise WebSocketClosed("Connection lost: %s" % e)
+        if masking_key is not None:
+            payload = _apply_mask(payload, masking_key)
+        return bool(head[0] & 0x80), bool(head[0] & 0x40), head[0] & 0x0F, payload
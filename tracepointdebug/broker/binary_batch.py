@@ -0,0 +1,173 @@
+"""
+Compact binary encoding of event batches, for sinks that advertise it.
+
+Snapshot events repeat the same keys (``@type``, ``@value``, ``lineNo``, ``fileName``)
+and type names in every frame and every variable. A binary batch says each of them
+once: the first time a key or a name occurs it is written out and added to the batch's
+key or name table, later occurrences are the index into that table. Values of the form
+``{"@type": name, "@value": value}``, which make up most of a snapshot, take one tag
+byte and the name's index. The tables start empty in every batch, so a batch decodes on
+its own.
+
+A batch is the magic ``DBGB``, a version byte and the events one after the other, each
+a value::
+
+    0x00 null    0x01 false    0x02 true
+    0x03 int     zigzag varint
+    0x04 float   8 byte little-endian double
+    0x05 string  varint byte length, UTF-8
+    0x06 name    varint table index, see below
+    0x07 list    varint length, values
+    0x08 map     varint length, (key, value) pairs, the key a varint table index
+    0x09 typed   a name, the value; decodes to {"@type": name, "@value": value}
+
+A table index equal to the table's current length introduces a new entry: it is
+followed by the varint byte length and UTF-8 of the string, which gets that index.
+Keys and names have tables of their own. Strings under the keys in NAME_KEYS are
+written as names, other strings as strings.
+
+The encoding is negotiated: the sink lists ``binary`` in the ``formats`` of the batch
+capability its ``/health`` response advertises, and the agent then POSTs batches with
+``Content-Type: application/x-debugin-batch``. docs/event-schema.md describes it for
+sinks of other runtimes.
+"""
+
+import struct
+
+BINARY = "binary"
+CONTENT_TYPE = "application/x-debugin-batch"
+MAGIC = b"DBGB"
+VERSION = 1
+
+NULL, FALSE, TRUE, INT, FLOAT, STRING, NAME, LIST, MAP, TYPED = range(10)
+
+# Keys whose string values name things and repeat across events
+NAME_KEYS = frozenset(("@type", "name", "type", "fileName", "methodName", "className", "probeType", "hostName",
+                       "applicationName", "applicationInstanceId", "tracePointId", "logPointId", "probeId"))
+
+_DOUBLE = struct.Struct("<d")
+# Varints of 0 to 127, one byte each
+_SMALL = [bytes((i,)) for i in range(128)]
+
+
+def _varint(n):
+    if n < 128:
+        return _SMALL[n]
+    out = bytearray()
+    while n >= 128:
+        out.append((n & 0x7F) | 0x80)
+        n >>= 7
+    out.append(n)
+    return bytes(out)
+
+
+def supports_binary_batches(health):
+    """Whether the batch capability in the sink's /health response lists the binary format."""
+    batch = health.get("batch") if isinstance(health, dict) else None
+    return isinstance(batch, dict) and BINARY in (batch.get("formats") or ())
+
+
+class BinaryBatchEncoder(object):
+    """
+    Encodes one batch, event by event. Events are trees of plain values and of objects with a
+    to_json method, as for encoder.to_json.
+    """
+
+    def __init__(self):
+        self._out = bytearray(MAGIC)
+        self._out.append(VERSION)
+        self._keys = {}
+        self._names = {}
+        self.events = 0
+
+    def add(self, event):
+        """Appends event to the batch and returns how many bytes it took."""
+        start = len(self._out)
+        keys, names = len(self._keys), len(self._names)
+        try:
+            self._value(event, None)
+        except Exception:
+            # Leaves the batch as it was, entries the event added would be defined by bytes no longer there
+            del self._out[start:]
+            for table, size in ((self._keys, keys), (self._names, names)):
+                for string in [string for string, index in table.items() if index >= size]:
+                    del table[string]
+            raise
+        self.events += 1
+        return len(self._out) - start
+
+    def getvalue(self):
+        return bytes(self._out)
+
+    def __len__(self):
+        return len(self._out)
+
+    def _index(self, table, string):
+        # The index of string in table, or the definition of a new entry
+        index = table.get(string)
+        if index is not None:
+            return _varint(index)
+        index = table[string] = len(table)
+        data = string.encode("utf-8")
+        return _varint(index) + _varint(len(data)) + data
+
+    def _value(self, value, key):
+        out = self._out
+        kind = type(value)
+        if kind is str:
+            if key in NAME_KEYS:
+                out.append(NAME)
+                out += self._index(self._names, value)
+            else:
+                data = value.encode("utf-8", "surrogatepass")
+                out.append(STRING)
+                out += _varint(len(data))
+                out += data
+        elif kind is dict:
+            if len(value) == 2 and "@type" in value and "@value" in value and type(value["@type"]) is str:
+                out.append(TYPED)
+                out += self._index(self._names, value["@type"])
+                self._value(value["@value"], "@value")
+                return
+            out.append(MAP)
+            out += _varint(len(value))
+            keys = self._keys
+            for k, v in value.items():
+                if type(k) is not str:
+                    k = str(k)
+                index = keys.get(k)
+                out += _varint(index) if index is not None else self._index(keys, k)
+                self._value(v, k)
+        elif kind is int:
+            out.append(INT)
+            out += _varint(value << 1 if value >= 0 else (-value << 1) - 1)
+        elif value is None:
+            out.append(NULL)
+        elif kind is bool:
+            out.append(TRUE if value else FALSE)
+        elif kind is float:
+            out.append(FLOAT)
+            out += _DOUBLE.pack(value)
+        elif kind is list or kind is tuple:
+            out.append(LIST)
+            out += _varint(len(value))
+            for item in value:
+                self._value(item, None)
+        elif hasattr(value, "to_json"):
+            self._value(value.to_json(), key)
+        elif isinstance(value, bool):
+            out.append(TRUE if value else FALSE)
+        elif isinstance(value, int):
+            self._value(int(value), key)
+        elif isinstance(value, float):
+            self._value(float(value), key)
+        elif isinstance(value, str):
+            self._value(str(value), key)
+        elif isinstance(value, dict):
+            self._value(dict(value), key)
+        elif isinstance(value, (list, tuple)):
+            self._value(list(value), key)
+        elif isinstance(value, bytes):
+            self._value(value.decode("utf-8", errors="ignore"), key)
+        else:
+            raise TypeError("Object of type %s can't be encoded in a binary batch" % type(value).__name__)
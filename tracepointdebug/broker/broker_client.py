@@ -1,6 +1,12 @@
+import asyncio
+import collections
+import concurrent.futures
 import logging
+import select
 import socket
+import struct
 import threading
+import time
 from threading import Thread
 from time import sleep
 
@@ -9,13 +15,27 @@ from tracepointdebug.config import config_names
 from tracepointdebug.config.config_provider import ConfigProvider
 
 from tracepointdebug.utils import debug_logger
+from tracepointdebug.broker.async_ws import AsyncWebSocket, WebSocketClosed, WebSocketHandshakeError
 from tracepointdebug.broker.ws_app import WSApp
 from tracepointdebug.application.application import Application
 
+try:
+    import fcntl
+    import termios
+except ImportError:
+    fcntl = termios = None
+
 logger = logging.getLogger(__name__)
 
 _TIMEOUT = 3
 OPCODE_BINARY = 0x2
+# Event frames wait while the socket can't take more, backing off from the first to the second delay
+EVENT_FRAME_BACKOFF_SECS = (0.001, 0.05)
+# Event frames are held back while more than this is buffered ahead of the socket in asyncio mode,
+# so control messages written after them are never stuck behind a backlog of snapshots
+EVENT_FRAME_WRITE_BUFFER = 256 * 1024
+# Room left in the send buffer beyond an event frame in thread mode, for websocket and TLS framing
+EVENT_FRAME_OVERHEAD = 1024
 BROKER_HANDSHAKE_HEADERS = {
     "API_KEY": "x-sidekick-api-key",
     "APP_INSTANCE_ID": "x-sidekick-app-instance-id",
@@ -51,6 +71,22 @@ class EventClient:
                     raise
                 time.sleep(self.backoff * (2 ** i))
 
+def _send_buffer_room(sock):
+    """
+    (room, capacity) of sock's send buffer in bytes, what it takes now without blocking and what it
+    takes when empty, or None where the platform doesn't tell.
+    """
+    if fcntl is None or not hasattr(termios, "TIOCOUTQ"):
+        return None
+    try:
+        # Linux reports twice the buffer size, the other half is its bookkeeping
+        capacity = sock.getsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF) // 2
+        queued = struct.unpack("i", fcntl.ioctl(sock.fileno(), termios.TIOCOUTQ, b"\0\0\0\0"))[0]
+    except (OSError, ValueError):
+        return None
+    return capacity - queued, capacity
+
+
 class BrokerConnection:
 
     def __init__(self, host, port, broker_credentials, message_callback, initial_request_to_broker):
@@ -67,10 +103,15 @@ class BrokerConnection:
         self.error_printed = False
         self.connected = threading.Event()
         self.initial_request_to_broker = initial_request_to_broker
+        self.event_frame_backoffs = 0
 
     def is_running(self):
         return self._running
 
+    def is_connected(self):
+        ws = self.ws
+        return ws is not None and ws.sock is not None and ws.sock.connected
+
     def _create_app(self):
         return WSApp(
             self.get_broker_url(self.host, self.port),
@@ -189,9 +230,215 @@ class BrokerConnection:
         except websocket.WebSocketConnectionClosedException as e:
             debug_logger("Error sending %s" % e)
 
+    def event_frame_bytes(self):
+        """Largest event frame that fits in the socket's empty send buffer, None when unknown."""
+        ws = self.ws
+        sock = ws.sock.sock if ws is not None and ws.sock is not None else None
+        buffer = _send_buffer_room(sock) if sock is not None else None
+        return max(1, buffer[1] - EVENT_FRAME_OVERHEAD) if buffer is not None else None
+
+    def send_event_frame(self, data, timeout):
+        """
+        Sends data as a binary message once the socket's send buffer has room for all of it, so the
+        send doesn't block in the websocket's lock ahead of control messages; a frame larger than
+        the buffer waits for it to be empty. Where the room is unknown it waits for the socket to be
+        writable only. Raises ConnectionError when the connection is down and TimeoutError when
+        there is no room for timeout seconds, in which case nothing of data was sent.
+        """
+        ws = self.ws
+        if not self.is_connected():
+            raise ConnectionError("Broker connection is closed")
+        deadline = time.monotonic() + timeout
+        delay = EVENT_FRAME_BACKOFF_SECS[0]
+        while not self._has_room(ws.sock.sock, len(data)):
+            if time.monotonic() + delay > deadline:
+                raise TimeoutError("No room for an event frame on the broker socket in %s seconds" % timeout)
+            self.event_frame_backoffs += 1
+            sleep(delay)
+            delay = min(delay * 2, EVENT_FRAME_BACKOFF_SECS[1])
+        try:
+            ws.send(data, opcode=OPCODE_BINARY)
+        except (websocket.WebSocketConnectionClosedException, AttributeError) as e:
+            # AttributeError when the connection was torn down under us
+            raise ConnectionError("Broker connection closed while sending: %s" % e)
+
+    @staticmethod
+    def _has_room(sock, size):
+        buffer = _send_buffer_room(sock)
+        if buffer is None:
+            return bool(select.select([], [sock], [], 0)[1])
+        room, capacity = buffer
+        return room >= min(size + EVENT_FRAME_OVERHEAD, capacity)
+
     def close(self):
         self.error_printed = False
         self._running = False
         if self.ws:
             self.ws.close()
         self._thread.join()
+
+
+class AsyncBrokerConnection(BrokerConnection):
+    """BrokerConnection whose websocket and pinger run on the agent's IOLoop instead of threads of their own."""
+
+    ping_interval = 60
+    ping_timeout = 10
+
+    def __init__(self, host, port, broker_credentials, message_callback, initial_request_to_broker, io_loop,
+                 deflate=False):
+        super(AsyncBrokerConnection, self).__init__(host, port, broker_credentials, message_callback,
+                                                    initial_request_to_broker)
+        self.io_loop = io_loop
+        self.deflate = deflate
+        self._task = None
+        # Set on the loop while the websocket is open, for tasks waiting for the connection
+        self._open = None
+        # (ws, data, future) of event frames waiting for room in the write buffer, used on the loop only
+        self._event_frames = collections.deque()
+        self._event_drainer = None
+
+    def connect(self):
+        self._running = True
+        self._task = self.io_loop.submit(self._connect())
+
+    async def wait_connected(self):
+        if self._open is None:
+            self._open = asyncio.Event()
+        await self._open.wait()
+
+    async def _connect(self):
+        url = self.get_broker_url(self.host, self.port)
+        header = self._create_wsapp_header()
+        first = True
+        while self._running:
+            if not first:
+                debug_logger("Reconnecting in %s..." % self.reconnect_interval)
+                await asyncio.sleep(self.reconnect_interval)
+            first = False
+            debug_logger("Connecting to broker...")
+            try:
+                ws = await asyncio.wait_for(AsyncWebSocket.connect(url, header, self.deflate),
+                                            self.connection_timeout)
+            except WebSocketHandshakeError as e:
+                logger.error("Handshake failed, status code: {}, message: {}".format(e.status_code, e.args))
+                if e.status_code == 401:
+                    self._running = False
+                self.on_error(None, e)
+                continue
+            except Exception as e:
+                self.on_error(None, e)
+                continue
+            await self._serve(ws)
+
+    async def _serve(self, ws):
+        self.ws = ws
+        if self._open is None:
+            self._open = asyncio.Event()
+        self._open.set()
+        pinger = asyncio.ensure_future(self._ping(ws))
+        try:
+            self.on_open(ws)
+            while self._running:
+                self.on_message(ws, await ws.recv())
+        except WebSocketClosed as e:
+            if self._running:
+                self.on_error(ws, e)
+        except Exception as e:
+            self.on_error(ws, e)
+        finally:
+            self._open.clear()
+            pinger.cancel()
+            await ws.close()
+            self.on_close(ws)
+
+    async def _ping(self, ws):
+        while not ws.closed:
+            await asyncio.sleep(self.ping_interval)
+            sent_at = asyncio.get_event_loop().time()
+            self.on_ping(ws, b"")
+            await ws.ping()
+            await asyncio.sleep(self.ping_timeout)
+            if ws.last_pong is None or ws.last_pong < sent_at:
+                debug_logger("No pong from broker in %s seconds, reconnecting" % self.ping_timeout)
+                ws.abort()
+                return
+
+    def send(self, data):
+        ws = self.ws
+        if ws is None or ws.closed:
+            if ConfigProvider.get(config_names.SIDEKICK_PRINT_CLOSED_SOCKET_DATA, False):
+                print("Socket is already closed while sending data: %s" % data)
+            debug_logger("Socket is already closed while sending data to see data set SIDEKICK_PRINT_DEBUG_DATA to True!")
+            return
+        self.io_loop.submit(self._send(ws, data))
+
+    @staticmethod
+    async def _send(ws, data):
+        try:
+            await ws.send(data)
+        except (WebSocketClosed, ConnectionError, OSError) as e:
+            debug_logger("Error sending %s" % e)
+
+    def is_connected(self):
+        ws = self.ws
+        return ws is not None and not ws.closed
+
+    def event_frame_bytes(self):
+        # Frames wait in their own queue on the loop, they are never written ahead of control messages
+        return None
+
+    def send_event_frame(self, data, timeout):
+        """
+        Queues data to be sent as a binary message and waits until it's written. Event frames
+        have a queue of their own, control messages sent meanwhile go out ahead of them.
+        """
+        ws = self.ws
+        if ws is None or ws.closed:
+            raise ConnectionError("Broker connection is closed")
+        future = concurrent.futures.Future()
+        self.io_loop.call_soon(self._queue_event_frame, ws, data, future)
+        try:
+            future.result(timeout)
+        except concurrent.futures.TimeoutError:
+            future.cancel()
+            raise TimeoutError("Event frame not written in %s seconds" % timeout)
+        except WebSocketClosed as e:
+            raise ConnectionError("Broker connection closed while sending: %s" % e)
+
+    def _queue_event_frame(self, ws, data, future):
+        self._event_frames.append((ws, data, future))
+        if self._event_drainer is None or self._event_drainer.done():
+            self._event_drainer = asyncio.ensure_future(self._drain_event_frames())
+
+    async def _drain_event_frames(self):
+        frames = self._event_frames
+        delay = EVENT_FRAME_BACKOFF_SECS[0]
+        while frames:
+            ws, data, future = frames[0]
+            if not future.cancelled() and not ws.closed and ws.write_buffer_size() >= EVENT_FRAME_WRITE_BUFFER:
+                self.event_frame_backoffs += 1
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, EVENT_FRAME_BACKOFF_SECS[1])
+                continue
+            delay = EVENT_FRAME_BACKOFF_SECS[0]
+            frames.popleft()
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                ws.send_nowait(data)
+            except Exception as e:
+                future.set_exception(e)
+            else:
+                future.set_result(None)
+
+    def close(self):
+        self.error_printed = False
+        self._running = False
+        ws = self.ws
+        if ws is not None:
+            self.io_loop.submit(ws.close())
+        if self._task is not None and not self.io_loop.in_loop():
+            try:
+                self._task.result(self.connection_timeout)
+            except Exception:
+                pass
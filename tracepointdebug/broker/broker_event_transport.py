@@ -0,0 +1,114 @@
+"""
+Event transport over the broker websocket, for deployments without a separate event sink.
+
+With ``EVENT_SINK_URL=broker://`` events share the websocket the agent already keeps
+open to the broker instead of a connection of their own. Each batch goes out as binary
+messages, NDJSON of at most ``frame_bytes`` each, while the broker's requests and the
+agent's responses stay text messages; the broker tells them apart by the opcode. When
+permessage-deflate was negotiated on the connection, in asyncio I/O mode, the messages
+are compressed.
+
+Event frames don't hold up control messages for long. In asyncio mode they wait in a
+queue of their own on the loop, and are only written while little is buffered ahead of
+the socket, so control messages go out ahead of them. In thread mode both share the
+websocket's send lock and a message is never interleaved with another one, so frames
+are made to fit in the socket's send buffer and only written once it has room for the
+whole frame: the write then copies into the buffer without blocking, and a control
+message waits for that copy at most. Where the platform doesn't report the buffer's
+room, frames are written once the socket is writable and a large one can still block.
+Either way the sender backs off while there is no room, and gives up with TimeoutError
+after ``timeout`` seconds, before writing anything, which the batcher counts as a
+failed send. When earlier frames of the batch were written, PartialSendError tells the
+batcher how many events went out, so only the others are sent again.
+
+The broker doesn't answer event frames, a batch counts as accepted once it is written
+to the socket. While the broker connection is down sends fail with ConnectionError and
+the health check reports the sink down, so the circuit breaker spools the events until
+the connection is back.
+"""
+
+from threading import Lock
+
+from tracepointdebug.broker.event_batcher import encode_batch, NDJSON, PartialSendError
+
+BROKER_SCHEME = "broker://"
+
+
+def is_broker_url(url):
+    return url.startswith(BROKER_SCHEME)
+
+
+class BrokerEventTransport(object):
+
+    path = "broker"
+
+    def __init__(self, get_connection, frame_bytes=64 * 1024, timeout=2.0):
+        """get_connection returns the current BrokerConnection, or None before the agent connects."""
+        self.get_connection = get_connection
+        self.frame_bytes = frame_bytes
+        self.timeout = timeout
+        # Keeps the frames of one batch together
+        self._lock = Lock()
+        self.frames = 0
+        self.bytes_sent = 0
+
+    def send_batch(self, lines):
+        """
+        Sends lines, events encoded as JSON documents without newlines, as binary messages over the
+        broker websocket. Raises ConnectionError when the broker isn't connected, TimeoutError when
+        the socket takes nothing for timeout seconds, and PartialSendError when either happens after
+        the first frames were written.
+        """
+        connection = self._connection()
+        frame_bytes = min(self.frame_bytes, connection.event_frame_bytes() or self.frame_bytes)
+        with self._lock:
+            sent = 0
+            for frame, count in self._frames(lines, frame_bytes):
+                try:
+                    connection.send_event_frame(frame, self.timeout)
+                except Exception as e:
+                    if not sent:
+                        raise
+                    raise PartialSendError(sent, e)
+                sent += count
+                self.frames += 1
+                self.bytes_sent += len(frame)
+        return {"status": "accepted", "accepted": len(lines), "rejected": []}
+
+    def check_health(self):
+        """A health document advertising batches while the broker is connected, None otherwise."""
+        connection = self.get_connection()
+        if connection is None or not connection.is_connected():
+            return None
+        return {"status": "healthy", "batch": {"supported": True, "formats": [NDJSON]}}
+
+    def close(self):
+        pass
+
+    def get_stats(self):
+        connection = self.get_connection()
+        return {
+            "path": self.path,
+            "connected": connection is not None and connection.is_connected(),
+            "frames": self.frames,
+            "bytesSent": self.bytes_sent,
+            "backoffs": connection.event_frame_backoffs if connection is not None else 0
+        }
+
+    def _connection(self):
+        connection = self.get_connection()
+        if connection is None or not connection.is_connected():
+            raise ConnectionError("Broker is not connected")
+        return connection
+
+    @staticmethod
+    def _frames(lines, frame_bytes):
+        # (frame, events in it), whole events per frame, an event larger than frame_bytes gets a frame of its own
+        start = size = 0
+        for i, line in enumerate(lines):
+            if i > start and size + len(line) + 1 > frame_bytes:
+                yield encode_batch(lines[start:i], NDJSON), i - start
+                start, size = i, 0
+            size += len(line) + 1
+        if start < len(lines):
+            yield encode_batch(lines[start:], NDJSON), len(lines) - start
@@ -1,10 +1,13 @@
 from __future__ import absolute_import
+import asyncio
+import atexit
 import logging
 import socket
+import tempfile
 import time
 import os
 from concurrent.futures.thread import ThreadPoolExecutor
-from threading import Thread
+from threading import Event, Lock, Thread
 from uuid import uuid4
 
 from tracepointdebug.config import config_names
@@ -12,10 +15,22 @@ from tracepointdebug.config.config_provider import ConfigProvider
 from tracepointdebug.application import utils
 from tracepointdebug.application.application import Application
 from tracepointdebug.broker.application.application_status import ApplicationStatus
-from tracepointdebug.broker.broker_client import BrokerConnection, EventClient
+from tracepointdebug.broker.async_event_sender import AsyncEventSender
+from tracepointdebug.broker.async_http import AsyncHTTPPool
+from tracepointdebug.broker.binary_batch import BINARY, supports_binary_batches
+from tracepointdebug.broker.broker_client import AsyncBrokerConnection, BrokerConnection, EventClient
 from tracepointdebug.broker.broker_credentials import BrokerCredentials
+from tracepointdebug.broker.broker_event_transport import BrokerEventTransport, is_broker_url
 from tracepointdebug.broker.broker_message_callback import BrokerMessageCallback
+from tracepointdebug.broker.circuit_breaker import CircuitBreaker
 from tracepointdebug.broker.event.application_status_event import ApplicationStatusEvent
+from tracepointdebug.broker.event_batcher import EventBatcher, NDJSON, sink_supports_batches
+from tracepointdebug.broker.event_process_pool import EventProcessPool
+from tracepointdebug.broker.event_queue import EventQueue, DROP_NEWEST
+from tracepointdebug.broker.event_ring import EventRingTransport, is_ring_url, ring_path
+from tracepointdebug.broker.event_spool import EventSpool, make_private_directory
+from tracepointdebug.broker.io_loop import IOLoop, is_asyncio_mode
+from tracepointdebug.broker.unix_socket_transport import UnixSocketTransport, is_unix_socket_url, socket_path
 from tracepointdebug.probe.application.application_status_tracepoint_provider import \
     ApplicationStatusTracePointProvider
 from tracepointdebug.probe.encoder import to_json
@@ -27,7 +42,45 @@ from tracepointdebug.broker.request.get_config_request import GetConfigRequest
 API_KEY = ConfigProvider.get(config_names.SIDEKICK_APIKEY)
 BROKER_HOST = utils.get_from_environment_variables("SIDEKICK_BROKER_HOST", "wss://broker.service.runsidekick.com", str)
 BROKER_PORT = utils.get_from_environment_variables("SIDEKICK_BROKER_PORT", 443, int)
+# http(s)://host:port, for a collector on the same node unix:///path/to/sock or ring:///dev/shm/<ring>,
+# or broker:// to send events over the broker websocket
 EVENT_SINK_URL = os.getenv("EVENT_SINK_URL", "http://127.0.0.1:4317")
+# Largest binary message events are sent in over the broker websocket
+BROKER_EVENT_FRAME_BYTES = utils.get_from_environment_variables("DEBUGIN_BROKER_EVENT_FRAME_BYTES", 64 * 1024, int)
+# 1 offers permessage-deflate to the broker in asyncio I/O mode
+BROKER_WS_DEFLATE = utils.get_from_environment_variables("DEBUGIN_BROKER_WS_DEFLATE", 1, int)
+# Worker processes that encode and send events, 0 sends them from threads of the application process
+EVENT_PROCESS_WORKERS = utils.get_from_environment_variables("DEBUGIN_EVENT_PROCESS_WORKERS", 0, int)
+# Events are batched when the event sink supports it, at most this many per batch, 0 sends them one by one
+EVENT_BATCH_MAX_EVENTS = utils.get_from_environment_variables("DEBUGIN_EVENT_BATCH_MAX_EVENTS", 500, int)
+EVENT_BATCH_MAX_BYTES = utils.get_from_environment_variables("DEBUGIN_EVENT_BATCH_MAX_BYTES", 1024 * 1024, int)
+EVENT_BATCH_MAX_DELAY_MS = utils.get_from_environment_variables("DEBUGIN_EVENT_BATCH_MAX_DELAY_MS", 200, int)
+# ndjson, json or binary, binary batches are only sent to sinks that list the format in /health
+EVENT_BATCH_FORMAT = utils.get_from_environment_variables("DEBUGIN_EVENT_BATCH_FORMAT", "ndjson", str)
+# Bounds of the queue of snapshots and log messages waiting to be sent, and what to drop when it is full
+EVENT_QUEUE_MAX_EVENTS = utils.get_from_environment_variables("DEBUGIN_EVENT_QUEUE_MAX_EVENTS", 10000, int)
+EVENT_QUEUE_MAX_BYTES = utils.get_from_environment_variables("DEBUGIN_EVENT_QUEUE_MAX_BYTES", 64 * 1024 * 1024, int)
+EVENT_QUEUE_OVERFLOW = utils.get_from_environment_variables("DEBUGIN_EVENT_QUEUE_OVERFLOW", DROP_NEWEST, str)
+EVENT_QUEUE_SAMPLE_EVERY = utils.get_from_environment_variables("DEBUGIN_EVENT_QUEUE_SAMPLE_EVERY", 10, int)
+# Sender threads, or in asyncio I/O mode the requests in flight to the event sink
+EVENT_SENDER_THREADS = utils.get_from_environment_variables("DEBUGIN_EVENT_SENDER_THREADS", 4, int)
+# Bytes an event counts against the queue bound when its publisher doesn't know its size
+EVENT_SIZE_ESTIMATE = 512
+# Longest wait at exit for queued events to be sent
+EVENT_QUEUE_EXIT_TIMEOUT_SECS = 5
+# Failed sends in a row after which the event sink is considered down, and how often it is probed then
+EVENT_SINK_FAILURE_THRESHOLD = utils.get_from_environment_variables("DEBUGIN_EVENT_SINK_FAILURE_THRESHOLD", 5, int)
+EVENT_SINK_PROBE_INTERVAL_MS = utils.get_from_environment_variables("DEBUGIN_EVENT_SINK_PROBE_INTERVAL_MS", 5000, int)
+# Events are spooled here while the event sink is down, by default a directory of this process in a directory
+# of the user under the temp dir, where the spools of processes that are gone are adopted
+EVENT_SPOOL_DIR = utils.get_from_environment_variables("DEBUGIN_EVENT_SPOOL_DIR", "", str)
+# 0 drops events while the event sink is down instead of spooling them
+EVENT_SPOOL_MAX_BYTES = utils.get_from_environment_variables("DEBUGIN_EVENT_SPOOL_MAX_BYTES", 256 * 1024 * 1024, int)
+EVENT_SPOOL_SEGMENT_BYTES = utils.get_from_environment_variables("DEBUGIN_EVENT_SPOOL_SEGMENT_BYTES",
+                                                                 8 * 1024 * 1024, int)
+EVENT_SPOOL_FSYNC_INTERVAL_MS = utils.get_from_environment_variables("DEBUGIN_EVENT_SPOOL_FSYNC_INTERVAL_MS", 1000, int)
+# Spooled events sent per second once the event sink is back
+EVENT_SPOOL_REPLAY_RATE = utils.get_from_environment_variables("DEBUGIN_EVENT_SPOOL_REPLAY_RATE", 200, int)
 
 APPLICATION_STATUS_PUBLISH_PERIOD_IN_SECS = 60
 GET_CONFIG_PERIOD_IN_SECS = 5 * 60
@@ -39,6 +92,7 @@ class BrokerManager(object):
 
 
     __instance = None
+    __instance_lock = Lock()
     hostname = socket.gethostname()
 
 
@@ -47,14 +101,37 @@ class BrokerManager(object):
             raise RuntimeError("EVENT_SINK_URL environment variable not set.")
         logger.info("Event sink URL: %s", EVENT_SINK_URL)
         self._client = None
+        self._sink_supports_batches = False
+        self._sink_supports_binary = False
+        self.broker_connection = None
+        # Transport to a local collector or the broker, when the event sink URL is a unix://, ring:// or broker:// one
+        self._transport = self._create_transport()
+        self._circuit_breaker = CircuitBreaker(f"{EVENT_SINK_URL}/health",
+                                               failure_threshold=EVENT_SINK_FAILURE_THRESHOLD,
+                                               probe_interval=EVENT_SINK_PROBE_INTERVAL_MS / 1000.0,
+                                               on_close=self._on_sink_healthy,
+                                               health_check=self._transport.check_health
+                                               if self._transport is not None else None)
+        self._event_spool = self._create_event_spool()
+        self._replay_lock = Lock()
         self._initialize_event_client()
         
-        self.broker_connection = None
         self.initialized = False
-        self._event_executor = ThreadPoolExecutor()
+        self._event_queue = self._create_event_queue()
+        self._event_senders = None
+        self._event_senders_lock = Lock()
         self._request_executor = ThreadPoolExecutor()
         self._tracepoint_data_redaction_callback = None
         self._log_data_redaction_callback = None
+        self._process_pool = None
+        self._process_pool_failed = False
+        self._process_pool_lock = Lock()
+        self._event_batcher = None
+        self._event_batcher_failed = False
+        self._event_batcher_lock = Lock()
+        # Runs the broker connection, periodic tasks and event sending in asyncio I/O mode
+        self._io_loop = IOLoop.instance() if is_asyncio_mode() else None
+        self._async_event_sender = None
         import sys
         if sys.version_info[0] >= 3:
             self.application_status_thread = Thread(target=self.application_status_sender, daemon=True)
@@ -70,18 +147,100 @@ class BrokerManager(object):
         """Initialize the event client with health check"""
         try:
             self._client = EventClient(base_url=EVENT_SINK_URL)
+        except Exception as e:
+            logger.error("Failed to initialize EventClient: %s", e)
+            self._client = None
+            return
+        if self._transport is not None:
+            # Every frame to the collector is a batch
+            if is_broker_url(EVENT_SINK_URL):
+                # Not connected yet, events are spooled until the breaker's probe finds the connection open
+                self._circuit_breaker.open()
+            elif self._transport.check_health() is None:
+                logger.error("Event collector at %s is not reachable", self._transport.path)
+                self._circuit_breaker.open()
+            else:
+                logger.info("Event sink health check passed")
+                self._sink_supports_batches = True
+            return
+        try:
             # Perform health check
             import requests
             response = requests.get(f"{EVENT_SINK_URL}/health", timeout=2)
             response.raise_for_status()
             logger.info("Event sink health check passed")
+            try:
+                health = response.json()
+                self._sink_supports_batches = sink_supports_batches(health)
+                self._sink_supports_binary = supports_binary_batches(health)
+            except ValueError:
+                self._sink_supports_batches = False
         except Exception as e:
-            logger.error("Failed to initialize EventClient: %s", e)
-            self._client = None
+            logger.error("Event sink health check failed: %s", e)
+            self._circuit_breaker.open()
+
+    def _create_transport(self):
+        if is_broker_url(EVENT_SINK_URL):
+            return BrokerEventTransport(lambda: self.broker_connection, frame_bytes=BROKER_EVENT_FRAME_BYTES)
+        if is_unix_socket_url(EVENT_SINK_URL):
+            return UnixSocketTransport(socket_path(EVENT_SINK_URL))
+        if is_ring_url(EVENT_SINK_URL):
+            return EventRingTransport(ring_path(EVENT_SINK_URL))
+        return None
+
+    @staticmethod
+    def _create_event_spool():
+        if EVENT_SPOOL_MAX_BYTES <= 0:
+            return None
+        base = None if EVENT_SPOOL_DIR else \
+            os.path.join(tempfile.gettempdir(), "tracepointdebug-spool-%d" % os.geteuid())
+        directory = EVENT_SPOOL_DIR or os.path.join(base, str(os.getpid()))
+        try:
+            if base is not None:
+                make_private_directory(base)
+            event_spool = EventSpool(directory, max_bytes=EVENT_SPOOL_MAX_BYTES,
+                                     segment_bytes=EVENT_SPOOL_SEGMENT_BYTES,
+                                     fsync_interval=EVENT_SPOOL_FSYNC_INTERVAL_MS / 1000.0)
+        except Exception as e:
+            logger.error("Error opening event spool %s, events are dropped while the sink is down: %s", directory, e)
+            return None
+        if base is not None:
+            BrokerManager._adopt_event_spools(event_spool, base)
+        atexit.register(event_spool.close)
+        return event_spool
+
+    @staticmethod
+    def _adopt_event_spools(event_spool, base):
+        """Takes over the spools in base of processes that are gone, so their events are replayed too."""
+        try:
+            names = os.listdir(base)
+        except OSError as e:
+            logger.error("Error listing event spools in %s: %s", base, e)
+            return
+        for name in names:
+            if not name.isdigit() or int(name) == os.getpid() or _is_running(int(name)):
+                continue
+            try:
+                event_spool.adopt(os.path.join(base, name))
+            except OSError as e:
+                logger.error("Error adopting event spool %s: %s", os.path.join(base, name), e)
+
+    @staticmethod
+    def _create_event_queue():
+        try:
+            return EventQueue(max_events=EVENT_QUEUE_MAX_EVENTS, max_bytes=EVENT_QUEUE_MAX_BYTES,
+                              overflow=EVENT_QUEUE_OVERFLOW.lower(), sample_every=EVENT_QUEUE_SAMPLE_EVERY)
+        except ValueError as e:
+            logger.error("Invalid event queue config, dropping new events when it is full: %s", e)
+            return EventQueue(max_events=EVENT_QUEUE_MAX_EVENTS, max_bytes=EVENT_QUEUE_MAX_BYTES)
 
     @staticmethod
     def instance():
-        return BrokerManager() if BrokerManager.__instance is None else BrokerManager.__instance
+        if BrokerManager.__instance is None:
+            with BrokerManager.__instance_lock:
+                if BrokerManager.__instance is None:
+                    BrokerManager.__instance = BrokerManager()
+        return BrokerManager.__instance
 
 
     def initialize(self):
@@ -101,6 +260,18 @@ class BrokerManager(object):
                                                    hostname=BrokerManager.hostname)
 
             broker_message_callback = BrokerMessageCallback()
+            if self._io_loop is not None:
+                self.broker_connection = AsyncBrokerConnection(host=BROKER_HOST, port=BROKER_PORT,
+                                                               broker_credentials=broker_credentials,
+                                                               message_callback=broker_message_callback.on_message,
+                                                               initial_request_to_broker=self.publish_request,
+                                                               io_loop=self._io_loop,
+                                                               deflate=BROKER_WS_DEFLATE > 0)
+                self.broker_connection.connect()
+                self._io_loop.submit(self.run_while_connected(self.publish_application_status,
+                                                              APPLICATION_STATUS_PUBLISH_PERIOD_IN_SECS))
+                self._io_loop.submit(self.run_while_connected(self.send_get_config, GET_CONFIG_PERIOD_IN_SECS))
+                return
             self.broker_connection = BrokerConnection(host=BROKER_HOST, port=BROKER_PORT,
                                                       broker_credentials=broker_credentials,
                                                       message_callback=broker_message_callback.on_message,
@@ -126,45 +297,287 @@ class BrokerManager(object):
         event.application_name = application_info['applicationName']
 
     def do_publish_event(self, event):
-        # Check if client is initialized
+        """
+        Sends a prepared event to the event sink once. Returns True when it was accepted, None when
+        the sink rejected it and False when the sink couldn't take it.
+        """
         if self._client is None:
             logger.error("EventClient is None in do_publish_event. Cannot publish event.")
             return False
-            
-        self.prepare_event(event)
         try:
             payload = event.to_json() if hasattr(event, "to_json") else event.__dict__
-            # Add runtime header for event sink
             import requests
-            headers = {"X-Runtime": Application.get_application_info().get("applicationRuntime", "python")}
-            url = f"{self._client.base_url}/api/events"
-            
-            # Use the EventClient's send method with retries
-            for i in range(self._client.retries):
-                try:
-                    data = requests.compat.json.dumps(payload)
-                    r = self._client.session.post(url, data=data, 
-                                              headers={"content-type": "application/json", **headers}, 
-                                              timeout=self._client.timeout)
-                    r.raise_for_status()
-                    return True
-                except Exception as e:
-                    if i == self._client.retries - 1:
-                        logger.exception("publish_event failed after %d retries to %s", self._client.retries, url)
-                        return False
-                    time.sleep(self._client.backoff * (2 ** i))
+            data = requests.compat.json.dumps(payload)
+        except Exception as e:
+            logger.error("Error encoding %s (%s): %s", type(event).__name__, getattr(event, 'id', None), e)
+            return None
+        return self.post_event(data)
+
+    def post_event(self, data):
+        """POSTs an encoded event to the event sink, returns as do_publish_event does."""
+        if self._transport is not None:
+            return self._send_frame(data)
+        url = f"{self._client.base_url}/api/events"
+        # Add runtime header for event sink
+        headers = {"X-Runtime": Application.get_application_info().get("applicationRuntime", "python")}
+        try:
+            r = self._client.session.post(url, data=data, headers={"content-type": "application/json", **headers},
+                                          timeout=self._client.timeout)
+        except Exception as e:
+            logger.debug("Sending event to %s failed: %s", url, e)
             return False
+        if r.status_code < 400:
+            return True
+        if r.status_code < 500 and r.status_code not in (408, 429):
+            logger.debug("Event sink rejected event with %d: %s", r.status_code, r.text[:200])
+            return None
+        return False
+
+    def _send_frame(self, data):
+        """Sends an encoded event to the local collector over the transport, returns as post_event does."""
+        try:
+            answer = self._transport.send_batch([data.encode("utf-8") if isinstance(data, str) else data])
         except Exception as e:
-            logger.exception("publish_event failed: %s (%s)", type(event).__name__, getattr(event, 'id', None))
+            logger.debug("Sending event to %s failed: %s", self._transport.path, e)
             return False
-
-
-    def publish_event(self, event):
+        answer = answer if isinstance(answer, dict) else {}
+        if answer.get("status") == "error" or answer.get("rejected"):
+            logger.debug("Event collector rejected event: %s", answer.get("error") or answer["rejected"][0].get("error"))
+            return None
+        return True
+
+    def publish_event(self, event, callback=None, size=None):
+        """
+        Queues event for sending, callback, if given, is called once it has been sent, given up on or dropped.
+        size is the event's size in bytes, when the publisher knows it, for the queue bound.
+        """
         if self._client is None:
             logger.error("EventClient is None in publish_event. Cannot publish event.")
+            if callback:
+                callback()
+            return
+        self.prepare_event(event)
+        self.start_event_senders()
+        bulk = getattr(event, "BULK", False)
+        if size is None:
+            size = self.estimate_event_size(event)
+        if not self._event_queue.put(event, callback, size, priority=not bulk):
+            logger.debug("Event queue is full, dropped %s (%s)", type(event).__name__, event.id)
+
+    @staticmethod
+    def estimate_event_size(event):
+        message = getattr(event, "log_message", None)
+        return EVENT_SIZE_ESTIMATE + (len(message) if isinstance(message, str) else 0)
+
+    def start_event_senders(self):
+        """Starts what takes events from the event queue, the event batcher or sender threads."""
+        if self._event_senders is not None:
+            return
+        with self._event_senders_lock:
+            if self._event_senders is not None:
+                return
+            senders = []
+            if self._io_loop is not None and self.get_process_pool() is None and self._transport is None:
+                self._async_event_sender = self._create_async_event_sender()
+                self._async_event_sender.start()
+            # The batcher takes events from the queue itself, worker processes are fed by sender threads
+            elif self.get_process_pool() is not None or self.get_event_batcher() is None:
+                for i in range(max(1, EVENT_SENDER_THREADS)):
+                    sender = Thread(target=self._send_events, name="tracepointdebug-event-sender-%d" % i,
+                                    daemon=True)
+                    sender.start()
+                    senders.append(sender)
+            atexit.register(self._event_queue.join, EVENT_QUEUE_EXIT_TIMEOUT_SECS)
+            self._event_senders = senders
+        if self._event_spool is not None and len(self._event_spool) and not self._circuit_breaker.is_open:
+            # Left by an earlier process spooling to the same directory, or adopted from one that is gone
+            Thread(target=self.replay_spooled_events, name="tracepointdebug-spool-replay", daemon=True).start()
+
+    def _create_async_event_sender(self):
+        headers = {"X-Runtime": Application.get_application_info().get("applicationRuntime", "python")}
+        pool = AsyncHTTPPool(self._client.base_url, max_connections=max(1, EVENT_SENDER_THREADS),
+                             timeout=self._client.timeout)
+        return AsyncEventSender(self._io_loop, self._event_queue, pool, self.encode_event, headers=headers,
+                                retries=self._client.retries, backoff=self._client.backoff,
+                                max_in_flight=EVENT_SENDER_THREADS,
+                                batching=self._sink_supports_batches and EVENT_BATCH_MAX_EVENTS > 0,
+                                batch_max_events=EVENT_BATCH_MAX_EVENTS, batch_max_bytes=EVENT_BATCH_MAX_BYTES,
+                                # Binary batches are only encoded by the EventBatcher
+                                batch_format=NDJSON if self._batch_format() == BINARY else self._batch_format(),
+                                circuit_breaker=self._circuit_breaker, spool=self._event_spool)
+
+    def _send_events(self):
+        while True:
+            if self._event_batcher is not None and self._process_pool is None:
+                # The sink has taken batches since this thread started, see _on_sink_healthy
+                return
+            taken = self._event_queue.take()
+            if not taken:
+                if self._event_queue.closed and not len(self._event_queue):
+                    return
+                continue
+            try:
+                self.send_queued_event(taken[0])
+            except Exception as e:
+                logger.error("Error sending %s: %s", type(taken[0].event).__name__, e)
+                self._finish_event(taken[0])
+
+    def send_queued_event(self, queued):
+        if self._circuit_breaker.is_open:
+            self._spool_event(queued)
+            return
+        process_pool = self.get_process_pool()
+        if process_pool is not None:
+            try:
+                payload = queued.event.to_json() if hasattr(queued.event, "to_json") else queued.event.__dict__
+                headers = {"X-Runtime": Application.get_application_info().get("applicationRuntime", "python")}
+                sent = Event()
+                process_pool.submit(payload, "/api/events", headers=headers, callback=sent.set)
+                # Waiting keeps at most one event per sender thread in the pool, the rest stay bounded in the queue.
+                # The pool calls back for events of workers that die too, the bound only guards against a hung one
+                if not sent.wait(process_pool.task_timeout):
+                    logger.error("Event process pool did not finish %s (%s) in %.0f seconds, going on without it",
+                                 type(queued.event).__name__, queued.event.id, process_pool.task_timeout)
+                self._finish_event(queued)
+                return
+            except Exception as e:
+                logger.error("Error handing event to process pool, sending it from this process: %s", e)
+        sent = self.do_publish_event(queued.event)
+        if sent:
+            self._circuit_breaker.record_success()
+            self._finish_event(queued)
+        elif sent is None:
+            logger.error("Event sink rejected %s (%s)", type(queued.event).__name__, queued.event.id)
+            self._finish_event(queued)
+        else:
+            self._circuit_breaker.record_failure()
+            if self._circuit_breaker.is_open:
+                self._spool_event(queued)
+            elif queued.attempts + 1 < self._client.retries:
+                # The event waits for its retry in the queue, this thread goes on with the next one
+                self._event_queue.retry(queued, self._client.backoff * (2 ** queued.attempts))
+            else:
+                logger.error("publish_event failed after %d retries: %s (%s)", self._client.retries,
+                             type(queued.event).__name__, queued.event.id)
+                self._finish_event(queued)
+
+    def _spool_event(self, queued):
+        if self._event_spool is None:
+            logger.debug("Event sink is down, dropped %s (%s)", type(queued.event).__name__, queued.event.id)
+        else:
+            try:
+                self._event_spool.append(self.encode_event(queued.event))
+            except Exception as e:
+                logger.error("Error spooling %s (%s): %s", type(queued.event).__name__, queued.event.id, e)
+        self._finish_event(queued)
+
+    def _on_sink_healthy(self, health):
+        # Every frame to a collector or the broker is a batch
+        self._sink_supports_batches = self._transport is not None or sink_supports_batches(health)
+        self._sink_supports_binary = supports_binary_batches(health)
+        if self._async_event_sender is not None:
+            self._async_event_sender.batching = self._sink_supports_batches and EVENT_BATCH_MAX_EVENTS > 0
+        elif self._event_senders and self.get_process_pool() is None and self.get_event_batcher() is not None:
+            # Sender threads started while the sink took no batches, they leave the queue to the batcher
+            self._event_queue.wake()
+        Thread(target=self.replay_spooled_events, name="tracepointdebug-spool-replay", daemon=True).start()
+
+    def replay_spooled_events(self):
+        """Sends the spooled events to the event sink, oldest first, at most EVENT_SPOOL_REPLAY_RATE a second."""
+        if self._event_spool is None or self._client is None or not self._replay_lock.acquire(False):
             return
-        self._event_executor.submit(self.do_publish_event, event)
+        try:
+            if len(self._event_spool) and self._event_spool.replay(self._send_spooled_event,
+                                                                   rate=EVENT_SPOOL_REPLAY_RATE):
+                logger.info("Replayed spooled events to the event sink")
+        except Exception as e:
+            logger.error("Error replaying spooled events: %s", e)
+        finally:
+            self._replay_lock.release()
 
+    def _send_spooled_event(self, line):
+        if self._circuit_breaker.is_open:
+            return False
+        sent = self.post_event(line)
+        if sent is None:
+            logger.error("Event sink rejected a spooled event, dropping it")
+        elif not sent:
+            # Down again, the next recovery goes on from this event
+            self._circuit_breaker.open()
+            return False
+        return True
+
+    def _finish_event(self, queued):
+        if queued.callback:
+            try:
+                queued.callback()
+            except Exception as e:
+                logger.error("Error in event callback: %s", e)
+        self._event_queue.task_done()
+
+    def get_stats(self):
+        return {
+            "queue": self._event_queue.get_stats(),
+            "batcher": self._event_batcher.get_stats() if self._event_batcher is not None else None,
+            "sender": self._async_event_sender.get_stats() if self._async_event_sender is not None else None,
+            "circuitBreaker": self._circuit_breaker.get_stats(),
+            "spool": self._event_spool.get_stats() if self._event_spool is not None else None,
+            "transport": self._transport.get_stats() if self._transport is not None else None
+        }
+
+    def get_process_pool(self):
+        """Returns the event process pool, started on first use, or None when events are sent from threads."""
+        # Workers only post over HTTP, events for a local collector are sent from this process
+        if self._process_pool is not None or EVENT_PROCESS_WORKERS <= 0 or self._process_pool_failed \
+                or self._transport is not None:
+            return self._process_pool
+        with self._process_pool_lock:
+            if self._process_pool is None and not self._process_pool_failed:
+                try:
+                    process_pool = EventProcessPool(EVENT_PROCESS_WORKERS, self._client.base_url,
+                                                    timeout=self._client.timeout, retries=self._client.retries,
+                                                    backoff=self._client.backoff)
+                    process_pool.start()
+                    self._process_pool = process_pool
+                except Exception as e:
+                    logger.error("Error starting event process pool, events are sent from threads: %s", e)
+                    self._process_pool_failed = True
+        return self._process_pool
+
+    def get_event_batcher(self):
+        """Returns the event batcher, started on first use, or None when events are sent one by one."""
+        if self._event_batcher is not None or not self._sink_supports_batches or EVENT_BATCH_MAX_EVENTS <= 0 \
+                or self._event_batcher_failed:
+            return self._event_batcher
+        with self._event_batcher_lock:
+            if self._event_batcher is None and not self._event_batcher_failed:
+                try:
+                    headers = {"X-Runtime": Application.get_application_info().get("applicationRuntime", "python")}
+                    event_batcher = EventBatcher(self._client.base_url, self.encode_event,
+                                                 max_events=EVENT_BATCH_MAX_EVENTS, max_bytes=EVENT_BATCH_MAX_BYTES,
+                                                 max_delay_ms=EVENT_BATCH_MAX_DELAY_MS,
+                                                 batch_format=self._batch_format(), headers=headers,
+                                                 timeout=self._client.timeout, retries=self._client.retries,
+                                                 backoff=self._client.backoff, queue=self._event_queue,
+                                                 circuit_breaker=self._circuit_breaker, spool=self._event_spool,
+                                                 transport=self._transport)
+                    event_batcher.start()
+                    self._event_batcher = event_batcher
+                except Exception as e:
+                    logger.error("Error starting event batcher, events are sent one by one: %s", e)
+                    self._event_batcher_failed = True
+        return self._event_batcher
+
+    def _batch_format(self):
+        """The configured batch format, NDJSON instead of binary when the sink doesn't list it."""
+        batch_format = EVENT_BATCH_FORMAT.lower()
+        if batch_format == BINARY and not self._sink_supports_binary:
+            return NDJSON
+        return batch_format
+
+    def encode_event(self, event):
+        payload = event.to_json() if hasattr(event, "to_json") else event.__dict__
+        return to_json(payload, separators=(",", ":")).encode("utf-8")
 
     @staticmethod
     def create_request():
@@ -194,7 +607,10 @@ class BrokerManager(object):
 
 
     def publish_request(self):
-        self._request_executor.submit(self.do_publish_request)
+        if self._io_loop is not None:
+            self._io_loop.call_soon(self.do_publish_request)
+        else:
+            self._request_executor.submit(self.do_publish_request)
 
 
     def application_status_sender(self):
@@ -210,6 +626,16 @@ class BrokerManager(object):
             self.send_get_config()
             time.sleep(GET_CONFIG_PERIOD_IN_SECS)
 
+    async def run_while_connected(self, function, period):
+        """Counterpart of the sender threads above on the IOLoop, calls function every period seconds while connected."""
+        while self.broker_connection is not None and self.broker_connection.is_running():
+            await self.broker_connection.wait_connected()
+            try:
+                function()
+            except Exception as e:
+                logger.error("Error in %s: %s", function.__name__, e)
+            await asyncio.sleep(period)
+
     def send_get_config(self):
         try:
             application_info = Application.get_application_info()
@@ -241,4 +667,15 @@ class BrokerManager(object):
         for status_provider in self.application_status_providers:
             status_provider.provide(application_status, client)
         event = ApplicationStatusEvent(client=client, application=application_status)
-        self.publish_event(event)
\ No newline at end of file
+        self.publish_event(event)
+
+
+def _is_running(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        # Running as another user
+        return True
+    return True
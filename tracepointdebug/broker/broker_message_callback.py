@@ -7,7 +7,8 @@ from tracepointdebug.probe.handler import ( DisableTracePointRequestHandler,
     UpdateTracePointRequestHandler, FilterTracePointsResponseHandler, DisableLogPointRequestHandler, 
     EnableLogPointRequestHandler, PutLogPointRequestHandler, RemoveLogPointRequestHandler, UpdateLogPointRequestHandler,
     FilterLogPointsResponseHandler, EnableProbeTagRequestHandler, DisableProbeTagRequestHandler, GetConfigResponseHandler, 
-    AttachRequestHandler, DetachRequestHandler, UpdateConfigRequestHandler, RemoveProbeTagRequestHandler)
+    AttachRequestHandler, DetachRequestHandler, UpdateConfigRequestHandler, RemoveProbeTagRequestHandler,
+    ExpandSnapshotRequestHandler)
 from tracepointdebug.utils import debug_logger
 
 MESSAGE_REQUEST_TYPE = "Request"
@@ -19,6 +20,7 @@ REQUEST_HANDLER_MAP = {
     "PutTracePointRequest": PutTracePointRequestHandler,
     "RemoveTracePointRequest": RemoveTracePointRequestHandler,
     "UpdateTracePointRequest": UpdateTracePointRequestHandler,
+    "ExpandSnapshotRequest": ExpandSnapshotRequestHandler,
 
     "DisableLogPointRequest": DisableLogPointRequestHandler,
     "EnableLogPointRequest": EnableLogPointRequestHandler,
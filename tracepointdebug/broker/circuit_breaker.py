@@ -0,0 +1,113 @@
+"""
+Circuit breaker around the event sink.
+
+After ``failure_threshold`` sends in a row failed, the breaker opens: senders stop
+trying the sink, BrokerManager spools events to disk instead, and a background
+thread probes the sink's ``GET /health`` every ``probe_interval`` seconds. The first
+healthy answer closes the breaker and calls ``on_close`` with the body of the
+``/health`` response, which replays the spool. Sinks that aren't reached over HTTP
+pass their own ``health_check``.
+"""
+
+import logging
+import time
+from threading import Event, Lock, Thread
+
+logger = logging.getLogger(__name__)
+
+CLOSED = "closed"
+OPEN = "open"
+
+
+class CircuitBreaker(object):
+
+    def __init__(self, health_url, failure_threshold=5, probe_interval=5.0, timeout=2.0, on_close=None,
+                 health_check=None):
+        self.health_url = health_url
+        self.health_check = health_check
+        self.failure_threshold = max(1, failure_threshold)
+        self.probe_interval = probe_interval
+        self.timeout = timeout
+        self.on_close = on_close
+        self._lock = Lock()
+        self._state = CLOSED
+        self._failures = 0
+        self._stopped = Event()
+        self._probe_thread = None
+        self.opened = 0
+        self.opened_at = None
+
+    @property
+    def state(self):
+        return self._state
+
+    @property
+    def is_open(self):
+        return self._state == OPEN
+
+    def record_success(self):
+        self._failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._failures < self.failure_threshold:
+                return
+        self.open()
+
+    def open(self):
+        """Opens the breaker, unless it is already open, and starts probing the sink."""
+        with self._lock:
+            if self._state == OPEN or self._stopped.is_set():
+                return
+            self._state = OPEN
+            self.opened += 1
+            self.opened_at = time.time()
+            self._probe_thread = Thread(target=self._probe, name="tracepointdebug-sink-probe", daemon=True)
+            self._probe_thread.start()
+        logger.warning("Event sink unreachable, spooling events until %s is healthy", self.health_url)
+
+    def stop(self):
+        self._stopped.set()
+
+    def get_stats(self):
+        return {
+            "state": self._state,
+            "consecutiveFailures": self._failures,
+            "opened": self.opened,
+            "openedAt": self.opened_at
+        }
+
+    def check_health(self):
+        """Body of the sink's /health response, {} when it isn't JSON, or None when the sink isn't healthy."""
+        if self.health_check is not None:
+            return self.health_check()
+        import requests
+        try:
+            response = requests.get(self.health_url, timeout=self.timeout)
+            response.raise_for_status()
+        except Exception:
+            return None
+        try:
+            return response.json()
+        except ValueError:
+            return {}
+
+    def _probe(self):
+        while not self._stopped.wait(self.probe_interval):
+            health = self.check_health()
+            if health is not None:
+                self._close(health)
+                return
+
+    def _close(self, health):
+        with self._lock:
+            self._state = CLOSED
+            self._failures = 0
+            self._probe_thread = None
+        logger.info("Event sink is healthy again")
+        if self.on_close:
+            try:
+                self.on_close(health)
+            except Exception as e:
+                logger.error("Error after the event sink recovered: %s", e)
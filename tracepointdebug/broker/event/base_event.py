@@ -2,6 +2,8 @@ from tracepointdebug.broker.event.event import Event
 
 
 class BaseEvent(Event):
+    # Snapshots and log messages are bulk events, queued behind control events and dropped first
+    BULK = False
 
     def __init__(self, send_ack=False, client=None, time=None, hostname=None,
                  application_name=None, application_instance_id=None):
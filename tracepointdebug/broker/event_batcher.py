@@ -0,0 +1,357 @@
+"""
+Batched shipping of events to the event sink.
+
+When the event sink advertises batch support in ``GET /health``, BrokerManager hands
+events to an EventBatcher instead of posting each one from its own task. The batcher's
+thread encodes the events as they arrive and sends them together as one POST to
+``/api/events/batch`` once it holds ``max_events`` events or ``max_bytes`` of encoded
+events, or ``max_delay_ms`` after the first event of the batch, whichever comes first.
+
+Batches are NDJSON (one event per line, ``application/x-ndjson``), a JSON array
+(``application/json``) or, when the sink lists it, the compact binary encoding of
+binary_batch, gzip compressed when they are large. A binary batch is encoded event by
+event as events arrive; if the sink answers 415 the batcher goes on with NDJSON. If the
+sink stops accepting batches (404 or 405), the batcher goes on posting each event to
+``/api/events`` as before. Events the sink rejects with any other 4xx than 408 or 429
+are counted as failed and not sent again.
+
+Events wait for the batcher in an EventQueue, BrokerManager shares its bounded one.
+A batch that fails is not retried on the batcher's thread: its events go back to the
+queue with EventQueue.retry and join a later batch once their backoff is over, so
+priority events keep going out meanwhile. While the circuit breaker around the sink
+is open, batches are written to the disk spool instead. With a ``transport`` to a local collector, a UnixSocketTransport or an
+EventRingTransport, batches are sent as frames over its socket or written into its
+shared memory ring instead of POSTs; with a BrokerEventTransport they are sent as
+binary messages over the broker websocket. A transport that fails part way through a
+batch raises PartialSendError, and only the events it had not sent yet are retried.
+"""
+
+import atexit
+import gzip
+import logging
+import time
+from threading import Thread
+
+from tracepointdebug.broker.binary_batch import BINARY, CONTENT_TYPE as BINARY_CONTENT_TYPE, BinaryBatchEncoder
+from tracepointdebug.broker.event_process_pool import COMPRESS_LEVEL, COMPRESS_MIN_BYTES
+from tracepointdebug.broker.event_queue import EventQueue
+
+logger = logging.getLogger(__name__)
+
+BATCH_PATH = "/api/events/batch"
+EVENT_PATH = "/api/events"
+
+# What _post returns when the sink rejected the events, sending them again would get the same answer
+REJECTED = "rejected"
+
+NDJSON = "ndjson"
+JSON_ARRAY = "json"
+BATCH_FORMATS = (NDJSON, JSON_ARRAY, BINARY)
+
+CONTENT_TYPES = {
+    NDJSON: "application/x-ndjson",
+    JSON_ARRAY: "application/json",
+    BINARY: BINARY_CONTENT_TYPE
+}
+
+
+class PartialSendError(OSError):
+    """Raised by a transport's send_batch that failed after sending the first ``sent`` lines."""
+
+    def __init__(self, sent, error):
+        super(PartialSendError, self).__init__("failed after sending %d events: %s" % (sent, error))
+        self.sent = sent
+
+
+def sink_supports_batches(health):
+    """Whether the body of the sink's /health response advertises /api/events/batch."""
+    batch = health.get("batch") if isinstance(health, dict) else None
+    if isinstance(batch, dict):
+        return bool(batch.get("supported"))
+    return batch is True
+
+
+def encode_batch(lines, batch_format=NDJSON):
+    """Body of a batch of events, each already encoded as a JSON document without newlines."""
+    if batch_format == NDJSON:
+        return b"\n".join(lines) + b"\n"
+    return b"[" + b",".join(lines) + b"]"
+
+
+class EventBatcher(object):
+
+    def __init__(self, base_url, encode, max_events=500, max_bytes=1024 * 1024, max_delay_ms=200,
+                 batch_format=NDJSON, headers=None, timeout=2.0, retries=3, backoff=0.25,
+                 compress_min_bytes=COMPRESS_MIN_BYTES, queue=None, circuit_breaker=None, spool=None,
+                 transport=None):
+        """
+        encode(event) returns the event as a JSON document in bytes, it is called on the batcher thread.
+        With the binary batch_format events are given to a BinaryBatchEncoder instead, and only encoded
+        as JSON to be spooled or sent one by one.
+        Events are taken from queue, an EventQueue shared with the publisher, or from one of the batcher's own.
+        While circuit_breaker is open, batches are written to spool, an EventSpool, instead of being sent.
+        """
+        if batch_format not in BATCH_FORMATS:
+            raise ValueError("Unknown batch format %s, expected one of %s" % (batch_format, ", ".join(BATCH_FORMATS)))
+        import requests
+        self.base_url = base_url.rstrip("/")
+        self.encode = encode
+        self.max_events = max(1, max_events)
+        self.max_bytes = max_bytes
+        self.max_delay = max_delay_ms / 1000.0
+        self.batch_format = batch_format
+        self.headers = dict(headers or {})
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.compress_min_bytes = compress_min_bytes
+        # Only used from the batcher thread
+        self._session = requests.Session()
+        self._queue = queue if queue is not None else EventQueue()
+        self._flushing = False
+        self._thread = None
+        self.circuit_breaker = circuit_breaker
+        self.spool = spool
+        self.transport = transport
+        # Holds the binary batch being filled, frames to a transport are always NDJSON
+        self._binary = BinaryBatchEncoder() if batch_format == BINARY and transport is None else None
+        self.batching = True
+        self.sent_batches = 0
+        self.sent_events = 0
+        self.failed_events = 0
+        self.spooled_events = 0
+
+    def start(self):
+        self._thread = Thread(target=self._run, name="tracepointdebug-event-batcher", daemon=True)
+        self._thread.start()
+        atexit.register(self.stop)
+
+    def submit(self, event, callback=None, size=0, priority=False):
+        """
+        Queues event, callback, if given, is called once it has been sent or given up on.
+        Returns False when the queue dropped the event.
+        """
+        return self._queue.put(event, callback, size, priority)
+
+    def flush(self, timeout=None):
+        """Waits until every submitted event has been sent or given up on, returns False on timeout."""
+        self._flushing = True
+        self._queue.wake()
+        try:
+            return self._queue.join(timeout)
+        finally:
+            self._flushing = False
+
+    def stop(self, timeout=5.0):
+        self._queue.close()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def get_stats(self):
+        return {
+            "batching": self.batching,
+            "format": BINARY if self._binary is not None else self.batch_format,
+            "sentBatches": self.sent_batches,
+            "sentEvents": self.sent_events,
+            "failedEvents": self.failed_events,
+            "spooledEvents": self.spooled_events
+        }
+
+    def _run(self):
+        # (encoded event, QueuedEvent) pairs of the batch being filled, no encoded event in a binary batch
+        batch = []
+        size = 0
+        deadline = None
+        while True:
+            timeout = None if not batch else max(0.0, deadline - time.monotonic())
+            taken = self._queue.take(self.max_events, timeout)
+            for queued in taken:
+                try:
+                    if self._binary is not None:
+                        # Already in the batch, which may so end one event past max_bytes
+                        line, length = None, self._binary.add(queued.event)
+                    else:
+                        line = self.encode(queued.event)
+                        length = len(line)
+                except Exception as e:
+                    logger.error("Error encoding event %s for the event sink: %s", type(queued.event).__name__, e)
+                    self.failed_events += 1
+                    self._finish([queued])
+                    continue
+                if line is not None and batch and size + length > self.max_bytes:
+                    self._send(batch)
+                    batch, size = [], 0
+                if not batch:
+                    deadline = time.monotonic() + self.max_delay
+                batch.append((line, queued))
+                size += length
+                if len(batch) >= self.max_events or size >= self.max_bytes:
+                    self._send(batch)
+                    batch, size = [], 0
+            # Nothing taken means the delay is over, a flush or the queue was closed
+            if batch and (not taken or self._flushing or time.monotonic() >= deadline):
+                self._send(batch)
+                batch, size = [], 0
+            if not taken and self._queue.closed and not len(self._queue):
+                return
+
+    def _send(self, batch):
+        body = None
+        if self._binary is not None:
+            body, self._binary = self._binary.getvalue(), BinaryBatchEncoder()
+        if self.circuit_breaker is not None and self.circuit_breaker.is_open:
+            self._spool(batch)
+            return
+        ok = False
+        if self.batching:
+            ok = self._post_batch(batch, body)
+            if ok is None:
+                logger.warning("Event sink does not accept batches any more, sending events one by one")
+                self.batching = False
+        if ok == REJECTED:
+            self._rejected(batch)
+            return
+        if not self.batching:
+            # Events posted before one fails are done, the failed one and those after it are retried
+            lines = self._lines(batch)
+            sent, rejected, unsent = [], [], []
+            for i, line in enumerate(lines):
+                result = self._post(EVENT_PATH, line, {"content-type": "application/json"})
+                if not result:
+                    unsent = batch[i:]
+                    break
+                (rejected if result == REJECTED else sent).append(batch[i])
+            if sent:
+                self._sent(sent)
+            if rejected:
+                self._rejected(rejected)
+            batch = unsent
+            if not batch:
+                return
+        if ok:
+            self._sent(batch)
+        else:
+            self._failed(batch)
+
+    def _sent(self, batch):
+        self.sent_batches += 1
+        self.sent_events += len(batch)
+        if self.circuit_breaker is not None:
+            self.circuit_breaker.record_success()
+        self._finish([queued for _, queued in batch])
+
+    def _failed(self, batch):
+        if self.circuit_breaker is not None:
+            self.circuit_breaker.record_failure()
+            if self.circuit_breaker.is_open:
+                self._spool(batch)
+                return
+        given_up = []
+        for _, queued in batch:
+            if queued.attempts + 1 < self.retries:
+                # The event waits for its retry in the queue, the batcher goes on with the next ones
+                self._queue.retry(queued, self.backoff * (2 ** queued.attempts))
+            else:
+                given_up.append(queued)
+        if given_up:
+            logger.error("Sending %d events to %s failed after %d retries", len(given_up),
+                         self.transport.path if self.transport is not None else self.base_url, self.retries)
+            self.failed_events += len(given_up)
+            self._finish(given_up)
+
+    def _rejected(self, batch):
+        # Not a failure of the sink, so neither retried nor counted by the circuit breaker
+        self.failed_events += len(batch)
+        self._finish([queued for _, queued in batch])
+
+    def _spool(self, batch):
+        if self.spool is None:
+            self.failed_events += len(batch)
+        else:
+            try:
+                for line in self._lines(batch):
+                    self.spool.append(line)
+                self.spooled_events += len(batch)
+            except Exception as e:
+                logger.error("Error spooling events: %s", e)
+                self.failed_events += len(batch)
+        self._finish([queued for _, queued in batch])
+
+    def _lines(self, batch):
+        """The batch's events encoded as JSON documents, encoding those of a binary batch now."""
+        return [line if line is not None else self.encode(queued.event) for line, queued in batch]
+
+    def _post_batch(self, batch, body=None):
+        """
+        True when the batch was sent, False when it failed, REJECTED when the sink rejected it and
+        None when the sink has no batch endpoint.
+        body is the batch's binary encoding, for a binary batch.
+        """
+        if self.transport is not None:
+            return self._send_frame(batch)
+        if body is not None:
+            ok = self._post_body(body, BINARY_CONTENT_TYPE, unsupported=(404, 405, 415))
+            if ok is not None:
+                return ok
+            logger.warning("Event sink does not accept binary batches any more, sending NDJSON batches")
+            self.batch_format = NDJSON
+            self._binary = None
+        return self._post_body(encode_batch(self._lines(batch), self.batch_format), CONTENT_TYPES[self.batch_format],
+                               unsupported=(404, 405))
+
+    def _post_body(self, body, content_type, unsupported):
+        headers = {"content-type": content_type}
+        if self.compress_min_bytes is not None and len(body) >= self.compress_min_bytes:
+            body = gzip.compress(body, COMPRESS_LEVEL)
+            headers["content-encoding"] = "gzip"
+        return self._post(BATCH_PATH, body, headers, unsupported=unsupported)
+
+    def _post(self, path, body, headers, unsupported=()):
+        """One attempt, the events of a failed one are retried through the queue."""
+        url = self.base_url + path
+        headers.update(self.headers)
+        try:
+            r = self._session.post(url, data=body, headers=headers, timeout=self.timeout)
+            if r.status_code in unsupported:
+                return None
+            if 400 <= r.status_code < 500 and r.status_code not in (408, 429):
+                logger.error("Event sink rejected events posted to %s with %d: %s", url, r.status_code, r.text[:200])
+                return REJECTED
+            r.raise_for_status()
+            return True
+        except Exception as e:
+            logger.debug("Sending events to %s failed: %s", url, e)
+            return False
+
+    def _send_frame(self, batch):
+        """As _post_batch, events sent before the transport failed are done and removed from batch."""
+        lines = self._lines(batch)
+        try:
+            answer = self.transport.send_batch(lines)
+        except PartialSendError as e:
+            logger.debug("Sending events to %s failed: %s", self.transport.path, e)
+            self._sent(batch[:e.sent])
+            del batch[:e.sent]
+            return False
+        except Exception as e:
+            logger.debug("Sending events to %s failed: %s", self.transport.path, e)
+            return False
+        # Rejected events are not sent again, as after a 4xx
+        answer = answer if isinstance(answer, dict) else {}
+        if answer.get("status") == "error":
+            logger.error("Event collector rejected a batch of %d events: %s", len(lines), answer.get("error"))
+        elif answer.get("rejected"):
+            logger.warning("Event collector rejected %d of %d events", len(answer["rejected"]), len(lines))
+        elif answer.get("dropped"):
+            # A full ring, the events are counted in its stats
+            logger.debug("Event ring is full, dropped %d of %d events", answer["dropped"], len(lines))
+        return True
+
+    def _finish(self, queued_events):
+        for queued in queued_events:
+            if queued.callback:
+                try:
+                    queued.callback()
+                except Exception as e:
+                    logger.error("Error in event callback: %s", e)
+        self._queue.task_done(len(queued_events))
@@ -0,0 +1,289 @@
+"""
+Optional process pool that encodes, compresses and sends events outside the application process.
+
+With the GIL, JSON encoding and compression of large snapshots on the agent's event
+threads compete with application threads no matter how many threads do it. When
+``DEBUGIN_EVENT_PROCESS_WORKERS`` is set, BrokerManager hands each prepared event to
+this pool instead: the event tree, which only holds plain values by then, is pickled
+into a shared memory block and a worker process encodes it, gzips it when it is large
+and POSTs it to the event sink. The application process only pays for the pickling.
+
+Redaction rules are applied while snapshots are captured and redaction callbacks on
+the capturing thread, so events reach the pool already redacted.
+
+Workers are started with the ``spawn`` method, so the application's main module must
+be import safe (``if __name__ == "__main__":``), as for any multiprocessing use.
+
+Each worker has its own task queue, so the events of a worker that dies (killed by
+the OOM killer, crashed in a native extension) are known: they are failed through
+their callbacks and the worker is replaced by a new one.
+"""
+
+import atexit
+import gzip
+import itertools
+import logging
+import multiprocessing
+import pickle
+import queue
+import sys
+import time
+from threading import Lock, Thread
+
+logger = logging.getLogger(__name__)
+
+# Bodies at least this large are sent gzip compressed
+COMPRESS_MIN_BYTES = 1024
+COMPRESS_LEVEL = 6
+# How often workers are checked for being alive while results are awaited
+LIVENESS_CHECK_SECS = 0.5
+# Dead workers replaced per worker slot before the pool stops replacing them
+MAX_RESPAWNS_PER_WORKER = 10
+# Time a worker may take to start, on top of the time it may take to send an event
+TASK_GRACE_SECS = 10.0
+
+
+def _attach(name):
+    from multiprocessing import shared_memory
+    if sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory(name=name, track=False)
+    # Spawned workers share the parent's resource tracker, registering the block again there is harmless
+    return shared_memory.SharedMemory(name=name)
+
+
+def encode_body(payload, compress_min_bytes=COMPRESS_MIN_BYTES):
+    """Returns the request body and headers for payload, gzip compressed when it is large."""
+    from tracepointdebug.probe.encoder import to_json
+    body = to_json(payload).encode("utf-8")
+    headers = {"content-type": "application/json"}
+    if compress_min_bytes is not None and len(body) >= compress_min_bytes:
+        body = gzip.compress(body, COMPRESS_LEVEL)
+        headers["content-encoding"] = "gzip"
+    return body, headers
+
+
+def _worker_main(tasks, results, base_url, timeout, retries, backoff, compress_min_bytes):
+    import requests
+    session = requests.Session()
+    while True:
+        task = tasks.get()
+        if task is None:
+            return
+        task_id, name, size, path, headers = task
+        ok = False
+        try:
+            shm = _attach(name)
+            try:
+                payload = pickle.loads(shm.buf[:size])
+            finally:
+                shm.close()
+            body, body_headers = encode_body(payload, compress_min_bytes)
+            body_headers.update(headers)
+            for i in range(retries):
+                try:
+                    r = session.post(base_url + path, data=body, headers=body_headers, timeout=timeout)
+                    if 400 <= r.status_code < 500 and r.status_code not in (408, 429):
+                        # A rejection, sending the event again would get the same answer
+                        logger.error("Event sink rejected event with %d", r.status_code)
+                        break
+                    r.raise_for_status()
+                    ok = True
+                    break
+                except Exception:
+                    if i < retries - 1:
+                        time.sleep(backoff * (2 ** i))
+        except Exception as e:
+            logger.error("Event process worker failed to send event: %s", e)
+        results.put((task_id, ok))
+
+
+class _Worker(object):
+    """A worker process, the queue of its tasks and the ids of the tasks it has not finished."""
+    __slots__ = ('process', 'tasks', 'task_ids')
+
+    def __init__(self, process, tasks):
+        self.process = process
+        self.tasks = tasks
+        self.task_ids = set()
+
+
+class EventProcessPool(object):
+
+    def __init__(self, workers, base_url, timeout=2.0, retries=3, backoff=0.25,
+                 compress_min_bytes=COMPRESS_MIN_BYTES):
+        self.workers = workers
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.compress_min_bytes = compress_min_bytes
+        self._lock = Lock()
+        self._task_ids = itertools.count(1)
+        # task id -> (shared memory block, callback, worker) of the events workers have not finished yet
+        self._pending = {}
+        self._context = None
+        self._workers = []
+        self._results = None
+        self._result_thread = None
+        self._stopping = False
+        self.sent = 0
+        self.failed = 0
+        self.respawned = 0
+
+    @property
+    def task_timeout(self):
+        """Longest time a worker should take to send an event, including its retries and starting up."""
+        return self.retries * self.timeout + sum(self.backoff * (2 ** i) for i in range(self.retries - 1)) + \
+            TASK_GRACE_SECS
+
+    def start(self):
+        self._context = multiprocessing.get_context("spawn")
+        self._results = self._context.Queue()
+        self._workers = [self._start_worker() for _ in range(self.workers)]
+        self._result_thread = Thread(target=self._collect_results, name="tracepointdebug-event-results", daemon=True)
+        self._result_thread.start()
+        atexit.register(self.stop)
+
+    def _start_worker(self):
+        tasks = self._context.Queue()
+        process = self._context.Process(target=_worker_main, name="tracepointdebug-event-worker", daemon=True,
+                                        args=(tasks, self._results, self.base_url, self.timeout, self.retries,
+                                              self.backoff, self.compress_min_bytes))
+        process.start()
+        return _Worker(process, tasks)
+
+    def submit(self, payload, path, headers=None, callback=None):
+        """
+        Queues payload to be sent to path on the event sink. callback, if given, is called once
+        a worker has sent the event or given up on it, or died before doing either.
+        Raises RuntimeError when no worker is left to send it.
+        """
+        from multiprocessing import shared_memory
+        data = pickle.dumps(payload, protocol=pickle.HIGHEST_PROTOCOL)
+        shm = shared_memory.SharedMemory(create=True, size=max(1, len(data)))
+        task_id = next(self._task_ids)
+        worker = None
+        try:
+            shm.buf[:len(data)] = data
+            with self._lock:
+                workers = [w for w in self._workers if w.process.is_alive()]
+                if not workers:
+                    raise RuntimeError("no event process worker is alive")
+                worker = min(workers, key=lambda w: len(w.task_ids))
+                worker.task_ids.add(task_id)
+                self._pending[task_id] = (shm, callback, worker)
+            worker.tasks.put((task_id, shm.name, len(data), path, headers or {}))
+        except Exception:
+            if worker is not None:
+                with self._lock:
+                    self._pending.pop(task_id, None)
+                    worker.task_ids.discard(task_id)
+            self._release(shm)
+            raise
+
+    def pending(self):
+        with self._lock:
+            return len(self._pending)
+
+    def alive(self):
+        """Number of worker processes alive."""
+        with self._lock:
+            return sum(1 for worker in self._workers if worker.process.is_alive())
+
+    def stop(self, timeout=5.0):
+        if self._results is None:
+            return
+        self._stopping = True
+        for worker in self._workers:
+            worker.tasks.put(None)
+        for worker in self._workers:
+            worker.process.join(timeout)
+        self._results.put(None)
+        self._result_thread.join(timeout)
+        with self._lock:
+            pending, self._pending = list(self._pending.values()), {}
+        for shm, callback, _ in pending:
+            self._release(shm)
+            if callback:
+                callback()
+        self._workers = []
+        self._results = None
+
+    def _collect_results(self):
+        checked = time.time()
+        while True:
+            try:
+                result = self._results.get(timeout=LIVENESS_CHECK_SECS)
+            except queue.Empty:
+                result = False
+            if result is None:
+                return
+            if result:
+                self._finish(*result)
+            if time.time() - checked >= LIVENESS_CHECK_SECS and not self._stopping:
+                checked = time.time()
+                self._replace_dead_workers()
+
+    def _finish(self, task_id, ok):
+        with self._lock:
+            shm, callback, worker = self._pending.pop(task_id, (None, None, None))
+            if worker is not None:
+                worker.task_ids.discard(task_id)
+            if ok:
+                self.sent += 1
+            else:
+                self.failed += 1
+        if shm is not None:
+            self._release(shm)
+        if callback:
+            try:
+                callback()
+            except Exception as e:
+                logger.error("Error in event callback: %s", e)
+
+    def _replace_dead_workers(self):
+        with self._lock:
+            dead = [worker for worker in self._workers if not worker.process.is_alive()]
+        for worker in dead:
+            # Results the worker put before dying are still read, only what is left is lost
+            self._drain_results()
+            with self._lock:
+                lost = list(worker.task_ids)
+            logger.error("Event process worker %s exited with code %s, failing %d events",
+                         worker.process.pid, worker.process.exitcode, len(lost))
+            for task_id in lost:
+                self._finish(task_id, False)
+            worker.tasks.cancel_join_thread()
+            worker.tasks.close()
+            replacement = None
+            if self.respawned < MAX_RESPAWNS_PER_WORKER * self.workers:
+                try:
+                    replacement = self._start_worker()
+                except Exception as e:
+                    logger.error("Error replacing event process worker: %s", e)
+            with self._lock:
+                if replacement is not None:
+                    self._workers[self._workers.index(worker)] = replacement
+                    self.respawned += 1
+                else:
+                    self._workers.remove(worker)
+
+    def _drain_results(self):
+        while True:
+            try:
+                result = self._results.get_nowait()
+            except queue.Empty:
+                return
+            if result is None:
+                # stop() is waiting for this thread, leave its marker for the main loop
+                self._results.put(None)
+                return
+            self._finish(*result)
+
+    @staticmethod
+    def _release(shm):
+        try:
+            shm.close()
+            shm.unlink()
+        except Exception as e:
+            logger.debug("Error releasing shared memory %s: %s", shm.name, e)
@@ -0,0 +1,250 @@
+"""
+Bounded queue of events waiting to be sent to the event sink.
+
+Events wait in one of two lanes. Snapshots and log messages (events with ``BULK``
+set) go to the bulk lane, every other event, like failures, rate limits and the
+application status, to the priority lane. Senders always take from the priority lane
+first, so control events are never stuck behind bulk snapshots.
+
+The bulk lane is bounded by event count and by bytes, events taken by a sender no
+longer count. When a new bulk event doesn't fit, the overflow policy decides:
+
+- ``drop_newest``: the new event is dropped
+- ``drop_oldest``: the oldest queued events are dropped to make room for it
+- ``sample``: one in ``sample_every`` events that don't fit replaces the oldest ones,
+  the others are dropped
+
+The priority lane only holds small events and is bounded by count, dropping its
+oldest. Dropped events get their callback called, as sent events do, and are counted
+by ``get_stats``.
+
+Events whose send failed wait in the queue for their retry, still counting against
+the bounds, instead of blocking a sender thread during the backoff.
+"""
+
+import heapq
+import itertools
+import logging
+import time
+from collections import deque
+from threading import Condition, Lock
+
+logger = logging.getLogger(__name__)
+
+DROP_NEWEST = "drop_newest"
+DROP_OLDEST = "drop_oldest"
+SAMPLE = "sample"
+OVERFLOW_POLICIES = (DROP_NEWEST, DROP_OLDEST, SAMPLE)
+
+MAX_PRIORITY_EVENTS = 1000
+
+
+class QueuedEvent(object):
+    __slots__ = ('event', 'callback', 'size', 'priority', 'attempts')
+
+    def __init__(self, event, callback, size, priority):
+        self.event = event
+        self.callback = callback
+        self.size = size
+        self.priority = priority
+        # Failed sends so far
+        self.attempts = 0
+
+
+class EventQueue(object):
+
+    def __init__(self, max_events=10000, max_bytes=64 * 1024 * 1024, overflow=DROP_NEWEST, sample_every=10,
+                 max_priority_events=MAX_PRIORITY_EVENTS):
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError("Unknown overflow policy %s, expected one of %s" % (overflow, ", ".join(OVERFLOW_POLICIES)))
+        self.max_events = max(1, max_events)
+        self.max_bytes = max_bytes
+        self.overflow = overflow
+        self.sample_every = max(1, sample_every)
+        self.max_priority_events = max(1, max_priority_events)
+        self._condition = Condition(Lock())
+        self._priority = deque()
+        self._bulk = deque()
+        # (due, sequence, QueuedEvent) of events waiting for their retry
+        self._retries = []
+        self._sequence = itertools.count()
+        # Bulk events in the bulk lane or waiting for their retry
+        self._bulk_count = 0
+        self._bulk_bytes = 0
+        # Events put and not finished yet, see task_done
+        self._unfinished = 0
+        self._wakeups = 0
+        self._overflowed = 0
+        self._closed = False
+        # Called after each event put, outside the lock, by consumers that don't block in take()
+        self.on_put = None
+        self.dropped_newest = 0
+        self.dropped_oldest = 0
+        self.dropped_sampled = 0
+        self.dropped_priority = 0
+        self.retried = 0
+
+    def put(self, event, callback=None, size=0, priority=False):
+        """Queues event, returns False when it was dropped. Dropped events get their callback called."""
+        queued = QueuedEvent(event, callback, size, priority)
+        dropped = []
+        with self._condition:
+            if self._closed:
+                dropped.append(queued)
+                admitted = False
+            elif priority:
+                if len(self._priority) >= self.max_priority_events:
+                    dropped.append(self._priority.popleft())
+                    self._unfinished -= 1
+                    self.dropped_priority += 1
+                self._priority.append(queued)
+                admitted = True
+            else:
+                admitted = self._admit(queued, dropped)
+            if admitted:
+                self._unfinished += 1
+                self._condition.notify_all()
+        self._drop(dropped)
+        if admitted and self.on_put is not None:
+            self.on_put()
+        return admitted
+
+    def take(self, max_events=1, timeout=None):
+        """
+        Waits for events and returns up to max_events of them, priority events first. Returns an
+        empty list on timeout, on wake() and once the queue is closed and empty. The caller must
+        call task_done() or retry() for each event it took.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._condition:
+            wakeups = self._wakeups
+            while True:
+                now = time.monotonic()
+                self._requeue_due(now)
+                if self._priority or self._bulk or self._closed and not self._retries or self._wakeups != wakeups:
+                    break
+                wait = None if deadline is None else deadline - now
+                if self._retries:
+                    retry_wait = self._retries[0][0] - now
+                    wait = retry_wait if wait is None else min(wait, retry_wait)
+                if wait is not None and wait <= 0:
+                    break
+                self._condition.wait(wait)
+            taken = []
+            while len(taken) < max_events and self._priority:
+                taken.append(self._priority.popleft())
+            while len(taken) < max_events and self._bulk:
+                queued = self._bulk.popleft()
+                self._bulk_count -= 1
+                self._bulk_bytes -= queued.size
+                taken.append(queued)
+            return taken
+
+    def retry(self, queued, delay):
+        """Queues an event taken by take() again once delay seconds have passed."""
+        with self._condition:
+            queued.attempts += 1
+            self.retried += 1
+            if not queued.priority:
+                self._bulk_count += 1
+                self._bulk_bytes += queued.size
+            heapq.heappush(self._retries, (time.monotonic() + delay, next(self._sequence), queued))
+            self._condition.notify_all()
+
+    def task_done(self, count=1):
+        """Marks count events taken by take() as sent or given up on."""
+        with self._condition:
+            self._unfinished -= count
+            self._condition.notify_all()
+
+    def join(self, timeout=None):
+        """Waits until every queued event has been sent or given up on, returns False on timeout."""
+        with self._condition:
+            return self._condition.wait_for(lambda: self._unfinished <= 0, timeout)
+
+    def wake(self):
+        """Makes every waiting take() return, even without events."""
+        with self._condition:
+            self._wakeups += 1
+            self._condition.notify_all()
+
+    def close(self):
+        """Stops accepting events, take() returns the queued ones and then empty lists."""
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+
+    @property
+    def closed(self):
+        return self._closed
+
+    def __len__(self):
+        with self._condition:
+            return len(self._priority) + len(self._bulk) + len(self._retries)
+
+    def get_stats(self):
+        with self._condition:
+            return {
+                "events": self._bulk_count,
+                "bytes": self._bulk_bytes,
+                "priorityEvents": len(self._priority),
+                "retrying": len(self._retries),
+                "unfinished": self._unfinished,
+                "maxEvents": self.max_events,
+                "maxBytes": self.max_bytes,
+                "overflow": self.overflow,
+                "droppedNewest": self.dropped_newest,
+                "droppedOldest": self.dropped_oldest,
+                "droppedSampled": self.dropped_sampled,
+                "droppedPriority": self.dropped_priority,
+                "retried": self.retried
+            }
+
+    def _fits(self, size):
+        # An event larger than max_bytes still gets in on its own, or it could never be sent
+        return self._bulk_count < self.max_events and self._bulk_bytes + size <= self.max_bytes \
+            or self._bulk_count == 0
+
+    def _admit(self, queued, dropped):
+        if not self._fits(queued.size):
+            if self.overflow == DROP_NEWEST:
+                self.dropped_newest += 1
+                dropped.append(queued)
+                return False
+            if self.overflow == SAMPLE:
+                self._overflowed += 1
+                if self._overflowed % self.sample_every:
+                    self.dropped_sampled += 1
+                    dropped.append(queued)
+                    return False
+            while self._bulk and not self._fits(queued.size):
+                oldest = self._bulk.popleft()
+                self._bulk_count -= 1
+                self._bulk_bytes -= oldest.size
+                self._unfinished -= 1
+                self.dropped_oldest += 1
+                dropped.append(oldest)
+            if not self._fits(queued.size):
+                # The rest are events waiting for their retry
+                self.dropped_newest += 1
+                dropped.append(queued)
+                return False
+        self._bulk.append(queued)
+        self._bulk_count += 1
+        self._bulk_bytes += queued.size
+        return True
+
+    def _requeue_due(self, now):
+        while self._retries and self._retries[0][0] <= now:
+            queued = heapq.heappop(self._retries)[2]
+            # Retried events are older than anything queued since, so they go first
+            (self._priority if queued.priority else self._bulk).appendleft(queued)
+
+    @staticmethod
+    def _drop(dropped):
+        for queued in dropped:
+            if queued.callback:
+                try:
+                    queued.callback()
+                except Exception as e:
+                    logger.error("Error in event callback: %s", e)
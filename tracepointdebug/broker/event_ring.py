@@ -0,0 +1,243 @@
+"""
+Event transport through a shared memory ring buffer, for a collector on the same host.
+
+The collector creates the ring, a file mapped into memory by both processes; on
+``/dev/shm`` it never touches a disk. With ``EVENT_SINK_URL=ring:///dev/shm/<name>`` the
+agent maps it too and copies each encoded event into it once, the collector reads the
+events in place. There is no system call per event, only the collector's wakeups.
+scripts/event_sink.py --ring is the reference collector.
+
+Layout, all integers little-endian::
+
+    0    magic "DBGRING1", capacity u64
+    64   write position u64, dropped events u64, dropped bytes u64   (agent)
+    128  read position u64, waiting u32, heartbeat u64              (collector)
+    256  capacity bytes of records
+
+Positions count bytes written and read since the ring was created; a record starts at
+``position % capacity``. A record is a u32 length and the event, padded to 8 bytes. A
+record that doesn't fit before the end of the ring is written at its start, after a
+WRAP length marking the rest of the ring as skipped.
+
+The ring has a single producer: the agent writes from one thread at a time and never
+waits for the collector. An event that doesn't fit in the free space is dropped and
+counted. The collector sets ``waiting`` before it sleeps; the agent then writes a byte
+to the FIFO ``<ring>.wakeup`` to wake it. As that handshake can race, the collector
+also wakes up on its own every few milliseconds. It updates ``heartbeat`` while it runs,
+which is how the agent tells a live collector from a ring left behind: writes to a ring
+left behind raise OSError, so the circuit breaker opens and events are spooled.
+"""
+
+import mmap
+import os
+import struct
+import time
+from threading import Lock
+
+MAGIC = b"DBGRING1"
+HEADER_BYTES = 256
+WRAP = 0xFFFFFFFF
+RING_SCHEME = "ring://"
+
+# Collector heartbeats older than this mean it is gone
+STALE_HEARTBEAT_SECS = 5.0
+# How often writes check that the ring file is still the one mapped, a restarted collector creates a new one
+RING_FILE_CHECK_SECS = 1.0
+
+_U32 = struct.Struct("<I")
+_U64 = struct.Struct("<Q")
+_CAPACITY = 8
+_WRITE_POS = 64
+_DROPPED_EVENTS = 72
+_DROPPED_BYTES = 80
+_READ_POS = 128
+_WAITING = 136
+_HEARTBEAT = 144
+
+
+def is_ring_url(url):
+    return url.startswith(RING_SCHEME)
+
+
+def ring_path(url):
+    return url[len(RING_SCHEME):]
+
+
+def _record_size(length):
+    return (_U32.size + length + 7) & ~7
+
+
+class EventRing(object):
+
+    def __init__(self, path, mapping, file):
+        self.path = path
+        self._map = mapping
+        self._file = file
+        self.capacity = _U64.unpack_from(mapping, _CAPACITY)[0]
+        self._data = memoryview(mapping)[HEADER_BYTES:]
+        self._wakeup_fd = None
+
+    @classmethod
+    def attach(cls, path):
+        """Maps the ring a collector created at path. Raises OSError or ValueError when there is none."""
+        f = open(path, "r+b")
+        try:
+            mapping = mmap.mmap(f.fileno(), 0)
+        except (OSError, ValueError):
+            f.close()
+            raise
+        if len(mapping) < HEADER_BYTES or mapping[:len(MAGIC)] != MAGIC \
+                or len(mapping) < HEADER_BYTES + _U64.unpack_from(mapping, _CAPACITY)[0]:
+            mapping.close()
+            f.close()
+            raise ValueError("%s is not an event ring" % path)
+        return cls(path, mapping, f)
+
+    @property
+    def inode(self):
+        return os.fstat(self._file.fileno()).st_ino
+
+    def write(self, records):
+        """
+        Appends records, each an encoded event, and wakes the collector. Never waits for room:
+        returns how many records were written, the others were dropped.
+        """
+        write_pos = _U64.unpack_from(self._map, _WRITE_POS)[0]
+        read_pos = _U64.unpack_from(self._map, _READ_POS)[0]
+        written = 0
+        dropped_bytes = 0
+        for record in records:
+            size = _record_size(len(record))
+            offset = write_pos % self.capacity
+            skip = self.capacity - offset if offset + size > self.capacity else 0
+            if write_pos + skip + size - read_pos > self.capacity:
+                dropped_bytes += len(record)
+                continue
+            if skip:
+                _U32.pack_into(self._data, offset, WRAP)
+                write_pos += skip
+                offset = 0
+            _U32.pack_into(self._data, offset, len(record))
+            self._data[offset + _U32.size:offset + _U32.size + len(record)] = record
+            write_pos += size
+            written += 1
+        # Published after the records, the collector reads up to here
+        _U64.pack_into(self._map, _WRITE_POS, write_pos)
+        if written < len(records):
+            self._add(_DROPPED_EVENTS, len(records) - written)
+            self._add(_DROPPED_BYTES, dropped_bytes)
+        if written and _U32.unpack_from(self._map, _WAITING)[0]:
+            self._wake()
+        return written
+
+    def heartbeat_age(self):
+        return (time.time_ns() - _U64.unpack_from(self._map, _HEARTBEAT)[0]) / 1e9
+
+    def get_stats(self):
+        write_pos = _U64.unpack_from(self._map, _WRITE_POS)[0]
+        return {
+            "path": self.path,
+            "capacity": self.capacity,
+            "used": write_pos - _U64.unpack_from(self._map, _READ_POS)[0],
+            "written": write_pos,
+            "droppedEvents": _U64.unpack_from(self._map, _DROPPED_EVENTS)[0],
+            "droppedBytes": _U64.unpack_from(self._map, _DROPPED_BYTES)[0]
+        }
+
+    def close(self):
+        if self._wakeup_fd is not None:
+            os.close(self._wakeup_fd)
+            self._wakeup_fd = None
+        self._data.release()
+        self._map.close()
+        self._file.close()
+
+    def _add(self, offset, count):
+        _U64.pack_into(self._map, offset, _U64.unpack_from(self._map, offset)[0] + count)
+
+    def _wake(self):
+        try:
+            if self._wakeup_fd is None:
+                self._wakeup_fd = os.open(self.path + ".wakeup", os.O_WRONLY | os.O_NONBLOCK)
+            os.write(self._wakeup_fd, b"\0")
+        except BlockingIOError:
+            # Full of wakeups the collector hasn't read yet
+            pass
+        except OSError:
+            # No collector has the FIFO open, it finds the records when it polls
+            if self._wakeup_fd is not None:
+                os.close(self._wakeup_fd)
+                self._wakeup_fd = None
+
+
+class EventRingTransport(object):
+    """Agent side of an EventRing, with the interface of UnixSocketTransport."""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = Lock()
+        self._ring = None
+        self._file_checked = 0.0
+        self.attaches = 0
+        self.written = 0
+        self.dropped = 0
+
+    def send_batch(self, lines):
+        """
+        Writes lines, events encoded as JSON documents, into the ring. Events that don't fit are
+        dropped and counted, not waited for. Raises OSError or ValueError when there is no ring,
+        or no collector reads it any more, so that the events are spooled instead.
+        """
+        with self._lock:
+            self._live_ring()
+            written = self._ring.write(lines)
+            self.written += written
+            self.dropped += len(lines) - written
+        return {"status": "accepted", "accepted": written, "dropped": len(lines) - written, "rejected": []}
+
+    def check_health(self):
+        """A health document while a collector reads the ring, None when there is none."""
+        with self._lock:
+            try:
+                self._live_ring(check_file=True)
+            except (OSError, ValueError):
+                return None
+            return {"status": "healthy", "batch": {"supported": True}}
+
+    def close(self):
+        with self._lock:
+            if self._ring is not None:
+                self._ring.close()
+                self._ring = None
+
+    def get_stats(self):
+        stats = {"path": self.path, "attaches": self.attaches, "written": self.written, "dropped": self.dropped}
+        ring = self._ring
+        if ring is not None:
+            stats.update(capacity=ring.capacity, used=ring.get_stats()["used"])
+        return stats
+
+    def _live_ring(self, check_file=False):
+        """
+        Attaches the ring when needed, or again when a restarted collector has created a new one.
+        Raises OSError when its collector has stopped beating.
+        """
+        if self._ring is None:
+            self._attach()
+        stale = self._ring.heartbeat_age() > STALE_HEARTBEAT_SECS
+        now = time.monotonic()
+        if stale or check_file or now - self._file_checked >= RING_FILE_CHECK_SECS:
+            self._file_checked = now
+            if os.stat(self.path).st_ino != self._ring.inode:
+                self._attach()
+                stale = self._ring.heartbeat_age() > STALE_HEARTBEAT_SECS
+        if stale:
+            raise OSError("no collector has read the event ring %s for %.0f seconds" %
+                          (self.path, self._ring.heartbeat_age()))
+
+    def _attach(self):
+        ring = EventRing.attach(self.path)
+        if self._ring is not None:
+            self._ring.close()
+        self._ring = ring
+        self.attaches += 1
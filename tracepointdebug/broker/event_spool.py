@@ -0,0 +1,246 @@
+"""
+Append only spool of events on local disk, for while the event sink is unreachable.
+
+Events are appended, one encoded JSON document per line, to segment files named
+``<sequence>.ndjson`` in the spool directory, which is only created when the first
+event is spooled. The directory and its segments are private to the agent's user: a
+directory that already exists is only used when it belongs to that user and others
+have no access to it. Writes go through the OS page cache; the segment being written is
+fsynced on the first append ``fsync_interval`` seconds after the last fsync and when
+it is closed, so a crash of the process loses nothing and a crash of the machine at
+most the last interval. A new segment is started once the current one holds
+``segment_bytes``, and when the spool grows past ``max_bytes`` its oldest segments
+are deleted.
+
+replay() sends the spooled events oldest first at a limited rate and deletes each
+segment once all of its events were sent. Spooled events are sent at least once: a
+segment whose replay was cut short by a crash is sent again from its start.
+adopt() moves the segments of a spool left by a process that is gone into this one.
+"""
+
+import logging
+import os
+import stat
+import time
+from collections import deque
+from threading import Lock
+
+logger = logging.getLogger(__name__)
+
+SEGMENT_SUFFIX = ".ndjson"
+
+_SEGMENT_FLAGS = os.O_WRONLY | os.O_APPEND | os.O_CREAT | getattr(os, "O_NOFOLLOW", 0)
+
+
+def make_private_directory(directory):
+    """
+    Creates directory with access for the current user only. Raises OSError when it already
+    exists and is not a directory of this user, or others have access to it.
+    """
+    try:
+        os.makedirs(directory, mode=0o700)
+    except FileExistsError:
+        pass
+    check_private_directory(directory)
+
+
+def check_private_directory(directory):
+    st = os.lstat(directory)
+    if not stat.S_ISDIR(st.st_mode) or st.st_uid != os.geteuid() or st.st_mode & 0o077:
+        raise OSError("%s is not a directory accessible to this user only" % directory)
+
+
+class _Segment(object):
+    __slots__ = ('sequence', 'path', 'size', 'offset')
+
+    def __init__(self, sequence, path, size):
+        self.sequence = sequence
+        self.path = path
+        self.size = size
+        # Bytes of the segment already replayed
+        self.offset = 0
+
+
+class EventSpool(object):
+
+    def __init__(self, directory, max_bytes=256 * 1024 * 1024, segment_bytes=8 * 1024 * 1024, fsync_interval=1.0):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.segment_bytes = segment_bytes
+        self.fsync_interval = fsync_interval
+        self._lock = Lock()
+        self._segments = deque()
+        # File of the last segment while events are appended to it
+        self._file = None
+        self._last_fsync = time.monotonic()
+        self._bytes = 0
+        self.spooled = 0
+        self.replayed = 0
+        self.dropped_segments = 0
+        self.dropped_bytes = 0
+        self._load()
+
+    def append(self, line):
+        """Spools line, an event encoded as a JSON document without newlines."""
+        record = line + b"\n"
+        with self._lock:
+            if self._file is None or self._segments[-1].size >= self.segment_bytes:
+                self._roll()
+            self._file.write(record)
+            self._segments[-1].size += len(record)
+            self._bytes += len(record)
+            self.spooled += 1
+            if time.monotonic() - self._last_fsync >= self.fsync_interval:
+                self._fsync()
+            self._trim()
+
+    def replay(self, send, rate=None, stopped=None):
+        """
+        Calls send(line) for each spooled event, oldest first and at most rate times a second.
+        Stops at the first event send returns False for, or once stopped is set, and returns
+        whether the spool was emptied.
+        """
+        interval = 1.0 / rate if rate else 0
+        next_send = time.monotonic()
+        while True:
+            with self._lock:
+                if not self._segments:
+                    return True
+                segment = self._segments[0]
+                if self._file is not None and segment is self._segments[-1]:
+                    # Appends go on in a new segment while this one is replayed
+                    self._close_file()
+            try:
+                with open(segment.path, "rb") as f:
+                    f.seek(segment.offset)
+                    for line in f:
+                        if stopped is not None and stopped.is_set():
+                            return False
+                        if interval:
+                            delay = next_send - time.monotonic()
+                            if delay > 0:
+                                time.sleep(delay)
+                            next_send = max(next_send, time.monotonic()) + interval
+                        if line.strip() and not send(line.rstrip(b"\n")):
+                            return False
+                        segment.offset += len(line)
+                        self.replayed += 1
+            except FileNotFoundError:
+                # Deleted by _trim while it was replayed
+                pass
+            with self._lock:
+                if self._segments and self._segments[0] is segment:
+                    self._segments.popleft()
+                    self._bytes -= segment.size
+                    self._remove(segment)
+
+    def adopt(self, directory):
+        """
+        Moves the segments of the spool in directory, left by a process that is gone, after the
+        segments of this one so they are replayed too, and removes directory.
+        """
+        check_private_directory(directory)
+        with self._lock:
+            self._close_file()
+            make_private_directory(self.directory)
+            for _, name in _segment_names(directory):
+                sequence = self._segments[-1].sequence + 1 if self._segments else 0
+                path = os.path.join(self.directory, "%012d%s" % (sequence, SEGMENT_SUFFIX))
+                try:
+                    os.rename(os.path.join(directory, name), path)
+                except FileNotFoundError:
+                    # Adopted by another process
+                    continue
+                segment = _Segment(sequence, path, os.path.getsize(path))
+                self._segments.append(segment)
+                self._bytes += segment.size
+            try:
+                os.rmdir(directory)
+            except OSError:
+                pass
+
+    def close(self):
+        with self._lock:
+            self._close_file()
+            if not self._segments:
+                try:
+                    os.rmdir(self.directory)
+                except OSError:
+                    pass
+
+    def __len__(self):
+        """Bytes of spooled events not replayed yet."""
+        with self._lock:
+            return self._bytes - (self._segments[0].offset if self._segments else 0)
+
+    def get_stats(self):
+        with self._lock:
+            return {
+                "directory": self.directory,
+                "segments": len(self._segments),
+                "bytes": self._bytes,
+                "maxBytes": self.max_bytes,
+                "spooled": self.spooled,
+                "replayed": self.replayed,
+                "droppedSegments": self.dropped_segments,
+                "droppedBytes": self.dropped_bytes
+            }
+
+    def _load(self):
+        """Picks up the segments a previous process left, so they are replayed too."""
+        if not os.path.lexists(self.directory):
+            return
+        check_private_directory(self.directory)
+        for sequence, name in _segment_names(self.directory):
+            path = os.path.join(self.directory, name)
+            self._segments.append(_Segment(sequence, path, os.path.getsize(path)))
+        self._bytes = sum(segment.size for segment in self._segments)
+
+    def _roll(self):
+        self._close_file()
+        make_private_directory(self.directory)
+        sequence = self._segments[-1].sequence + 1 if self._segments else 0
+        path = os.path.join(self.directory, "%012d%s" % (sequence, SEGMENT_SUFFIX))
+        self._file = os.fdopen(os.open(path, _SEGMENT_FLAGS, 0o600), "ab")
+        self._segments.append(_Segment(sequence, path, 0))
+
+    def _close_file(self):
+        if self._file is not None:
+            try:
+                self._fsync()
+                self._file.close()
+            except OSError as e:
+                logger.error("Error closing event spool segment: %s", e)
+            self._file = None
+
+    def _fsync(self):
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._last_fsync = time.monotonic()
+
+    def _trim(self):
+        # The segment being written is never dropped
+        while self._bytes > self.max_bytes and len(self._segments) > 1:
+            segment = self._segments.popleft()
+            self._bytes -= segment.size
+            self.dropped_segments += 1
+            self.dropped_bytes += segment.size - segment.offset
+            self._remove(segment)
+            logger.warning("Event spool is over %d bytes, dropped its oldest segment %s", self.max_bytes, segment.path)
+
+    @staticmethod
+    def _remove(segment):
+        try:
+            os.remove(segment.path)
+        except OSError:
+            pass
+
+
+def _segment_names(directory):
+    """(sequence, file name) of the segments in directory, oldest first."""
+    segments = []
+    for name in os.listdir(directory):
+        sequence = name[:-len(SEGMENT_SUFFIX)]
+        if name.endswith(SEGMENT_SUFFIX) and sequence.isdigit():
+            segments.append((int(sequence), name))
+    return sorted(segments)
@@ -0,0 +1,121 @@
+"""
+Optional single asyncio loop for the agent's networking and timers.
+
+By default the agent runs a thread per concern: the broker websocket and its pinger,
+executors sending events and requests, the periodic application status and config
+senders and a timer thread per expiring probe. With ``DEBUGIN_IO_MODE=asyncio`` one
+daemon thread runs an asyncio event loop that owns all of them instead: the broker
+websocket, keep-alive HTTP/1.1 connections to the event sink, the periodic tasks and
+the timers.
+
+schedule_timer() is the timer for code that runs in both modes: a daemon
+``threading.Timer`` in thread mode, a callback on the loop in asyncio mode. Callbacks
+on the loop must not block, they hold up all of the agent's networking meanwhile.
+"""
+
+import asyncio
+import logging
+from threading import Event, Lock, Thread, Timer, get_ident
+
+from tracepointdebug.application import utils
+
+logger = logging.getLogger(__name__)
+
+THREADS = "threads"
+ASYNCIO = "asyncio"
+
+IO_MODE = utils.get_from_environment_variables("DEBUGIN_IO_MODE", THREADS, str)
+
+
+def is_asyncio_mode():
+    return IO_MODE.lower() == ASYNCIO
+
+
+class LoopTimer(object):
+    """Callback scheduled on the IOLoop, cancellable from any thread like a threading.Timer."""
+
+    def __init__(self, io_loop, delay, function, args=()):
+        self.io_loop = io_loop
+        self.function = function
+        self.args = args
+        self._handle = None
+        self._cancelled = False
+        io_loop.call_soon(self._schedule, delay)
+
+    def cancel(self):
+        self._cancelled = True
+        handle = self._handle
+        if handle is not None:
+            self.io_loop.call_soon(handle.cancel)
+
+    def _schedule(self, delay):
+        if not self._cancelled:
+            self._handle = self.io_loop.loop.call_later(delay, self._fire)
+
+    def _fire(self):
+        if self._cancelled:
+            return
+        try:
+            self.function(*self.args)
+        except Exception as e:
+            logger.error("Error in scheduled %s: %s", getattr(self.function, "__name__", self.function), e)
+
+
+class IOLoop(object):
+    __instance = None
+    __instance_lock = Lock()
+
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self._thread = Thread(target=self._run, name="tracepointdebug-io", daemon=True)
+        self._started = Event()
+        self._lock = Lock()
+
+    @staticmethod
+    def instance():
+        if IOLoop.__instance is None:
+            with IOLoop.__instance_lock:
+                if IOLoop.__instance is None:
+                    IOLoop.__instance = IOLoop()
+        return IOLoop.__instance
+
+    def start(self):
+        with self._lock:
+            if not self._thread.is_alive() and not self._started.is_set():
+                self._thread.start()
+        self._started.wait()
+
+    def in_loop(self):
+        return get_ident() == self._thread.ident
+
+    def call_soon(self, function, *args):
+        """Runs function on the loop, callable from any thread."""
+        self.start()
+        self.loop.call_soon_threadsafe(function, *args)
+
+    def call_later(self, delay, function, *args):
+        return LoopTimer(self, delay, function, args)
+
+    def submit(self, coroutine):
+        """Runs coroutine on the loop, returns a concurrent.futures.Future of its result."""
+        self.start()
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop)
+
+    def stop(self):
+        if self._started.is_set():
+            self.loop.call_soon_threadsafe(self.loop.stop)
+
+    def _run(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.call_soon(self._started.set)
+        self.loop.run_forever()
+
+
+def schedule_timer(delay, function, *args):
+    """Calls function(*args) after delay seconds, returns the timer, which has a cancel() method."""
+    if is_asyncio_mode():
+        return IOLoop.instance().call_later(delay, function, *args)
+    timer = Timer(delay, function, args=args)
+    timer.daemon = True
+    timer.start()
+    return timer
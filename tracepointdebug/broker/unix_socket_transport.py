@@ -0,0 +1,133 @@
+"""
+Event transport over a Unix domain socket, for a collector running on the same node.
+
+With ``EVENT_SINK_URL=unix:///path/to/sock`` events skip TCP and HTTP: the agent keeps
+one connection to the socket open and sends each batch of events as one frame, a 4
+byte big-endian length followed by the batch as NDJSON. The collector answers every
+frame with a frame holding a JSON document, ``{"accepted": n, "rejected": [{"index": i,
+"error": "..."}]}`` like ``POST /api/events/batch`` does. An empty frame asks for the
+collector's health, it answers with the document ``GET /health`` returns.
+
+Frames are sent and answered one at a time. A broken connection is reopened on the
+next frame, and a frame that failed on a connection that had been used before is sent
+once more on a new one, as the collector may have restarted in the meantime.
+"""
+
+import json
+import logging
+import socket
+import struct
+from threading import Lock
+
+from tracepointdebug.broker.event_batcher import encode_batch, NDJSON
+
+logger = logging.getLogger(__name__)
+
+UNIX_SCHEME = "unix://"
+MAX_FRAME_BYTES = 64 * 1024 * 1024
+
+_LENGTH = struct.Struct(">I")
+
+
+def is_unix_socket_url(url):
+    return url.startswith(UNIX_SCHEME)
+
+
+def socket_path(url):
+    return url[len(UNIX_SCHEME):]
+
+
+class UnixSocketTransport(object):
+
+    def __init__(self, path, timeout=2.0):
+        self.path = path
+        self.timeout = timeout
+        self._lock = Lock()
+        self._socket = None
+        self.connects = 0
+        self.frames = 0
+        self.bytes_sent = 0
+
+    def send_batch(self, lines):
+        """
+        Sends lines, events encoded as JSON documents without newlines, as one frame and returns the
+        collector's answer. Raises OSError when the collector can't be reached, ValueError when its
+        answer is garbled.
+        """
+        return self._request(encode_batch(lines, NDJSON))
+
+    def check_health(self):
+        """The collector's health document, or None when it can't be reached."""
+        try:
+            return self._request(b"")
+        except (OSError, ValueError):
+            return None
+
+    def close(self):
+        with self._lock:
+            self._close()
+
+    def get_stats(self):
+        return {
+            "path": self.path,
+            "connected": self._socket is not None,
+            "connects": self.connects,
+            "frames": self.frames,
+            "bytesSent": self.bytes_sent
+        }
+
+    def _request(self, body):
+        with self._lock:
+            reused = self._socket is not None
+            try:
+                return self._exchange(body)
+            except OSError:
+                if not reused:
+                    raise
+            return self._exchange(body)
+
+    def _exchange(self, body):
+        if self._socket is None:
+            self._connect()
+        try:
+            self._socket.sendall(_LENGTH.pack(len(body)) + body)
+            self.frames += 1
+            self.bytes_sent += len(body)
+            length = _LENGTH.unpack(self._receive(_LENGTH.size))[0]
+            if length > MAX_FRAME_BYTES:
+                raise ValueError("Answer of %d bytes from %s" % (length, self.path))
+            return json.loads(self._receive(length))
+        except (OSError, ValueError):
+            # The answer to this frame may still come, the next one starts on a new connection
+            self._close()
+            raise
+
+    def _connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        try:
+            sock.connect(self.path)
+        except OSError:
+            sock.close()
+            raise
+        self._socket = sock
+        self.connects += 1
+        if self.connects > 1:
+            logger.info("Reconnected to event collector at %s", self.path)
+
+    def _receive(self, size):
+        data = bytearray()
+        while len(data) < size:
+            chunk = self._socket.recv(size - len(data))
+            if not chunk:
+                raise ConnectionResetError("Event collector at %s closed the connection" % self.path)
+            data += chunk
+        return bytes(data)
+
+    def _close(self):
+        if self._socket is not None:
+            try:
+                self._socket.close()
+            except OSError:
+                pass
+            self._socket = None
@@ -13,7 +13,7 @@ import json
 import os
 import sys
 import threading
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify
 from typing import Dict, Any, Optional
 import uuid
 
@@ -27,6 +27,14 @@ from tracepointdebug.probe.event.tracepoint.trace_point_snapshot_event import Tr
 from tracepointdebug.probe.event.logpoint.log_point_event import LogPointEvent
 from tracepointdebug.probe.event.logpoint.put_logpoint_failed_event import PutLogPointFailedEvent
 from tracepointdebug.probe.event.tracepoint.put_tracepoint_failed_event import PutTracePointFailedEvent
+from tracepointdebug.probe.snapshot.snapshot_memory_budget import SnapshotMemoryBudget
+from tracepointdebug.probe.snapshot.blob_store import SnapshotBlobStore
+from tracepointdebug.probe.breakpoints.logpoint.log_output import LogOutput
+from tracepointdebug.probe.snapshot.drill_down import expand_snapshot_value
+from tracepointdebug.probe.coded_exception import CodedException
+from tracepointdebug.probe.encoder import to_plain
+from tracepointdebug.probe.errors import INVALID_CAPTURE_PROFILE, SNAPSHOT_HANDLE_NOT_FOUND, \
+    SNAPSHOT_OBJECT_COLLECTED, SNAPSHOT_PATH_NOT_FOUND, INVALID_LOGPOINT_COALESCE
 
 import logging
 logger = logging.getLogger(__name__)
@@ -72,6 +80,10 @@ class ControlAPI:
         self.app.add_url_rule('/points/remove', 'remove_point', self.remove_point, methods=['POST'])
         self.app.add_url_rule('/points', 'get_points', self.get_points, methods=['GET'])
         self.app.add_url_rule('/config', 'set_config', self.set_config, methods=['POST'])
+        self.app.add_url_rule('/stats', 'get_stats', self.get_stats, methods=['GET'])
+        self.app.add_url_rule('/blobs/<int:blob_id>', 'get_blob', self.get_blob, methods=['GET'])
+        self.app.add_url_rule('/snapshots/<snapshot_id>/expand', 'expand_snapshot', self.expand_snapshot,
+                              methods=['POST'])
     
     def health(self):
         """Health check endpoint"""
@@ -181,6 +193,8 @@ class ControlAPI:
             expire_duration_ms = data.get('expire_duration_ms', 0)
             tags = data.get('tags', [])
             file_hash = data.get('file_hash', None)
+            deferred_capture = bool(data.get('deferred_capture', False))
+            capture_profile = data.get('capture_profile', None)
             
             # Create a unique ID for this tracepoint
             point_id = self._generate_point_id()
@@ -200,7 +214,9 @@ class ControlAPI:
                     expire_count=expire_hit_count,
                     enable_tracing=True,  # Enable tracing by default
                     condition=condition,
-                    tags=tags
+                    tags=tags,
+                    deferred_capture=deferred_capture,
+                    capture_profile=capture_profile
                 )
             
             # Store the point ID for later management
@@ -218,6 +234,17 @@ class ControlAPI:
                 "created": "now",
                 "condition": data.get('condition')
             }), 201
+        except CodedException as e:
+            if e.code != INVALID_CAPTURE_PROFILE.code:
+                logger.exception("Error creating tracepoint")
+                return jsonify({
+                    "error": f"Failed to create tracepoint: {str(e)}",
+                    "code": "TRACEPOINT_CREATE_ERROR"
+                }), 500
+            return jsonify({
+                "error": str(e),
+                "code": "INVALID_CAPTURE_PROFILE"
+            }), 400
         except Exception as e:
             logger.exception("Error creating tracepoint")
             return jsonify({
@@ -249,6 +276,7 @@ class ControlAPI:
             expire_hit_count = data.get('expire_hit_count', 0)
             expire_duration_ms = data.get('expire_duration_ms', 0)
             tags = data.get('tags', [])
+            coalesce = data.get('coalesce', None)
             
             # Create a unique ID for this logpoint
             point_id = self._generate_point_id()
@@ -271,7 +299,8 @@ class ControlAPI:
                     condition=condition,
                     log_level=level,
                     stdout_enabled=stdout_enabled,
-                    tags=tags
+                    tags=tags,
+                    coalesce=coalesce
                 )
             
             # Store the point ID for later management
@@ -284,12 +313,23 @@ class ControlAPI:
                 "ok": True,
                 "id": point_id
             })
+        except CodedException as e:
+            if e.code != INVALID_LOGPOINT_COALESCE.code:
+                return jsonify({
+                    "ok": False,
+                    "error": f"Exception occurred: {str(e)}"
+                }), 500
+            return jsonify({
+                "ok": False,
+                "error": str(e),
+                "code": "INVALID_COALESCE"
+            }), 400
         except Exception as e:
             return jsonify({
                 "ok": False,
                 "error": f"Exception occurred: {str(e)}"
             }), 500
-    
+
     def enable_tags(self):
         """Handle POST /tags/enable"""
         try:
@@ -569,6 +609,87 @@ class ControlAPI:
                 "error": f"Exception occurred: {str(e)}"
             }), 500
     
+    def get_stats(self):
+        """Handle GET /stats"""
+        try:
+            return jsonify({
+                "ok": True,
+                "snapshotMemory": SnapshotMemoryBudget.instance().get_stats(),
+                "tracePoints": self.tracepoint_manager.get_stats() if self.tracepoint_manager else {},
+                "snapshotBlobs": SnapshotBlobStore.instance().get_stats(),
+                "logpointOutput": LogOutput.instance().get_stats(),
+                "events": self.broker_manager.get_stats() if self.broker_manager else {}
+            })
+        except Exception as e:
+            return jsonify({
+                "ok": False,
+                "error": f"Exception occurred: {str(e)}"
+            }), 500
+
+    def get_blob(self, blob_id):
+        """Handle GET /blobs/<blob_id>"""
+        store = SnapshotBlobStore.instance()
+        data = store.get(blob_id)
+        if data is None:
+            return jsonify({
+                "ok": False,
+                "error": f"Blob {blob_id} not found, it may have been evicted",
+                "code": "BLOB_NOT_FOUND"
+            }), 404
+        return Response(store.iter_chunks(data), mimetype="application/json",
+                        headers={"Content-Length": str(len(data))})
+
+    def expand_snapshot(self, snapshot_id):
+        """Handle POST /snapshots/<snapshot_id>/expand"""
+        data = request.get_json(force=True, silent=True)
+        if data is None:
+            return jsonify({
+                "error": "Invalid JSON",
+                "code": "INVALID_JSON"
+            }), 400
+        handle = data.get('handle')
+        path = data.get('path', [])
+        depth = data.get('depth')
+        if not isinstance(handle, int) or isinstance(handle, bool):
+            return jsonify({
+                "error": "Missing or invalid field: handle",
+                "code": "MISSING_FIELD"
+            }), 400
+        if not isinstance(path, list) or (depth is not None and not isinstance(depth, int)):
+            return jsonify({
+                "error": "path must be a list of keys and depth an integer",
+                "code": "INVALID_FIELD"
+            }), 400
+        try:
+            value = expand_snapshot_value(snapshot_id, handle, path, depth)
+            return jsonify({
+                "ok": True,
+                "snapshotId": snapshot_id,
+                "handle": handle,
+                "path": path,
+                "value": to_plain(value)
+            })
+        except CodedException as e:
+            # The object being gone is reported as such, not as a missing handle
+            statuses = {
+                SNAPSHOT_HANDLE_NOT_FOUND.code: ("HANDLE_NOT_FOUND", 404),
+                SNAPSHOT_OBJECT_COLLECTED.code: ("OBJECT_COLLECTED", 410),
+                SNAPSHOT_PATH_NOT_FOUND.code: ("PATH_NOT_FOUND", 404),
+            }
+            code, status = statuses.get(e.code, ("EXPAND_ERROR", 500))
+            return jsonify({
+                "ok": False,
+                "error": str(e),
+                "code": code
+            }), status
+        except Exception as e:
+            logger.exception("Error expanding snapshot")
+            return jsonify({
+                "ok": False,
+                "error": f"Exception occurred: {str(e)}",
+                "code": "EXPAND_ERROR"
+            }), 500
+
     def start(self):
         """Start the control API server in a separate thread"""
         if self.running:
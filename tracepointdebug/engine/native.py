@@ -24,7 +24,7 @@ def stop():
         from .pytrace import stop as pytrace_stop
         pytrace_stop()
 
-def set_logpoint(lp_id, file, line, fn):
+def set_logpoint(lp_id, file, line, fn, capture_limits=None):
     # Use the native C++ implementation for setting breakpoints when available
     try:
         import tracepointdebug.cdbg_native as cdbg_native
@@ -36,12 +36,12 @@ def set_logpoint(lp_id, file, line, fn):
     except ImportError:
         # Fallback to pytrace if native module is not available
         from .pytrace import set_logpoint as _py_set
-        return _py_set(lp_id, file, line, fn)
+        return _py_set(lp_id, file, line, fn, capture_limits)
     except Exception as e:
         # Fallback to pytrace if native fails
         print(f"Warning: Native breakpoint failed, falling back: {e}", file=sys.stderr)
         from .pytrace import set_logpoint as _py_set
-        return _py_set(lp_id, file, line, fn)
+        return _py_set(lp_id, file, line, fn, capture_limits)
 
 def remove_logpoint(lp_id):
     # Use the native C++ implementation for removing breakpoints when available
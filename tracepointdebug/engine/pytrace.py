@@ -1,20 +1,44 @@
-import sys, threading, time
+import os, sys, threading, time
+
+from tracepointdebug.probe.capture_context import open_capture_context, close_capture_context
 
 _ACTIVE = False
-_CALLBACKS = {}  # id -> callable
+_CALLBACKS = {}  # id -> (line key, callable, capture limits callable or None)
+_LINE_CALLBACKS = {}  # (abs file, line) -> tuple of callables, replaced on every change
+_LINE_LIMITS = {}  # (abs file, line) -> tuple of capture limits callables of the probes there that capture
+_ABS_PATHS = {}  # co_filename -> abs file
 _LOCK = threading.RLock()
 
 def _trace(frame, event, arg):
     # Fast path: only on 'line' or 'call' as needed
     if not _ACTIVE or event not in ("line", "call"):
         return _trace
-    code = frame.f_code
-    key = (code.co_filename, code.co_firstlineno, frame.f_lineno)
-    with _LOCK:
-        for cb in _CALLBACKS.values():
-            cb(frame, event, arg)  # should implement quotas/redaction
+    if not _LINE_CALLBACKS:
+        return _trace
+    filename = frame.f_code.co_filename
+    path = _ABS_PATHS.get(filename)
+    if path is None:
+        path = _ABS_PATHS[filename] = os.path.abspath(filename)
+    key = (path, frame.f_lineno)
+    callbacks = _LINE_CALLBACKS.get(key)
+    if callbacks:
+        # One capture context per hit, shared by every probe on the line
+        shared = len(callbacks) > 1
+        open_capture_context(frame, shared=shared, limits=_line_limits(key) if shared else None)
+        try:
+            for cb in callbacks:
+                cb(event, frame)  # should implement quotas/redaction
+        finally:
+            close_capture_context()
     return _trace
 
+def _line_limits(key):
+    """The deepest parse depth and largest size the probes on the line ask for, None when none captures."""
+    requested = [limits() for limits in _LINE_LIMITS.get(key, ())]
+    if not requested:
+        return None
+    return max(depth for depth, _ in requested), max(size for _, size in requested)
+
 def start():
     global _ACTIVE
     if _ACTIVE: return
@@ -26,10 +50,36 @@ def stop():
     _ACTIVE = False
     sys.settrace(None)
 
-def set_logpoint(lp_id, file, line, fn):
+def _line_key(file, line):
+    return os.path.abspath(file), line
+
+def set_logpoint(lp_id, file, line, fn, capture_limits=None):
+    """
+    Calls fn(event, frame) on every hit of line. capture_limits, for probes that capture snapshots,
+    returns the (parse depth, max size) a capture of the probe asks for, read on every hit of a line
+    with several probes so that the frame is walked once for all of them.
+    """
     with _LOCK:
-        _CALLBACKS[lp_id] = fn
+        remove_logpoint(lp_id)
+        key = _line_key(file, line)
+        _CALLBACKS[lp_id] = (key, fn, capture_limits)
+        _LINE_CALLBACKS[key] = _LINE_CALLBACKS.get(key, ()) + (fn,)
+        if capture_limits is not None:
+            _LINE_LIMITS[key] = _LINE_LIMITS.get(key, ()) + (capture_limits,)
 
 def remove_logpoint(lp_id):
     with _LOCK:
-        _CALLBACKS.pop(lp_id, None)
\ No newline at end of file
+        entry = _CALLBACKS.pop(lp_id, None)
+        if entry is None:
+            return
+        key, fn, capture_limits = entry
+        callbacks = tuple(cb for cb in _LINE_CALLBACKS.get(key, ()) if cb is not fn)
+        if callbacks:
+            _LINE_CALLBACKS[key] = callbacks
+        else:
+            _LINE_CALLBACKS.pop(key, None)
+        limits = tuple(cl for cl in _LINE_LIMITS.get(key, ()) if cl is not capture_limits)
+        if limits:
+            _LINE_LIMITS[key] = limits
+        else:
+            _LINE_LIMITS.pop(key, None)
@@ -0,0 +1,168 @@
+"""
+Coalescing of repeated logpoint messages.
+
+A logpoint with a ``coalesce`` config folds identical messages hit within a time
+window into one LogPointEvent with ``count``, ``firstSeen`` and ``lastSeen``.
+Messages are identical when their rendered text is, or, when the config lists
+``keys``, when the listed variables have the same values; those hits are folded
+before the message is rendered at all.
+
+The first message of a key opens its window. The folded event is published when
+the window closes or when ``maxCount`` messages have been folded into it. Each
+logpoint keeps at most MAX_COALESCE_ENTRIES open windows; messages with a new key
+beyond that are published on their own.
+"""
+
+import logging
+import time
+from threading import Lock
+
+from tracepointdebug.broker.io_loop import schedule_timer
+
+from .log_template import format_timestamp
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_COALESCE_MAX_COUNT = 1000
+MAX_COALESCE_ENTRIES = 256
+
+
+class CoalesceConfig(object):
+
+    def __init__(self, window_ms, max_count=DEFAULT_COALESCE_MAX_COUNT, keys=None):
+        self.window_ms = window_ms
+        self.max_count = max_count
+        self.keys = keys
+
+    @staticmethod
+    def from_json(config):
+        """CoalesceConfig of the ``coalesce`` logpoint field, None when not set. Raises ValueError when invalid."""
+        if not config:
+            return None
+        if not isinstance(config, dict):
+            raise ValueError("coalesce must be an object")
+        unknown = set(config) - {"windowMs", "maxCount", "keys"}
+        if unknown:
+            raise ValueError("unknown coalesce keys: {}".format(", ".join(sorted(unknown))))
+        window_ms = config.get("windowMs")
+        if isinstance(window_ms, bool) or not isinstance(window_ms, (int, float)) or window_ms <= 0:
+            raise ValueError("windowMs must be a positive number")
+        max_count = config.get("maxCount", DEFAULT_COALESCE_MAX_COUNT)
+        if isinstance(max_count, bool) or not isinstance(max_count, int) or max_count < 1:
+            raise ValueError("maxCount must be a positive integer")
+        keys = config.get("keys")
+        if keys is not None:
+            if not isinstance(keys, list) or not keys or not all(isinstance(key, str) and key for key in keys):
+                raise ValueError("keys must be a non empty list of variable names")
+            keys = tuple(keys)
+        return CoalesceConfig(window_ms, max_count, keys)
+
+
+class _Window(object):
+    __slots__ = ('event', 'count', 'first_ns', 'last_ns')
+
+    def __init__(self, event, now_ns):
+        self.event = event
+        self.count = 1
+        self.first_ns = now_ns
+        self.last_ns = now_ns
+
+
+class LogCoalescer(object):
+
+    def __init__(self, config, publish):
+        self.config = config
+        self.window_ns = int(config.window_ms * 1000000)
+        self._publish = publish
+        self._lock = Lock()
+        self._windows = {}
+        self._timer = None
+        self._closed = False
+
+    def values_key(self, variables):
+        """Key of the values of config.keys in variables, for folding hits before rendering their message."""
+        values = tuple(variables.get(key) for key in self.config.keys)
+        try:
+            hash(values)
+            return values
+        except TypeError:
+            return tuple(repr(value) for value in values)
+
+    def fold(self, key):
+        """Folds a hit with key into its open window and returns True, or returns False when there is none."""
+        now_ns = time.time_ns()
+        with self._lock:
+            window = self._windows.get(key)
+            if window is None:
+                return False
+            if now_ns - window.first_ns >= self.window_ns:
+                closed = self._windows.pop(key)
+                folded = False
+            else:
+                window.count += 1
+                window.last_ns = now_ns
+                folded = True
+                closed = self._windows.pop(key) if window.count >= self.config.max_count else None
+        if closed is not None:
+            self._emit(closed)
+        return folded
+
+    def add(self, key, event):
+        """
+        Opens a window for key with event, or folds event into the window already open.
+        Returns False when event should be published right away instead.
+        """
+        if self.fold(key):
+            return True
+        with self._lock:
+            if self._closed or len(self._windows) >= MAX_COALESCE_ENTRIES:
+                return False
+            if key in self._windows:
+                # Opened by another thread since the fold above
+                window = self._windows[key]
+                window.count += 1
+                window.last_ns = time.time_ns()
+                return True
+            if self.config.max_count == 1:
+                return False
+            self._windows[key] = _Window(event, time.time_ns())
+            if self._timer is None:
+                self._schedule(self.window_ns)
+        return True
+
+    def flush(self):
+        """Publishes every open window, e.g. when the logpoint is removed."""
+        with self._lock:
+            self._closed = True
+            windows, self._windows = list(self._windows.values()), {}
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+        for window in windows:
+            self._emit(window)
+
+    def _schedule(self, delay_ns):
+        self._timer = schedule_timer(delay_ns / 1e9, self._close_expired)
+
+    def _close_expired(self):
+        now_ns = time.time_ns()
+        with self._lock:
+            self._timer = None
+            expired = [key for key, window in self._windows.items() if now_ns - window.first_ns >= self.window_ns]
+            windows = [self._windows.pop(key) for key in expired]
+            if self._windows and not self._closed:
+                first_ns = min(window.first_ns for window in self._windows.values())
+                self._schedule(max(0, first_ns + self.window_ns - now_ns))
+        for window in windows:
+            self._emit(window)
+
+    def _emit(self, window):
+        event = window.event
+        event.count = window.count
+        # The folded event is the first message, created when its window opened
+        event.first_seen = event.created_at
+        event.last_seen = event.created_at if window.count == 1 else format_timestamp(window.last_ns)
+        try:
+            self._publish(event)
+        except Exception as e:
+            logger.error("Error publishing coalesced logpoint event: %s", e)
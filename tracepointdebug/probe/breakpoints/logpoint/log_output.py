@@ -0,0 +1,367 @@
+"""
+Output of logpoint messages to local sinks.
+
+Logpoints with ``stdoutEnabled`` hand their messages to the sinks of LogOutput
+instead of printing them on the application thread. Each sink queues messages in a
+bounded in-memory buffer and writes them from its own writer thread, taking all the
+queued messages at once, so a slow pipe or disk never blocks the application.
+
+When a buffer is full, the overflow policy decides whether the oldest queued message
+(``drop_oldest``) or the new one (``drop_newest``) is dropped. Dropped messages are
+counted per sink and reported by ``GET /stats``.
+
+Sinks:
+
+- ``stdout``: the ``<time> [<level>] <message>`` lines logpoints always printed
+- ``file``: NDJSON records in a file rotated by size
+- ``logging``: ``logging.LogRecord``s queued through a ``QueueHandler`` and handled
+  by a logger (``tracepointdebug.logpoint`` by default) on the writer thread
+"""
+
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import sys
+from collections import deque
+from threading import Condition, Lock, Thread
+
+from tracepointdebug.application import utils
+from tracepointdebug.utils.log.logger import format_log_event_message
+
+logger = logging.getLogger(__name__)
+
+DROP_OLDEST = "drop_oldest"
+DROP_NEWEST = "drop_newest"
+OVERFLOW_POLICIES = (DROP_OLDEST, DROP_NEWEST)
+
+LOG_OUTPUT_SINKS = utils.get_from_environment_variables("DEBUGIN_LOGPOINT_SINKS", "stdout", str)
+LOG_OUTPUT_BUFFER_SIZE = utils.get_from_environment_variables("DEBUGIN_LOGPOINT_BUFFER_SIZE", 10000, int)
+LOG_OUTPUT_OVERFLOW = utils.get_from_environment_variables("DEBUGIN_LOGPOINT_OVERFLOW", DROP_OLDEST, str)
+LOG_OUTPUT_FILE = utils.get_from_environment_variables("DEBUGIN_LOGPOINT_FILE", "tracepointdebug-logpoints.ndjson", str)
+LOG_OUTPUT_FILE_MAX_BYTES = utils.get_from_environment_variables("DEBUGIN_LOGPOINT_FILE_MAX_BYTES",
+                                                                 10 * 1024 * 1024, int)
+LOG_OUTPUT_FILE_BACKUPS = utils.get_from_environment_variables("DEBUGIN_LOGPOINT_FILE_BACKUPS", 5, int)
+LOG_OUTPUT_LOGGER = utils.get_from_environment_variables("DEBUGIN_LOGPOINT_LOGGER", "tracepointdebug.logpoint", str)
+
+# Most buffers passed to a single os.writev call, below the IOV_MAX of common platforms
+MAX_WRITE_BUFFERS = 1024
+
+
+class LogOutputBuffer(object):
+    """Bounded queue of messages waiting for a writer thread, dropping by overflow policy when full."""
+
+    def __init__(self, capacity=LOG_OUTPUT_BUFFER_SIZE, overflow=LOG_OUTPUT_OVERFLOW):
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError("Unknown overflow policy %s, expected one of %s" % (overflow, ", ".join(OVERFLOW_POLICIES)))
+        self.capacity = max(1, capacity)
+        self.overflow = overflow
+        self._items = deque()
+        self._condition = Condition(Lock())
+        self._writing = 0
+        self._closed = False
+        self.dropped_oldest = 0
+        self.dropped_newest = 0
+
+    def put(self, item):
+        """Queues item, returns False when it was dropped."""
+        with self._condition:
+            if self._closed:
+                return False
+            if len(self._items) >= self.capacity:
+                if self.overflow == DROP_NEWEST:
+                    self.dropped_newest += 1
+                    return False
+                self._items.popleft()
+                self.dropped_oldest += 1
+            self._items.append(item)
+            self._condition.notify_all()
+            return True
+
+    # Lets the buffer back a logging.handlers.QueueHandler
+    put_nowait = put
+
+    def take_all(self):
+        """
+        Waits for messages and returns all of them, or None once the buffer is closed and empty.
+        The caller must call done() after writing them.
+        """
+        with self._condition:
+            while not self._items and not self._closed:
+                self._condition.wait()
+            if not self._items:
+                return None
+            items = list(self._items)
+            self._items.clear()
+            self._writing = len(items)
+            return items
+
+    def done(self):
+        with self._condition:
+            self._writing = 0
+            self._condition.notify_all()
+
+    def wait_empty(self, timeout=None):
+        """Waits until every queued message has been written, returns False on timeout."""
+        with self._condition:
+            return self._condition.wait_for(lambda: not self._items and not self._writing, timeout)
+
+    def close(self):
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+
+    def __len__(self):
+        with self._condition:
+            return len(self._items) + self._writing
+
+
+class LogSink(object):
+    name = None
+
+    def __init__(self, buffer_size=LOG_OUTPUT_BUFFER_SIZE, overflow=LOG_OUTPUT_OVERFLOW):
+        self.buffer = LogOutputBuffer(buffer_size, overflow)
+        self._start_lock = Lock()
+        self._thread = None
+        self.written = 0
+        self.write_errors = 0
+
+    def emit(self, event, log_level):
+        """Queues the message of a LogPointEvent for the writer thread."""
+        self._ensure_started()
+        self.buffer.put((event, log_level))
+
+    def write(self, messages):
+        """Writes a batch of queued messages on the writer thread."""
+        raise NotImplementedError
+
+    def flush(self, timeout=None):
+        return self.buffer.wait_empty(timeout)
+
+    def close(self, timeout=5.0):
+        self.buffer.close()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def get_stats(self):
+        return {
+            "buffered": len(self.buffer),
+            "written": self.written,
+            "droppedOldest": self.buffer.dropped_oldest,
+            "droppedNewest": self.buffer.dropped_newest,
+            "writeErrors": self.write_errors,
+            "overflow": self.buffer.overflow
+        }
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._start_lock:
+            if self._thread is None:
+                thread = Thread(target=self._drain, name="tracepointdebug-logpoint-" + self.name, daemon=True)
+                thread.start()
+                self._thread = thread
+
+    def _drain(self):
+        while True:
+            messages = self.buffer.take_all()
+            if messages is None:
+                return
+            try:
+                self.write(messages)
+                self.written += len(messages)
+            except Exception as e:
+                self.write_errors += 1
+                logger.error("Error writing logpoint messages to %s sink: %s", self.name, e)
+            finally:
+                self.buffer.done()
+
+
+class StdoutSink(LogSink):
+    name = "stdout"
+
+    def write(self, messages):
+        # Looked up on each write, so redirections of sys.stdout are followed
+        stream = sys.stdout
+        stream.write("".join(format_log_event_message(event.created_at, log_level, event.log_message) + "\n"
+                             for event, log_level in messages))
+        stream.flush()
+
+
+class NdjsonFileSink(LogSink):
+    """
+    Writes a JSON record per message. Once the file would grow past max_bytes it is renamed
+    to ``<path>.1`` (older files shifting to ``.2`` and so on, up to backups) and a new one started.
+    """
+    name = "file"
+
+    def __init__(self, path=LOG_OUTPUT_FILE, max_bytes=LOG_OUTPUT_FILE_MAX_BYTES, backups=LOG_OUTPUT_FILE_BACKUPS,
+                 buffer_size=LOG_OUTPUT_BUFFER_SIZE, overflow=LOG_OUTPUT_OVERFLOW):
+        super(NdjsonFileSink, self).__init__(buffer_size, overflow)
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self._fd = None
+        self._size = 0
+
+    def write(self, messages):
+        lines = [self._encode(event, log_level) for event, log_level in messages]
+        if self._fd is None:
+            self._open()
+        start = 0
+        while start < len(lines):
+            end = start
+            size = 0
+            while end < len(lines) and end - start < MAX_WRITE_BUFFERS and \
+                    (end == start or self._size + size + len(lines[end]) <= self.max_bytes):
+                size += len(lines[end])
+                end += 1
+            if self._size > 0 and self._size + size > self.max_bytes:
+                self._rotate()
+            self._write_all(lines[start:end])
+            self._size += size
+            start = end
+
+    def close(self, timeout=5.0):
+        super(NdjsonFileSink, self).close(timeout)
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+    @staticmethod
+    def _encode(event, log_level):
+        return (json.dumps({
+            "createdAt": event.created_at,
+            "level": log_level,
+            "logPointId": event.log_point_id,
+            "fileName": event.file,
+            "lineNo": event.line_no,
+            "methodName": event.method_name,
+            "logMessage": event.log_message
+        }, separators=(",", ":")) + "\n").encode("utf-8")
+
+    def _write_all(self, lines):
+        if not hasattr(os, "writev"):
+            data = b"".join(lines)
+            while data:
+                data = data[os.write(self._fd, data):]
+            return
+        while lines:
+            written = os.writev(self._fd, lines)
+            # Short writes leave the rest of the batch, possibly starting in the middle of a line
+            while lines and written >= len(lines[0]):
+                written -= len(lines[0])
+                lines = lines[1:]
+            if written:
+                lines = [lines[0][written:]] + lines[1:]
+
+    def _open(self):
+        self._fd = os.open(self.path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+        self._size = os.fstat(self._fd).st_size
+
+    def _rotate(self):
+        os.close(self._fd)
+        self._fd = None
+        if self.backups > 0:
+            for i in range(self.backups - 1, 0, -1):
+                source = "%s.%d" % (self.path, i)
+                if os.path.exists(source):
+                    os.replace(source, "%s.%d" % (self.path, i + 1))
+            os.replace(self.path, self.path + ".1")
+        else:
+            os.remove(self.path)
+        self._open()
+
+
+class LoggingSink(LogSink):
+    """Queues a LogRecord per message through a QueueHandler and has logger handle them on the writer thread."""
+    name = "logging"
+
+    def __init__(self, logger_name=LOG_OUTPUT_LOGGER, buffer_size=LOG_OUTPUT_BUFFER_SIZE,
+                 overflow=LOG_OUTPUT_OVERFLOW):
+        super(LoggingSink, self).__init__(buffer_size, overflow)
+        self.logger = logging.getLogger(logger_name)
+        self._queue_handler = logging.handlers.QueueHandler(self.buffer)
+
+    def emit(self, event, log_level):
+        level = logging.getLevelName(str(log_level).upper())
+        if not isinstance(level, int):
+            level = logging.INFO
+        if not self.logger.isEnabledFor(level):
+            return
+        self._ensure_started()
+        record = self.logger.makeRecord(self.logger.name, level, event.file, event.line_no, event.log_message, None,
+                                        None, func=event.method_name,
+                                        extra={"log_point_id": event.log_point_id, "created_at": event.created_at})
+        self._queue_handler.handle(record)
+
+    def write(self, records):
+        for record in records:
+            self.logger.handle(record)
+
+
+_SINK_TYPES = {
+    StdoutSink.name: StdoutSink,
+    NdjsonFileSink.name: NdjsonFileSink,
+    LoggingSink.name: LoggingSink
+}
+
+
+def create_sinks(spec):
+    """Sinks for a comma separated list of sink names, as in DEBUGIN_LOGPOINT_SINKS."""
+    sinks = []
+    for name in (part.strip().lower() for part in spec.split(",")):
+        if not name:
+            continue
+        sink_type = _SINK_TYPES.get(name)
+        if sink_type is None:
+            raise ValueError("Unknown logpoint sink %s, expected one of %s" % (name, ", ".join(_SINK_TYPES)))
+        sinks.append(sink_type())
+    return sinks
+
+
+class LogOutput(object):
+    __instance = None
+
+    def __init__(self, sinks=None):
+        self._lock = Lock()
+        self._sinks = list(sinks) if sinks is not None else create_sinks(LOG_OUTPUT_SINKS)
+
+    @staticmethod
+    def instance():
+        if LogOutput.__instance is None:
+            LogOutput.__instance = LogOutput()
+            atexit.register(LogOutput.__instance.flush, 2.0)
+        return LogOutput.__instance
+
+    @property
+    def sinks(self):
+        return self._sinks
+
+    def set_sinks(self, sinks):
+        """Replaces the sinks, writing what the previous ones still have queued."""
+        with self._lock:
+            previous, self._sinks = self._sinks, list(sinks)
+        for sink in previous:
+            sink.close()
+
+    def emit(self, event, log_level):
+        for sink in self._sinks:
+            sink.emit(event, log_level)
+
+    def flush(self, timeout=None):
+        return all([sink.flush(timeout) for sink in self._sinks])
+
+    def get_stats(self):
+        return {sink.name: sink.get_stats() for sink in self._sinks}
+
+
+def set_log_output_sinks(sinks):
+    """
+    Sets where logpoints with stdout enabled write their messages: a list of LogSinks, or
+    a comma separated list of sink names (``stdout``, ``file``, ``logging``).
+    """
+    if isinstance(sinks, str):
+        sinks = create_sinks(sinks)
+    LogOutput.instance().set_sinks(sinks)
@@ -1,11 +1,13 @@
 import logging
 import os
 import time
-from threading import Lock, Timer
+from threading import Lock
 
 
+from tracepointdebug.broker.io_loop import schedule_timer
 from tracepointdebug.external.googleclouddebugger import imphook2, module_search2, module_utils2
 from tracepointdebug.external.googleclouddebugger.module_explorer import GetCodeObjectAtLine
+from tracepointdebug.probe.capture_context import get_capture_context
 from tracepointdebug.probe.coded_exception import CodedException
 from tracepointdebug.probe.condition.condition_context import ConditionContext
 from tracepointdebug.probe.condition.condition_factory import ConditionFactory
@@ -15,11 +17,11 @@ from tracepointdebug.probe.event.logpoint.log_point_failed_event import LogPoint
 from tracepointdebug.probe.event.logpoint.put_logpoint_failed_event import PutLogPointFailedEvent
 from tracepointdebug.probe.ratelimit.rate_limit_result import RateLimitResult
 from tracepointdebug.probe.ratelimit.rate_limiter import RateLimiter
-from tracepointdebug.probe.snapshot import SnapshotCollector
+from tracepointdebug.probe.snapshot.redaction import get_redaction_rules
 from tracepointdebug.probe.source_code_helper import get_source_code_hash
-import pystache
-from datetime import datetime
-from tracepointdebug.utils.log.logger import print_log_event_message
+from tracepointdebug.probe.breakpoints.logpoint.log_template import LogTemplate, format_timestamp
+from tracepointdebug.probe.breakpoints.logpoint.log_output import LogOutput
+from tracepointdebug.probe.breakpoints.logpoint.log_coalescer import CoalesceConfig, LogCoalescer
 
 logger = logging.getLogger(__name__)
 
@@ -38,14 +40,23 @@ class LogPoint(object):
         self.timer = None
         self.rate_limiter = RateLimiter()
         self.engine = engine
+        self.template = LogTemplate(log_point_config.log_expression)
+        self.coalescer = None
 
         if os.path.splitext(self.config.file)[1] != '.py':
             raise CodedException(errors.PUT_LOGPOINT_FAILED, (
                 self.config.get_file_name(), self.config.line, self.config.client, 'Only .py file extension is supported'))
 
+        try:
+            coalesce = CoalesceConfig.from_json(self.config.coalesce)
+        except ValueError as e:
+            raise CodedException(errors.INVALID_LOGPOINT_COALESCE, (
+                self.config.get_file_name(), self.config.line, self.config.client, str(e)))
+        if coalesce is not None:
+            self.coalescer = LogCoalescer(coalesce, self.publish_log_event)
+
         if log_point_config.expire_duration != -1:
-            self.timer = Timer(log_point_config.expire_duration, self.log_point_manager.expire_log_point,
-                               args=(self,)).start()
+            self.timer = schedule_timer(log_point_config.expire_duration, self.log_point_manager.expire_log_point, self)
 
         # Check if file really exist
         source_path = module_search2.Search(self.config.file)
@@ -120,14 +131,13 @@ class LogPoint(object):
 
     def breakpoint_callback(self, event, frame):
         try:
-            f_variables = {}
-            f_variables.update(frame.f_locals)
-            f_variables.update(frame.f_globals)
             if self.config.disabled:
                 return
+            # Shared with the other probes on this line when the engine fires several of them
+            context = get_capture_context(frame)
             if self.condition:
                 try:
-                    result = self.condition.evaluate(ConditionContext(f_variables))
+                    result = self.condition.evaluate(ConditionContext(context.variables))
                     # Condition failed, do not send snapshot
                     if not result:
                         return
@@ -149,15 +159,29 @@ class LogPoint(object):
 
             if rate_limit_result == RateLimitResult.EXCEEDED:
                 return
-            snapshot_collector = SnapshotCollector()
-            snapshot = snapshot_collector.collect(frame)
+            coalesce_key = None
+            if self.coalescer is not None and self.coalescer.config.keys:
+                # Repeats are folded before their message is rendered
+                coalesce_key = self.coalescer.values_key(context.lookup(self.coalescer.config.keys))
+                if self.coalescer.fold(coalesce_key):
+                    return
+            redaction = get_redaction_rules()
+            if self.log_point_manager._data_redaction_callback or self.template.names is None:
+                # The callback may change the expression to refer to any variable
+                f_variables = context.variables
+            else:
+                f_variables = context.lookup(self.template.names)
+            if redaction is not None:
+                # Masked before rendering, the redaction callback below gets the masked copy
+                f_variables = redaction.redact_variables(f_variables)
             if self.log_point_manager._data_redaction_callback:
                 log_redaction = {
                     "file_name": self.config.get_file_name(),
                     "line_no": self.config.line,
-                    "method_name": snapshot.method_name,
+                    "method_name": context.method_name,
                     "log_expression": self.config.log_expression,
-                    "variables": f_variables
+                    # The callback may change the variables, which other probes on the line still read
+                    "variables": dict(f_variables)
                 }
                 try:
                     self.log_point_manager._data_redaction_callback(log_redaction)
@@ -165,20 +189,22 @@ class LogPoint(object):
                     f_variables = log_redaction.get("variables", {})
                 except Exception as e:
                     logger.error("Error for external processing log in log manager with callback %s" % e)
-            log_message = pystache.render(self.config.log_expression, f_variables)
-            created_at = datetime.now().strftime("%Y-%m-%d %H:%M:%S.%f")[:-3]
+            if self.template.expression != self.config.log_expression:
+                self.template = LogTemplate(self.config.log_expression)
+            log_message = self.template.render(f_variables)
+            if redaction is not None:
+                log_message = redaction.redact_text(log_message)
+            created_at = format_timestamp()
             event = LogPointEvent(log_point_id = self.id, 
                 file=self.config.get_file_name(), 
                 line_no = self.config.line, 
-                method_name=snapshot.method_name, 
+                method_name=context.method_name, 
                 log_message=log_message,
                 created_at=created_at)
-            
-            if self.config.stdout_enabled:
-                print_log_event_message(created_at, self.config.log_level, log_message)
-
-            event.client = self.config.client
-            self.log_point_manager.publish_event(event)
+            if self.coalescer is not None:
+                if self.coalescer.add(log_message if coalesce_key is None else coalesce_key, event):
+                    return
+            self.publish_log_event(event)
         except Exception as exc:
             logger.warning('Error on log point snapshot %s' % exc)
             code = 0
@@ -188,8 +214,17 @@ class LogPoint(object):
             event.client = self.config.client
             self.log_point_manager.publish_event(event)
 
+    def publish_log_event(self, event):
+        if self.config.stdout_enabled:
+            LogOutput.instance().emit(event, self.config.log_level)
+
+        event.client = self.config.client
+        self.log_point_manager.publish_event(event)
+
     def remove_log_point(self):
         self.remove_import_hook()
+        if self.coalescer is not None:
+            self.coalescer.flush()
         if self._cookie is not None:
             logger.info('Clearing breakpoint %s' % self.id)
             if self.timer is not None:
@@ -1,7 +1,7 @@
 class LogPointConfig(object):
 
     def __init__(self, log_point_id, file=None, file_ref=None, line=None, client=None, log_expression=None, cond=None, expire_duration=None, expire_hit_count=None,
-                 file_hash=None, disabled=False, log_level="INFO", stdout_enabled=False, tags=set()):
+                 file_hash=None, disabled=False, log_level="INFO", stdout_enabled=False, tags=set(), coalesce=None):
         self.log_point_id = log_point_id
         self.file = file
         self.file_ref = file_ref
@@ -16,6 +16,7 @@ class LogPointConfig(object):
         self.log_level = log_level
         self.stdout_enabled = stdout_enabled
         self.tags = tags
+        self.coalesce = coalesce
 
     def get_file_name(self):
         return self.file if not self.file_ref else '{0}?ref={1}'.format(self.file, self.file_ref)
@@ -33,5 +34,6 @@ class LogPointConfig(object):
             "logLevel": self.log_level,
             "stdoutEnabled": self.stdout_enabled,
             "conditionExpression": self.cond,
-            "tags": list(self.tags)
+            "tags": list(self.tags),
+            "coalesce": self.coalesce
         }
@@ -38,7 +38,7 @@ class LogPointManager(object):
             return log_points
 
     def update_log_point(self, log_point_id, client, expire_duration, expire_count, log_expression,
-                           condition, disabled, log_level, stdout_enabled, tags):
+                           condition, disabled, log_level, stdout_enabled, tags, coalesce=None):
         with self._lock:
             if log_point_id not in self._log_points:
                 raise CodedException(errors.NO_LOGPOINT_EXIST_WITH_ID, (log_point_id, client))
@@ -47,14 +47,15 @@ class LogPointManager(object):
             log_point.remove_log_point()
             log_point_config = LogPointConfig(log_point_id, log_point.config.file, log_point.config.file_ref, log_point.config.line,
                                                   client, log_expression, condition, expire_duration, expire_count, disabled=disabled,
-                                                  log_level=log_level, stdout_enabled=stdout_enabled, tags=tags)
+                                                  log_level=log_level, stdout_enabled=stdout_enabled, tags=tags,
+                                                  coalesce=coalesce)
             log_point = LogPoint(self, log_point_config, self.engine)
             self._log_points[log_point_id] = log_point
             if tags:
                 self._add_log_point_tags(log_point_id, tags)
 
     def put_log_point(self, log_point_id, file, file_hash, line, client, expire_duration, expire_count,
-                        disabled, log_expression, condition, log_level, stdout_enabled, tags):
+                        disabled, log_expression, condition, log_level, stdout_enabled, tags, coalesce=None):
         with self._lock:
             if log_point_id in self._log_points:
                 raise CodedException(errors.LOGPOINT_ALREADY_EXIST, (file, line, client))
@@ -68,7 +69,8 @@ class LogPointManager(object):
                                                   disabled=disabled,
                                                   log_level=log_level,
                                                   stdout_enabled=stdout_enabled,
-                                                  tags=tags)
+                                                  tags=tags,
+                                                  coalesce=coalesce)
             log_point = LogPoint(self, log_point_config, self.engine)
             self._log_points[log_point_id] = log_point
             if tags:
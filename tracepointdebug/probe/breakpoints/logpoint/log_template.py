@@ -0,0 +1,76 @@
+"""
+Logpoint message templates, parsed once when the logpoint is put.
+
+A LogTemplate keeps the parsed mustache template and the root names it refers to,
+so a hit only looks up those names in the frame instead of merging all locals and
+globals, and renders without parsing the template again. Rendering goes through
+pystache itself, so messages are the same as ``pystache.render`` would give.
+"""
+
+import time
+from datetime import datetime
+
+import pystache
+from pystache.parser import _EscapeNode, _LiteralNode, _SectionNode, _InvertedNode, _CommentNode, _ChangeNode
+from pystache.renderer import Renderer
+
+# (second, "%Y-%m-%d %H:%M:%S" of that second in local time) of the last timestamp formatted
+_timestamp_prefix = (None, None)
+
+
+class LogTemplate(object):
+
+    def __init__(self, expression):
+        self.expression = expression
+        self.names = None
+        self._parsed = None
+        self._error = None
+        try:
+            self._parsed = pystache.parse(expression)
+            self.names = _referenced_names(self._parsed._parse_tree)
+        except Exception as e:
+            # Raised on every render, as rendering the expression each hit did
+            self._error = e
+
+    def render(self, variables):
+        if self._error is not None:
+            raise self._error
+        # Renderers keep the context of the render in progress, so they are not shared between threads
+        return Renderer().render(self._parsed, variables)
+
+
+def _referenced_names(nodes):
+    """Root names of the tags in nodes, None when they cannot be known before rendering (partials)."""
+    names = set()
+    for node in nodes:
+        if isinstance(node, str) or isinstance(node, (_CommentNode, _ChangeNode)):
+            continue
+        if isinstance(node, (_EscapeNode, _LiteralNode, _SectionNode, _InvertedNode)):
+            if node.key != '.':
+                names.add(node.key.split('.', 1)[0])
+            section = node.parsed if isinstance(node, _SectionNode) else \
+                node.parsed_section if isinstance(node, _InvertedNode) else None
+            child_names = set() if section is None else _referenced_names(section._parse_tree)
+            if child_names is None:
+                return None
+            names.update(child_names)
+        else:
+            return None
+    return names
+
+
+def format_timestamp(now_ns=None):
+    """
+    Formats now_ns (time.time_ns() by default) as ``datetime.now().strftime("%Y-%m-%d %H:%M:%S.%f")[:-3]``
+    does, reusing the formatted date and time while the second does not change.
+    """
+    global _timestamp_prefix
+    if now_ns is None:
+        now_ns = time.time_ns()
+    # Truncated like datetime.now() does with the system clock
+    second, nanos = divmod(now_ns, 1000000000)
+    cached_second, prefix = _timestamp_prefix
+    if cached_second != second:
+        prefix = datetime.fromtimestamp(second).strftime("%Y-%m-%d %H:%M:%S")
+        _timestamp_prefix = (second, prefix)
+    return "%s.%03d" % (prefix, nanos // 1000000)
@@ -1,28 +1,41 @@
 import logging
 import os
 import time
-from threading import Lock, Timer
+from threading import Lock
+from uuid import uuid4
 
 
+from tracepointdebug.broker.io_loop import schedule_timer
 from tracepointdebug.external.googleclouddebugger import imphook2, module_search2, module_utils2
 from tracepointdebug.external.googleclouddebugger.module_explorer import GetCodeObjectAtLine
+from tracepointdebug.probe.capture_context import CaptureContext, get_capture_context
 from tracepointdebug.probe.coded_exception import CodedException
 from tracepointdebug.probe.condition.condition_context import ConditionContext
 from tracepointdebug.probe.condition.condition_factory import ConditionFactory
 from tracepointdebug.probe.errors import CONDITION_CHECK_FAILED, SOURCE_CODE_MISMATCH_DETECTED, \
-    LINE_NO_IS_NOT_AVAILABLE, LINE_NO_IS_NOT_AVAILABLE_2, LINE_NO_IS_NOT_AVAILABLE_3, PUT_TRACEPOINT_FAILED
+    LINE_NO_IS_NOT_AVAILABLE, LINE_NO_IS_NOT_AVAILABLE_2, LINE_NO_IS_NOT_AVAILABLE_3, PUT_TRACEPOINT_FAILED, \
+    SNAPSHOT_MEMORY_BUDGET_EXCEEDED, INVALID_CAPTURE_PROFILE
 from tracepointdebug.probe.event.tracepoint.put_tracepoint_failed_event import PutTracePointFailedEvent
 from tracepointdebug.probe.event.tracepoint.trace_point_rate_limit_event import TracePointRateLimitEvent
 from tracepointdebug.probe.event.tracepoint.trace_point_snapshot_event import TracePointSnapshotEvent
 from tracepointdebug.probe.event.tracepoint.tracepoint_snapshot_failed_event import TracePointSnapshotFailedEvent
 from tracepointdebug.probe.ratelimit.rate_limit_result import RateLimitResult
 from tracepointdebug.probe.ratelimit.rate_limiter import RateLimiter
-from tracepointdebug.probe.snapshot import SnapshotCollector
+from tracepointdebug.probe.snapshot import SnapshotCollector, SnapshotCollectorConfigManager
+from tracepointdebug.probe.snapshot import deferred_capture
+from tracepointdebug.probe.snapshot.blob_store import offload_frames
+from tracepointdebug.probe.snapshot.capture_profile import CaptureProfile
+from tracepointdebug.probe.snapshot.drill_down import DrillDownCache
+from tracepointdebug.probe.snapshot.snapshot_delta_encoder import SnapshotDeltaEncoder
+from tracepointdebug.probe.snapshot.snapshot_memory_budget import SnapshotMemoryBudget, CAPTURE_DROPPED
 from tracepointdebug.probe.source_code_helper import get_source_code_hash
-from tracepointdebug.trace import TraceSupport
+from .trace_point_stats import TracePointStats
 
 logger = logging.getLogger(__name__)
 
+# Snapshots dropped for the memory budget are reported at most this often per tracepoint
+DROPPED_SNAPSHOT_REPORT_INTERVAL_SECS = 1
+
 class TracePoint(object):
 
     def __init__(self, trace_point_manager, trace_point_config, engine):
@@ -37,6 +50,10 @@ class TracePoint(object):
         self.condition = None
         self.timer = None
         self.rate_limiter = RateLimiter()
+        self.delta_encoder = SnapshotDeltaEncoder()
+        self._dropped_snapshots = 0
+        self._dropped_snapshots_reported_at = 0
+        self.stats = TracePointStats()
         self.thundra_agent = True
         self.engine = engine
 
@@ -44,9 +61,15 @@ class TracePoint(object):
             raise CodedException(PUT_TRACEPOINT_FAILED, (
                 self.config.get_file_name(), self.config.line, self.config.client, 'Only .py file extension is supported'))
 
+        # Compiled once here, watch expressions are only evaluated on hits
+        try:
+            self.capture_profile = CaptureProfile.from_json(self.config.capture_profile)
+        except ValueError as e:
+            raise CodedException(INVALID_CAPTURE_PROFILE, (
+                self.config.get_file_name(), self.config.line, self.config.client, str(e)))
+
         if trace_point_config.expire_duration != -1:
-            self.timer = Timer(trace_point_config.expire_duration, self.trace_point_manager.expire_trace_point,
-                               args=(self,)).start()
+            self.timer = schedule_timer(trace_point_config.expire_duration, self.trace_point_manager.expire_trace_point, self)
 
         # Check if file really exist
         source_path = module_search2.Search(self.config.file)
@@ -108,7 +131,8 @@ class TracePoint(object):
                 self.id,
                 file_path,
                 self.config.line,
-                self.breakpoint_callback
+                self.breakpoint_callback,
+                capture_limits=self.capture_limits
             )
         except Exception as exc:
             code = 0
@@ -119,16 +143,21 @@ class TracePoint(object):
             self.trace_point_manager.publish_event(event)
             self.complete_trace_point()
 
+    def capture_limits(self):
+        """The parse depth and size a full capture of this tracepoint asks for."""
+        config = self.capture_profile if self.capture_profile is not None else SnapshotCollectorConfigManager
+        return config.get_parse_depth(), config.get_max_size()
+
     def breakpoint_callback(self, event, frame):
+        reservation = None
         try:
             if self.config.disabled:
                 return
+            # Shared with the other probes on this line when the engine fires several of them
+            context = get_capture_context(frame)
             if self.condition:
                 try:
-                    f_variables = {}
-                    f_variables.update(frame.f_locals)
-                    f_variables.update(frame.f_globals)
-                    result = self.condition.evaluate(ConditionContext(f_variables))
+                    result = self.condition.evaluate(ConditionContext(context.variables))
                     # Condition failed, do not send snapshot
                     if not result:
                         return
@@ -149,10 +178,33 @@ class TracePoint(object):
 
             if rate_limit_result == RateLimitResult.EXCEEDED:
                 return
-            snapshot_collector = SnapshotCollector()
-            snapshot = snapshot_collector.collect(frame)
+            reservation = SnapshotMemoryBudget.instance().reserve(self.capture_profile)
+            if reservation.level == CAPTURE_DROPPED:
+                self.report_dropped_snapshot()
+                return
+            snapshot_collector = SnapshotCollector(parse_depth=reservation.parse_depth, max_size=reservation.max_size,
+                                                   collect_variables=reservation.collect_variables,
+                                                   profile=self.capture_profile)
+            # The active span is thread local, so it is looked up on the hit thread even for deferred captures
+            trace_context = context.trace_context
 
-            trace_context = TraceSupport.get_trace_context()
+            if self.config.deferred_capture:
+                captured_frame = deferred_capture.copy_frames(snapshot_collector, frame)
+                deferred_capture.submit(self.complete_snapshot, snapshot_collector, CaptureContext(captured_frame),
+                                        trace_context, reservation)
+            else:
+                self.complete_snapshot(snapshot_collector, context, trace_context, reservation)
+        except Exception as exc:
+            if reservation is not None:
+                reservation.release()
+            self.publish_snapshot_failed(exc)
+
+    def complete_snapshot(self, snapshot_collector, context, trace_context, reservation):
+        try:
+            started = time.perf_counter()
+            snapshot = context.collect(snapshot_collector)
+            self.stats.record_snapshot(time.perf_counter() - started, snapshot.truncated_by_time)
+            reservation.settle(snapshot_collector, snapshot)
 
             trace_id = None if not trace_context else trace_context.get_trace_id()
             transaction_id = None if not trace_context else trace_context.get_transaction_id()
@@ -160,7 +212,7 @@ class TracePoint(object):
 
             event = TracePointSnapshotEvent(self.id, self.config.get_file_name(), self.config.line, method_name=snapshot.method_name,
                                             frames=snapshot.frames, transaction_id=transaction_id, trace_id=trace_id,
-                                            span_id=span_id)
+                                            span_id=span_id, truncated_by_time=snapshot.truncated_by_time)
 
             try:
                 if self.trace_point_manager._data_redaction_callback:
@@ -175,16 +227,53 @@ class TracePoint(object):
             except Exception as e:
                 logger.error("Error for external processing tracepoint with callbacks %s" % e)
 
+            if snapshot_collector.drill_down_refs:
+                # Expansions address values by snapshot id, so it is assigned here instead of at publish time
+                event.id = str(uuid4())
+                DrillDownCache.instance().store(event.id, snapshot_collector.drill_down_refs)
+
+            blob_threshold = SnapshotCollectorConfigManager.get_blob_threshold()
+            if blob_threshold and snapshot_collector.cur_size >= blob_threshold:
+                # Too large to send inline, the full frames are fetched from the blob store on request
+                event.frames, event.blob = offload_frames(event.frames)
+
+            if event.blob is None and SnapshotCollectorConfigManager.is_delta_encoding_enabled():
+                # Deltas refer to the previous snapshot by id, so the id is assigned here instead of at publish time
+                event.id = event.id or str(uuid4())
+                event.frames, event.base_snapshot_id = self.delta_encoder.encode(event.id, event.frames)
+
             event.client = self.config.client
-            self.trace_point_manager.publish_event(event)
+            self.trace_point_manager.publish_event(event, callback=reservation.release, size=reservation.size)
         except Exception as exc:
-            logger.warning('Error on trace point snapshot %s' % exc)
-            code = 0
-            if isinstance(exc, CodedException):
-                code = exc.code
-            event = TracePointSnapshotFailedEvent(self.config.get_file_name(), self.config.line, code, str(exc))
-            event.client = self.config.client
-            self.trace_point_manager.publish_event(event)
+            reservation.release()
+            self.publish_snapshot_failed(exc)
+
+    def publish_snapshot_failed(self, exc):
+        self.stats.record_failed()
+        logger.warning('Error on trace point snapshot %s' % exc)
+        code = 0
+        if isinstance(exc, CodedException):
+            code = exc.code
+        event = TracePointSnapshotFailedEvent(self.config.get_file_name(), self.config.line, code, str(exc))
+        event.client = self.config.client
+        self.trace_point_manager.publish_event(event)
+
+    def report_dropped_snapshot(self, now=None):
+        now = time.time() if now is None else now
+        self.stats.record_dropped()
+        with self._lock:
+            self._dropped_snapshots += 1
+            if now - self._dropped_snapshots_reported_at < DROPPED_SNAPSHOT_REPORT_INTERVAL_SECS:
+                return
+            dropped = self._dropped_snapshots
+            self._dropped_snapshots = 0
+            self._dropped_snapshots_reported_at = now
+        message = SNAPSHOT_MEMORY_BUDGET_EXCEEDED.format_message(
+            (dropped, self.config.get_file_name(), self.config.line, SnapshotCollectorConfigManager.get_memory_budget()))
+        event = TracePointSnapshotFailedEvent(self.config.get_file_name(), self.config.line,
+                                              SNAPSHOT_MEMORY_BUDGET_EXCEEDED.code, message)
+        event.client = self.config.client
+        self.trace_point_manager.publish_event(event)
 
     def remove_trace_point(self):
         self.remove_import_hook()
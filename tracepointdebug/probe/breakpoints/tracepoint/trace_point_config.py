@@ -1,7 +1,7 @@
 class TracePointConfig(object):
 
     def __init__(self, trace_point_id, file=None, file_ref=None, line=None, client=None, cond=None, expire_duration=None, expire_hit_count=None,
-                 file_hash=None, disabled=False, tracing_enabled=False, tags=set()):
+                 file_hash=None, disabled=False, tracing_enabled=False, tags=set(), deferred_capture=False, capture_profile=None):
         self.trace_point_id = trace_point_id
         self.file = file
         self.file_ref = file_ref
@@ -14,6 +14,8 @@ class TracePointConfig(object):
         self.disabled = disabled
         self.tracing_enabled = tracing_enabled
         self.tags = tags
+        self.deferred_capture = deferred_capture
+        self.capture_profile = capture_profile
 
     def get_file_name(self):
         return self.file if not self.file_ref else '{0}?ref={1}'.format(self.file, self.file_ref)
@@ -29,5 +31,7 @@ class TracePointConfig(object):
             "disabled": self.disabled,
             "tracingEnabled": self.tracing_enabled,
             "conditionExpression": self.cond,
-            "tags": list(self.tags)
+            "tags": list(self.tags),
+            "deferredCapture": self.deferred_capture,
+            "captureProfile": self.capture_profile
         }
@@ -29,6 +29,12 @@ class TracePointManager(object):
         return TracePointManager(*args,
                                  **kwargs) if TracePointManager.__instance is None else TracePointManager.__instance
 
+    def get_stats(self):
+        """Returns the capture counters of every tracepoint by id."""
+        with self._lock:
+            return {trace_point_id: trace_point.stats.to_json()
+                    for trace_point_id, trace_point in self._trace_points.items()}
+
     def list_trace_points(self, client):
         with self._lock:
             trace_points = []
@@ -39,7 +45,7 @@ class TracePointManager(object):
             return trace_points
 
     def update_trace_point(self, trace_point_id, client, expire_duration, expire_count, enable_tracing,
-                           condition, disable, tags):
+                           condition, disable, tags, deferred_capture=False, capture_profile=None):
         with self._lock:
             if trace_point_id not in self._trace_points:
                 raise CodedException(errors.NO_TRACEPOINT_EXIST_WITH_ID, (trace_point_id, client))
@@ -48,14 +54,15 @@ class TracePointManager(object):
             trace_point.remove_trace_point()
             trace_point_config = TracePointConfig(trace_point_id, trace_point.config.file, trace_point.config.file_ref, trace_point.config.line,
                                                   client, condition, expire_duration, expire_count,
-                                                  tracing_enabled=enable_tracing, disabled=disable, tags=tags)
+                                                  tracing_enabled=enable_tracing, disabled=disable, tags=tags,
+                                                  deferred_capture=deferred_capture, capture_profile=capture_profile)
             trace_point = TracePoint(self, trace_point_config, self.engine)
             self._trace_points[trace_point_id] = trace_point
             if tags:
                 self._add_trace_point_tags(trace_point_id, tags)
 
     def put_trace_point(self, trace_point_id, file, file_hash, line, client, expire_duration, expire_count,
-                        enable_tracing, condition, tags):
+                        enable_tracing, condition, tags, deferred_capture=False, capture_profile=None):
         with self._lock:
             if trace_point_id in self._trace_points:
                 raise CodedException(errors.TRACEPOINT_ALREADY_EXIST, (file, line, client))
@@ -67,7 +74,9 @@ class TracePointManager(object):
                                                   expire_count,
                                                   file_hash=file_hash,
                                                   tracing_enabled=enable_tracing,
-                                                  tags=tags)
+                                                  tags=tags,
+                                                  deferred_capture=deferred_capture,
+                                                  capture_profile=capture_profile)
             trace_point = TracePoint(self, trace_point_config, self.engine)
             self._trace_points[trace_point_id] = trace_point
             if tags:
@@ -131,8 +140,8 @@ class TracePointManager(object):
             if trace_point_id in self._trace_points:
                 self._trace_points.pop(trace_point_id).remove_trace_point()
 
-    def publish_event(self, event):
-        self.broker_manager.publish_event(event)
+    def publish_event(self, event, callback=None, size=None):
+        self.broker_manager.publish_event(event, callback=callback, size=size)
 
     def publish_application_status(self, client=None):
         self.broker_manager.publish_application_status(client=client)
@@ -0,0 +1,41 @@
+from threading import Lock
+
+
+class TracePointStats(object):
+    """Capture counters of one tracepoint, reported by GET /stats."""
+
+    def __init__(self):
+        self._lock = Lock()
+        self.snapshots = 0
+        self.failed = 0
+        self.dropped = 0
+        self.time_truncated = 0
+        self.capture_secs_total = 0.0
+        self.capture_secs_max = 0.0
+
+    def record_snapshot(self, capture_secs, truncated_by_time=False):
+        with self._lock:
+            self.snapshots += 1
+            if truncated_by_time:
+                self.time_truncated += 1
+            self.capture_secs_total += capture_secs
+            self.capture_secs_max = max(self.capture_secs_max, capture_secs)
+
+    def record_failed(self):
+        with self._lock:
+            self.failed += 1
+
+    def record_dropped(self):
+        with self._lock:
+            self.dropped += 1
+
+    def to_json(self):
+        with self._lock:
+            return {
+                "snapshots": self.snapshots,
+                "failed": self.failed,
+                "dropped": self.dropped,
+                "timeTruncated": self.time_truncated,
+                "captureTimeMsTotal": round(self.capture_secs_total * 1000, 3),
+                "captureTimeMsMax": round(self.capture_secs_max * 1000, 3)
+            }
@@ -0,0 +1,216 @@
+"""
+Capture data shared by all the probes that fire on the same line hit.
+
+The engine opens one CaptureContext per hit of a line with probes and every probe
+callback draws from it: the condition variables, the method name, the trace context
+and the collected snapshot are each computed at most once, on first use. The engine
+also passes the deepest parse depth and largest size any probe on the line asks for,
+so the first probe to collect walks the frame once for all of them and every probe
+gets a copy trimmed to its own limits.
+"""
+
+import threading
+
+from tracepointdebug.probe.frame import Frame
+from tracepointdebug.probe.snapshot.snapshot import Snapshot
+from tracepointdebug.probe.snapshot.value import Value, ValueReference
+from tracepointdebug.probe.snapshot.variable import Variable
+from tracepointdebug.probe.snapshot.variables import Variables
+from tracepointdebug.trace import TraceSupport
+
+_UNSET = object()
+_local = threading.local()
+
+
+class CaptureContext(object):
+
+    def __init__(self, frame, shared=False, limits=None):
+        self.frame = frame
+        self.shared = shared
+        # (parse depth, max size) covering every probe on the line, None when not known
+        self.limits = limits
+        self._variables = None
+        self._trace_context = _UNSET
+        self._capture = None
+
+    @property
+    def method_name(self):
+        return self.frame.f_code.co_name
+
+    @property
+    def variables(self):
+        """Locals overridden by globals, as seen by conditions and logpoint templates. Must not be modified."""
+        if self._variables is None:
+            variables = {}
+            variables.update(self.frame.f_locals)
+            variables.update(self.frame.f_globals)
+            self._variables = variables
+        return self._variables
+
+    def lookup(self, names):
+        """The items of variables for names only, without merging all locals and globals when not done yet."""
+        if self._variables is not None:
+            return {name: self._variables[name] for name in names if name in self._variables}
+        f_locals, f_globals = self.frame.f_locals, self.frame.f_globals
+        found = {}
+        for name in names:
+            if name in f_globals:
+                found[name] = f_globals[name]
+            elif name in f_locals:
+                found[name] = f_locals[name]
+        return found
+
+    @property
+    def trace_context(self):
+        if self._trace_context is _UNSET:
+            self._trace_context = TraceSupport.get_trace_context()
+        return self._trace_context
+
+    def collect(self, collector):
+        """
+        Returns the snapshot collector would take of the frame.
+
+        A snapshot already collected for an earlier probe is reused when it was taken at least
+        as deep and as large and with the same variable settings; every probe gets its own copy
+        trimmed to its parse depth and size. collector.cur_size is set as if it had collected the
+        copy itself.
+        """
+        if not self.shared:
+            return collector.collect(self.frame)
+        capture = self._capture
+        if capture is None or not capture.covers(collector):
+            fresh = self._collect(collector)
+            if capture is not None and not fresh.covers_as_much(capture):
+                return fresh.copy_for(collector)
+            capture = self._capture = fresh
+        return capture.copy_for(collector)
+
+    def _collect(self, collector):
+        parse_depth, max_size = collector.parse_depth, collector.max_size
+        # Trimming would drop drill-down handles and could leave dangling references, those walk at their own depth
+        widen = self.limits is not None and not collector.drill_down_depth and not collector.dedup_references
+        if widen:
+            collector.parse_depth = max(parse_depth, self.limits[0])
+            collector.max_size = max(max_size, self.limits[1])
+        try:
+            return _Capture(collector, collector.collect(self.frame))
+        finally:
+            collector.parse_depth, collector.max_size = parse_depth, max_size
+
+
+class _Capture(object):
+    """A snapshot collected for the probes of a line, with the limits it was collected with."""
+
+    def __init__(self, collector, snapshot):
+        self.snapshot = snapshot
+        self.shape = _shape(collector)
+        self.parse_depth = collector.parse_depth
+        self.max_size = collector.max_size
+        self.cur_size = collector.cur_size
+        self.timed_out = collector.timed_out
+        self.drill_down_refs = collector.drill_down_refs
+
+    def covers(self, collector):
+        if self.shape != _shape(collector):
+            return False
+        if collector.drill_down_depth or collector.dedup_references:
+            return self.parse_depth == collector.parse_depth and self.max_size == collector.max_size
+        return self.parse_depth >= collector.parse_depth and self.max_size >= collector.max_size
+
+    def covers_as_much(self, other):
+        return self.parse_depth >= other.parse_depth and self.max_size >= other.max_size
+
+    def copy_for(self, collector):
+        # Copies keep probes (and their redaction callbacks) from seeing each other's changes
+        trimmer = _Trimmer(collector.parse_depth, collector.max_size if collector.max_size < self.max_size else None)
+        frames = [trimmer.frame(frame) for frame in self.snapshot.frames]
+        collector.cur_size = self.cur_size if trimmer.max_size is None else min(self.cur_size, trimmer.size)
+        collector.timed_out = self.timed_out
+        collector.drill_down_refs = self.drill_down_refs
+        return Snapshot(frames=frames, method_name=self.snapshot.method_name, file=self.snapshot.file,
+                        truncated_by_time=self.snapshot.truncated_by_time)
+
+
+def _shape(collector):
+    # Everything but the parse depth and size that decides what a collection walks
+    profile = collector.profile
+    config = collector.config
+    return (collector.collect_variables, collector.deadline_ms, collector.drill_down_depth, collector.dedup_references,
+            config.get_max_frames(), config.get_max_expand_frames(), config.get_max_properties(),
+            profile.variables if profile is not None else None,
+            tuple(watch.expression for watch in profile.watches) if profile is not None else ())
+
+
+class _Trimmer(object):
+    """
+    Copies collected frames down to a parse depth and, when max_size is set, a size, counting
+    sizes the way the collector does: values stop being added once the size is reached.
+    """
+
+    def __init__(self, parse_depth, max_size=None):
+        self.parse_depth = parse_depth
+        self.max_size = max_size
+        self.size = 0
+
+    def frame(self, frame):
+        watches = None if frame.watches is None else self.variables(frame.watches)
+        return Frame(frame.line_no, self.variables(frame.variables), frame.path, frame.method_name,
+                     collapsed_frames=frame.collapsed_frames, watches=watches)
+
+    def variables(self, variables):
+        copied = []
+        for variable in variables.variables:
+            if self._full():
+                break
+            copied.append(Variable(variable.name, variable.type, self.value(variable.value, 1)))
+        return Variables(copied)
+
+    def value(self, value, depth):
+        if isinstance(value, ValueReference):
+            return ValueReference(value.ref_id)
+        if not isinstance(value, Value):
+            return value
+        children = value.value
+        if isinstance(children, dict) and all(isinstance(child, (Value, ValueReference)) for child in children.values()):
+            copied = {}
+            if depth < self.parse_depth:
+                for name, child in children.items():
+                    if self._full():
+                        break
+                    if self.max_size is not None:
+                        self.size += len(repr(name))
+                    copied[name] = self.value(child, depth + 1)
+            children = copied
+        elif isinstance(children, list) and all(isinstance(child, (Value, ValueReference)) for child in children):
+            copied = []
+            if depth < self.parse_depth:
+                for child in children:
+                    if self._full():
+                        break
+                    copied.append(self.value(child, depth + 1))
+            children = copied
+        elif self.max_size is not None:
+            self.size += 4 if children is None else len(repr(children))
+        return Value(value.type, children, ref_id=value.ref_id, handle=value.handle)
+
+    def _full(self):
+        return self.max_size is not None and self.size >= self.max_size
+
+
+def open_capture_context(frame, shared=True, limits=None):
+    """Makes a new context for frame current on this thread and returns it."""
+    context = CaptureContext(frame, shared=shared, limits=limits)
+    _local.context = context
+    return context
+
+
+def close_capture_context():
+    _local.context = None
+
+
+def get_capture_context(frame):
+    """Returns the current context of this thread for frame, or a new unshared one."""
+    context = getattr(_local, 'context', None)
+    if context is not None and context.frame is frame:
+        return context
+    return CaptureContext(frame)
@@ -16,3 +16,16 @@ class JSONEncoder(json.JSONEncoder):
 
 def to_json(data, separators=None):
     return json.dumps(data, separators=separators, cls=JSONEncoder)
+
+
+def to_plain(data):
+    """Converts a tree of objects exposing ``to_json`` into plain dicts and lists."""
+    if hasattr(data, "to_json"):
+        return to_plain(data.to_json())
+    if isinstance(data, dict):
+        return {key: to_plain(value) for key, value in data.items()}
+    if isinstance(data, (list, tuple)):
+        return [to_plain(item) for item in data]
+    if isinstance(data, bytes):
+        return data.decode('utf-8', errors='ignore')
+    return data
@@ -35,6 +35,10 @@ SOURCE_CODE_MISMATCH_DETECTED = CodedError(
     2051,
     "Source code mismatch detected while putting {} to file {} on line {} from client {}")
 
+INVALID_CAPTURE_PROFILE = CodedError(
+    2052,
+    "Invalid capture profile for tracepoint in file {} on line {} from client {}: {}")
+
 UPDATE_TRACEPOINT_FAILED = CodedError(
     2100,
     "Error occurred while updating tracepoint to file {} on line {} from client {}: {}")
@@ -67,6 +71,22 @@ DISABLE_TRACEPOINT_WITH_ID_FAILED = CodedError(
     2251,
     "Error occurred while disabling tracepoint with id {} from client {}: {}")
 
+SNAPSHOT_MEMORY_BUDGET_EXCEEDED = CodedError(
+    2300,
+    "Dropped {} snapshot(s) of tracepoint in file {} on line {}: in-flight snapshot memory budget of {} bytes is used up")
+
+SNAPSHOT_HANDLE_NOT_FOUND = CodedError(
+    2301,
+    "No expandable object with handle {} in snapshot {}, it may have expired")
+
+SNAPSHOT_OBJECT_COLLECTED = CodedError(
+    2302,
+    "Object with handle {} in snapshot {} has been garbage collected")
+
+SNAPSHOT_PATH_NOT_FOUND = CodedError(
+    2303,
+    "Path {} could not be resolved below handle {} in snapshot {}: {}")
+
 # LOGPOINT ERROR CODES
 
 LOGPOINT_ALREADY_EXIST = CodedError(
@@ -94,6 +114,10 @@ PUT_LOGPOINT_FAILED = CodedError(
     "Error occurred while putting logpoint to file {} on line {} from client {}: {}"
 )
 
+INVALID_LOGPOINT_COALESCE = CodedError(
+    3052,
+    "Invalid coalesce config for logpoint in file {} on line {} from client {}: {}")
+
 UPDATE_LOGPOINT_FAILED = CodedError(
     3100,
     "Error occurred while updating logpoint to file {} on line {} from client {}: {}")
@@ -3,6 +3,7 @@ from tracepointdebug.broker.event.base_event import BaseEvent
 
 class ErrorStackSnapshotEvent(BaseEvent):
     EVENT_NAME = "ErrorStackSnapshotEvent"
+    BULK = True
 
     def __init__(self, error_stack_id, file, line_no, method_name, error, frames):
         super(ErrorStackSnapshotEvent, self).__init__()
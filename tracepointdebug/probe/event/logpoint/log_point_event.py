@@ -3,6 +3,7 @@ from tracepointdebug.broker.event.base_event import BaseEvent
 
 class LogPointEvent(BaseEvent):
     EVENT_NAME = "LogPointEvent"
+    BULK = True
 
     def __init__(self, log_point_id, file, line_no, method_name, log_message, created_at):
         super(LogPointEvent, self).__init__()
@@ -12,6 +13,10 @@ class LogPointEvent(BaseEvent):
         self.method_name = method_name
         self.log_message = log_message
         self.created_at = created_at
+        # Set when repeated messages are coalesced into this event
+        self.count = 1
+        self.first_seen = None
+        self.last_seen = None
 
     def to_json(self):
         return {
@@ -29,5 +34,8 @@ class LogPointEvent(BaseEvent):
             "client": self.client,
             "time": self.time,
             "hostName": self.hostname,
-            "createdAt": self.created_at
+            "createdAt": self.created_at,
+            "count": self.count,
+            "firstSeen": self.first_seen,
+            "lastSeen": self.last_seen
         }
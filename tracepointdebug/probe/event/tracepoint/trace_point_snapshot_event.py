@@ -3,8 +3,10 @@ from tracepointdebug.broker.event.base_event import BaseEvent
 
 class TracePointSnapshotEvent(BaseEvent):
     EVENT_NAME = "TracePointSnapshotEvent"
+    BULK = True
 
-    def __init__(self, tracepoint_id, file, line_no, method_name, frames, trace_id=None, transaction_id=None, span_id=None):
+    def __init__(self, tracepoint_id, file, line_no, method_name, frames, trace_id=None, transaction_id=None, span_id=None,
+                 base_snapshot_id=None, truncated_by_time=False, blob=None):
         super(TracePointSnapshotEvent, self).__init__()
         self.tracepoint_id = tracepoint_id
         self.file = file
@@ -14,6 +16,9 @@ class TracePointSnapshotEvent(BaseEvent):
         self.trace_id = trace_id
         self.transaction_id = transaction_id
         self.span_id = span_id
+        self.base_snapshot_id = base_snapshot_id
+        self.truncated_by_time = truncated_by_time
+        self.blob = blob
 
     def to_json(self):
         return {
@@ -28,6 +33,9 @@ class TracePointSnapshotEvent(BaseEvent):
             "traceId": self.trace_id,
             "transactionId": self.transaction_id,
             "spanId": self.span_id,
+            "baseSnapshotId": self.base_snapshot_id,
+            "truncatedByTime": self.truncated_by_time,
+            "blob": self.blob,
             "sendAck": self.send_ack,
             "applicationInstanceId": self.application_instance_id,
             "applicationName": self.application_name,
@@ -1,9 +1,11 @@
 class Frame(object):
-    def __init__(self, line_no, variables, path, method_name):
+    def __init__(self, line_no, variables, path, method_name, collapsed_frames=0, watches=None):
         self.line_no = line_no
         self.variables = variables
         self.path = path
         self.method_name = method_name
+        self.collapsed_frames = collapsed_frames
+        self.watches = watches
 
     def __repr__(self):
         return str({
@@ -14,9 +16,14 @@ class Frame(object):
         })
 
     def to_json(self):
-        return {
+        frame = {
             "lineNo": self.line_no,
             "variables": self.variables,
             "fileName": self.path,
             "methodName": self.method_name
         }
+        if self.collapsed_frames:
+            frame["collapsedFrames"] = self.collapsed_frames
+        if self.watches is not None:
+            frame["watches"] = self.watches
+        return frame
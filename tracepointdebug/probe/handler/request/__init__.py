@@ -1,4 +1,5 @@
 from .tracePoint import *
 from .logPoint import *
 from .tag import *
-from .dynamicConfig import *
\ No newline at end of file
+from .dynamicConfig import *
+from .snapshot import *
@@ -0,0 +1 @@
+from .expand_snapshot_request_handler import ExpandSnapshotRequestHandler
@@ -0,0 +1,35 @@
+from tracepointdebug.application.application import Application
+from tracepointdebug.broker.handler.request.request_handler import RequestHandler
+from tracepointdebug.probe.request.snapshot.expand_snapshot_request import ExpandSnapshotRequest
+from tracepointdebug.probe.response.snapshot.expand_snapshot_response import ExpandSnapshotResponse
+from tracepointdebug.probe.snapshot.drill_down import expand_snapshot_value
+
+
+class ExpandSnapshotRequestHandler(RequestHandler):
+    REQUEST_NAME = "ExpandSnapshotRequest"
+
+    @staticmethod
+    def get_request_name():
+        return ExpandSnapshotRequestHandler.REQUEST_NAME
+
+    @staticmethod
+    def get_request_cls():
+        return ExpandSnapshotRequest
+
+    @staticmethod
+    def handle_request(request):
+        application_info = Application.get_application_info()
+        try:
+            value = expand_snapshot_value(request.get_snapshot_id(), request.get_handle(), request.get_path(),
+                                          request.get_depth())
+            return ExpandSnapshotResponse(request_id=request.get_id(), client=request.get_client(),
+                                          application_instance_id=application_info.get('applicationInstanceId'),
+                                          snapshot_id=request.get_snapshot_id(), handle=request.get_handle(),
+                                          path=request.get_path(), value=value)
+        except Exception as e:
+            response = ExpandSnapshotResponse(request_id=request.get_id(), client=request.get_client(),
+                                              application_instance_id=application_info.get('applicationInstanceId'),
+                                              erroneous=True, snapshot_id=request.get_snapshot_id(),
+                                              handle=request.get_handle(), path=request.get_path())
+            response.set_error(e)
+            return response
@@ -27,7 +27,8 @@ class PutTracePointRequestHandler(RequestHandler):
                                                 request.line_no,
                                                 request.get_client(), request.expire_secs,
                                                 request.expire_count, request.enable_tracing, request.condition,
-                                                request.tags)
+                                                request.tags, deferred_capture=request.deferred_capture,
+                                                capture_profile=request.capture_profile)
 
             trace_point_manager.publish_application_status()
             if request.get_client() is not None:
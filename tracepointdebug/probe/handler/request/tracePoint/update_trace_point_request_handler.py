@@ -24,7 +24,9 @@ class UpdateTracePointRequestHandler(RequestHandler):
             trace_point_manager.update_trace_point(request.trace_point_id,
                                                    request.get_client(), request.expire_secs,
                                                    request.expire_count, request.enable_tracing, request.condition,
-                                                   disable=request.disable, tags=request.tags)
+                                                   disable=request.disable, tags=request.tags,
+                                                   deferred_capture=request.deferred_capture,
+                                                   capture_profile=request.capture_profile)
 
             trace_point_manager.publish_application_status()
             if request.get_client() is not None:
@@ -23,7 +23,8 @@ def _applyLogPoint(log_point):
                                             log_point.get("fileHash", None), log_point.get("lineNo",None),
                                             client, log_point.get("expireDuration", None), log_point.get("expireCount", None),
                                             log_point.get("disabled", False), log_expression=log_expression, condition=condition,
-                                            log_level=log_level, stdout_enabled=stdout_enabled, tags=log_point.get("tags", set()))
+                                            log_level=log_level, stdout_enabled=stdout_enabled, tags=log_point.get("tags", set()),
+                                            coalesce=log_point.get("coalesce"))
         
         log_point_manager.publish_application_status()
         if client is not None:
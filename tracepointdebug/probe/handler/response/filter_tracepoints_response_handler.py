@@ -20,7 +20,9 @@ def _applyTracePoint(trace_point):
                                             trace_point.get("fileHash", None), trace_point.get("lineNo",None),
                                             client, trace_point.get("expireDuration", None), trace_point.get("expireCount", None),
                                             trace_point.get("disabled", None), condition = condition,
-                                            tags=trace_point.get("tags", set()))
+                                            tags=trace_point.get("tags", set()),
+                                            deferred_capture=bool(trace_point.get("deferredCapture", False)),
+                                            capture_profile=trace_point.get("captureProfile"))
         
         trace_point_manager.publish_application_status()
         if client is not None:
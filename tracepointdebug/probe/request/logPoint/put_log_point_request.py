@@ -20,6 +20,7 @@ class PutLogPointRequest(BaseRequest):
 
         self.log_level = request.get("logLevel", "INFO")
         self.stdout_enabled = request.get("stdoutEnabled", False)
+        self.coalesce = request.get("coalesce")
 
     def get_id(self):
         return self.id
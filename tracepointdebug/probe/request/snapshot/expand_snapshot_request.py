@@ -0,0 +1,32 @@
+from tracepointdebug.broker.request.base_request import BaseRequest
+
+
+class ExpandSnapshotRequest(BaseRequest):
+
+    def __init__(self, request):
+        super(ExpandSnapshotRequest, self).__init__(id=request.get("id"), client=request.get("client"))
+        self.snapshot_id = request.get("snapshotId")
+        self.handle = request.get("handle")
+        self.path = request.get("path") or []
+        self.depth = request.get("depth")
+
+    def get_id(self):
+        return self.id
+
+    def get_snapshot_id(self):
+        return self.snapshot_id
+
+    def get_handle(self):
+        return self.handle
+
+    def get_path(self):
+        return self.path
+
+    def get_depth(self):
+        return self.depth
+
+    def get_name(self):
+        return self.__class__.__name__
+
+    def get_client(self):
+        return self.client
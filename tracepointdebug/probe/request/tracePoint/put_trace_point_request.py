@@ -13,6 +13,8 @@ class PutTracePointRequest(BaseRequest):
         self.enable_tracing = request.get("enableTracing")
         self.condition = request.get("conditionExpression")
         self.tags = request.get("tags", set())
+        self.deferred_capture = bool(request.get("deferredCapture", False))
+        self.capture_profile = request.get("captureProfile")
         self.expire_secs = min(int(request.get("expireSecs", constants.TRACEPOINT_DEFAULT_EXPIRY_SECS)),
                                constants.TRACEPOINT_MAX_EXPIRY_SECS)
         self.expire_count = min(int(request.get("expireCount", constants.TRACEPOINT_DEFAULT_EXPIRY_COUNT)),
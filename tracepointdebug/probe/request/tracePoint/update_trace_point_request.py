@@ -11,6 +11,8 @@ class UpdateTracePointRequest(BaseRequest):
         self.condition = request.get("conditionExpression")
         self.disable = request.get("disable")
         self.tags = request.get("tags", set())
+        self.deferred_capture = bool(request.get("deferredCapture", False))
+        self.capture_profile = request.get("captureProfile")
         self.expire_secs = min(int(request.get("expireSecs", constants.TRACEPOINT_DEFAULT_EXPIRY_SECS)),
                                constants.TRACEPOINT_MAX_EXPIRY_SECS)
         self.expire_count = min(int(request.get("expireCount", constants.TRACEPOINT_DEFAULT_EXPIRY_COUNT)),
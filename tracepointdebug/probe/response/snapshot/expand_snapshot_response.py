@@ -0,0 +1,23 @@
+from tracepointdebug.broker.response.base_response import BaseResponse
+
+
+class ExpandSnapshotResponse(BaseResponse):
+
+    def __init__(self, request_id=None, client=None, application_instance_id=None, erroneous=False, error_code=None,
+                 error_type=None, error_message=None, snapshot_id=None, handle=None, path=None, value=None):
+        super(ExpandSnapshotResponse, self).__init__(request_id, client, application_instance_id, erroneous,
+                                                     error_code, error_type, error_message)
+        self.snapshot_id = snapshot_id
+        self.handle = handle
+        self.path = path
+        self.value = value
+
+    def to_json(self):
+        response = super(ExpandSnapshotResponse, self).to_json()
+        response.update({
+            "snapshotId": self.snapshot_id,
+            "handle": self.handle,
+            "path": self.path,
+            "value": self.value
+        })
+        return response
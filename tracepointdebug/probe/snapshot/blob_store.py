@@ -0,0 +1,218 @@
+"""
+Local store for snapshots too large to send inline.
+
+Snapshots whose captured size reaches the ``blobThreshold`` snapshot config key are
+encoded into a size capped ring file on local disk, memory mapped by the agent. Their
+event only carries the frames without variables plus a blob reference, and the blob
+is streamed by ``GET /blobs/<id>`` when someone asks for it.
+
+Blobs are written one after another and never split. When the next blob does not fit
+before the end of the file, writing wraps to its start. Blobs a write overlaps, and the
+ones it skips at the end of the file, are evicted, so the oldest blobs always go first.
+The file is created on the first large snapshot, readable by the agent's user only, in
+a private temporary directory unless ``DEBUGIN_BLOB_STORE_PATH`` is set. It is removed
+when the store is closed or the process exits.
+"""
+
+import atexit
+import logging
+import mmap
+import os
+import stat
+import tempfile
+import zlib
+from collections import OrderedDict
+from threading import Lock
+
+from tracepointdebug.application import utils
+from tracepointdebug.probe.encoder import to_json, to_plain
+
+# None for a file in a private directory created by tempfile.mkdtemp
+BLOB_STORE_PATH = utils.get_from_environment_variables("DEBUGIN_BLOB_STORE_PATH", None, str)
+BLOB_STORE_SIZE = utils.get_from_environment_variables("DEBUGIN_BLOB_STORE_SIZE", 64 * 1024 * 1024, int)
+
+BLOB_CHUNK_SIZE = 64 * 1024
+
+_OPEN_FLAGS = os.O_RDWR | os.O_CREAT | os.O_EXCL | getattr(os, "O_NOFOLLOW", 0) | getattr(os, "O_BINARY", 0)
+
+logger = logging.getLogger(__name__)
+
+
+class BlobRef(object):
+    """Where a blob was written: its id, offset and length in the ring file and its CRC-32."""
+
+    def __init__(self, blob_id, offset, length, checksum):
+        self.blob_id = blob_id
+        self.offset = offset
+        self.length = length
+        self.checksum = checksum
+
+    def to_json(self):
+        return {
+            "id": self.blob_id,
+            "offset": self.offset,
+            "length": self.length,
+            "checksum": "crc32:%08x" % self.checksum
+        }
+
+
+def offload_frames(frames, store=None):
+    """
+    Writes the encoded frames to the blob store. Returns the frames without their variables and
+    watches, with the BlobRef of the full ones, or frames itself and None when they do not fit.
+    """
+    store = SnapshotBlobStore.instance() if store is None else store
+    ref = store.put(to_json(frames, separators=(",", ":")).encode("utf-8"))
+    if ref is None:
+        return frames, None
+    summary = []
+    for frame in to_plain(frames):
+        frame = {key: value for key, value in frame.items() if key != "watches"}
+        frame["variables"] = {}
+        summary.append(frame)
+    return summary, ref
+
+
+class SnapshotBlobStore(object):
+    __instance = None
+
+    def __init__(self, path=BLOB_STORE_PATH, capacity=BLOB_STORE_SIZE):
+        self.path = path
+        self.capacity = capacity
+        self._lock = Lock()
+        self._mmap = None
+        # The ring file while it is mapped, and the private directory holding it when no path was given
+        self._file_path = None
+        self._directory = None
+        self._position = 0
+        self._next_id = 1
+        # blob id -> BlobRef, oldest first
+        self._blobs = OrderedDict()
+        self.evicted = 0
+
+    @staticmethod
+    def instance():
+        if SnapshotBlobStore.__instance is None:
+            SnapshotBlobStore.__instance = SnapshotBlobStore()
+        return SnapshotBlobStore.__instance
+
+    def put(self, data):
+        """
+        Writes data to the ring and returns its BlobRef, None when it is larger than the whole ring
+        or the ring file cannot be created.
+        """
+        length = len(data)
+        if length == 0 or length > self.capacity:
+            return None
+        checksum = zlib.crc32(data) & 0xffffffff
+        with self._lock:
+            if self._mmap is None:
+                try:
+                    self._open()
+                except (OSError, ValueError) as e:
+                    logger.error("Unable to create the snapshot blob store: %s", e)
+                    return None
+            if self._position + length > self.capacity:
+                self._evict(self._position, self.capacity)
+                self._position = 0
+            offset = self._position
+            self._evict(offset, offset + length)
+            self._mmap[offset:offset + length] = data
+            self._position = offset + length
+            ref = BlobRef(self._next_id, offset, length, checksum)
+            self._next_id += 1
+            self._blobs[ref.blob_id] = ref
+            return ref
+
+    def get(self, blob_id):
+        """Returns a copy of the blob, None when it has been evicted or never existed."""
+        with self._lock:
+            ref = self._blobs.get(blob_id)
+            if ref is None:
+                return None
+            data = self._mmap[ref.offset:ref.offset + ref.length]
+        if zlib.crc32(data) & 0xffffffff != ref.checksum:
+            return None
+        return data
+
+    def iter_chunks(self, data, chunk_size=BLOB_CHUNK_SIZE):
+        for start in range(0, len(data), chunk_size):
+            yield data[start:start + chunk_size]
+
+    def get_stats(self):
+        with self._lock:
+            return {
+                "capacityBytes": self.capacity,
+                "blobs": len(self._blobs),
+                "storedBytes": sum(ref.length for ref in self._blobs.values()),
+                "evicted": self.evicted
+            }
+
+    def close(self):
+        """Unmaps and removes the ring file, a later put creates a new one."""
+        with self._lock:
+            if self._mmap is not None:
+                self._mmap.close()
+                self._mmap = None
+                self._remove_file()
+                atexit.unregister(self.close)
+            self._blobs.clear()
+            self._position = 0
+
+    def _open(self):
+        path = self.path
+        if path is None:
+            self._directory = tempfile.mkdtemp(prefix="tracepointdebug-blobs-")
+            path = os.path.join(self._directory, "snapshots.blobs")
+        try:
+            fd = self._create(path)
+        except OSError:
+            self._remove_file()
+            raise
+        self._file_path = path
+        try:
+            os.ftruncate(fd, self.capacity)
+            self._mmap = mmap.mmap(fd, self.capacity)
+        except Exception:
+            self._remove_file()
+            raise
+        finally:
+            os.close(fd)
+        atexit.register(self.close)
+
+    @staticmethod
+    def _create(path):
+        """
+        Creates the file with no access for others. It is never opened through a symlink or left
+        by another user; a regular file of ours, left by a process that did not exit cleanly, is replaced.
+        """
+        try:
+            return os.open(path, _OPEN_FLAGS, 0o600)
+        except FileExistsError:
+            st = os.lstat(path)
+            if not stat.S_ISREG(st.st_mode) or st.st_uid != os.geteuid():
+                raise OSError("refusing to use %s, it is not a regular file owned by this user" % path)
+            os.unlink(path)
+            return os.open(path, _OPEN_FLAGS, 0o600)
+
+    def _remove_file(self):
+        if self._file_path is not None:
+            try:
+                os.unlink(self._file_path)
+            except OSError:
+                pass
+            self._file_path = None
+        if self._directory is not None:
+            try:
+                os.rmdir(self._directory)
+            except OSError:
+                pass
+            self._directory = None
+
+    def _evict(self, start, end):
+        while self._blobs:
+            ref = next(iter(self._blobs.values()))
+            if ref.offset >= end or ref.offset + ref.length <= start:
+                break
+            del self._blobs[ref.blob_id]
+            self.evicted += 1
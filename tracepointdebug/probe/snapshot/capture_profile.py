@@ -0,0 +1,149 @@
+"""
+Per probe capture profiles.
+
+A profile overrides the global snapshot limits for one tracepoint, restricts the
+captured locals to an allowlist of names and adds watch expressions evaluated on
+the top frame. Limits the profile leaves out fall back to the global config.
+Watch expressions are parsed and compiled once, when the profile is created.
+"""
+
+import ast
+
+from .snapshot_collector_config_manager import SnapshotCollectorConfigManager, MAX_SNAPSHOT_CONFIGS
+
+_ALLOWED_NODES = (ast.Expression, ast.Name, ast.Load, ast.Attribute, ast.Subscript, ast.Constant, ast.Tuple,
+                  ast.Compare, ast.BoolOp, ast.UnaryOp, ast.And, ast.Or, ast.Not, ast.USub,
+                  ast.Eq, ast.NotEq, ast.Lt, ast.LtE, ast.Gt, ast.GtE, ast.Is, ast.IsNot, ast.In, ast.NotIn)
+if hasattr(ast, "Index"):
+    # Subscript slices are wrapped in Index nodes before Python 3.9
+    _ALLOWED_NODES += (ast.Index,)
+
+# Limit name -> (profile key, maximum or None)
+_LIMITS = {
+    "max_frames": ("maxFrames", MAX_SNAPSHOT_CONFIGS.MAX_FRAMES),
+    "max_expand_frames": ("maxExpandFrames", MAX_SNAPSHOT_CONFIGS.MAX_EXPAND_FRAMES),
+    "parse_depth": ("maxParseDepth", MAX_SNAPSHOT_CONFIGS.MAX_PARSE_DEPTH),
+    "max_properties": ("maxProperties", MAX_SNAPSHOT_CONFIGS.MAX_PROPERTIES),
+    "max_size": ("maxSize", None),
+    "capture_deadline_ms": ("captureDeadlineMs", None),
+    "drill_down_depth": ("drillDownDepth", MAX_SNAPSHOT_CONFIGS.MAX_PARSE_DEPTH),
+}
+
+
+class WatchExpression(object):
+    """
+    A watch expression compiled for evaluation against a frame.
+
+    Only names, attribute access, subscripts, constants, comparisons and boolean
+    operators are accepted. Calls and attributes starting with an underscore are
+    rejected, so evaluating a watch cannot run arbitrary code of the agent's choosing.
+    """
+
+    def __init__(self, expression):
+        self.expression = expression
+        try:
+            tree = ast.parse(expression.strip(), mode="eval")
+        except SyntaxError as e:
+            raise ValueError("invalid watch expression '{}': {}".format(expression, e.msg))
+        names = []
+        identifiers = []
+        for node in ast.walk(tree):
+            if not isinstance(node, _ALLOWED_NODES):
+                raise ValueError("watch expression '{}' uses unsupported syntax: {}".format(
+                    expression, type(node).__name__))
+            if isinstance(node, ast.Attribute) and node.attr.startswith("_"):
+                raise ValueError("watch expression '{}' accesses private attribute '{}'".format(expression, node.attr))
+            if isinstance(node, ast.Name) and node.id not in names:
+                names.append(node.id)
+            if isinstance(node, ast.Name):
+                identifiers.append(node.id)
+            elif isinstance(node, ast.Attribute):
+                identifiers.append(node.attr)
+            elif isinstance(node, ast.Constant) and isinstance(node.value, str):
+                identifiers.append(node.value)
+        self.names = tuple(names)
+        # Every name, attribute and string key the expression reads, checked against redaction rules
+        self.identifiers = tuple(identifiers)
+        self._code = compile(tree, "<watch>", "eval")
+
+    def evaluate(self, frame):
+        return eval(self._code, frame.f_globals, frame.f_locals)
+
+
+class CaptureProfile(object):
+
+    def __init__(self, max_frames=None, max_expand_frames=None, parse_depth=None, max_properties=None, max_size=None,
+                 variables=None, watch_expressions=None, capture_deadline_ms=None, drill_down_depth=None):
+        self.max_frames = max_frames
+        self.max_expand_frames = max_expand_frames
+        self.parse_depth = parse_depth
+        self.max_properties = max_properties
+        self.max_size = max_size
+        self.capture_deadline_ms = capture_deadline_ms
+        self.drill_down_depth = drill_down_depth
+        self.variables = tuple(variables) if variables is not None else None
+        self.watches = [WatchExpression(expression) for expression in watch_expressions or ()]
+        # Locals a capture needs from the top frame, when the profile restricts them
+        self.watch_names = tuple(name for watch in self.watches for name in watch.names)
+
+    @staticmethod
+    def from_json(profile):
+        """Builds a profile from its ``captureProfile`` JSON form. Raises ValueError when it is invalid."""
+        if profile is None:
+            return None
+        if not isinstance(profile, dict):
+            raise ValueError("capture profile must be an object")
+        limits = {}
+        for name, (key, maximum) in _LIMITS.items():
+            value = profile.get(key)
+            if value is None:
+                continue
+            if isinstance(value, bool) or not isinstance(value, int) or value < 0:
+                raise ValueError("{} must be a non negative integer".format(key))
+            limits[name] = min(value, maximum) if maximum is not None else value
+        variables = profile.get("variables")
+        if variables is not None and (not isinstance(variables, list)
+                                      or not all(isinstance(name, str) for name in variables)):
+            raise ValueError("variables must be a list of names")
+        watch_expressions = profile.get("watchExpressions")
+        if watch_expressions is not None and (not isinstance(watch_expressions, list)
+                                              or not all(isinstance(e, str) for e in watch_expressions)):
+            raise ValueError("watchExpressions must be a list of expressions")
+        return CaptureProfile(variables=variables, watch_expressions=watch_expressions, **limits)
+
+    def to_json(self):
+        profile = {key: getattr(self, name) for name, (key, _) in _LIMITS.items() if getattr(self, name) is not None}
+        if self.variables is not None:
+            profile["variables"] = list(self.variables)
+        if self.watches:
+            profile["watchExpressions"] = [watch.expression for watch in self.watches]
+        return profile
+
+    def get_max_frames(self):
+        return SnapshotCollectorConfigManager.get_max_frames() if self.max_frames is None else self.max_frames
+
+    def get_max_expand_frames(self):
+        if self.max_expand_frames is None:
+            return SnapshotCollectorConfigManager.get_max_expand_frames()
+        return self.max_expand_frames
+
+    def get_parse_depth(self):
+        return SnapshotCollectorConfigManager.get_parse_depth() if self.parse_depth is None else self.parse_depth
+
+    def get_max_properties(self):
+        if self.max_properties is None:
+            return SnapshotCollectorConfigManager.get_max_properties()
+        return self.max_properties
+
+    def get_max_size(self):
+        return SnapshotCollectorConfigManager.get_max_size() if self.max_size is None else self.max_size
+
+    def get_capture_deadline_ms(self):
+        if self.capture_deadline_ms is None:
+            return SnapshotCollectorConfigManager.get_capture_deadline_ms()
+        return self.capture_deadline_ms
+
+    def get_drill_down_depth(self):
+        if self.drill_down_depth is None:
+            return SnapshotCollectorConfigManager.get_drill_down_depth()
+        return self.drill_down_depth
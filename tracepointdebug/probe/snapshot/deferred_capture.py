@@ -0,0 +1,88 @@
+"""
+Deferred snapshot capture.
+
+The application thread only takes a bounded shallow copy of the frames a snapshot
+needs: immutable values are kept by reference and builtin containers are copied
+one level down. Walking, redaction and encoding of that copy then run on an agent
+worker thread.
+
+Consistency caveat: objects below the first container level (and every other
+object) are shared with the application, so the worker sees them as they are
+when it serializes them, which may be after the application changed them.
+"""
+
+import itertools
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+
+from .snapshot_collector import FRAME_EXPANDED
+
+logger = logging.getLogger(__name__)
+
+# Containers are copied up to this many items; longer ones are cut
+MAX_COPIED_ITEMS = 1000
+
+_executor = None
+_executor_lock = Lock()
+
+
+class CapturedFrame(object):
+    """Stand in for a frame object, holding a copy of its locals, that SnapshotCollector can walk."""
+    __slots__ = ('f_code', 'f_lineno', 'f_locals', 'f_globals', 'f_back')
+
+    def __init__(self, f_code, f_lineno, f_locals, f_globals=None):
+        self.f_code = f_code
+        self.f_lineno = f_lineno
+        self.f_locals = f_locals
+        # Module globals are shared, watch expressions read them when the snapshot is collected
+        self.f_globals = f_globals if f_globals is not None else {}
+        self.f_back = None
+
+
+def copy_frames(collector, top_frame):
+    """Copies the frames collector would capture from top_frame, returning the top CapturedFrame."""
+    captured_top = previous = None
+    profile = collector.profile
+    for frame, metadata, kind in collector.iter_frames(top_frame):
+        frame_locals = {}
+        if kind == FRAME_EXPANDED:
+            frame_locals = {name: shallow_copy(value) for name, value in collector.iter_frame_locals(frame)}
+        if frame is top_frame and profile is not None and profile.watch_names and collector.collect_variables:
+            # Watch expressions may read locals the allowlist leaves out
+            all_locals = frame.f_locals
+            for name in profile.watch_names:
+                if name not in frame_locals and name in all_locals:
+                    frame_locals[name] = shallow_copy(all_locals[name])
+        captured = CapturedFrame(frame.f_code, frame.f_lineno, frame_locals, frame.f_globals)
+        if previous is None:
+            captured_top = captured
+        else:
+            previous.f_back = captured
+        previous = captured
+    return captured_top
+
+
+def shallow_copy(value):
+    value_type = type(value)
+    if value_type is dict:
+        if len(value) > MAX_COPIED_ITEMS:
+            return dict(itertools.islice(value.items(), MAX_COPIED_ITEMS))
+        return value.copy()
+    if value_type is list:
+        return value[:MAX_COPIED_ITEMS]
+    if value_type is set:
+        if len(value) > MAX_COPIED_ITEMS:
+            return set(itertools.islice(value, MAX_COPIED_ITEMS))
+        return value.copy()
+    # Immutable values are safe to share, other objects are shared by design
+    return value
+
+
+def submit(fn, *args):
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="tracepointdebug-capture")
+    return _executor.submit(fn, *args)
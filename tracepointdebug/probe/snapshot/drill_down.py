@@ -0,0 +1,175 @@
+"""
+Drill-down snapshots.
+
+In drill-down mode a hit captures only the first levels of each value. Objects
+below that level are sent as an ``@handle`` and kept in a bounded, time limited
+cache keyed by snapshot id and handle, so a later ExpandSnapshotRequest (or
+``POST /snapshots/<id>/expand``) can serialize them on demand.
+
+Objects are held by weak reference. Builtin containers cannot be, so they are
+reached from their nearest weakly referenceable owner through a path of keys.
+Only containers without any such owner (e.g. a dict local holding dicts) are
+held strongly, until their cache entry expires. A value reached through a path
+must still be the object that was captured: when its owner has since replaced it
+(``order.lines = [...]``), expanding it fails as collected rather than showing
+the new value under the old handle.
+"""
+
+import itertools
+import weakref
+from threading import Lock
+
+from cachetools import TTLCache
+
+from tracepointdebug.probe.coded_exception import CodedException
+from tracepointdebug.probe.errors import SNAPSHOT_HANDLE_NOT_FOUND, SNAPSHOT_OBJECT_COLLECTED, SNAPSHOT_PATH_NOT_FOUND
+from .snapshot_collector_config_manager import SnapshotCollectorConfigManager, MAX_SNAPSHOT_CONFIGS
+from .type_serializers import get_type_serializer
+
+DRILL_DOWN_CACHE_SIZE = 10000
+DRILL_DOWN_CACHE_TTL_SECS = 300
+
+_handle_ids = itertools.count(1)
+
+
+class DrillDownRef(object):
+    """
+    How to get back to one unexpanded object: an owner, held weakly if possible, and a path below it.
+    target, the captured object, is remembered by id() for paths, so that resolving to another object
+    found at the same place is detected. Objects rebuilt on every read (values converted by a type
+    serializer) are given without a target.
+    """
+    __slots__ = ('_owner', '_weak', 'path', 'type_name', '_target_id')
+
+    def __init__(self, owner, path, type_name, target=None):
+        try:
+            self._owner = weakref.ref(owner)
+            self._weak = True
+        except TypeError:
+            self._owner = owner
+            self._weak = False
+        self.path = tuple(path)
+        self.type_name = type_name
+        # The owner keeps the target alive while it still holds it, so its id cannot be reused meanwhile
+        self._target_id = id(target) if target is not None and self.path else None
+
+    def resolve(self):
+        """Returns the object, raising LookupError when it is gone or no longer where it was captured."""
+        owner = self._owner() if self._weak else self._owner
+        if owner is None:
+            raise LookupError("collected")
+        value = resolve_path(owner, self.path)
+        if self._target_id is not None and (id(value) != self._target_id or type(value).__name__ != self.type_name):
+            raise LookupError("replaced")
+        return value
+
+
+def new_handle():
+    return next(_handle_ids)
+
+
+def weakly_referenceable(value):
+    try:
+        weakref.ref(value)
+        return True
+    except TypeError:
+        return False
+
+
+def resolve_path(value, path):
+    for key in path:
+        value = resolve_child(value, key)
+    return value
+
+
+def resolve_child(value, key):
+    """Child of value under key, as named in snapshots: dict keys and field names as strings, item indices."""
+    serializer = get_type_serializer(type(value))
+    if serializer is not None and serializer.fn is not None:
+        value = serializer.fn(value)
+        serializer = get_type_serializer(type(value))
+    if serializer is not None and serializer.summarizer is None:
+        for name, field in serializer.iter_fields(value):
+            if str(name) == key:
+                return field
+        raise KeyError(key)
+    if isinstance(value, dict):
+        if key in value:
+            return value[key]
+        for name, item in value.items():
+            if str(name) == key:
+                return item
+        raise KeyError(key)
+    if isinstance(value, (list, tuple)):
+        return value[int(key)]
+    if isinstance(value, (set, frozenset)):
+        return next(itertools.islice(value, int(key), None))
+    if hasattr(value, '__dict__'):
+        return value.__dict__[key]
+    raise KeyError(key)
+
+
+class DrillDownCache(object):
+    __instance = None
+
+    def __init__(self, maxsize=DRILL_DOWN_CACHE_SIZE, ttl=DRILL_DOWN_CACHE_TTL_SECS):
+        self._lock = Lock()
+        self._refs = TTLCache(maxsize=maxsize, ttl=ttl)
+
+    @staticmethod
+    def instance():
+        if DrillDownCache.__instance is None:
+            DrillDownCache.__instance = DrillDownCache()
+        return DrillDownCache.__instance
+
+    def store(self, snapshot_id, refs):
+        """Keeps the ``handle -> DrillDownRef`` items of refs for snapshot_id."""
+        with self._lock:
+            for handle, ref in refs.items():
+                self._refs[(snapshot_id, handle)] = ref
+
+    def get(self, snapshot_id, handle, path=()):
+        """
+        Returns the object behind handle of snapshot_id, or below it when path is given.
+        Raises CodedException when the handle expired or the object has been collected.
+        """
+        with self._lock:
+            ref = self._refs.get((snapshot_id, handle))
+        if ref is None:
+            raise CodedException(SNAPSHOT_HANDLE_NOT_FOUND, (handle, snapshot_id))
+        try:
+            value = ref.resolve()
+        except Exception:
+            # Either collected itself, or its owner is alive but no longer holds it where it was
+            raise CodedException(SNAPSHOT_OBJECT_COLLECTED, (handle, snapshot_id))
+        try:
+            return resolve_path(value, path)
+        except Exception as e:
+            raise CodedException(SNAPSHOT_PATH_NOT_FOUND, ("/".join(str(key) for key in path), handle, snapshot_id,
+                                                           "{}: {}".format(type(e).__name__, e)))
+
+    def __len__(self):
+        with self._lock:
+            return len(self._refs)
+
+
+def expand_snapshot_value(snapshot_id, handle, path=(), depth=None):
+    """
+    Serializes the unexpanded value behind handle of snapshot_id, or the value below it at path,
+    ``depth`` levels deep. Values below that get handles of their own in the same snapshot.
+    Raises CodedException when the value cannot be reached any more.
+    """
+    # Imported here, the collector itself imports this module for its references
+    from .snapshot_collector import SnapshotCollector
+
+    if depth is None:
+        depth = SnapshotCollectorConfigManager.get_drill_down_depth() or 1
+    depth = min(max(1, depth), MAX_SNAPSHOT_CONFIGS.MAX_PARSE_DEPTH)
+    cache = DrillDownCache.instance()
+    value = cache.get(snapshot_id, handle, path)
+    collector = SnapshotCollector(parse_depth=depth, drill_down_depth=depth)
+    if collector.redaction is not None and any(collector.redaction.matches_name(key) for key in path):
+        return collector.redacted_value(value)
+    result = collector.collect_value(value)
+    cache.store(snapshot_id, collector.drill_down_refs)
+    return result
@@ -0,0 +1,88 @@
+"""
+Per code object metadata used while walking the frames of a snapshot.
+
+Path normalization loops over ``sys.path`` for every frame, so the result is cached
+per code object together with the method names and the library/app classification.
+Entries go away with their code object and the whole cache is dropped when
+``sys.path`` changes.
+"""
+
+import os
+import sys
+import sysconfig
+import weakref
+
+FRAME_CATEGORY_APP = "app"
+FRAME_CATEGORY_LIBRARY = "library"
+FRAME_CATEGORY_STDLIB = "stdlib"
+FRAME_CATEGORY_AGENT = "agent"
+
+_AGENT_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), '')
+_LIBRARY_DIR_NAMES = (os.sep + 'site-packages' + os.sep, os.sep + 'dist-packages' + os.sep)
+_STDLIB_DIRS = tuple(set(os.path.join(os.path.normpath(path), '')
+                         for path in (sysconfig.get_paths().get(name) for name in ('stdlib', 'platstdlib'))
+                         if path))
+
+_metadata_cache = {}
+_cached_sys_path = list(sys.path)
+
+
+class FrameMetadata(object):
+    __slots__ = ('path', 'method_name', 'qualified_name', 'category')
+
+    def __init__(self, code):
+        self.path = normalize_path(code.co_filename)
+        self.method_name = code.co_name
+        self.qualified_name = getattr(code, 'co_qualname', code.co_name)
+        self.category = classify_path(code.co_filename)
+
+    @property
+    def is_library(self):
+        return self.category != FRAME_CATEGORY_APP
+
+
+def get_frame_metadata(code):
+    key = id(code)
+    entry = _metadata_cache.get(key)
+    if entry is not None and entry[0]() is code:
+        return entry[1]
+    metadata = FrameMetadata(code)
+    _metadata_cache[key] = (weakref.ref(code, lambda _, key=key: _metadata_cache.pop(key, None)), metadata)
+    return metadata
+
+
+def check_sys_path():
+    """Drops the cached metadata if sys.path changed since it was computed."""
+    global _cached_sys_path
+    if sys.path != _cached_sys_path:
+        _cached_sys_path = list(sys.path)
+        _metadata_cache.clear()
+
+
+def classify_path(path):
+    if path.startswith('<'):
+        # <frozen importlib._bootstrap>, <string>, ...
+        return FRAME_CATEGORY_STDLIB if path.startswith('<frozen') else FRAME_CATEGORY_APP
+    path = os.path.normpath(os.path.abspath(path))
+    if path.startswith(_AGENT_DIR):
+        return FRAME_CATEGORY_AGENT
+    if any(name in path for name in _LIBRARY_DIR_NAMES):
+        return FRAME_CATEGORY_LIBRARY
+    if path.startswith(_STDLIB_DIRS):
+        return FRAME_CATEGORY_STDLIB
+    return FRAME_CATEGORY_APP
+
+
+def normalize_path(path):
+    path = os.path.normpath(path)
+
+    for sys_path in sys.path:
+        if not sys_path:
+            continue
+
+        sys_path = os.path.join(sys_path, '')
+
+        if path.startswith(sys_path):
+            return path[len(sys_path):]
+
+    return path
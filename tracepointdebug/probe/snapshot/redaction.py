@@ -0,0 +1,239 @@
+"""
+Declarative redaction rules applied while snapshots are captured.
+
+Rules are made of variable, key and attribute name patterns (globs, case insensitive),
+type names and value regexes. They are compiled once into combined matchers, and
+SnapshotCollector consults them before it descends into a value, so redacted
+subtrees are never walked or encoded:
+
+- a name or type match replaces the whole value with the mask
+- a value regex match replaces the matching parts of a string with the mask
+
+Names are matched at every level: variables, dict keys and object attributes.
+Logpoints hand their template views of the variables it reads, which mask matching
+keys and attributes as the template looks them up (``{{user.password}}``), and
+apply the value regexes to the rendered message. The redaction callbacks passed to
+``tracepointdebug.start`` still run afterwards, on the already redacted data.
+"""
+
+import fnmatch
+import re
+from threading import Lock
+
+import six
+
+DEFAULT_MASK = "***REDACTED***"
+
+# Value patterns that can be referred to by name in the ``values`` rule list
+BUILTIN_VALUE_PATTERNS = {
+    "cardNumber": r"\b(?:\d[ -]?){12,18}\d\b",
+    "bearerToken": r"(?i:\bbearer\s+)[A-Za-z0-9\-._~+/]+=*",
+}
+
+# Characters past the captured length of a string that are still scanned, so a
+# secret cut by the length limit is not partly shown
+_VALUE_SCAN_MARGIN = 64
+
+_rules = None
+_rules_lock = Lock()
+
+
+class RedactionRules(object):
+
+    def __init__(self, names=(), types=(), values=(), mask=DEFAULT_MASK):
+        self.mask = mask
+        self._name_pattern = _combine([fnmatch.translate(name.lower()) for name in names])
+        self._value_pattern = _combine([BUILTIN_VALUE_PATTERNS.get(value, value) for value in values])
+        self._type_names = frozenset(types)
+        # type -> bool, filled as types are seen
+        self._type_matches = {}
+
+    @staticmethod
+    def from_json(rules):
+        """Compiles rules from their declarative form. Raises ValueError when they are invalid."""
+        if rules is None:
+            return None
+        if not isinstance(rules, dict):
+            raise ValueError("redaction rules must be an object")
+        lists = {}
+        for key in ("names", "types", "values"):
+            value = rules.get(key) or []
+            if not isinstance(value, (list, tuple)) or not all(isinstance(item, six.string_types) for item in value):
+                raise ValueError("{} must be a list of strings".format(key))
+            lists[key] = value
+        mask = rules.get("mask", DEFAULT_MASK)
+        if not isinstance(mask, six.string_types):
+            raise ValueError("mask must be a string")
+        try:
+            return RedactionRules(mask=mask, **lists)
+        except re.error as e:
+            raise ValueError("invalid redaction pattern: {}".format(e))
+
+    def matches_name(self, name):
+        return self._name_pattern is not None and self._name_pattern.match(str(name).lower()) is not None
+
+    def matches_type(self, value):
+        if not self._type_names:
+            return False
+        value_type = type(value)
+        matched = self._type_matches.get(value_type)
+        if matched is None:
+            matched = value_type.__name__ in self._type_names or \
+                      "{}.{}".format(value_type.__module__, value_type.__qualname__) in self._type_names
+            self._type_matches[value_type] = matched
+        return matched
+
+    def redact_text(self, text, max_len=None):
+        """Returns text with the parts matching a value pattern masked, or text itself when nothing matches."""
+        if self._value_pattern is None:
+            return text
+        if max_len is not None and len(text) > max_len + _VALUE_SCAN_MARGIN:
+            text = text[:max_len + _VALUE_SCAN_MARGIN]
+        if self._value_pattern.search(text) is None:
+            return text
+        return self._value_pattern.sub(self.mask, text)
+
+    def redact_variables(self, variables):
+        """
+        Returns a copy of a name -> value dict with the values of matching names and types masked.
+        Dicts, sequences and objects are wrapped in views applying the rules to what is read below them.
+        """
+        return {name: self.mask if self.matches_name(name) else self.redact_value(value)
+                for name, value in six.viewitems(variables)}
+
+    def redact_value(self, value):
+        """value with the rules applied, a view of it when it is a container or an object."""
+        if self.matches_type(value):
+            return self.mask
+        if isinstance(value, six.string_types):
+            return self.redact_text(value)
+        if self._name_pattern is None and not self._type_names:
+            return value
+        if isinstance(value, dict):
+            return _RedactedMapping(value, self)
+        if isinstance(value, (list, tuple, set, frozenset)):
+            return _RedactedSequence(value, self)
+        if type(value).__module__ == _BUILTIN_MODULE or callable(value):
+            return value
+        return _RedactedObject(value, self)
+
+
+_BUILTIN_MODULE = type(0).__module__
+
+
+class _RedactedMapping(dict):
+    """
+    A dict as templates read it, with the values of matching keys masked. It holds no items of its
+    own, so wrapping a large dict copies nothing; lookups go to the wrapped dict.
+    """
+
+    def __init__(self, wrapped, rules):
+        super(_RedactedMapping, self).__init__()
+        self._wrapped = wrapped
+        self._rules = rules
+
+    def __contains__(self, key):
+        return key in self._wrapped
+
+    def __getitem__(self, key):
+        value = self._wrapped[key]
+        return self._rules.mask if self._rules.matches_name(key) else self._rules.redact_value(value)
+
+    def get(self, key, default=None):
+        return self[key] if key in self._wrapped else default
+
+    def __iter__(self):
+        return iter(self._wrapped)
+
+    def __len__(self):
+        return len(self._wrapped)
+
+    def keys(self):
+        return self._wrapped.keys()
+
+    def items(self):
+        return [(key, self[key]) for key in self._wrapped]
+
+    def values(self):
+        return [self[key] for key in self._wrapped]
+
+    def __repr__(self):
+        return repr(dict(self.items()))
+
+    __str__ = __repr__
+
+
+class _RedactedSequence(object):
+    """A list, tuple or set as templates iterate it, with the rules applied to its items."""
+
+    def __init__(self, wrapped, rules):
+        self._wrapped = wrapped
+        self._rules = rules
+
+    def __iter__(self):
+        return (self._rules.redact_value(item) for item in self._wrapped)
+
+    def __len__(self):
+        return len(self._wrapped)
+
+    def __getitem__(self, index):
+        return self._rules.redact_value(self._wrapped[index])
+
+    def __repr__(self):
+        return repr(list(self))
+
+    __str__ = __repr__
+
+
+class _RedactedObject(object):
+    """An object as templates read it, with the values of matching attributes masked."""
+
+    def __init__(self, wrapped, rules):
+        object.__setattr__(self, "_wrapped", wrapped)
+        object.__setattr__(self, "_rules", rules)
+
+    def __getattr__(self, name):
+        rules = self._rules
+        if rules.matches_name(name):
+            return rules.mask
+        value = getattr(self._wrapped, name)
+        if callable(value) and not isinstance(value, type):
+            # Templates call methods they look up, the result is redacted in turn
+            return lambda: rules.redact_value(value())
+        return rules.redact_value(value)
+
+    def __str__(self):
+        return self._rules.redact_text(str(self._wrapped))
+
+    def __repr__(self):
+        return self._rules.redact_text(repr(self._wrapped))
+
+
+def _combine(patterns):
+    if not patterns:
+        return None
+    return re.compile("|".join("(?:{})".format(pattern) for pattern in patterns))
+
+
+def set_redaction_rules(rules):
+    """
+    Replaces the redaction rules with rules, given in their declarative form::
+
+        set_redaction_rules({
+            "names": ["*password*", "*secret*", "authorization"],
+            "types": ["myapp.auth.Credentials"],
+            "values": ["cardNumber", "bearerToken", r"\\bsk_live_\\w+"],
+        })
+
+    ``values`` items are regexes or names of BUILTIN_VALUE_PATTERNS. None removes all rules.
+    Raises ValueError when the rules are invalid, in which case the current rules are kept.
+    """
+    global _rules
+    compiled = RedactionRules.from_json(rules)
+    with _rules_lock:
+        _rules = compiled
+
+
+def get_redaction_rules():
+    """Returns the compiled RedactionRules, None when there are none."""
+    return _rules
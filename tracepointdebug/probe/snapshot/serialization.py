@@ -75,7 +75,7 @@ def is_non_serializable(obj):
     return False
 
 
-def make_type_representation(obj):
+def make_type_representation(obj, redaction=None):
     """Create a safe representation of a non-serializable object."""
     obj_type = type(obj).__name__
     obj_repr = repr(obj)
@@ -83,6 +83,8 @@ def make_type_representation(obj):
     # Truncate repr if too long
     if len(obj_repr) > 200:
         obj_repr = obj_repr[:197] + "..."
+    if redaction is not None:
+        obj_repr = redaction.redact_text(obj_repr)
 
     return {
         "__tpd_type__": obj_type,
@@ -101,7 +103,7 @@ def make_circular_reference_marker(depth_reached=False):
     }
 
 
-def safe_serialize_object(obj, tracker, max_properties=100):
+def safe_serialize_object(obj, tracker, max_properties=100, redaction=None):
     """
     Safely serialize an object, handling circular refs and non-serializable types.
 
@@ -109,6 +111,7 @@ def safe_serialize_object(obj, tracker, max_properties=100):
         obj: Object to serialize
         tracker: CircularReferenceTracker instance
         max_properties: Max properties to include in objects
+        redaction: RedactionRules masking matching keys, attributes, types and strings at every level
 
     Returns:
         Serializable representation of object
@@ -117,17 +120,23 @@ def safe_serialize_object(obj, tracker, max_properties=100):
     if obj is None:
         return None
 
+    if redaction is not None:
+        if redaction.matches_type(obj):
+            return redaction.mask
+        if isinstance(obj, str):
+            return redaction.redact_text(obj)
+
     # Primitives
     if isinstance(obj, (bool, int, float, str, bytes)):
         return obj
 
     # Check if non-serializable
     if is_non_serializable(obj):
-        return make_type_representation(obj)
+        return make_type_representation(obj, redaction)
 
     # Check max depth
     if tracker.is_max_depth_reached():
-        return make_type_representation(obj)
+        return make_type_representation(obj, redaction)
 
     obj_id = id(obj)
 
@@ -146,7 +155,7 @@ def safe_serialize_object(obj, tracker, max_properties=100):
                     result["__tpd_remaining__"] = len(obj) - count
                     break
                 try:
-                    result[str(key)] = safe_serialize_object(value, tracker, max_properties)
+                    result[str(key)] = _serialize_member(key, value, tracker, max_properties, redaction)
                     count += 1
                 except Exception as e:
                     result[str(key)] = f"<error serializing: {type(e).__name__}>"
@@ -163,7 +172,7 @@ def safe_serialize_object(obj, tracker, max_properties=100):
                     })
                     break
                 try:
-                    result.append(safe_serialize_object(item, tracker, max_properties))
+                    result.append(safe_serialize_object(item, tracker, max_properties, redaction))
                 except Exception as e:
                     result.append(f"<error serializing: {type(e).__name__}>")
             return result if isinstance(obj, list) else tuple(result)
@@ -179,7 +188,7 @@ def safe_serialize_object(obj, tracker, max_properties=100):
                     })
                     break
                 try:
-                    result.append(safe_serialize_object(item, tracker, max_properties))
+                    result.append(safe_serialize_object(item, tracker, max_properties, redaction))
                 except Exception as e:
                     result.append(f"<error serializing: {type(e).__name__}>")
             return result
@@ -194,14 +203,20 @@ def safe_serialize_object(obj, tracker, max_properties=100):
                     result["__tpd_remaining__"] = len(obj.__dict__) - count
                     break
                 try:
-                    result[str(key)] = safe_serialize_object(value, tracker, max_properties)
+                    result[str(key)] = _serialize_member(key, value, tracker, max_properties, redaction)
                     count += 1
                 except Exception as e:
                     result[str(key)] = f"<error serializing: {type(e).__name__}>"
             return result
 
         # Fallback: use repr
-        return make_type_representation(obj)
+        return make_type_representation(obj, redaction)
 
     finally:
         tracker.exit(obj_id)
+
+
+def _serialize_member(name, value, tracker, max_properties, redaction):
+    if redaction is not None and redaction.matches_name(name):
+        return redaction.mask
+    return safe_serialize_object(value, tracker, max_properties, redaction)
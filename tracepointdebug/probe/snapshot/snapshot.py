@@ -1,6 +1,7 @@
 class Snapshot(object):
-    def __init__(self, frames, method_name, file):
+    def __init__(self, frames, method_name, file, truncated_by_time=False):
         self.frames = frames
         self.method_name = method_name
         self.file = file
+        self.truncated_by_time = truncated_by_time
 
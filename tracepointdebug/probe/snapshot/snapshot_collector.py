@@ -1,72 +1,180 @@
 import datetime
 import itertools
-import os
-import sys
+import time
 import types
 import logging
 
 import six
 
 from .snapshot import Snapshot
-from .value import Value
+from .value import Value, ValueReference
 from .variable import Variable
 from .variables import Variables
 from .snapshot_collector_config_manager import SnapshotCollectorConfigManager
 from .serialization import CircularReferenceTracker, safe_serialize_object, is_non_serializable
+from .type_serializers import get_type_serializer
+from .redaction import get_redaction_rules
+from .drill_down import DrillDownRef, new_handle, weakly_referenceable
+from .frame_metadata import check_sys_path, get_frame_metadata
 from tracepointdebug.probe.frame import Frame
 
 logger = logging.getLogger(__name__)
 
-_PRIMITIVE_TYPES = (type(None), float, complex, bool, slice, bytearray,
-                    six.text_type,
-                    six.binary_type) + six.integer_types + six.string_types
+_PRIMITIVE_TYPES = (type(None), float, complex, bool, slice,
+                    six.text_type) + six.integer_types + six.string_types
 _TEXT_TYPES = (six.string_types, six.text_type)
 _DATE_TYPES = (datetime.date, datetime.time, datetime.timedelta)
 _VECTOR_TYPES = (tuple, list, set)
+_REFERENCE_MARKER_SIZE = len('{"@ref": 0}')
+_HANDLE_MARKER_SIZE = len('{"@handle": 0}')
+_WATCH_ERROR_TYPE = "EvaluationError"
+_REDACTED_TYPE = "Redacted"
+_MISSING = object()
+
+# The capture deadline is checked once every this many values, reading the clock for each would cost more
+DEADLINE_CHECK_INTERVAL = 64
+
+FRAME_EXPANDED = "expanded"
+FRAME_PLAIN = "plain"
+FRAME_COLLAPSED = "collapsed"
 
 
 class SnapshotCollector(object):
-    def __init__(self):
+    def __init__(self, parse_depth=None, max_size=None, collect_variables=True, profile=None,
+                 drill_down_depth=None):
         self.cur_size = 0
-        self.tracker = CircularReferenceTracker(max_depth=SnapshotCollectorConfigManager.get_parse_depth())
+        self.profile = profile
+        self.parse_depth = self.config.get_parse_depth() if parse_depth is None else parse_depth
+        self.drill_down_depth = self.config.get_drill_down_depth() if drill_down_depth is None else drill_down_depth
+        if self.drill_down_depth:
+            self.parse_depth = min(self.parse_depth, self.drill_down_depth)
+        self.max_size = self.config.get_max_size() if max_size is None else max_size
+        self.collect_variables = collect_variables
+        self.tracker = CircularReferenceTracker(max_depth=self.parse_depth)
+        self.dedup_references = SnapshotCollectorConfigManager.is_dedup_references_enabled()
+        self._ref_ids = {}
+        self._converted = []
+        self.redaction = get_redaction_rules()
+        self.deadline_ms = self.config.get_capture_deadline_ms()
+        self._deadline = None
+        self._values_to_check = DEADLINE_CHECK_INTERVAL
+        self.timed_out = False
+        # handle -> DrillDownRef of the values left unexpanded, None when drill-down is off
+        self.drill_down_refs = None
+        self._drill_down_path = None
+
+    @property
+    def config(self):
+        """Source of the limits: the probe's capture profile, which falls back to the global config itself."""
+        return self.profile if self.profile is not None else SnapshotCollectorConfigManager
+
+    def reset(self):
+        self.tracker = CircularReferenceTracker(max_depth=self.parse_depth)
+        self._ref_ids = {}
+        self._converted = []
+        self._deadline = time.perf_counter() + self.deadline_ms / 1000.0 if self.deadline_ms else None
+        self._values_to_check = DEADLINE_CHECK_INTERVAL
+        self.timed_out = False
+        if self.drill_down_depth:
+            self.drill_down_refs = {}
+            # (owner, key) of every container the value being collected is nested in
+            self._drill_down_path = []
 
     def collect(self, top_frame):
-        frame = top_frame
         collected_frames = []
         # Reset tracker for new collection
-        self.tracker = CircularReferenceTracker(max_depth=SnapshotCollectorConfigManager.get_parse_depth())
-
-        while frame and len(collected_frames) < SnapshotCollectorConfigManager.get_max_frames():
-            code = frame.f_code
-            file_path = normalize_path(code.co_filename)
-            if len(collected_frames) < SnapshotCollectorConfigManager.get_max_expand_frames():
-                collected_frames.append(
-                    Frame(frame.f_lineno, self.collect_frame_locals(frame=frame), file_path, code.co_name))
-            else:
-                collected_frames.append(Frame(frame.f_lineno, Variables([]), file_path, code.co_name))
-            frame = frame.f_back
+        self.reset()
+
+        collapsed_frame = None
+        for frame, metadata, kind in self.iter_frames(top_frame):
+            if kind == FRAME_COLLAPSED:
+                if collapsed_frame is None:
+                    collapsed_frame = Frame(frame.f_lineno, Variables([]), metadata.path, metadata.method_name)
+                    collected_frames.append(collapsed_frame)
+                collapsed_frame.collapsed_frames += 1
+                continue
+            collapsed_frame = None
+            # Frames past the deadline are still listed, only their variables are left out
+            expand = kind == FRAME_EXPANDED and not self.timed_out
+            variables = self.collect_frame_locals(frame=frame) if expand else Variables([])
+            collected_frames.append(Frame(frame.f_lineno, variables, metadata.path, metadata.method_name))
+
+        if self.profile is not None and self.profile.watches and self.collect_variables and collected_frames:
+            collected_frames[0].watches = self.collect_watches(top_frame)
 
         top_frame_method_name = top_frame.f_code.co_name
         file = top_frame.f_code.co_filename
-        snapshot = Snapshot(frames=collected_frames, method_name=top_frame_method_name, file=file)
+        snapshot = Snapshot(frames=collected_frames, method_name=top_frame_method_name, file=file,
+                            truncated_by_time=self.timed_out)
         return snapshot
 
-    def collect_frame_locals(self, frame):
+    def collect_value(self, value):
+        """Collects a single value, as a drill-down expansion does."""
+        self.reset()
+        return self.collect_variable_value(value, 0, self.parse_depth)
+
+    def iter_frames(self, top_frame):
+        """
+        Yields ``(frame, metadata, kind)`` for every frame a snapshot of top_frame is made of.
+        Consecutive FRAME_COLLAPSED frames end up as a single snapshot frame.
+        """
+        check_sys_path()
+        max_frames = self.config.get_max_frames()
+        max_expand_frames = self.config.get_max_expand_frames() if self.collect_variables else 0
+        library_frames = SnapshotCollectorConfigManager.get_library_frames()
+        frame_count = 0
+        collapsing = False
+        frame = top_frame
+
+        while frame and frame_count < max_frames:
+            metadata = get_frame_metadata(frame.f_code)
+            if library_frames != "include" and metadata.is_library and frame is not top_frame:
+                # Library, stdlib and agent frames do not use up the frame budget
+                if library_frames == "collapse":
+                    if not collapsing:
+                        collapsing = True
+                        frame_count += 1
+                    yield frame, metadata, FRAME_COLLAPSED
+                frame = frame.f_back
+                continue
+            collapsing = False
+            yield frame, metadata, FRAME_EXPANDED if frame_count < max_expand_frames else FRAME_PLAIN
+            frame_count += 1
+            frame = frame.f_back
+
+    def iter_frame_locals(self, frame):
+        """Yields the ``(name, value)`` locals of frame to capture, only the allowlisted ones when there is a list."""
         frame_locals = frame.f_locals
+        if self.profile is None or self.profile.variables is None:
+            for item in six.viewitems(frame_locals):
+                yield item
+            return
+        for name in self.profile.variables:
+            value = frame_locals.get(name, _MISSING)
+            if value is not _MISSING:
+                yield name, value
+
+    def collect_frame_locals(self, frame):
         variables = []
-        for name, value in six.viewitems(frame_locals):
+        max_properties = self.config.get_max_properties()
+        for name, value in self.iter_frame_locals(frame):
+            if self.timed_out:
+                break
             try:
+                if self.redaction is not None and (self.redaction.matches_name(name) or
+                                                   self.redaction.matches_type(value)):
+                    val = self.redacted_value(value)
                 # Use enhanced serialization for robustness
-                if is_non_serializable(value):
+                elif is_non_serializable(value):
                     # Use safe_serialize_object for non-serializable types
                     val = Value(var_type=type(value).__name__,
-                              value=safe_serialize_object(value, self.tracker))
+                                value=safe_serialize_object(value, self.tracker, redaction=self.redaction))
                 else:
-                    val = self.collect_variable_value(value, 0, SnapshotCollectorConfigManager.get_parse_depth())
+                    val = self.collect_variable_value(value, 0, self.parse_depth)
 
-                if val is not None and type(value).__name__.find("byte") == -1:
+                if val is not None:
                     variables.append(Variable(name, type(value).__name__, val))
-                if len(variables) > SnapshotCollectorConfigManager.get_max_properties():
+                if len(variables) > max_properties:
                     break
             except Exception as e:
                 logger.warning(f"Error collecting variable '{name}': {e}")
@@ -74,20 +182,58 @@ class SnapshotCollector(object):
                 continue
         return Variables(variables)
 
+    def collect_watches(self, frame):
+        watches = []
+        for watch in self.profile.watches:
+            if self.timed_out:
+                break
+            if self.redaction is not None and any(self.redaction.matches_name(name) for name in watch.identifiers):
+                watches.append(Variable(watch.expression, _REDACTED_TYPE, Value(var_type=_REDACTED_TYPE,
+                                                                                 value=self.redaction.mask)))
+                continue
+            try:
+                value = watch.evaluate(frame)
+            except Exception as e:
+                # A failing watch is reported in place of its value, it does not fail the snapshot
+                watches.append(Variable(watch.expression, _WATCH_ERROR_TYPE,
+                                        Value(var_type=_WATCH_ERROR_TYPE, value="%s: %s" % (type(e).__name__, e))))
+                continue
+            val = self.collect_variable_value(value, 0, self.parse_depth)
+            if val is not None:
+                watches.append(Variable(watch.expression, type(value).__name__, val))
+        return Variables(watches)
+
     def collect_variable_value(self, variable, depth, max_depth):
-        if depth >= max_depth:
+        if depth >= max_depth or self.timed_out:
+            if depth == max_depth and self.drill_down_refs is not None and not self.timed_out:
+                return self.collect_drill_down_value(variable, depth)
             return None
 
-        if self.cur_size >= SnapshotCollectorConfigManager.get_max_size():
+        if self._deadline is not None:
+            self._values_to_check -= 1
+            if self._values_to_check <= 0:
+                self._values_to_check = DEADLINE_CHECK_INTERVAL
+                if time.perf_counter() > self._deadline:
+                    self.timed_out = True
+                    return None
+
+        if self.cur_size >= self.max_size:
             return None
 
         if variable is None:
             self.cur_size += 4
             return Value(var_type=type(None).__name__, value=None)
 
+        # Redacted values are masked before anything below them is walked
+        if self.redaction is not None and self.redaction.matches_type(variable):
+            return self.redacted_value(variable)
+
         if isinstance(variable, _PRIMITIVE_TYPES):
             if isinstance(variable, _TEXT_TYPES):
-                r = _trim_string(variable, SnapshotCollectorConfigManager.get_max_var_len())
+                max_var_len = SnapshotCollectorConfigManager.get_max_var_len()
+                if self.redaction is not None:
+                    variable = self.redaction.redact_text(variable, max_var_len)
+                r = _trim_string(variable, max_var_len)
             else:
                 r = variable
             self.cur_size += len(repr(r))
@@ -98,64 +244,155 @@ class SnapshotCollector(object):
             self.cur_size += len(r)
             return Value(var_type=type(variable).__name__, value=r)
 
+        serializer = get_type_serializer(type(variable))
+        if serializer is not None:
+            if serializer.summarizer is not None:
+                try:
+                    r = serializer.summarizer(variable, SnapshotCollectorConfigManager.get_max_var_len())
+                except Exception as e:
+                    logger.debug("Error summarizing %s value: %s" % (type(variable).__name__, e))
+                    r = None
+                self.cur_size += len(repr(r))
+                return Value(var_type=type(variable).__name__, value=r)
+            if serializer.fn is not None:
+                return self.collect_converted_value(variable, serializer, depth, max_depth)
+
+        if isinstance(variable, types.FunctionType):
+            self.cur_size += len(variable.__name__)
+            return Value(var_type=type(variable).__name__, value=variable.__name__)
+
+        ref_id = None
+        if self.dedup_references and (serializer is not None or isinstance(variable, (dict,) + _VECTOR_TYPES)
+                                      or hasattr(variable, '__dict__')):
+            # Identity based sharing: later occurrences of an object point back to its first serialization
+            seen_ref_id = self._ref_ids.get(id(variable))
+            if seen_ref_id is not None:
+                self.cur_size += _REFERENCE_MARKER_SIZE
+                return ValueReference(seen_ref_id)
+            ref_id = len(self._ref_ids) + 1
+            self._ref_ids[id(variable)] = ref_id
+
+        if serializer is not None:
+            r = self.collect_items(serializer.iter_fields(variable), depth, max_depth, owner=variable)
+            return Value(var_type=type(variable).__name__, value=r, ref_id=ref_id)
+
         if isinstance(variable, dict):
-            items = [(k, v) for (k, v) in variable.items()]
-            r = {}
-            for name, value in items:
-                if self.cur_size >= SnapshotCollectorConfigManager.get_max_size():
-                    break
-                val = self.collect_variable_value(value, depth + 1, max_depth)
-                if val is not None:
-                    r[str(name)] = val
-                    self.cur_size += len(repr(name))
-            return Value(var_type=type(variable).__name__, value=r)
+            # Every captured item takes at least a byte, so no more than the remaining size can be captured
+            items = list(itertools.islice(variable.items(), max(0, self.max_size - self.cur_size)))
+            r = self.collect_items(items, depth, max_depth, owner=variable)
+            return Value(var_type=type(variable).__name__, value=r, ref_id=ref_id)
 
         if isinstance(variable, _VECTOR_TYPES):
             r = []
-            for item in variable:
-                if self.cur_size >= SnapshotCollectorConfigManager.get_max_size():
+            for index, item in enumerate(variable):
+                if self.cur_size >= self.max_size or self.timed_out:
                     break
-                val = self.collect_variable_value(item, depth + 1, max_depth)
+                if self._drill_down_path is not None:
+                    self._drill_down_path.append((variable, index))
+                    try:
+                        val = self.collect_variable_value(item, depth + 1, max_depth)
+                    finally:
+                        self._drill_down_path.pop()
+                else:
+                    val = self.collect_variable_value(item, depth + 1, max_depth)
                 if val is not None:
                     r.append(val)
 
-            return Value(var_type=type(variable).__name__, value=r)
-
-        if isinstance(variable, types.FunctionType):
-            self.cur_size += len(variable.__name__)
-            return Value(var_type=type(variable).__name__, value=variable.__name__)
+            return Value(var_type=type(variable).__name__, value=r, ref_id=ref_id)
 
         if hasattr(variable, '__dict__'):
             items = variable.__dict__.items()
             if six.PY3:
                 items = list(itertools.islice(items, 20 + 1))
-            r = {}
-            for name, value in items:
-                if self.cur_size >= SnapshotCollectorConfigManager.get_max_size():
-                    break
-                val = self.collect_variable_value(value, depth + 1, max_depth)
-                if val is not None:
-                    r[str(name)] = val
-                    self.cur_size += len(repr(name))
-
-            return Value(var_type=type(variable).__name__, value=r)
+            r = self.collect_items(items, depth, max_depth, owner=variable)
+            return Value(var_type=type(variable).__name__, value=r, ref_id=ref_id)
 
         return Value(var_type=type(variable).__name__, value=None)
 
+    def collect_items(self, items, depth, max_depth, owner=None):
+        r = {}
+        # Items at the drill-down cutoff get handles, so their names are checked there too
+        redact_depth = max_depth + 1 if self.drill_down_refs is not None else max_depth
+        for name, value in items:
+            if self.cur_size >= self.max_size or self.timed_out:
+                break
+            if self.redaction is not None and self.redaction.matches_name(name) and depth + 1 < redact_depth:
+                val = self.redacted_value(value)
+            elif self._drill_down_path is not None:
+                self._drill_down_path.append((owner, str(name)))
+                try:
+                    val = self.collect_variable_value(value, depth + 1, max_depth)
+                finally:
+                    self._drill_down_path.pop()
+            else:
+                val = self.collect_variable_value(value, depth + 1, max_depth)
+            if val is not None:
+                r[str(name)] = val
+                self.cur_size += len(repr(name))
+        return r
 
-def normalize_path(path):
-    path = os.path.normpath(path)
-
-    for sys_path in sys.path:
-        if not sys_path:
-            continue
+    def collect_drill_down_value(self, variable, depth):
+        """Value of variable at the drill-down cutoff: containers and objects become handles, leaves are kept."""
+        serializer = get_type_serializer(type(variable))
+        expandable = serializer.summarizer is None if serializer is not None else \
+            isinstance(variable, (dict,) + _VECTOR_TYPES) or \
+            (hasattr(variable, '__dict__') and not isinstance(variable, (type, types.FunctionType, types.ModuleType)))
+        if not expandable or (self.redaction is not None and self.redaction.matches_type(variable)):
+            return self.collect_variable_value(variable, depth, depth + 1)
+        if self.cur_size >= self.max_size:
+            return None
+        handle = new_handle()
+        self.drill_down_refs[handle] = self.drill_down_ref(variable)
+        self.cur_size += _HANDLE_MARKER_SIZE
+        return Value(var_type=type(variable).__name__, value=None, handle=handle)
 
-        sys_path = os.path.join(sys_path, '')
+    def drill_down_ref(self, variable):
+        """
+        Reference to variable that does not keep it alive: a weak reference to it, or else to the
+        closest container it is nested in through the path of keys down to it.
+        """
+        if weakly_referenceable(variable):
+            return DrillDownRef(variable, (), type(variable).__name__)
+        path = []
+        target = variable
+        for owner, key in reversed(self._drill_down_path):
+            if key is not None:
+                path.append(key)
+            # Converted values only live as long as the capture, their path starts at the original value
+            if any(owner is converted for converted in self._converted):
+                # and resolving it converts again, into new objects that cannot be told from the captured ones
+                target = None
+            elif weakly_referenceable(owner):
+                return DrillDownRef(owner, reversed(path), type(variable).__name__, target)
+        return DrillDownRef(variable, (), type(variable).__name__)
 
-        if path.startswith(sys_path):
-            return path[len(sys_path):]
+    def redacted_value(self, variable):
+        self.cur_size += len(self.redaction.mask)
+        return Value(var_type=type(variable).__name__, value=self.redaction.mask)
 
-    return path
+    def collect_converted_value(self, variable, serializer, depth, max_depth):
+        try:
+            converted = serializer.fn(variable)
+        except Exception as e:
+            logger.debug("Error serializing %s value: %s" % (type(variable).__name__, e))
+            return Value(var_type=type(variable).__name__, value=None)
+        if get_type_serializer(type(converted)) is serializer:
+            # fn handed back a value of the same type, converting it again would never end
+            return Value(var_type=type(variable).__name__, value=None)
+        # Keep converted data alive until the snapshot is done so its id() is never reused for reference sharing
+        self._converted.append(converted)
+        if self._drill_down_path is not None:
+            # Keys below the converted value resolve from variable itself, which converts again
+            self._drill_down_path.append((variable, None))
+            try:
+                val = self.collect_variable_value(converted, depth, max_depth)
+            finally:
+                self._drill_down_path.pop()
+        else:
+            val = self.collect_variable_value(converted, depth, max_depth)
+        if isinstance(val, Value):
+            val.type = type(variable).__name__
+        return val
 
 
 def _trim_string(s, max_len):
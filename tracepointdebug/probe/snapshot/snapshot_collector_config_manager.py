@@ -5,6 +5,15 @@ class DEFAULT_SNAPSHOT_CONFIGS:
     MAX_PARSE_DEPTH = 3
     MAX_VAR_LEN = 256
     MAX_SIZE = 32768
+    DEDUP_REFERENCES = False
+    DELTA_ENCODING = False
+    DELTA_KEYFRAME_INTERVAL = 10
+    DELTA_KEYFRAME_SECS = 30
+    LIBRARY_FRAMES = "include"
+    MEMORY_BUDGET = 8 * 1024 * 1024
+    CAPTURE_DEADLINE_MS = 25
+    DRILL_DOWN_DEPTH = 0
+    BLOB_THRESHOLD = 1024 * 1024
 
 class MAX_SNAPSHOT_CONFIGS:
     MAX_FRAMES = 20
@@ -12,13 +21,24 @@ class MAX_SNAPSHOT_CONFIGS:
     MAX_PROPERTIES = 50
     MAX_PARSE_DEPTH = 6
 
+LIBRARY_FRAMES_MODES = ("include", "skip", "collapse")
+
 snapshot_configs = {
     "maxFrames": DEFAULT_SNAPSHOT_CONFIGS.MAX_FRAMES,
     "maxExpandFrames": DEFAULT_SNAPSHOT_CONFIGS.MAX_EXPAND_FRAMES,
     "maxProperties": DEFAULT_SNAPSHOT_CONFIGS.MAX_PROPERTIES,
     "maxParseDepth": DEFAULT_SNAPSHOT_CONFIGS.MAX_PARSE_DEPTH,
     "maxVarLen": DEFAULT_SNAPSHOT_CONFIGS.MAX_VAR_LEN,
-    "maxSize": DEFAULT_SNAPSHOT_CONFIGS.MAX_SIZE
+    "maxSize": DEFAULT_SNAPSHOT_CONFIGS.MAX_SIZE,
+    "dedupReferences": DEFAULT_SNAPSHOT_CONFIGS.DEDUP_REFERENCES,
+    "deltaEncoding": DEFAULT_SNAPSHOT_CONFIGS.DELTA_ENCODING,
+    "deltaKeyframeInterval": DEFAULT_SNAPSHOT_CONFIGS.DELTA_KEYFRAME_INTERVAL,
+    "deltaKeyframeSecs": DEFAULT_SNAPSHOT_CONFIGS.DELTA_KEYFRAME_SECS,
+    "libraryFrames": DEFAULT_SNAPSHOT_CONFIGS.LIBRARY_FRAMES,
+    "memoryBudget": DEFAULT_SNAPSHOT_CONFIGS.MEMORY_BUDGET,
+    "captureDeadlineMs": DEFAULT_SNAPSHOT_CONFIGS.CAPTURE_DEADLINE_MS,
+    "drillDownDepth": DEFAULT_SNAPSHOT_CONFIGS.DRILL_DOWN_DEPTH,
+    "blobThreshold": DEFAULT_SNAPSHOT_CONFIGS.BLOB_THRESHOLD
 }
 
 class SnapshotCollectorConfigManager():
@@ -47,13 +67,67 @@ class SnapshotCollectorConfigManager():
     def get_max_properties():
         return snapshot_configs.get("maxProperties")
 
+    @staticmethod
+    def is_dedup_references_enabled():
+        return snapshot_configs.get("dedupReferences")
+
+    @staticmethod
+    def is_delta_encoding_enabled():
+        return snapshot_configs.get("deltaEncoding")
+
+    @staticmethod
+    def get_delta_keyframe_interval():
+        return snapshot_configs.get("deltaKeyframeInterval")
+
+    @staticmethod
+    def get_delta_keyframe_secs():
+        return snapshot_configs.get("deltaKeyframeSecs")
+
+    @staticmethod
+    def get_library_frames():
+        return snapshot_configs.get("libraryFrames")
+
+    @staticmethod
+    def get_memory_budget():
+        return snapshot_configs.get("memoryBudget")
+
+    @staticmethod
+    def get_capture_deadline_ms():
+        return snapshot_configs.get("captureDeadlineMs")
+
+    @staticmethod
+    def get_drill_down_depth():
+        return snapshot_configs.get("drillDownDepth")
+
+    @staticmethod
+    def get_blob_threshold():
+        return snapshot_configs.get("blobThreshold")
+
     @staticmethod
     def update_snapshot_config(update_configs): 
         max_frames = update_configs.get("maxFrames", DEFAULT_SNAPSHOT_CONFIGS.MAX_FRAMES)
         max_expand_frames = update_configs.get("maxExpandFrames", DEFAULT_SNAPSHOT_CONFIGS.MAX_EXPAND_FRAMES)
         max_properties = update_configs.get("maxProperties", DEFAULT_SNAPSHOT_CONFIGS.MAX_PROPERTIES)
         max_parse_depth = update_configs.get("maxParseDepth", DEFAULT_SNAPSHOT_CONFIGS.MAX_PARSE_DEPTH)
+        dedup_references = update_configs.get("dedupReferences", DEFAULT_SNAPSHOT_CONFIGS.DEDUP_REFERENCES)
+        delta_encoding = update_configs.get("deltaEncoding", DEFAULT_SNAPSHOT_CONFIGS.DELTA_ENCODING)
+        delta_keyframe_interval = update_configs.get("deltaKeyframeInterval", DEFAULT_SNAPSHOT_CONFIGS.DELTA_KEYFRAME_INTERVAL)
+        delta_keyframe_secs = update_configs.get("deltaKeyframeSecs", DEFAULT_SNAPSHOT_CONFIGS.DELTA_KEYFRAME_SECS)
+        library_frames = update_configs.get("libraryFrames", DEFAULT_SNAPSHOT_CONFIGS.LIBRARY_FRAMES)
+        memory_budget = update_configs.get("memoryBudget", DEFAULT_SNAPSHOT_CONFIGS.MEMORY_BUDGET)
+        capture_deadline_ms = update_configs.get("captureDeadlineMs", DEFAULT_SNAPSHOT_CONFIGS.CAPTURE_DEADLINE_MS)
+        drill_down_depth = update_configs.get("drillDownDepth", DEFAULT_SNAPSHOT_CONFIGS.DRILL_DOWN_DEPTH)
+        blob_threshold = update_configs.get("blobThreshold", DEFAULT_SNAPSHOT_CONFIGS.BLOB_THRESHOLD)
         snapshot_configs["maxFrames"] = MAX_SNAPSHOT_CONFIGS.MAX_FRAMES if max_frames > MAX_SNAPSHOT_CONFIGS.MAX_FRAMES else max_frames
         snapshot_configs["maxExpandFrames"] = MAX_SNAPSHOT_CONFIGS.MAX_EXPAND_FRAMES if max_expand_frames > MAX_SNAPSHOT_CONFIGS.MAX_EXPAND_FRAMES else max_expand_frames
         snapshot_configs["maxProperties"] = MAX_SNAPSHOT_CONFIGS.MAX_PROPERTIES if max_properties > MAX_SNAPSHOT_CONFIGS.MAX_PROPERTIES else max_properties
-        snapshot_configs["maxParseDepth"] = MAX_SNAPSHOT_CONFIGS.MAX_PARSE_DEPTH if max_parse_depth > MAX_SNAPSHOT_CONFIGS.MAX_PARSE_DEPTH else max_parse_depth
\ No newline at end of file
+        snapshot_configs["maxParseDepth"] = MAX_SNAPSHOT_CONFIGS.MAX_PARSE_DEPTH if max_parse_depth > MAX_SNAPSHOT_CONFIGS.MAX_PARSE_DEPTH else max_parse_depth
+        snapshot_configs["dedupReferences"] = bool(dedup_references)
+        snapshot_configs["deltaEncoding"] = bool(delta_encoding)
+        snapshot_configs["deltaKeyframeInterval"] = max(1, int(delta_keyframe_interval))
+        snapshot_configs["deltaKeyframeSecs"] = max(0, delta_keyframe_secs)
+        snapshot_configs["libraryFrames"] = library_frames if library_frames in LIBRARY_FRAMES_MODES else DEFAULT_SNAPSHOT_CONFIGS.LIBRARY_FRAMES
+        snapshot_configs["memoryBudget"] = max(0, int(memory_budget))
+        snapshot_configs["captureDeadlineMs"] = max(0, capture_deadline_ms)
+        snapshot_configs["drillDownDepth"] = min(max(0, int(drill_down_depth)), MAX_SNAPSHOT_CONFIGS.MAX_PARSE_DEPTH)
+        snapshot_configs["blobThreshold"] = max(0, int(blob_threshold))
\ No newline at end of file
@@ -0,0 +1,98 @@
+import hashlib
+import json
+import time
+from threading import Lock
+
+from tracepointdebug.probe.encoder import to_plain
+from .snapshot_collector_config_manager import SnapshotCollectorConfigManager
+
+UNCHANGED_MARKER = {"@unchanged": True}
+
+# Levels below a frame variable that get their own structural hash.
+# Deeper subtrees are hashed (and resent) as a whole.
+_MAX_DELTA_DEPTH = 2
+
+
+def _leaf_hash(node):
+    encoded = json.dumps(node, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.blake2b(encoded.encode('utf-8'), digest_size=16).digest()
+
+
+class SnapshotDeltaEncoder(object):
+    """
+    Per probe delta state for repeated snapshots of the same tracepoint.
+
+    Keeps the structural hash of every captured subtree of the last keyframe.
+    Subtrees whose hash did not change since then are replaced by ``{"@unchanged": true}``
+    and the event refers to the keyframe through ``baseSnapshotId``. Deltas are never
+    based on other deltas, so a delta dropped on its way to the sink (queue overflow,
+    memory budget, rejection) doesn't leave the ones after it unresolvable.
+    A full keyframe is sent every ``deltaKeyframeInterval`` snapshots or
+    ``deltaKeyframeSecs`` seconds, whichever comes first.
+    """
+
+    def __init__(self):
+        self._lock = Lock()
+        self._base_snapshot_id = None
+        self._base_hashes = {}
+        self._snapshots_since_keyframe = 0
+        self._keyframe_time = 0
+
+    def encode(self, snapshot_id, frames, now=None):
+        """
+        Returns ``(frames, base_snapshot_id)`` where frames is plain JSON data.
+        ``base_snapshot_id`` is None when the snapshot is sent as a keyframe.
+        """
+        now = time.time() if now is None else now
+        frames = to_plain(frames)
+        hashes = {}
+        for frame_idx, frame in enumerate(frames):
+            frame_key = (frame_idx, frame.get("fileName"), frame.get("methodName"))
+            for name, node in (frame.get("variables") or {}).items():
+                self._hash_node(node, frame_key + (name,), hashes, 0)
+
+        with self._lock:
+            is_keyframe = (self._base_snapshot_id is None
+                           or self._snapshots_since_keyframe + 1 >= SnapshotCollectorConfigManager.get_delta_keyframe_interval()
+                           or now - self._keyframe_time >= SnapshotCollectorConfigManager.get_delta_keyframe_secs())
+            if is_keyframe:
+                base_snapshot_id = None
+                self._snapshots_since_keyframe = 0
+                self._keyframe_time = now
+                self._base_snapshot_id = snapshot_id
+                self._base_hashes = hashes
+            else:
+                base_snapshot_id = self._base_snapshot_id
+                self._snapshots_since_keyframe += 1
+                for frame_idx, frame in enumerate(frames):
+                    frame_key = (frame_idx, frame.get("fileName"), frame.get("methodName"))
+                    variables = frame.get("variables") or {}
+                    frame["variables"] = {name: self._delta_node(node, frame_key + (name,), hashes)
+                                          for name, node in variables.items()}
+        return frames, base_snapshot_id
+
+    def _hash_node(self, node, path, hashes, depth):
+        value = node.get("@value") if isinstance(node, dict) else None
+        if depth < _MAX_DELTA_DEPTH and isinstance(value, dict):
+            # Combine child hashes so every byte is hashed once, however deep the subtree
+            digest = hashlib.blake2b(digest_size=16)
+            digest.update(_leaf_hash({k: v for k, v in node.items() if k != "@value"}))
+            for key, child in value.items():
+                digest.update(key.encode('utf-8') + b'\0')
+                digest.update(self._hash_node(child, path + (key,), hashes, depth + 1))
+            node_hash = digest.digest()
+        else:
+            node_hash = _leaf_hash(node)
+        hashes[path] = node_hash
+        return node_hash
+
+    def _delta_node(self, node, path, hashes):
+        if self._base_hashes.get(path) == hashes[path]:
+            return dict(UNCHANGED_MARKER)
+        value = node.get("@value") if isinstance(node, dict) else None
+        if isinstance(value, dict):
+            delta = dict(node)
+            delta["@value"] = {key: self._delta_node(child, path + (key,), hashes) if path + (key,) in hashes else child
+                               for key, child in value.items()}
+            return delta
+        return node
@@ -0,0 +1,137 @@
+"""
+Process wide byte budget for captured but not yet published snapshot data.
+
+Every capture reserves its worst case size before walking the frame and gives the
+unused part back once the real size is known. The rest stays reserved until the
+event has been published. As the budget fills up captures degrade: first to a
+shallower parse depth, then to frames without variables, and finally they are dropped.
+"""
+
+from threading import Lock
+
+from .snapshot_collector_config_manager import SnapshotCollectorConfigManager
+
+CAPTURE_FULL = "full"
+CAPTURE_SHALLOW = "shallow"
+CAPTURE_FRAMES_ONLY = "framesOnly"
+CAPTURE_DROPPED = "dropped"
+
+# Rough encoded size of a frame without its variables
+FRAME_SIZE_ESTIMATE = 128
+
+# Budget usage ratios from which captures degrade
+_SHALLOW_USAGE = 0.5
+_FRAMES_ONLY_USAGE = 0.75
+
+
+class SnapshotReservation(object):
+    """Bytes held for one snapshot until it is published."""
+
+    def __init__(self, budget, level, size, profile=None):
+        self.budget = budget
+        self.level = level
+        self.size = size
+        self.profile = profile
+
+    @property
+    def config(self):
+        return self.profile if self.profile is not None else SnapshotCollectorConfigManager
+
+    @property
+    def parse_depth(self):
+        """Parse depth for this capture, None to use the configured one."""
+        if self.level == CAPTURE_SHALLOW:
+            return max(1, self.config.get_parse_depth() // 2)
+        return None
+
+    @property
+    def collect_variables(self):
+        return self.level in (CAPTURE_FULL, CAPTURE_SHALLOW)
+
+    @property
+    def max_size(self):
+        """Variable data a capture at this level may produce without overrunning the reservation."""
+        return max(0, self.size - FRAME_SIZE_ESTIMATE * self.config.get_max_frames())
+
+    def settle(self, collector, snapshot):
+        """Shrinks the reservation to the size actually captured."""
+        size = collector.cur_size + FRAME_SIZE_ESTIMATE * len(snapshot.frames)
+        self.budget._resize(self, min(size, self.size))
+
+    def release(self):
+        self.budget._resize(self, 0)
+
+
+class SnapshotMemoryBudget(object):
+    __instance = None
+
+    def __init__(self):
+        self._lock = Lock()
+        self.in_flight_bytes = 0
+        self.in_flight_snapshots = 0
+        self.peak_bytes = 0
+        self.captures = {CAPTURE_FULL: 0, CAPTURE_SHALLOW: 0, CAPTURE_FRAMES_ONLY: 0, CAPTURE_DROPPED: 0}
+
+    @staticmethod
+    def instance():
+        if SnapshotMemoryBudget.__instance is None:
+            SnapshotMemoryBudget.__instance = SnapshotMemoryBudget()
+        return SnapshotMemoryBudget.__instance
+
+    def reserve(self, profile=None):
+        """
+        Reserves room for a new snapshot and returns the reservation.
+        ``reservation.level`` tells how much of the snapshot may be captured;
+        dropped captures hold no bytes. The sizes come from the probe's capture
+        profile when it has one.
+        """
+        config = profile if profile is not None else SnapshotCollectorConfigManager
+        budget = SnapshotCollectorConfigManager.get_memory_budget()
+        max_size = config.get_max_size()
+        frames_size = FRAME_SIZE_ESTIMATE * config.get_max_frames()
+        with self._lock:
+            remaining = budget - self.in_flight_bytes
+            usage = float(self.in_flight_bytes) / budget if budget > 0 else 0
+            if budget > 0 and remaining < frames_size:
+                level = CAPTURE_DROPPED
+            elif budget > 0 and (usage >= _FRAMES_ONLY_USAGE or remaining < frames_size * 2):
+                level = CAPTURE_FRAMES_ONLY
+            elif usage >= _SHALLOW_USAGE:
+                level = CAPTURE_SHALLOW
+            else:
+                level = CAPTURE_FULL
+
+            if level == CAPTURE_DROPPED:
+                size = 0
+            elif level == CAPTURE_FRAMES_ONLY:
+                size = frames_size
+            elif budget > 0:
+                size = min(max_size + frames_size, remaining)
+            else:
+                size = max_size + frames_size
+            self.captures[level] += 1
+            reservation = SnapshotReservation(self, level, size, profile)
+            if size:
+                self.in_flight_bytes += size
+                self.in_flight_snapshots += 1
+                self.peak_bytes = max(self.peak_bytes, self.in_flight_bytes)
+        return reservation
+
+    def _resize(self, reservation, size):
+        with self._lock:
+            if reservation.size == 0:
+                return
+            self.in_flight_bytes -= reservation.size - size
+            if size == 0:
+                self.in_flight_snapshots -= 1
+            reservation.size = size
+
+    def get_stats(self):
+        with self._lock:
+            return {
+                "budgetBytes": SnapshotCollectorConfigManager.get_memory_budget(),
+                "inFlightBytes": self.in_flight_bytes,
+                "inFlightSnapshots": self.in_flight_snapshots,
+                "peakBytes": self.peak_bytes,
+                "captures": dict(self.captures)
+            }
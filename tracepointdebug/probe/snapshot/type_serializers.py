@@ -0,0 +1,122 @@
+"""
+Registry of per type serializers consulted by the snapshot collector.
+
+Handlers are resolved once per type by walking its MRO and cached, so capturing an
+instance costs a single dict lookup. User registered serializers win over the
+built-in handlers for summarized values, namedtuples, dataclasses, enums and
+``__slots__`` classes.
+"""
+
+import dataclasses
+import enum
+from threading import Lock
+
+from .value_summarizers import get_type_summarizer
+
+_registered_serializers = {}
+_resolved_serializers = {}
+_registry_lock = Lock()
+
+
+class TypeSerializer(object):
+    """
+    How the snapshot collector captures instances of one type.
+
+    ``fn`` converts the value into plain data that is captured in its place.
+    ``fields`` names the only attributes worth capturing; nothing else is touched.
+    ``summarizer`` builds a bounded summary instead of walking the value.
+    """
+
+    def __init__(self, fn=None, fields=None, summarizer=None, include_instance_dict=False):
+        self.fn = fn
+        self.fields = tuple(fields) if fields is not None else None
+        self.summarizer = summarizer
+        self.include_instance_dict = include_instance_dict
+
+    def iter_fields(self, value):
+        for name in self.fields:
+            try:
+                yield name, getattr(value, name)
+            except AttributeError:
+                continue
+        if self.include_instance_dict:
+            instance_dict = getattr(value, '__dict__', None)
+            if instance_dict:
+                for item in instance_dict.items():
+                    yield item
+
+
+def register_serializer(cls, fn=None, fields=None):
+    """
+    Registers how instances of cls (and its subclasses) are captured in snapshots.
+
+    Either pass ``fn``, called with the value and returning the data to capture,
+    or ``fields``, the attribute names to capture.
+    """
+    if not isinstance(cls, type):
+        raise TypeError("cls must be a type, got %r" % (cls,))
+    if (fn is None) == (fields is None):
+        raise ValueError("Exactly one of fn or fields must be given")
+    if fn is not None and not callable(fn):
+        raise TypeError("fn must be callable")
+    with _registry_lock:
+        _registered_serializers[cls] = TypeSerializer(fn=fn, fields=fields)
+        _resolved_serializers.clear()
+
+
+def unregister_serializer(cls):
+    with _registry_lock:
+        _registered_serializers.pop(cls, None)
+        _resolved_serializers.clear()
+
+
+def get_type_serializer(cls):
+    """Returns the cached TypeSerializer for cls, or None if cls is serialized by the default rules."""
+    try:
+        return _resolved_serializers[cls]
+    except KeyError:
+        pass
+    serializer = _resolve_serializer(cls)
+    _resolved_serializers[cls] = serializer
+    return serializer
+
+
+def _resolve_serializer(cls):
+    for base in cls.__mro__:
+        serializer = _registered_serializers.get(base)
+        if serializer is not None:
+            return serializer
+
+    summarizer = get_type_summarizer(cls)
+    if summarizer is not None:
+        return TypeSerializer(summarizer=summarizer)
+
+    if issubclass(cls, tuple) and isinstance(getattr(cls, '_fields', None), tuple):
+        return TypeSerializer(fields=cls._fields)
+
+    if dataclasses.is_dataclass(cls):
+        return TypeSerializer(fields=[field.name for field in dataclasses.fields(cls)])
+
+    if issubclass(cls, enum.Enum):
+        return TypeSerializer(fields=('name', 'value'))
+
+    slots = _slot_names(cls)
+    if slots:
+        # Subclasses of a slotted class may still carry an instance __dict__
+        return TypeSerializer(fields=slots, include_instance_dict=getattr(cls, '__dictoffset__', 0) != 0)
+    return None
+
+
+def _slot_names(cls):
+    names = []
+    for base in reversed(cls.__mro__):
+        slots = base.__dict__.get('__slots__', ())
+        if isinstance(slots, str):
+            slots = (slots,)
+        for name in slots:
+            if name.startswith('__') and not name.endswith('__'):
+                # Private slot names are mangled on the class
+                name = '_%s%s' % (base.__name__.lstrip('_'), name)
+            if name not in ('__dict__', '__weakref__') and name not in names:
+                names.append(name)
+    return names
@@ -1,7 +1,10 @@
 class Value(object):
-    def __init__(self, var_type, value):
+    def __init__(self, var_type, value, ref_id=None, handle=None):
         self.type = var_type
         self.value = value
+        self.ref_id = ref_id
+        # Set on drill-down values left unexpanded, which can be fetched later by this handle
+        self.handle = handle
 
     def __repr__(self):
         return str(
@@ -9,7 +12,33 @@ class Value(object):
         )
 
     def to_json(self):
+        if self.handle is not None:
+            return {
+                "@type": str(self.type),
+                "@handle": self.handle
+            }
+        if self.ref_id is None:
+            return {
+                "@type": str(self.type),
+                "@value": self.value
+            }
         return {
             "@type": str(self.type),
+            "@id": self.ref_id,
             "@value": self.value
         }
+
+
+class ValueReference(object):
+    """Marker for a value already serialized earlier in the same snapshot under ``@id``."""
+
+    def __init__(self, ref_id):
+        self.ref_id = ref_id
+
+    def __repr__(self):
+        return "@ref:{}".format(self.ref_id)
+
+    def to_json(self):
+        return {
+            "@ref": self.ref_id
+        }
@@ -0,0 +1,164 @@
+"""
+Summarizers for values whose contents are too large or too opaque to walk element by element.
+
+NumPy and pandas are never imported here; their summarizers are only used when the
+application already imported them (they are looked up in ``sys.modules``).
+All statistics are computed with vectorized library calls, never by iterating in Python.
+"""
+
+import array
+import sys
+
+SAMPLE_SIZE = 5
+MAX_SUMMARY_COLUMNS = 20
+
+
+def _sample_item(item, max_var_len):
+    if item is None or isinstance(item, (bool, int, float)):
+        return item
+    if isinstance(item, (list, tuple)):
+        return [_sample_item(i, max_var_len) for i in item]
+    r = item if isinstance(item, str) else repr(item)
+    return r if len(r) <= max_var_len else r[:max_var_len] + '...'
+
+
+def _hex_preview(buffer, length, max_var_len):
+    preview_len = max(1, max_var_len // 2)
+    return {
+        "length": length,
+        "hex": bytes(buffer[:preview_len]).hex(),
+        "truncated": length > preview_len
+    }
+
+
+def summarize_bytes(value, max_var_len):
+    return _hex_preview(value, len(value), max_var_len)
+
+
+def summarize_memoryview(value, max_var_len):
+    summary = {
+        "format": value.format,
+        "shape": list(value.shape or ()),
+        "nbytes": value.nbytes,
+    }
+    if value.c_contiguous:
+        summary.update(_hex_preview(value.cast('B'), value.nbytes, max_var_len))
+    return summary
+
+
+def summarize_array(value, max_var_len):
+    summary = {
+        "typecode": value.typecode,
+        "itemsize": value.itemsize,
+        "nbytes": value.itemsize * len(value),
+    }
+    summary.update(_hex_preview(memoryview(value).cast('B'), summary["nbytes"], max_var_len))
+    return summary
+
+
+def _numeric_stats(np, values):
+    """min/max/mean/NaN count of a numeric ndarray, skipping NaNs."""
+    stats = {}
+    if values.size == 0 or values.dtype.kind not in 'iuf':
+        return stats
+    if values.dtype.kind == 'f':
+        nan_count = int(np.count_nonzero(np.isnan(values)))
+        stats["nanCount"] = nan_count
+        if nan_count == values.size:
+            return stats
+        stats["min"] = float(np.nanmin(values))
+        stats["max"] = float(np.nanmax(values))
+        stats["mean"] = float(np.nanmean(values))
+    else:
+        stats["min"] = values.min().item()
+        stats["max"] = values.max().item()
+        stats["mean"] = float(values.mean())
+    return stats
+
+
+def summarize_ndarray(value, max_var_len):
+    np = sys.modules['numpy']
+    summary = {
+        "shape": list(value.shape),
+        "dtype": str(value.dtype),
+        "nbytes": int(value.nbytes),
+        "size": int(value.size),
+    }
+    # flat slicing only copies the sampled elements, even for non contiguous arrays
+    summary["head"] = _sample_item(value.flat[:SAMPLE_SIZE].tolist(), max_var_len)
+    if value.size > SAMPLE_SIZE:
+        summary["tail"] = _sample_item(value.flat[max(SAMPLE_SIZE, value.size - SAMPLE_SIZE):].tolist(), max_var_len)
+    summary.update(_numeric_stats(np, value))
+    return summary
+
+
+def summarize_numpy_scalar(value, max_var_len):
+    return _sample_item(value.item(), max_var_len)
+
+
+def summarize_series(value, max_var_len):
+    np = sys.modules['numpy']
+    summary = {
+        "shape": list(value.shape),
+        "dtype": str(value.dtype),
+        "name": _sample_item(value.name, max_var_len),
+        "nbytes": int(value.memory_usage(index=False, deep=False)),
+        "head": _sample_item(value.iloc[:SAMPLE_SIZE].tolist(), max_var_len),
+    }
+    if len(value) > SAMPLE_SIZE:
+        summary["tail"] = _sample_item(value.iloc[max(SAMPLE_SIZE, len(value) - SAMPLE_SIZE):].tolist(), max_var_len)
+    summary.update(_numeric_stats(np, value.to_numpy()))
+    return summary
+
+
+def summarize_dataframe(value, max_var_len):
+    np = sys.modules['numpy']
+    columns = value.columns[:MAX_SUMMARY_COLUMNS]
+    frame = value[columns] if len(value.columns) > MAX_SUMMARY_COLUMNS else value
+    summary = {
+        "shape": list(value.shape),
+        "columns": _sample_item(columns.tolist(), max_var_len),
+        "dtypes": [str(dtype) for dtype in frame.dtypes],
+        "nbytes": int(value.memory_usage(index=False, deep=False).sum()),
+        "head": _sample_item(frame.iloc[:SAMPLE_SIZE].to_numpy().tolist(), max_var_len),
+    }
+    if len(value) > SAMPLE_SIZE:
+        summary["tail"] = _sample_item(frame.iloc[max(SAMPLE_SIZE, len(value) - SAMPLE_SIZE):].to_numpy().tolist(),
+                                       max_var_len)
+    stats = {}
+    for column in columns:
+        column_stats = _numeric_stats(np, frame[column].to_numpy())
+        if column_stats:
+            stats[str(column)] = column_stats
+    summary["stats"] = stats
+    return summary
+
+
+_BUILTIN_SUMMARIZERS = {
+    bytes: summarize_bytes,
+    bytearray: summarize_bytes,
+    memoryview: summarize_memoryview,
+    array.array: summarize_array,
+}
+
+
+def get_type_summarizer(cls):
+    """Returns the summarizer for instances of cls, or None if they should be serialized normally."""
+    summarizer = _BUILTIN_SUMMARIZERS.get(cls)
+    if summarizer is not None:
+        return summarizer
+    if issubclass(cls, (bytes, bytearray)):
+        return summarize_bytes
+    np = sys.modules.get('numpy')
+    if np is not None:
+        if issubclass(cls, np.ndarray):
+            return summarize_ndarray
+        if issubclass(cls, np.generic):
+            return summarize_numpy_scalar
+    pd = sys.modules.get('pandas')
+    if pd is not None:
+        if issubclass(cls, pd.DataFrame):
+            return summarize_dataframe
+        if issubclass(cls, pd.Series):
+            return summarize_series
+    return None
@@ -52,5 +52,9 @@ def debug_logger_helper(msg, handler):
             debug_logger_helper(getattr(msg, key), handler)
 
 
+def format_log_event_message(created_at, log_level, log_message):
+    return "{created_at} [{log_level}] {log_message}".format(created_at=created_at, log_level=log_level, log_message=log_message)
+
+
 def print_log_event_message(created_at, log_level, log_message):
-    print("{created_at} [{log_level}] {log_message}".format(created_at=created_at, log_level=log_level, log_message=log_message))
\ No newline at end of file
+    print(format_log_event_message(created_at, log_level, log_message))